@@ -48,8 +48,13 @@
    This module provides classes for record and field comparisons that can be
    used for the linkage process.
 
+   Field comparators can cache the weights of compared value pairs. If the
+   cache size is limited, a full cache either stops inserting new pairs
+   (default) or evicts the least recently used (LRU) or least frequently used
+   (LFU) pairs. Cached weights can also be kept in a SQLite database file, so
+   they can be reused by later runs and shared between worker processes.
+
    TODO:
-   - improve cache: how to remove oldest count-1 pair efficiently?
    - do caching timing test -> comparisonTiming.py module
    - improve value frequency based weight calculations
 
@@ -69,8 +74,12 @@
 import bz2
 import datetime
 import difflib
+import hashlib
+import heapq
 import logging
 import math
+import os
+import sqlite3
 import time
 import zlib
 
@@ -78,6 +87,12 @@ import auxiliary
 import encode
 import mymath
 
+try:  # NumPy is used (if available) for batch comparisons
+  import numpy
+  imp_numpy = True
+except:
+  imp_numpy = False
+
 # =============================================================================
 
 class RecordComparator:
@@ -202,19 +217,88 @@ class RecordComparator:
 
   # ---------------------------------------------------------------------------
 
+  def compare_batch(self, rec_pair_list):
+    """Compare a batch of record pairs, given as a list of tuples (rec1, rec2)
+       with each record being a list of fields.
+
+       The field values are extracted column-wise for the whole batch, and each
+       field comparator then compares all its value pairs in one call of its
+       compare_batch() method.
+
+       If the NumPy module is available the weights are returned as a two-
+       dimensional floating-point array with one row per record pair and one
+       column per field comparator, otherwise as a list of weight vectors
+       (lists). In both cases the weights are the same as the ones returned by
+       the compare() method.
+    """
+
+    num_pairs = len(rec_pair_list)
+
+    weight_column_list = []
+
+    for i in range(len(self.field_comparison_list)):
+      field_comp =                    self.field_comparator_list[i][0]
+      (comp_method, field_index1, field_index2) = self.field_comparison_list[i]
+
+      # Extract the two columns of field values for this field comparator
+      #
+      val1_list = []
+      val2_list = []
+
+      for (rec1, rec2) in rec_pair_list:
+
+        if (field_index1 >= len(rec1)):
+          val1_list.append('')
+        else:
+          val1_list.append(rec1[field_index1].lower())
+
+        if (field_index2 >= len(rec2)):
+          val2_list.append('')
+        else:
+          val2_list.append(rec2[field_index2].lower())
+
+      weight_column_list.append(field_comp.compare_batch(val1_list, val2_list))
+
+    if (imp_numpy == True):
+      weight_array = numpy.empty((num_pairs, len(weight_column_list)))
+
+      for i in range(len(weight_column_list)):
+        weight_array[:,i] = weight_column_list[i]
+
+      return weight_array
+
+    else:
+      weight_vector_list = []
+
+      for weight_vector in zip(*weight_column_list):
+        weight_vector_list.append(list(weight_vector))
+
+      return weight_vector_list
+
+  # ---------------------------------------------------------------------------
+
   def get_cache_stats(self):
     """Extract information about the cache size, maximum and average counts for
        all the field comparators that have an activated cache.
+
+       Returns a list with one dictionary per field comparator (in the order of
+       the field comparator list) containing the numbers of cache hits, misses,
+       evicted entries, hits in the cache file, non-cached comparisons, and the
+       number of cache entries.
     """
 
     logging.info('Caching statistics for record comparator "%s"' % \
                  (self.description))
 
+    cache_stats_list = []
+
     # Go through field list and check if available
     #
     for (field_comp, field_name1, field_name2) in self.field_comparator_list:
       logging.info('  Field comparator: "%s"' % (field_comp.description))
 
+      cache_stats_list.append(field_comp.__get_cache_counts__())
+
       if (field_comp.do_caching == False):
         logging.info('    Caching is not activated')
 
@@ -245,6 +329,20 @@ class RecordComparator:
         logging.info('    Maximum and average cache entry count: %d / %.2f' % \
                      (cache_max_count, cache_avrg_count))
 
+      if (field_comp.do_caching == True):
+        field_comp.__log_cache_counts__('    ')
+
+    return cache_stats_list
+
+  # ---------------------------------------------------------------------------
+
+  def flush_cache(self):
+    """Commit all weights added to the cache files of the field comparators.
+    """
+
+    for (field_comp, field_name1, field_name2) in self.field_comparator_list:
+      field_comp.flush_cache()
+
 # =============================================================================
 
 class FieldComparator:
@@ -256,6 +354,16 @@ class FieldComparator:
        description      A string describing the field comparator.
        do_caching       A flag, True or False, to enable or disable caching.
        max_cache_size   The maximum number of comparisons to be cached.
+       cache_policy     What to do once the cache has reached its maximum size,
+                        one of: 'none' (no more comparisons are cached, the
+                        default), 'lru' (remove the least recently used cache
+                        entry), or 'lfu' (remove the cache entry with the
+                        smallest access count, and the least recently used of
+                        these).
+       cache_file       The name of a SQLite database file in which all cached
+                        comparisons are stored as well, so they can be reused
+                        in later runs or by other processes. Default is None
+                        (no file is used).
        cache            A dictionary with cached comparisons.
        missing_values   A list of one or more strings that correspond to
                         missing values.
@@ -283,6 +391,22 @@ class FieldComparator:
     self.cache_num_not_cached = 0            # Number of comparisons not cached
     self.cache_warn_counts =    [2,5,10,50]  # List of when warnings should be
                                              # given (minimum counts)
+    self.cache_policy =         'none'       # Eviction policy for a full cache
+    self.cache_file =           None         # SQLite file with cached values
+
+    self.cache_num_hits =       0  # Counters for cache statistics
+    self.cache_num_misses =     0
+    self.cache_num_evicted =    0
+    self.cache_num_store_hits = 0
+
+    self.cache_heap =      []  # Heap with (priority, tick, cache key) tuples
+    self.cache_key_ticks = {}  # Tick of the last access for each cache key
+    self.cache_tick =      0
+
+    self.cache_store_conn =      None  # Connection to SQLite cache file
+    self.cache_store_pid =       None  # Process that opened the connection
+    self.cache_store_sig =       None  # Signature of comparator settings
+    self.cache_store_new_list =  []    # Pairs not yet written into the file
     self.missing_values =  ['']
     self.missing_weight =  0.0
     self.agree_weight =    1.0
@@ -317,6 +441,18 @@ class FieldComparator:
           auxiliary.check_is_not_negative('max_cache_size', value)
           self.max_cache_size = value
 
+      elif (keyword.startswith('cache_p')):
+        if (value not in ['none', 'lru', 'lfu']):
+          logging.exception('Illegal value for cache policy: "%s" (must ' % \
+                            (str(value)) + 'be one of "none", "lru" or "lfu")')
+          raise Exception
+        self.cache_policy = value
+
+      elif (keyword.startswith('cache_f')):
+        if (value != None):
+          auxiliary.check_is_string('cache_file', value)
+        self.cache_file = value
+
       elif (keyword.startswith('missing_v')):
         auxiliary.check_is_list('missing_values', value)
         self.missing_values = value
@@ -416,7 +552,9 @@ class FieldComparator:
     """Check if the given pair of values is in the cache, if so return cached
        similarity weight. Otherwise return None.
 
-       If found in the cache, the pair's count is increased by one.
+       If found in the cache, the pair's count is increased by one. If not
+       found and a cache file is used, the pair is looked up in the file and
+       (if found there) inserted into the cache.
 
        warning messages are logged if the cache size is limited and all entries
        have certain counts (see numbers: self.cache_warn_counts).
@@ -436,8 +574,20 @@ class FieldComparator:
       cache_key = (val2, val1)
 
     if cache_key not in self.cache:  # The values pair is not in the cache
+
+      if (self.cache_file != None):
+        cache_weight = self.__get_from_cache_store__(cache_key)
+
+        if (cache_weight != None):
+          self.cache_num_store_hits += 1
+          self.__insert_into_cache__(cache_key, cache_weight)
+          return cache_weight
+
+      self.cache_num_misses += 1
       return None
 
+    self.cache_num_hits += 1
+
     # Get weight and access count from cache, increase count, and put it back
     #
     (cache_weight, access_count) = self.cache[cache_key]
@@ -447,6 +597,9 @@ class FieldComparator:
     if (self.max_cache_size == None):
       return cache_weight  # Unlimited cache size, simply return
 
+    if (self.cache_policy != 'none'):
+      self.__push_cache_key__(cache_key, access_count)
+
     if (access_count in self.cache_warn_counts):  # Check if warning needed
 
       num_count_pairs = self.cache_warn_dict_counts[access_count]
@@ -464,8 +617,10 @@ class FieldComparator:
     """If caching is enabled and there is room in the cache put the given pair
        of values into the cache with the given similarity weight.
 
-       If the cache is full don't insert values pair but increase the number of
-       non-cached comparisons.
+       If the cache is full and no cache policy is set don't insert values pair
+       but increase the number of non-cached comparisons, otherwise remove an
+       entry according to the cache policy. If a cache file is used the pair is
+       also stored in the file.
 
        If caching is disabled do nothing.
     """
@@ -473,19 +628,6 @@ class FieldComparator:
     if (self.do_caching == False):
       return
 
-    # Check if the cache is full
-    #
-    if ((self.max_cache_size != None) and \
-        (len(self.cache) == self.max_cache_size)):
-
-      self.cache_num_not_cached += 1  # One more pair not cached
-
-      if (self.cache_num_not_cached in [100, 1000, 10000, 100000]):
-        logging.warning('Cache is full, %d comparisons cannot be cached' % \
-                        (self.cache_num_not_cached))
-
-      return
-
     # Comparisons have to be symmetric: Only one of the pairs (val1,val2) and
     # (val2,val1) should be stored in the cache, so sort them
     #
@@ -494,10 +636,243 @@ class FieldComparator:
     else:
       cache_key = (val2, val1)
 
+    if (self.cache_file != None):
+      self.__put_into_cache_store__(cache_key, weight)
+
+    self.__insert_into_cache__(cache_key, weight)
+
+  # ---------------------------------------------------------------------------
+
+  def __insert_into_cache__(self, cache_key, weight):
+    """Insert a new cache key into the cache with the given weight and a count
+       of 1, removing another entry first if the cache is full and a cache
+       policy is set.
+    """
+
+    # Check if the cache is full
+    #
+    if ((self.max_cache_size != None) and \
+        (len(self.cache) >= self.max_cache_size)):
+
+      if ((self.cache_policy == 'none') or \
+          (self.__evict_from_cache__() == False)):
+
+        self.cache_num_not_cached += 1  # One more pair not cached
+
+        if (self.cache_num_not_cached in [100, 1000, 10000, 100000]):
+          logging.warning('Cache is full, %d comparisons cannot be cached' % \
+                          (self.cache_num_not_cached))
+
+        return
+
     # Insert new pair into cache and list of pairs with count 1
     #
     self.cache[cache_key] = (weight, 1)
 
+    if ((self.max_cache_size != None) and (self.cache_policy != 'none')):
+      self.__push_cache_key__(cache_key, 1)
+
+  # ---------------------------------------------------------------------------
+
+  def __push_cache_key__(self, cache_key, access_count):
+    """Record an access to the given cache key in the heap used to find the
+       cache entry to be removed next.
+
+       Old heap entries of a cache key are not removed, but ignored once they
+       get to the top of the heap (their tick is not the latest for the key).
+    """
+
+    self.cache_tick += 1
+    self.cache_key_ticks[cache_key] = self.cache_tick
+
+    if (self.cache_policy == 'lru'):
+      priority = self.cache_tick
+    else:  # LFU
+      priority = access_count
+
+    heapq.heappush(self.cache_heap, (priority, self.cache_tick, cache_key))
+
+    # Rebuild the heap if it contains too many outdated entries
+    #
+    if (len(self.cache_heap) > 4*len(self.cache) + 64):
+      self.__rebuild_cache_heap__()
+
+  # ---------------------------------------------------------------------------
+
+  def __rebuild_cache_heap__(self):
+    """Build a new heap from the current cache entries only.
+    """
+
+    cache_key_ticks = {}
+    cache_heap =      []
+
+    for (cache_key, (cache_weight, access_count)) in self.cache.iteritems():
+      cache_tick = self.cache_key_ticks.get(cache_key, 0)
+      cache_key_ticks[cache_key] = cache_tick
+
+      if (self.cache_policy == 'lru'):
+        cache_heap.append((cache_tick, cache_tick, cache_key))
+      else:
+        cache_heap.append((access_count, cache_tick, cache_key))
+
+    heapq.heapify(cache_heap)
+
+    self.cache_heap =      cache_heap
+    self.cache_key_ticks = cache_key_ticks
+
+  # ---------------------------------------------------------------------------
+
+  def __evict_from_cache__(self):
+    """Remove one entry from the cache according to the cache policy. Returns
+       False if no entry could be removed (the cache is empty), True otherwise.
+    """
+
+    if (self.cache_heap == []):  # Cache might have been modified from outside
+      self.__rebuild_cache_heap__()
+
+    while (self.cache_heap != []):
+      (priority, cache_tick, cache_key) = heapq.heappop(self.cache_heap)
+
+      if ((self.cache_key_ticks.get(cache_key) == cache_tick) and \
+          (cache_key in self.cache)):
+        (cache_weight, access_count) = self.cache.pop(cache_key)
+        del self.cache_key_ticks[cache_key]
+        self.cache_num_evicted += 1
+
+        # The removed entry no longer counts for the cache warnings
+        #
+        for warn_count in self.cache_warn_counts:
+          if (warn_count <= access_count):
+            self.cache_warn_dict_counts[warn_count] -= 1
+        return True
+
+    return False
+
+  # ---------------------------------------------------------------------------
+
+  def __get_cache_store_sig__(self):
+    """Return a signature string of the field comparator type and all its
+       settings (like weights and thresholds) that influence the calculated
+       weights, so cached weights in a cache file are only reused by the same
+       kind of field comparator.
+
+       Dictionary settings (like a frequency or geocode look-up table) are
+       included as a digest of their sorted items, so weights calculated with
+       different tables are not reused.
+    """
+
+    if (self.cache_store_sig == None):
+      simple_types = (bool, int, long, float, str, unicode, type(None))
+
+      setting_list = []
+
+      for (name, value) in sorted(self.__dict__.items()):
+        if (name.startswith('cache') or \
+            (name in ['description', 'do_caching', 'max_cache_size'])):
+          continue
+
+        if (isinstance(value, dict)):  # Look-up tables
+          value_digest = hashlib.md5()
+          for item in sorted(value.iteritems()):
+            value_digest.update(repr(item))
+          setting_list.append('%s=%s' % (name, value_digest.hexdigest()))
+          continue
+
+        if (isinstance(value, (list, tuple))):  # Only lists of simple values
+          if ([v for v in value if not isinstance(v, simple_types)] != []):
+            continue
+        elif (not isinstance(value, simple_types)):
+          continue
+
+        setting_list.append('%s=%s' % (name, repr(value)))
+
+      setting_str = self.__class__.__name__+':'+','.join(setting_list)
+
+      self.cache_store_sig = hashlib.md5(setting_str).hexdigest()
+
+    return self.cache_store_sig
+
+  # ---------------------------------------------------------------------------
+
+  def __open_cache_store__(self):
+    """Open the cache file (and create its table if needed). Each process uses
+       its own connection, a connection inherited from a parent process is not
+       used.
+    """
+
+    if ((self.cache_store_conn != None) and \
+        (self.cache_store_pid == os.getpid())):
+      return self.cache_store_conn
+
+    try:
+      cache_store_conn = sqlite3.connect(self.cache_file, timeout=60.0)
+      cache_store_conn.text_factory = str
+
+      cache_store_conn.execute('CREATE TABLE IF NOT EXISTS field_cache ' + \
+                               '(comp TEXT, val1 TEXT, val2 TEXT, ' + \
+                               'weight REAL, PRIMARY KEY (comp, val1, val2))')
+      cache_store_conn.commit()
+    except:
+      logging.exception('Cannot open cache file "%s"' % (self.cache_file))
+      raise Exception
+
+    self.cache_store_conn =     cache_store_conn
+    self.cache_store_pid =      os.getpid()
+    self.cache_store_new_list = []
+
+    return cache_store_conn
+
+  # ---------------------------------------------------------------------------
+
+  def __get_from_cache_store__(self, cache_key):
+    """Return the weight of the given cache key from the cache file, or None if
+       it is not stored in the file.
+    """
+
+    cache_store_conn = self.__open_cache_store__()
+
+    result = cache_store_conn.execute('SELECT weight FROM field_cache ' + \
+                                      'WHERE comp=? AND val1=? AND val2=?',
+                                      (self.__get_cache_store_sig__(),
+                                       cache_key[0], cache_key[1])).fetchone()
+    if (result == None):
+      return None
+
+    return result[0]
+
+  # ---------------------------------------------------------------------------
+
+  def __put_into_cache_store__(self, cache_key, weight):
+    """Add the given cache key and its weight to the list of pairs to be
+       written into the cache file. The pairs are written in batches (and when
+       flush_cache() is called), so the file is only locked for short times.
+    """
+
+    self.__open_cache_store__()
+
+    self.cache_store_new_list.append((self.__get_cache_store_sig__(),
+                                      cache_key[0], cache_key[1], weight))
+
+    if (len(self.cache_store_new_list) >= 1000):
+      self.flush_cache()
+
+  # ---------------------------------------------------------------------------
+
+  def flush_cache(self):
+    """Write all weights added to the cache into the cache file (if one is
+       used).
+    """
+
+    if ((self.cache_store_conn != None) and \
+        (self.cache_store_pid == os.getpid()) and \
+        (self.cache_store_new_list != [])):
+
+      self.cache_store_conn.executemany('INSERT OR REPLACE INTO ' + \
+                                        'field_cache VALUES (?,?,?,?)',
+                                        self.cache_store_new_list)
+      self.cache_store_conn.commit()
+      self.cache_store_new_list = []
+
   # ---------------------------------------------------------------------------
 
   def __calc_freq_agree_weight__(self, val):
@@ -601,6 +976,8 @@ class FieldComparator:
 
     self.__check_weights__()
 
+    self.cache_store_sig = None  # Weights in cache file depend on settings
+
   # ---------------------------------------------------------------------------
 
   def train(self):
@@ -624,6 +1001,109 @@ class FieldComparator:
 
   # ---------------------------------------------------------------------------
 
+  def compare_batch(self, val1_list, val2_list):
+    """Compare the pairs of field values from the two given lists (of the same
+       length), and return a list (or a NumPy array) with the weights.
+
+       This default version simply calls compare() for each pair of values,
+       field comparators that can compute their weights for many value pairs
+       at once (using NumPy arrays) override this method.
+    """
+
+    assert len(val1_list) == len(val2_list)
+
+    compare_funct = self.compare  # Shorthand
+
+    weight_list = []
+
+    for i in xrange(len(val1_list)):
+      weight_list.append(compare_funct(val1_list[i], val2_list[i]))
+
+    return weight_list
+
+  # ---------------------------------------------------------------------------
+
+  def __batch_can_vectorise__(self, val1_list, val2_list):
+    """Check if a batch of value pairs can be compared using NumPy arrays,
+       which requires the NumPy module, a non-empty batch, and that no
+       frequency table is used (as frequency based weights depend upon the
+       individual values).
+    """
+
+    assert len(val1_list) == len(val2_list)
+
+    return ((imp_numpy == True) and (len(val1_list) > 0) and \
+            (self.val_freq_table == None))
+
+  # ---------------------------------------------------------------------------
+
+  def __batch_missing_mask__(self, val1_array, val2_array):
+    """Return a Boolean NumPy array which is True for all value pairs where at
+       least one of the two values is a missing value.
+    """
+
+    missing_mask = numpy.zeros(len(val1_array), dtype=bool)
+
+    for missing_val in self.missing_values:
+      missing_mask |= (val1_array == missing_val)
+      missing_mask |= (val2_array == missing_val)
+
+    return missing_mask
+
+  # ---------------------------------------------------------------------------
+
+  def __batch_char_arrays__(self, val1_list, val2_list):
+    """Convert the two lists of string values into two NumPy arrays of the same
+       string type, and two two-dimensional arrays with the character codes of
+       each value (one row per value, padded with zero codes at the end).
+
+       Returns None if the values cannot be converted into string arrays.
+    """
+
+    num_vals = len(val1_list)
+
+    try:
+      str_array = numpy.array(val1_list+val2_list)
+    except:
+      return None
+
+    if (str_array.dtype.kind == 'S'):
+      code_type = numpy.uint8
+      str_width = str_array.dtype.itemsize
+    elif (str_array.dtype.kind == 'U'):
+      code_type = numpy.uint32
+      str_width = str_array.dtype.itemsize / 4
+    else:
+      return None
+
+    code_array = str_array.view(code_type).reshape(2*num_vals, str_width)
+
+    return (str_array[:num_vals], str_array[num_vals:],
+            code_array[:num_vals], code_array[num_vals:])
+
+  # ---------------------------------------------------------------------------
+
+  def __batch_float_arrays__(self, val_list):
+    """Convert the given list of values into a NumPy array of floating-point
+       numbers, and return it together with a Boolean array which is False for
+       all values that are not valid numbers.
+    """
+
+    float_list = []
+    valid_list = []
+
+    for val in val_list:
+      try:
+        float_list.append(float(val))
+        valid_list.append(True)
+      except:
+        float_list.append(0.0)
+        valid_list.append(False)
+
+    return (numpy.array(float_list), numpy.array(valid_list, dtype=bool))
+
+  # ---------------------------------------------------------------------------
+
   def log(self, instance_var_list = None):
     """Write a log message with the basic field comparator instance variables
        plus the instance variable provided in the given input list (assumed to
@@ -639,6 +1119,9 @@ class FieldComparator:
       logging.info('  Unlimited cache size')
     logging.info('    Warnings will be given once all cache entries have ' + \
                  'counts: %s' % (str(self.cache_warn_counts)))
+    logging.info('  Cache policy:        %s' % (self.cache_policy))
+    if (self.cache_file != None):
+      logging.info('  Cache file:          %s' % (self.cache_file))
     logging.info('  Missing values:      %s' % (str(self.missing_weight)))
     logging.info('  Missing weight:      %f' % (self.missing_weight))
     logging.info('  Agreement weight:    %f' % (self.agree_weight))
@@ -667,6 +1150,9 @@ class FieldComparator:
 
   def get_cache_stats(self):
     """Extract information about the cache size, maximum and average counts.
+
+       Returns a dictionary with the cache counters (see
+       __get_cache_counts__()).
     """
 
     logging.info('Field comparator: "%s"' % (self.description))
@@ -702,6 +1188,41 @@ class FieldComparator:
       logging.info('  Maximum and average cache entry count: %d / %.2f' % \
                    (cache_max_count, cache_avrg_count))
 
+    if (self.do_caching == True):
+      self.__log_cache_counts__('  ')
+
+    return self.__get_cache_counts__()
+
+  # ---------------------------------------------------------------------------
+
+  def __get_cache_counts__(self):
+    """Return a dictionary with the numbers of cache hits, misses, evicted
+       entries, hits in the cache file, comparisons that could not be cached,
+       and the current number of cache entries.
+    """
+
+    return {'hits':       self.cache_num_hits,
+            'misses':     self.cache_num_misses,
+            'evicted':    self.cache_num_evicted,
+            'store_hits': self.cache_num_store_hits,
+            'not_cached': self.cache_num_not_cached,
+            'size':       len(self.cache)}
+
+  # ---------------------------------------------------------------------------
+
+  def __log_cache_counts__(self, indent):
+    """Log the cache counters with the given indentation string.
+    """
+
+    logging.info(indent+'Cache hits / misses: %d / %d' % \
+                 (self.cache_num_hits, self.cache_num_misses))
+    if (self.cache_policy != 'none'):
+      logging.info(indent+'Cache entries evicted (%s policy): %d' % \
+                   (self.cache_policy.upper(), self.cache_num_evicted))
+    if (self.cache_file != None):
+      logging.info(indent+'Cache file hits: %d (cache file: "%s")' % \
+                   (self.cache_num_store_hits, self.cache_file))
+
 # =============================================================================
 
 class FieldComparatorExactString(FieldComparator):
@@ -735,6 +1256,27 @@ class FieldComparatorExactString(FieldComparator):
     else:
       return self.disagree_weight
 
+  # ---------------------------------------------------------------------------
+
+  def compare_batch(self, val1_list, val2_list):
+    """Compare pairs of field values using exact string comparison, using
+       NumPy arrays if possible.
+    """
+
+    if (self.__batch_can_vectorise__(val1_list, val2_list) == False):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    val1_array = numpy.array(val1_list, dtype=object)
+    val2_array = numpy.array(val2_list, dtype=object)
+
+    weight_array = numpy.empty(len(val1_list))
+    weight_array.fill(self.disagree_weight)
+
+    weight_array[val1_array == val2_array] = self.agree_weight
+    weight_array[self.__batch_missing_mask__(val1_array, val2_array)] = \
+                                                            self.missing_weight
+    return weight_array
+
 # =============================================================================
 
 class FieldComparatorContainsString(FieldComparator):
@@ -853,6 +1395,37 @@ class FieldComparatorTruncateString(FieldComparator):
     else:
       return self.disagree_weight
 
+  # ---------------------------------------------------------------------------
+
+  def compare_batch(self, val1_list, val2_list):
+    """Compare pairs of field values using exact string comparison with
+       truncated strings, using NumPy arrays if possible.
+    """
+
+    if (self.__batch_can_vectorise__(val1_list, val2_list) == False):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    char_arrays = self.__batch_char_arrays__(val1_list, val2_list)
+    if (char_arrays == None):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    (str1_array, str2_array, code1_array, code2_array) = char_arrays
+
+    num_char = self.num_char_compared
+
+    weight_array = numpy.empty(len(val1_list))
+    weight_array.fill(self.disagree_weight)
+
+    # Compare the character codes of the first num_char characters
+    #
+    trunc_equal = (code1_array[:,:num_char] == \
+                   code2_array[:,:num_char]).all(axis=1)
+    weight_array[trunc_equal] = self.agree_weight
+
+    weight_array[self.__batch_missing_mask__(str1_array, str2_array)] = \
+                                                            self.missing_weight
+    return weight_array
+
 # =============================================================================
 
 class FieldComparatorKeyDiff(FieldComparator):
@@ -956,6 +1529,39 @@ class FieldComparatorKeyDiff(FieldComparator):
     return agree_weight - (float(num_err)/(self.max_key_diff+1.0)) * \
            (agree_weight + abs(self.disagree_weight))
 
+  # ---------------------------------------------------------------------------
+
+  def compare_batch(self, val1_list, val2_list):
+    """Compare pairs of field values using the key difference field comparator,
+       using NumPy arrays if possible.
+
+       The number of different characters is the number of positions where the
+       (zero padded) character codes of the two values differ, which is the
+       same as the length difference plus the number of different characters
+       in the shorter length.
+    """
+
+    if (self.__batch_can_vectorise__(val1_list, val2_list) == False):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    char_arrays = self.__batch_char_arrays__(val1_list, val2_list)
+    if (char_arrays == None):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    (str1_array, str2_array, code1_array, code2_array) = char_arrays
+
+    num_err = (code1_array != code2_array).sum(axis=1)
+
+    agree_weight = self.agree_weight
+
+    weight_array = agree_weight - (num_err / (self.max_key_diff+1.0)) * \
+                   (agree_weight + abs(self.disagree_weight))
+
+    weight_array[num_err > self.max_key_diff] = self.disagree_weight
+    weight_array[self.__batch_missing_mask__(str1_array, str2_array)] = \
+                                                            self.missing_weight
+    return weight_array
+
 # =============================================================================
 
 class FieldComparatorNumericPerc(FieldComparator):
@@ -1064,6 +1670,47 @@ class FieldComparatorNumericPerc(FieldComparator):
     return agree_weight - (perc_diff / (self.max_perc_diff+1.0)) * \
            (agree_weight + abs(self.disagree_weight))
 
+  # ---------------------------------------------------------------------------
+
+  def compare_batch(self, val1_list, val2_list):
+    """Compare pairs of numerical field values tolerating a percentage
+       difference, using NumPy arrays if possible.
+    """
+
+    if (self.__batch_can_vectorise__(val1_list, val2_list) == False):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    (float1_array, valid1_array) = self.__batch_float_arrays__(val1_list)
+    (float2_array, valid2_array) = self.__batch_float_arrays__(val2_list)
+
+    agree_weight = self.agree_weight
+
+    old_settings = numpy.seterr(all='ignore')  # Invalid values are masked
+
+    perc_diff = 100.0 * numpy.abs(float1_array - float2_array) / \
+                numpy.maximum(numpy.abs(float1_array), numpy.abs(float2_array))
+
+    weight_array = agree_weight - (perc_diff / (self.max_perc_diff+1.0)) * \
+                   (agree_weight + abs(self.disagree_weight))
+
+    weight_array[perc_diff > self.max_perc_diff] = self.disagree_weight
+
+    numpy.seterr(**old_settings)
+
+    if (self.max_perc_diff == 0.0):  # No percentage difference tolerated
+      weight_array.fill(self.disagree_weight)
+
+    weight_array[float1_array == float2_array] = agree_weight
+    weight_array[~(valid1_array & valid2_array)] = self.disagree_weight
+
+    val1_array = numpy.array(val1_list, dtype=object)
+    val2_array = numpy.array(val2_list, dtype=object)
+
+    weight_array[val1_array == val2_array] = agree_weight
+    weight_array[self.__batch_missing_mask__(val1_array, val2_array)] = \
+                                                            self.missing_weight
+    return weight_array
+
 # =============================================================================
 
 class FieldComparatorNumericAbs(FieldComparator):
@@ -1176,6 +1823,46 @@ class FieldComparatorNumericAbs(FieldComparator):
     return agree_weight - (abs_diff / (self.max_abs_diff+1.0)) * \
            (agree_weight + abs(self.disagree_weight))
 
+  # ---------------------------------------------------------------------------
+
+  def compare_batch(self, val1_list, val2_list):
+    """Compare pairs of numerical field values tolerating an absolute
+       difference, using NumPy arrays if possible.
+    """
+
+    if (self.__batch_can_vectorise__(val1_list, val2_list) == False):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    (float1_array, valid1_array) = self.__batch_float_arrays__(val1_list)
+    (float2_array, valid2_array) = self.__batch_float_arrays__(val2_list)
+
+    agree_weight = self.agree_weight
+
+    old_settings = numpy.seterr(all='ignore')  # Invalid values are masked
+
+    abs_diff = numpy.abs(float1_array - float2_array)
+
+    weight_array = agree_weight - (abs_diff / (self.max_abs_diff+1.0)) * \
+                   (agree_weight + abs(self.disagree_weight))
+
+    weight_array[abs_diff > self.max_abs_diff] = self.disagree_weight
+
+    numpy.seterr(**old_settings)
+
+    if (self.max_abs_diff == 0.0):  # No absolute difference tolerated
+      weight_array.fill(self.disagree_weight)
+
+    weight_array[float1_array == float2_array] = agree_weight
+    weight_array[~(valid1_array & valid2_array)] = self.disagree_weight
+
+    val1_array = numpy.array(val1_list, dtype=object)
+    val2_array = numpy.array(val2_list, dtype=object)
+
+    weight_array[val1_array == val2_array] = agree_weight
+    weight_array[self.__batch_missing_mask__(val1_array, val2_array)] = \
+                                                            self.missing_weight
+    return weight_array
+
 # =============================================================================
 
 class FieldComparatorEncodeString(FieldComparator):
@@ -1749,6 +2436,136 @@ class FieldComparatorDate(FieldComparator):
 
     return w
 
+  # ---------------------------------------------------------------------------
+
+  def __parse_date__(self, val):
+    """Parse a single date value in the same way as done in compare(), and
+       return a tuple (ordinal day number, day, month, year), or None if the
+       value is not a valid date.
+    """
+
+    for c in '/:;,.\\':
+      if c in val:
+        val = val.replace(c,'')
+
+    if (len(val) not in [6,8]):
+      return None
+
+    if (self.date_format in ['ddmmyyyy', 'ddmmyy']):
+      day, month, year = val[:2],val[2:4],val[4:]
+    elif (self.date_format in ['mmddyyyy','mmddyy']):
+      day, month, year = val[2:4],val[:2],val[4:]
+    elif (self.date_format == 'yyyymmdd'):
+      day, month, year = val[6:],val[4:6],val[:4]
+
+    if ((month < '01') or (month > '12') or (day < '01')):
+      return None
+
+    if ((month in ['01','03','05','07','08','10','12']) and (day > '31')):
+      return None
+    elif ((month in ['04','06','09','11']) and (day > '30')):
+      return None
+    elif ((month == '02') and (day > '29')):
+      return None
+
+    try:
+      date = datetime.date(int(year), int(month), int(day))
+    except:
+      return None
+
+    return (date.toordinal(), date.day, date.month, date.year)
+
+  # ---------------------------------------------------------------------------
+
+  def compare_batch(self, val1_list, val2_list):
+    """Compare pairs of date field values, using NumPy arrays if possible.
+
+       Each distinct value is parsed only once. Value pairs where at least one
+       value is not a valid date are compared using the compare() method (so
+       the same warnings are logged).
+    """
+
+    if (self.__batch_can_vectorise__(val1_list, val2_list) == False):
+      return FieldComparator.compare_batch(self, val1_list, val2_list)
+
+    num_vals = len(val1_list)
+
+    parse_cache = {}  # Parsed dates for all distinct values in this batch
+
+    date1_list = []
+    date2_list = []
+    valid_list = []
+
+    for (val_list, date_list) in [(val1_list, date1_list),
+                                  (val2_list, date2_list)]:
+      for val in val_list:
+        if (val in parse_cache):
+          date_tuple = parse_cache[val]
+        else:
+          date_tuple = self.__parse_date__(val)
+          parse_cache[val] = date_tuple
+
+        if (date_tuple == None):
+          date_list.append((0,0,0,0))
+        else:
+          date_list.append(date_tuple)
+
+    date1_array = numpy.array(date1_list, dtype=int).reshape(num_vals, 4)
+    date2_array = numpy.array(date2_list, dtype=int).reshape(num_vals, 4)
+
+    (ordinal1, day1, month1, year1) = date1_array.T
+    (ordinal2, day2, month2, year2) = date2_array.T
+
+    agree_weight = self.agree_weight
+    disagree_weight = self.disagree_weight
+
+    day_diff = ordinal2 - ordinal1
+
+    weight_array = numpy.empty(num_vals)
+    weight_array.fill(disagree_weight)
+
+    # Day difference too large, but day and year values are the same
+    #
+    weight_array[(day1 == day2) & (year1 == year2)] = disagree_weight * 0.75
+
+    # Day difference is in the permitted tolerance range
+    #
+    in_range = (day_diff <= self.max_day1_before_day2) & \
+               (-day_diff <= self.max_day2_before_day1)
+
+    pos_diff = in_range & (day_diff > 0)
+    weight_array[pos_diff] = agree_weight - \
+            (day_diff[pos_diff] / (self.max_day1_before_day2+1.0)) * \
+            (agree_weight + abs(disagree_weight))
+
+    neg_diff = in_range & (day_diff < 0)
+    weight_array[neg_diff] = agree_weight - \
+            (-day_diff[neg_diff] / (self.max_day2_before_day1+1.0)) * \
+            (agree_weight + abs(disagree_weight))
+
+    # Swapped day and month values
+    #
+    weight_array[(day1 == month2) & (month1 == day2) & (year1 == year2)] = \
+            agree_weight-0.5*(agree_weight+abs(disagree_weight))
+
+    weight_array[day_diff == 0] = agree_weight  # Same dates
+
+    val1_array = numpy.array(val1_list, dtype=object)
+    val2_array = numpy.array(val2_list, dtype=object)
+
+    weight_array[val1_array == val2_array] = agree_weight
+
+    missing_mask = self.__batch_missing_mask__(val1_array, val2_array)
+    weight_array[missing_mask] = self.missing_weight
+
+    # Compare pairs with invalid dates one by one
+    #
+    for i in numpy.flatnonzero((ordinal1 == 0) | (ordinal2 == 0)):
+      if ((missing_mask[i] == False) and (val1_list[i] != val2_list[i])):
+        weight_array[i] = self.compare(val1_list[i], val2_list[i])
+
+    return weight_array
+
 # =============================================================================
 
 class FieldComparatorTime(FieldComparator):
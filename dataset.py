@@ -66,27 +66,64 @@
 
    TODO:
    - Implement SQL data set
-   - Implement handling of .ZIP and .BZ2 files for CSV and COL data sets
-   - Allow multiple files or tables in one data set
+   - Implement handling of .ZIP files for CSV and COL data sets, and of .BZ2
+     and .XZ files for COL data sets
+   - Allow multiple files or tables in COL and SQL data sets
 """
 
 # =============================================================================
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
+import array
+import bisect
+import bz2
+import cStringIO
 import csv
+import glob
 import gzip
+import hashlib
+import itertools
 import logging
 import math
 import os
+import Queue
 import random
 import shelve
 import string
+import struct
 import sys
+import threading
 import time
+import whichdb
+import zlib
 
 import auxiliary
 import mymath
 
+try:  # The lzma module (or its backport) is needed for XZ compressed files
+  import lzma
+  imp_lzma = True
+except:
+  try:
+    from backports import lzma
+    imp_lzma = True
+  except:
+    imp_lzma = False
+
+# =============================================================================
+# Approximate number of bytes read at once from COL files by readall()
+
+COL_READ_BLOCK_SIZE = 1048576
+
+# =============================================================================
+# File name extensions of compressed files, and the block size and number of
+# blocks in the queue used to decompress files in a background thread
+
+COMPRESSED_FILE_EXT = ('.gz', '.bz2', '.xz')
+
+DECOMPRESS_BLOCK_SIZE =  1048576
+DECOMPRESS_QUEUE_SIZE =  8
+
 # =============================================================================
 # Some constants used by the analyse() method
 
@@ -97,6 +134,152 @@ MISS_PERC_THRES = 5.0  # Threshold in percentage above which a column will not
 
 # =============================================================================
 
+class ThreadedReadFile:
+  """A read-only file-like object that reads the blocks of an opened (usually
+     compressed) file in a background thread and passes them through a bounded
+     queue, so that decompressing a file and parsing its lines can overlap.
+
+     Only sequential reading of lines is possible, using iteration or the
+     readline() method. Closing a threaded file stops the background thread,
+     which then closes the underlying file.
+  """
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, in_file, block_size=DECOMPRESS_BLOCK_SIZE,
+               queue_size=DECOMPRESS_QUEUE_SIZE):
+    """Constructor. Start the background thread reading the given file.
+    """
+
+    self.block_queue = Queue.Queue(queue_size)
+    self.stop_event =  threading.Event()
+
+    self.line_iter = iter([])  # Iterator over the lines of the current block
+    self.rest_line = ''        # Incomplete last line of the current block
+    self.end_of_file = False
+
+    # The thread does not reference this object, so that it is closed once it
+    # is not used anymore (see __del__())
+    #
+    self.read_thread = threading.Thread(target=read_file_blocks,
+                                        args=(in_file, block_size,
+                                              self.block_queue,
+                                              self.stop_event))
+    self.read_thread.daemon = True
+    self.read_thread.start()
+
+  # ---------------------------------------------------------------------------
+
+  def __del__(self):
+    """Destructor, stop the background thread.
+    """
+
+    self.stop_event.set()
+
+  # ---------------------------------------------------------------------------
+
+  def __next_block__(self):
+    """Get the next block from the queue and make its complete lines available
+       for reading. Returns False once the end of the file has been reached.
+    """
+
+    if (self.end_of_file == True):
+      return False
+
+    block = self.block_queue.get()
+
+    if (block == None):
+      logging.exception('Reading file in background thread failed')
+      raise IOError
+
+    if (block == ''):  # End of file, last line might have no line break
+      self.end_of_file = True
+      self.line_iter = iter([self.rest_line])
+      self.rest_line = ''
+
+    else:
+      block = self.rest_line + block
+      end_pos = block.rfind('\n') + 1  # Only complete lines
+
+      self.rest_line = block[end_pos:]
+      self.line_iter = iter(cStringIO.StringIO(block[:end_pos]))
+
+    return True
+
+  # ---------------------------------------------------------------------------
+
+  def __iter__(self):
+    """Return the lines of the file one by one.
+    """
+
+    while True:
+      for file_line in self.line_iter:
+        if (file_line != ''):
+          yield file_line
+
+      if (self.__next_block__() == False):
+        break
+
+  # ---------------------------------------------------------------------------
+
+  def readline(self):
+    """Return the next line of the file, or an empty string at its end.
+    """
+
+    file_line = next(self.line_iter, '')
+
+    while ((file_line == '') and (self.__next_block__() == True)):
+      file_line = next(self.line_iter, '')
+
+    return file_line
+
+  # ---------------------------------------------------------------------------
+
+  def close(self):
+    """Stop the background thread (which closes the underlying file).
+    """
+
+    self.stop_event.set()
+
+# =============================================================================
+
+def read_file_blocks(in_file, block_size, block_queue, stop_event):
+  """Read blocks from the given file and put them into the given queue until
+     the end of the file is reached or the stop event is set, then close the
+     file. Runs in the background thread of a ThreadedReadFile. An empty block
+     is put into the queue at the end of the file, and None if reading failed.
+  """
+
+  try:
+    while (not stop_event.is_set()):
+      block = in_file.read(block_size)
+      put_file_block(block, block_queue, stop_event)
+
+      if (block == ''):  # End of file reached
+        break
+
+  except:
+    logging.exception('Cannot read file in background thread')
+    put_file_block(None, block_queue, stop_event)
+
+  in_file.close()
+
+# -----------------------------------------------------------------------------
+
+def put_file_block(block, block_queue, stop_event):
+  """Put the given block into the given queue, waiting while the queue is full
+     unless the stop event is set.
+  """
+
+  while (not stop_event.is_set()):
+    try:
+      block_queue.put(block, True, 0.1)
+      return
+    except Queue.Full:
+      pass
+
+# =============================================================================
+
 class DataSet:
   """Base class for data set access.
 
@@ -260,6 +443,478 @@ class DataSet:
 
   # ---------------------------------------------------------------------------
 
+  def get_shards(self, num_shards):
+    """Split the data set into (approximately) the given number of shards
+       that can be read independently (for example in different processes)
+       using the readshard() method, and return a list of these shards.
+
+       The shards are given in the order of the records as returned by
+       readall(). This default implementation returns one shard that contains
+       all records, see implementations in derived classes for details.
+    """
+
+    auxiliary.check_is_integer('num_shards', num_shards)
+    auxiliary.check_is_positive('num_shards', num_shards)
+
+    return [None]
+
+  # ---------------------------------------------------------------------------
+
+  def readshard(self, shard):
+    """An iterator which will return one record per call as a tuple (record
+       identifier, record field list) for all records in the given shard (as
+       returned by the get_shards() method).
+
+       If record identifiers are generated (by adding record numbers to the
+       'rec_ident' string) the record identifier will be None, as the numbers
+       of records are not known within a shard. They can be generated using
+       the position of a record in the data set.
+
+       This default implementation only supports the shard None (all records).
+    """
+
+    if (shard != None):
+      logging.exception('Illegal shard for data set "%s": %s' % \
+                        (self.description, str(shard)))
+      raise Exception
+
+    return self.readall()
+
+  # ---------------------------------------------------------------------------
+
+  def read_batches(self, batch_size, fields=None):
+    """An iterator which will return (at most) 'batch_size' records per call
+       as a tuple (record identifier list, field value lists). There is one
+       field value list (column) for each field in 'fields' (a list of field
+       names, default is all fields in the field list) in the same order.
+
+       Use like:  for (rec_ident_list, col_list) in dataset.read_batches(1000):
+
+       This default implementation collects the records returned by readall(),
+       see implementations in derived classes for details.
+    """
+
+    field_num_list = self.__get_batch_field_nums__(batch_size, fields)
+
+    rec_iter = self.readall()
+
+    while True:
+
+      rec_ident_list = []
+      rec_list = []
+
+      for (rec_ident, rec) in itertools.islice(rec_iter, batch_size):
+        rec_ident_list.append(rec_ident)
+        rec_list.append(rec)
+
+      if (rec_list == []):  # No more records in data set
+        break
+
+      col_list = []
+
+      for field_num in field_num_list:
+        col_list.append(self.__get_batch_column__(rec_list, field_num))
+
+      yield (rec_ident_list, col_list)
+
+  # ---------------------------------------------------------------------------
+
+  def __get_batch_field_nums__(self, batch_size, fields):
+    """Check the arguments of read_batches() and return a list with the
+       numbers of the given fields (their positions in the field list).
+    """
+
+    auxiliary.check_is_integer('batch_size', batch_size)
+    auxiliary.check_is_positive('batch_size', batch_size)
+
+    field_name_list = [field_data[0] for field_data in self.field_list]
+
+    if (fields == None):
+      return range(len(field_name_list))
+
+    auxiliary.check_is_list('fields', fields)
+
+    field_num_list = []
+
+    for field_name in fields:
+      if (field_name not in field_name_list):
+        logging.exception('Field "%s" is not in the data set field list: %s' \
+                          % (str(field_name), str(field_name_list)))
+        raise Exception
+      field_num_list.append(field_name_list.index(field_name))
+
+    return field_num_list
+
+  # ---------------------------------------------------------------------------
+
+  def __get_batch_column__(self, rec_list, field_num):
+    """Return a list with the values of the given field number in all records
+       in the given list. Records that have less fields give empty values.
+    """
+
+    try:
+      return [rec[field_num] for rec in rec_list]
+
+    except IndexError:  # Some records are too short
+      col = []
+
+      for rec in rec_list:
+        if (len(rec) > field_num):
+          col.append(rec[field_num])
+        else:
+          col.append('')
+
+      return col
+
+  # ---------------------------------------------------------------------------
+
+  def __clean_batch_column__(self, col):
+    """Strip leading and trailing whitespace off the values in the given
+       column (if 'strip_fields' is set to True) and replace missing values
+       with empty strings, and return the cleaned column.
+    """
+
+    if (self.strip_fields == True):  # Strip leading and trailing whitespace
+      col = map(string.strip, col)
+
+    if (self.miss_val != None):  # Check for missing values in column
+      miss_val_list = self.miss_val  # Faster reference access
+
+      for i in range(len(col)):
+        if (col[i] in miss_val_list):  # Found a missing value
+          col[i] = ''  # Replace with empty string
+
+    return col
+
+  # ---------------------------------------------------------------------------
+
+  def __get_file_shards__(self, num_shards, file_name=None):
+    """Split the file of a data set (or the given file) into the given number
+       of byte ranges and return a list of tuples (start_pos, end_pos). The
+       last end position is None (read until the end of the file).
+
+       A record belongs to the shard that contains its first character, see
+       __read_file_shard__(). Compressed files are not split.
+    """
+
+    auxiliary.check_is_integer('num_shards', num_shards)
+    auxiliary.check_is_positive('num_shards', num_shards)
+
+    if (file_name == None):
+      file_name = self.file_name
+
+    if (file_name.lower().endswith(COMPRESSED_FILE_EXT)):
+      return [(0, None)]
+
+    file_size = os.path.getsize(file_name)
+
+    shard_list = []
+
+    for i in range(num_shards):
+      shard_list.append((file_size*i / num_shards,
+                         file_size*(i+1) / num_shards))
+
+    shard_list[-1] = (shard_list[-1][0], None)
+
+    return shard_list
+
+  # ---------------------------------------------------------------------------
+
+  def __read_file_shard__(self, shard_file, shard):
+    """An iterator which returns the lines of the given (opened) file that
+       start within the byte range of the given shard (a tuple (start_pos,
+       end_pos)). The header line is skipped over (if there is one).
+
+       Note that records must not contain line breaks (within quoted values)
+       if a file is read in several shards.
+    """
+
+    (start_pos, end_pos) = shard
+
+    if (start_pos == 0):
+      if (self.header_line == True):
+        shard_file.readline()
+
+    else:  # Skip over the rest of the line the shard starts in
+      shard_file.seek(start_pos-1)
+      shard_file.readline()
+
+    while ((end_pos == None) or (shard_file.tell() < end_pos)):
+
+      file_line = shard_file.readline()
+
+      if (file_line == ''):  # End of file reached
+        break
+
+      yield file_line
+
+  # ---------------------------------------------------------------------------
+
+  def __open_data_file__(self, file_name, use_thread=False):
+    """Open the given file for reading and return it. Files with names ending
+       in '.gz', '.bz2' or '.xz' are decompressed (XZ files need the 'lzma'
+       module). If 'use_thread' is set to True compressed files are read and
+       decompressed in a background thread, see ThreadedReadFile.
+    """
+
+    file_ext = os.path.splitext(file_name)[1].lower()
+
+    if ((file_ext == '.xz') and (imp_lzma == False)):
+      logging.exception('Module "lzma" is not available, cannot read XZ ' + \
+                        'compressed file "%s"' % (file_name))
+      raise Exception
+
+    try:
+      if (file_ext == '.gz'):
+        in_file = gzip.open(file_name) # Open gzipped file
+      elif (file_ext == '.bz2'):
+        in_file = bz2.BZ2File(file_name)
+      elif (file_ext == '.xz'):
+        in_file = lzma.LZMAFile(file_name)
+      else:
+        return open(file_name,'r')
+    except:
+      logging.exception('Cannot open file "%s" for reading' % (file_name))
+      raise IOError
+
+    if (use_thread == True):
+      in_file = ThreadedReadFile(in_file)
+
+    return in_file
+
+  # ---------------------------------------------------------------------------
+
+  def __read_file_lines__(self, file_name_list, use_thread=False):
+    """An iterator which returns the lines of all files in the given list as
+       if they were one file. The header lines of the second and following
+       files are skipped over (if there are header lines).
+    """
+
+    for file_num in range(len(file_name_list)):
+      in_file = self.__open_data_file__(file_name_list[file_num], use_thread)
+
+      try:
+        if ((file_num > 0) and (self.header_line == True)):
+          in_file.readline()
+
+        for file_line in in_file:
+          yield file_line
+
+      finally:
+        in_file.close()
+
+  # ---------------------------------------------------------------------------
+
+  def __get_record_offsets__(self, in_file):
+    """Return an array with the byte offsets of the starts of all records in
+       the given (opened) file, which must be positioned after the header line
+       (if there is one).
+
+       This default implementation assumes there is one record per line.
+    """
+
+    offset_array = array.array('L')
+
+    next_pos = in_file.tell()
+
+    for file_line in iter(in_file.readline, ''):
+      offset_array.append(next_pos)
+      next_pos = in_file.tell()
+
+    return offset_array
+
+  # ---------------------------------------------------------------------------
+
+  def __get_offset_index__(self):
+    """Return an array with the byte offsets of the starts of all records in
+       the file of a data set (for GZIP compressed files these are offsets
+       into the uncompressed data), so that read() can seek directly to a
+       record.
+
+       For GZIP files made of several members (like BGZF files or files
+       written by concatenating GZIP files) the compressed and uncompressed
+       start offsets of all members are kept as well (in 'gzip_members'), so
+       that __seek_data_file__() can start decompressing at the member that
+       contains a record.
+
+       The offsets are calculated once and stored in a sidecar file (the data
+       set file name with '.idx' appended). This file is calculated again if
+       the size or modification time of the data set file (or the header line
+       or delimiter settings) have changed. If the sidecar file cannot be
+       written the offsets are only kept in memory.
+    """
+
+    if (self.rec_offsets != None):
+      return self.rec_offsets
+
+    file_stat = os.stat(self.file_name)
+
+    index_key_list = [self.__class__.__name__, file_stat.st_size,
+                      repr(file_stat.st_mtime), self.header_line,
+                      getattr(self, 'delimiter', None)]
+    index_key = hashlib.md5(repr(index_key_list)).hexdigest()
+
+    offset_array = array.array('L')
+    index_header = 'febrl-offset-index %s %s %d' % \
+                   (index_key, offset_array.typecode, offset_array.itemsize)
+
+    index_file_name = self.file_name + '.idx'
+
+    # Try to load the offsets from an up-to-date sidecar file - - - - - - - - -
+    #
+    if (os.path.isfile(index_file_name)):
+      try:
+        index_file = open(index_file_name, 'rb')
+        header_list = index_file.readline().split()
+
+        if (' '.join(header_list[:-2]) == index_header):
+          offset_array.fromfile(index_file, int(header_list[-2]))
+
+          num_members = int(header_list[-1])
+          if (num_members > 0):
+            comp_array =   array.array(offset_array.typecode)
+            uncomp_array = array.array(offset_array.typecode)
+            comp_array.fromfile(index_file, num_members)
+            uncomp_array.fromfile(index_file, num_members)
+            self.gzip_members = (comp_array, uncomp_array)
+
+          self.rec_offsets = offset_array
+
+        index_file.close()
+
+      except (IOError, EOFError, ValueError):
+        logging.warning('Cannot load record offset index file "%s"' % \
+                        (index_file_name))
+
+    if (self.rec_offsets != None):
+      logging.info('Loaded offsets of %d records from file "%s"' % \
+                   (len(self.rec_offsets), index_file_name))
+      return self.rec_offsets
+
+    # Calculate the offsets and save them into the sidecar file - - - - - - - -
+    #
+    start_time = time.time()
+
+    in_file = self.__open_data_file__(self.file_name)
+
+    if (self.header_line == True):
+      in_file.readline()
+
+    self.rec_offsets = self.__get_record_offsets__(in_file)
+    in_file.close()
+
+    num_members = 0
+    if (os.path.splitext(self.file_name)[1].lower() == '.gz'):
+      gzip_members = self.__get_gzip_members__(self.file_name)
+      if (len(gzip_members[0]) > 1):  # Only useful with several members
+        self.gzip_members = gzip_members
+        num_members = len(gzip_members[0])
+
+    try:
+      index_file = open(index_file_name, 'wb')
+      index_file.write('%s %d %d\n' % (index_header, len(self.rec_offsets),
+                                       num_members))
+      self.rec_offsets.tofile(index_file)
+      if (num_members > 0):
+        self.gzip_members[0].tofile(index_file)
+        self.gzip_members[1].tofile(index_file)
+      index_file.close()
+
+    except IOError:
+      logging.warning('Cannot write record offset index file "%s"' % \
+                      (index_file_name))
+
+    logging.info('Calculated offsets of %d records in %s' % \
+                 (len(self.rec_offsets),
+                  auxiliary.time_string(time.time()-start_time)))
+
+    return self.rec_offsets
+
+  # ---------------------------------------------------------------------------
+
+  def __get_gzip_members__(self, file_name):
+    """Return two arrays with the compressed and uncompressed start offsets of
+       all members of the given GZIP file.
+
+       Each member of a GZIP file is an independent compressed stream, so
+       decompression can be started at any member without knowing the data
+       before it. Trailing zero padding after the last member is ignored.
+    """
+
+    comp_array =   array.array('L')
+    uncomp_array = array.array('L')
+
+    raw_file = open(file_name, 'rb')
+
+    comp_pos =   0   # Compressed offset of the start of 'comp_data'
+    uncomp_pos = 0   # Uncompressed offset reached so far
+    comp_data =  ''
+    decomp_obj = None
+
+    while True:
+      if (comp_data == ''):
+        comp_data = raw_file.read(DECOMPRESS_BLOCK_SIZE)
+        if (comp_data == ''):  # End of file reached
+          break
+
+      if (decomp_obj == None):  # A new member starts at 'comp_pos'
+        if (comp_data.lstrip('\x00') == ''):  # Zero padding
+          comp_pos += len(comp_data)
+          comp_data = ''
+          continue
+
+        comp_array.append(comp_pos)
+        uncomp_array.append(uncomp_pos)
+        decomp_obj = zlib.decompressobj(16+zlib.MAX_WBITS)
+
+      uncomp_pos += len(decomp_obj.decompress(comp_data))
+
+      # Data after the end of the current member starts the next member
+      #
+      unused_data = decomp_obj.unused_data
+      comp_pos += len(comp_data) - len(unused_data)
+      comp_data = unused_data
+
+      if (unused_data != ''):
+        decomp_obj = None
+
+    raw_file.close()
+
+    return (comp_array, uncomp_array)
+
+  # ---------------------------------------------------------------------------
+
+  def __seek_data_file__(self, file_offset):
+    """Move the opened data set file to the given offset (for GZIP compressed
+       files an offset into the uncompressed data).
+
+       A single member GZIP file can only be moved by decompressing all data
+       from its start up to the given offset (which is what the seek method of
+       a GZIP file does), so such seeks take time linear in the offset. If
+       the file has several members (see __get_offset_index__()) the file is
+       instead opened again at the start of the member that contains the
+       offset, and only this member is decompressed up to the offset.
+    """
+
+    if (self.gzip_members == None):
+      self.file.seek(file_offset)
+      return
+
+    (comp_array, uncomp_array) = self.gzip_members
+
+    member_num = bisect.bisect_right(uncomp_array, file_offset) - 1
+
+    self.file.close()
+
+    self.file = gzip.open(self.file_name)
+    self.file.fileobj.seek(comp_array[member_num])  # Start of member
+
+    # Offsets of the re-opened file are relative to the start of the member
+    #
+    self.file.seek(file_offset - uncomp_array[member_num])
+
+  # ---------------------------------------------------------------------------
+
   def write(self, rec_dict):
     """Write one or more records into the data set.
        See implementations in derived classes for details.
@@ -270,6 +925,51 @@ class DataSet:
 
   # ---------------------------------------------------------------------------
 
+  def write_many(self, rec_iter):
+    """Write the records from the given iterable (like a list or an iterator),
+       which must return tuples (record identifier, record field list), into
+       the data set in the given order.
+
+       This default implementation writes one record after the other using
+       write(), see implementations in derived classes for details.
+    """
+
+    for (rec_ident, rec) in rec_iter:
+      self.write({rec_ident:rec})
+
+  # ---------------------------------------------------------------------------
+
+  def get_fingerprint(self):
+    """Return a string (a MD5 hex digest) that identifies the data set and its
+       content, so that data derived from it (like a saved index) can be
+       recognised as being out of date.
+
+       The fingerprint is calculated from the data set type, its field list,
+       record identifier, the field cleaning settings and number of records,
+       and for data sets stored in a file from the file's name, size and
+       modification time. Changes in memory based data sets that do not alter
+       these values can therefore not be detected.
+    """
+
+    fingerprint_list = [self.__class__.__name__, self.field_list,
+                        self.rec_ident, self.strip_fields, self.miss_val,
+                        self.num_records]
+
+    file_name_list = getattr(self, 'file_name_list', None)
+
+    if (file_name_list == None):
+      file_name_list = [getattr(self, 'file_name', None)]
+
+    for file_name in file_name_list:
+      if ((file_name != None) and (os.path.isfile(file_name))):
+        file_stat = os.stat(file_name)
+        fingerprint_list += [os.path.abspath(file_name), file_stat.st_size,
+                             repr(file_stat.st_mtime)]
+
+    return hashlib.md5(repr(fingerprint_list)).hexdigest()
+
+  # ---------------------------------------------------------------------------
+
   def analyse(self, sample, word_analysis, log_funct=None, log_num_recs=None):
     """Read the data and analyse a sample (or all) of the records in it.
 
@@ -716,16 +1416,24 @@ class DataSetCSV(DataSet):
      Possible values for the 'access_mode' argument are: 'read', 'write', or
      'append' (but not 'readwrite').
 
-     If the file name ends with '.gz' it is assumed the file is GZIP compressed
-     and it will be opened using the gzip library. This will only be checked
-     when opening a CSV data set for reading, writing and appending will always
-     be into uncompressed files.
+     If the file name ends with '.gz', '.bz2' or '.xz' it is assumed the file
+     is GZIP, BZIP2 or XZ compressed and it will be decompressed when read (XZ
+     files need the 'lzma' module). This will only be checked when opening a
+     CSV data set for reading, writing and appending will always be into
+     uncompressed files.
+
+     For reading, the file name can also be a pattern (like 'data-*.csv.gz')
+     matching several files (parts) which are then read one after the other
+     (in the order of their sorted names) as one data set. If there is a header
+     line then each file must start with it. Generated record identifiers are
+     unique over all files.
 
      The additional arguments (besides the base class arguments) which have to
      be set when this data set is initialised are:
 
        file_name         A string containing the name of the underlying CSV
-                         file.
+                         file, or a pattern matching several files (only for
+                         access mode "read").
        delimiter         A one character string which designates the delimter
                          used to split a line into columns/attributes. Default
                          value is a comma (','), aother commen alternative is
@@ -741,6 +1449,26 @@ class DataSetCSV(DataSet):
                          'write' or 'append' (only if file empty) mode.
        write_quote_char  A quote character, used when writing to file. Default
                          is no quote character (empty string '').
+       write_buffer_size The number of bytes that are buffered before they are
+                         written into the file when it is opened in 'write' or
+                         'append' mode. If set to 0 (default) the file is
+                         flushed at the end of each call to write() or
+                         write_many(), otherwise the file is only flushed once
+                         the buffer is full (and when the data set is
+                         finalised).
+       offset_index      A flag, if set to True (and access mode is "read") the
+                         byte offsets of all records are stored in a sidecar
+                         file (the file name with '.idx' appended) so that
+                         read(s,n) can seek directly to record s instead of
+                         reading all records before it. Only possible for
+                         data sets made of one file. For GZIP files made of
+                         several members (like BGZF files) the seek starts at
+                         the member containing record s, while for other GZIP
+                         files it has to decompress all data before record s.
+                         Default is False.
+       decompress_thread A flag, if set to True (default) compressed files are
+                         read and decompressed in a background thread, so that
+                         decompressing and parsing of records can overlap.
 
      Note that all values returned from a CSV data set (from it's read methods)
      are strings, while non-string values written to the data set will be
@@ -761,8 +1489,15 @@ class DataSetCSV(DataSet):
     self.write_header =     False  # Flag, set to not write header line
     self.file =             None   # File pointer to current file
     self.write_quote_char = ''     # The quote character for writing fields
+    self.write_buffer_size = 0     # Number of bytes buffered when writing
     self.delimiter  =       ','    # The delimiter character
+    self.offset_index =     False  # Flag, set to not use a record offset index
+    self.decompress_thread = True  # Flag, decompress files in background thread
+
+    self.file_name_list = None  # Names of all files of the data set
 
+    self.rec_offsets =   None  # Array with record offsets (if offset index)
+    self.gzip_members =  None  # Arrays with GZIP member offsets (if several)
     self.next_rec_num =  None
     self.rec_ident_col = -1    # Column of the record identifier field
 
@@ -788,6 +1523,11 @@ class DataSetCSV(DataSet):
         auxiliary.check_is_string('write_quote_char', value)
         self.write_quote_char = value
 
+      elif (keyword.startswith('write_bu')):
+        auxiliary.check_is_integer('write_buffer_size', value)
+        auxiliary.check_is_not_negative('write_buffer_size', value)
+        self.write_buffer_size = value
+
       elif (keyword.startswith('delimi')):
         auxiliary.check_is_string('delimiter', value)
         if (len(value) != 1):
@@ -796,6 +1536,14 @@ class DataSetCSV(DataSet):
           raise Exception
         self.delimiter = value
 
+      elif (keyword.startswith('offset_i')):
+        auxiliary.check_is_flag('offset_index', value)
+        self.offset_index = value
+
+      elif (keyword.startswith('decompress')):
+        auxiliary.check_is_flag('decompress_thread', value)
+        self.decompress_thread = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -818,25 +1566,25 @@ class DataSetCSV(DataSet):
     #
     if (self.access_mode == 'read'):
 
-      if (self.file_name.endswith('.gz')) or (self.file_name.endswith('.GZ')):
-        file_gzipped = True
+      # Get the names of all files if the file name is a pattern
+      #
+      if (os.path.isfile(self.file_name)):
+        self.file_name_list = [self.file_name]
+      else:
+        self.file_name_list = sorted(glob.glob(self.file_name))
 
-        try:
-          self.file = gzip.open(self.file_name) # Open gzipped file
-        except:
-          logging.exception('Cannot open gzipped CSV file "%s" for reading' % \
+        if (self.file_name_list == []):
+          logging.exception('Cannot find CSV file(s) "%s" for reading' % \
                             (self.file_name))
           raise IOError
 
-      else:  # Open normal file for reading
-        file_gzipped = False
+      if ((self.offset_index == True) and \
+          (self.file_name_list != [self.file_name])):
+        logging.exception('Offset index is only possible for CSV data ' + \
+                          'sets made of one file')
+        raise Exception
 
-        try:  # Try to open the file in read mode
-          self.file = open(self.file_name,'r')
-        except:
-          logging.exception('Cannot open CSV file "%s" for reading' % \
-                            (self.file_name))
-          raise IOError
+      self.file = self.__open_read_file__()
 
       # Initialise the CSV parser - - - - - - - - - - - - - - - - - - - - - - -
       #
@@ -855,32 +1603,31 @@ class DataSetCSV(DataSet):
           self.field_list.append((field_name,col_num))
           col_num += 1
 
-      # Count number of records in the file
+      # Count number of records in the file(s)
       #
-      if ((sys.platform[0:5] in ['linux','sunos']) and \
-          (file_gzipped == False)):  # Fast line counting
-        if (' ' not in self.file_name):
-          wc = os.popen('wc -l ' + self.file_name)
-        else:
-          wc = os.popen('wc -l "%s"' % (self.file_name))
+      num_rows = 0
 
-        num_rows = int(string.split(wc.readline())[0])
-        wc.close()
-      else:  # Slow line counting method
+      for file_name in self.file_name_list:
 
-        num_rows = 0
+        if ((sys.platform[0:5] in ['linux','sunos']) and \
+            (not file_name.lower().endswith(COMPRESSED_FILE_EXT))):
+          if (' ' not in file_name):  # Fast line counting
+            wc = os.popen('wc -l ' + file_name)
+          else:
+            wc = os.popen('wc -l "%s"' % (file_name))
 
-        if (file_gzipped == True):
-          fp = gzip.open(self.file_name)
-        else:
-          fp = open(self.file_name,'r')
-        for l in fp:
-          num_rows += 1
-        fp.close()
+          num_rows += int(string.split(wc.readline())[0])
+          wc.close()
+        else:  # Slow line counting method
+
+          fp = self.__open_data_file__(file_name, self.decompress_thread)
+          for l in fp:
+            num_rows += 1
+          fp.close()
 
       self.num_records = num_rows
       if (self.header_line == True):
-        self.num_records -= 1
+        self.num_records -= len(self.file_name_list)
 
       # Check that there are records in the data set
       #
@@ -894,8 +1641,13 @@ class DataSetCSV(DataSet):
 
       # Try to open the file in write mode
       #
+      self.file_name_list = [self.file_name]
+
       try:
-        self.file = open(self.file_name,'w')
+        if (self.write_buffer_size > 0):
+          self.file = open(self.file_name,'w',self.write_buffer_size)
+        else:
+          self.file = open(self.file_name,'w')
       except:
         logging.exception('Cannot open CSV file "%s" for writing' % \
                           (self.file_name))
@@ -927,8 +1679,13 @@ class DataSetCSV(DataSet):
 
       # Try to open the file in append mode
       #
+      self.file_name_list = [self.file_name]
+
       try:
-        self.file = open(self.file_name,'a')
+        if (self.write_buffer_size > 0):
+          self.file = open(self.file_name,'a',self.write_buffer_size)
+        else:
+          self.file = open(self.file_name,'a')
       except:
         logging.exception('Cannot open CSV file "%s" for appending' % \
                           (self.file_name))
@@ -1012,8 +1769,12 @@ class DataSetCSV(DataSet):
               ('Header line', self.header_line),
               ('Write header', self.write_header),
               ('Quote character', self.write_quote_char),
+              ('Write buffer size', self.write_buffer_size),
               ('Record identifier column', self.rec_ident_col),
-              ('Delimiter', self.delimiter)])
+              ('Delimiter', self.delimiter),
+              ('Offset index', self.offset_index),
+              ('Number of files', len(self.file_name_list)),
+              ('Decompress thread', self.decompress_thread)])
 
   # ---------------------------------------------------------------------------
 
@@ -1031,8 +1792,11 @@ class DataSetCSV(DataSet):
 
     self.access_mode =  None
     self.file_name =    None
+    self.file_name_list = None
     self.num_records =  None
     self.next_rec_num = None
+    self.rec_offsets =  None
+    self.gzip_members = None
 
     # A log message - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     #
@@ -1040,6 +1804,26 @@ class DataSetCSV(DataSet):
 
   # ---------------------------------------------------------------------------
 
+  def __open_read_file__(self):
+    """Open the file(s) of the data set for reading and return a file, or an
+       iterator over the lines of all files if the data set is made of several
+       files. Should not be used from outside the module.
+
+       Compressed files are read in a background thread if 'decompress_thread'
+       is set to True and no offset index is used (which needs to seek in the
+       file).
+    """
+
+    use_thread = ((self.decompress_thread == True) and \
+                  (self.offset_index == False))
+
+    if (len(self.file_name_list) == 1):
+      return self.__open_data_file__(self.file_name_list[0], use_thread)
+    else:
+      return self.__read_file_lines__(self.file_name_list, use_thread)
+
+  # ---------------------------------------------------------------------------
+
   def __read_one_record__(self):
     """Read and return the next record. Should not be used from outside the
        module.
@@ -1081,6 +1865,30 @@ class DataSetCSV(DataSet):
 
   # ---------------------------------------------------------------------------
 
+  def __get_record_offsets__(self, in_file):
+    """Return an array with the byte offsets of the starts of all records in
+       the given (opened) file, which must be positioned after the header line
+       (if there is one).
+
+       The file is parsed with the CSV parser, so quoted values can contain
+       line breaks.
+    """
+
+    offset_array = array.array('L')
+
+    next_pos = in_file.tell()
+
+    # Read lines one by one so the file position is at the end of each record
+    #
+    for rec in csv.reader(iter(in_file.readline, ''),
+                          delimiter = self.delimiter):
+      offset_array.append(next_pos)
+      next_pos = in_file.tell()
+
+    return offset_array
+
+  # ---------------------------------------------------------------------------
+
   def read(self, *recs):
     """Read and return one or more records.
        - If no argument is given return the next record in the data set.
@@ -1155,15 +1963,26 @@ class DataSetCSV(DataSet):
 
       # Check if the start record number is at the current position or not
       #
-      if (start_num != self.next_rec_num):
+      if ((start_num != self.next_rec_num) and (self.offset_index == True)):
+
+        rec_offsets = self.__get_offset_index__()
+
+        if (start_num >= len(rec_offsets)):  # No more records in data set
+          return {}
+
+        self.__seek_data_file__(rec_offsets[start_num])  # Seek to start record
+
+        # Initialise the CSV parser as reader
+        #
+        self.csv_parser = csv.reader(self.file, delimiter = self.delimiter)
+
+        self.next_rec_num = start_num  # Update record counter
+
+      elif (start_num != self.next_rec_num):
 
         self.file.close()  # Close currently open file
 
-        if (self.file_name.endswith('.gz')) or \
-           (self.file_name.endswith('.GZ')):
-          self.file = gzip.open(self.file_name) # Open gzipped file
-        else:
-          self.file = open(self.file_name,'r')  # Re-open file
+        self.file = self.__open_read_file__()  # Re-open file
 
         # Initialise the CSV parser as reader
         #
@@ -1206,40 +2025,197 @@ class DataSetCSV(DataSet):
 
   # ---------------------------------------------------------------------------
 
-  def readall(self):
+  def readall(self):
+    """An iterator which will return one record per call as a tuple (record
+       identifier, record field list).
+
+       The file is first closed and then re-opened returning the first record.
+    """
+
+    if (self.file == None):
+      logging.exception('Data set not initialised')
+      raise Exception
+
+    if (self.access_mode != 'read'):
+      logging.exception('Data set not initialised for "read" access')
+      raise Exception
+
+    self.file.close()  # Close currently open file
+
+    self.file = self.__open_read_file__()  # Re-open file
+
+    self.next_rec_num = 0   # Initialise next record counter
+
+    # Initialise the CSV parser as reader
+    #
+    self.csv_parser = csv.reader(self.file, delimiter = self.delimiter)
+
+    # Skip over header (if there is one) and skip to start record
+    #
+    if (self.header_line == True):
+      self.csv_parser.next()
+
+    for rec in self.csv_parser:
+
+      if (self.strip_fields == True):  # Strip leading and trailing whitespace
+        rec = map(string.strip, rec)
+
+      if (self.miss_val != None):  # Check for missing values in record
+        clean_rec = []
+        miss_val_list = self.miss_val  # Faster reference access
+
+        for val in rec:
+          if (val in miss_val_list):  # Found a missing value
+            clean_rec.append('')  # Replace with empty string
+          else:
+            clean_rec.append(val)
+        rec = clean_rec
+
+      if (self.rec_ident_col == -1):  # Generate record identifier
+        rec_ident = self.rec_ident+'-%d' % (self.next_rec_num)
+
+      else:  # Get record identifier from the record itself
+        rec_ident = rec[self.rec_ident_col]
+
+      self.next_rec_num += 1
+
+      yield (rec_ident,rec)
+
+  # ---------------------------------------------------------------------------
+
+  def read_batches(self, batch_size, fields=None):
+    """An iterator which will return (at most) 'batch_size' records per call
+       as a tuple (record identifier list, field value lists), with one field
+       value list (column) for each field in 'fields' (a list of field names,
+       default is all fields in the field list).
+
+       The file is first closed and then re-opened returning the first batch.
+       Only the given fields (and the record identifier field) are cleaned.
+    """
+
+    if (self.file == None):
+      logging.exception('Data set not initialised')
+      raise Exception
+
+    if (self.access_mode != 'read'):
+      logging.exception('Data set not initialised for "read" access')
+      raise Exception
+
+    field_num_list = self.__get_batch_field_nums__(batch_size, fields)
+
+    self.file.close()  # Close currently open file
+
+    self.file = self.__open_read_file__()  # Re-open file
+
+    self.next_rec_num = 0   # Initialise next record counter
+
+    # Initialise the CSV parser as reader
+    #
+    self.csv_parser = csv.reader(self.file, delimiter = self.delimiter)
+
+    # Skip over header (if there is one)
+    #
+    if (self.header_line == True):
+      self.csv_parser.next()
+
+    while True:
+
+      rec_list = list(itertools.islice(self.csv_parser, batch_size))
+
+      if (rec_list == []):  # No more records in data set
+        break
+
+      col_list = []
+
+      for field_num in field_num_list:
+        col = self.__get_batch_column__(rec_list, field_num)
+        col_list.append(self.__clean_batch_column__(col))
+
+      if (self.rec_ident_col == -1):  # Generate record identifiers
+        rec_ident_list = []
+        for rec_num in xrange(self.next_rec_num,
+                              self.next_rec_num+len(rec_list)):
+          rec_ident_list.append(self.rec_ident+'-%d' % (rec_num))
+
+      elif (self.rec_ident_col in field_num_list):
+        rec_ident_list = list(col_list[field_num_list.index(
+                                       self.rec_ident_col)])
+
+      else:  # Get record identifiers from the records themselves
+        col = self.__get_batch_column__(rec_list, self.rec_ident_col)
+        rec_ident_list = self.__clean_batch_column__(col)
+
+      self.next_rec_num += len(rec_list)
+
+      yield (rec_ident_list, col_list)
+
+  # ---------------------------------------------------------------------------
+
+  def get_shards(self, num_shards):
+    """Split the CSV file(s) into (approximately) the given number of byte
+       ranges and return a list of tuples (file_name, start_pos, end_pos), see
+       readshard().
+
+       If a data set is made of several files, each file is split into a
+       number of shards according to its size (at least one). Compressed
+       files are not split (one shard is returned per file).
+    """
+
+    auxiliary.check_is_integer('num_shards', num_shards)
+    auxiliary.check_is_positive('num_shards', num_shards)
+
+    if (len(self.file_name_list) == 1):
+      file_num_shards_list = [num_shards]
+
+    else:
+      file_size_list = map(os.path.getsize, self.file_name_list)
+      total_size = max(1, sum(file_size_list))
+
+      file_num_shards_list = []
+      for file_size in file_size_list:
+        file_num_shards = int(round(float(num_shards)*file_size / total_size))
+        file_num_shards_list.append(max(1, file_num_shards))
+
+    shard_list = []
+
+    for i in range(len(self.file_name_list)):
+      file_name = self.file_name_list[i]
+
+      for (start_pos, end_pos) in \
+          self.__get_file_shards__(file_num_shards_list[i], file_name):
+        shard_list.append((file_name, start_pos, end_pos))
+
+    return shard_list
+
+  # ---------------------------------------------------------------------------
+
+  def readshard(self, shard):
     """An iterator which will return one record per call as a tuple (record
-       identifier, record field list).
+       identifier, record field list) for all records that start within the
+       byte range of the given shard (a tuple (file_name, start_pos, end_pos)
+       as returned by get_shards()).
 
-       The file is first closed and then re-opened returning the first record.
-    """
+       The file is opened separately, so several shards can be read at the
+       same time. If record identifiers are generated None is returned as
+       record identifier.
 
-    if (self.file == None):
-      logging.exception('Data set not initialised')
-      raise Exception
+       Note that records must not contain line breaks (within quoted values)
+       if a file is read in several shards.
+    """
 
     if (self.access_mode != 'read'):
       logging.exception('Data set not initialised for "read" access')
       raise Exception
 
-    self.file.close()  # Close currently open file
-
-    if (self.file_name.endswith('.gz')) or (self.file_name.endswith('.GZ')):
-      self.file = gzip.open(self.file_name) # Open gzipped file
-    else:
-      self.file = open(self.file_name,'r')  # Re-open file
-
-    self.next_rec_num = 0   # Initialise next record counter
+    (file_name, start_pos, end_pos) = shard
 
-    # Initialise the CSV parser as reader
-    #
-    self.csv_parser = csv.reader(self.file, delimiter = self.delimiter)
+    shard_file = self.__open_data_file__(file_name, self.decompress_thread)
 
-    # Skip over header (if there is one) and skip to start record
-    #
-    if (self.header_line == True):
-      self.csv_parser.next()
+    csv_parser = csv.reader(self.__read_file_shard__(shard_file,
+                                                     (start_pos, end_pos)),
+                            delimiter = self.delimiter)
 
-    for rec in self.csv_parser:
+    for rec in csv_parser:
 
       if (self.strip_fields == True):  # Strip leading and trailing whitespace
         rec = map(string.strip, rec)
@@ -1255,16 +2231,16 @@ class DataSetCSV(DataSet):
             clean_rec.append(val)
         rec = clean_rec
 
-      if (self.rec_ident_col == -1):  # Generate record identifier
-        rec_ident = self.rec_ident+'-%d' % (self.next_rec_num)
+      if (self.rec_ident_col == -1):  # Record identifier is generated
+        rec_ident = None
 
       else:  # Get record identifier from the record itself
         rec_ident = rec[self.rec_ident_col]
 
-      self.next_rec_num += 1
-
       yield (rec_ident,rec)
 
+    shard_file.close()
+
   # ---------------------------------------------------------------------------
 
   def write(self, rec_dict):
@@ -1287,8 +2263,46 @@ class DataSetCSV(DataSet):
     rec_ident_keys = rec_dict.keys()
     rec_ident_keys.sort()
 
-    for rec_ident in rec_ident_keys:
-      rec = rec_dict[rec_ident]
+    rec_list = [(rec_ident, rec_dict[rec_ident]) for rec_ident in \
+                rec_ident_keys]
+
+    self.csv_parser.writerows(self.__get_write_records__(rec_list))
+
+    if (self.write_buffer_size == 0):
+      self.file.flush()
+
+  # ---------------------------------------------------------------------------
+
+  def write_many(self, rec_iter):
+    """Write the records from the given iterable (like a list or an iterator),
+       which must return tuples (record identifier, record field list), into
+       the CSV file in the given order (records are not sorted).
+    """
+
+    if (self.file == None):
+      logging.exception('Data set not initialised')
+      raise Exception
+
+    if (self.access_mode not in ['write','append']):
+      logging.exception('Data set not initialised for "write" or "append" ' + \
+                        'access')
+      raise Exception
+
+    self.csv_parser.writerows(self.__get_write_records__(rec_iter))
+
+    if (self.write_buffer_size == 0):
+      self.file.flush()
+
+  # ---------------------------------------------------------------------------
+
+  def __get_write_records__(self, rec_iter):
+    """An iterator which returns the records (lists of field values) from the
+       given iterable of tuples (record identifier, record field list) cleaned
+       and quoted as they are written into the CSV file, and which counts the
+       written records. Should not be used from outside the module.
+    """
+
+    for (rec_ident, rec) in rec_iter:
 
       if (self.strip_fields == True):  # Strip leading and trailing whitespace
         rec = map(string.strip,rec)
@@ -1307,12 +2321,10 @@ class DataSetCSV(DataSet):
       if (self.write_quote_char != ''):
         rec = map(lambda s:self.write_quote_char+s+self.write_quote_char, rec)
 
-      self.csv_parser.writerow(rec)  # Write record to file
-
       self.num_records +=  1
       self.next_rec_num += 1
 
-    self.file.flush()
+      yield rec
 
 # =============================================================================
 
@@ -1348,6 +2360,15 @@ class DataSetCOL(DataSet):
        write_header      A flag, if set to "True" a header line with the field
                          names is written into the file when it is opened in
                          'write' or 'append' (only if file empty) mode.
+       offset_index      A flag, if set to True (and access mode is "read") the
+                         byte offsets of all records are stored in a sidecar
+                         file (the file name with '.idx' appended) so that
+                         read(s,n) can seek directly to record s instead of
+                         reading all records before it. For GZIP files made
+                         of several members (like BGZF files) the seek starts
+                         at the member containing record s, while for other
+                         GZIP files it has to decompress all data before
+                         record s. Default is False.
 
      Note that all values returned from a COL data set (from it's read methods)
      are strings, while non-string values written to the data set will be
@@ -1367,8 +2388,12 @@ class DataSetCOL(DataSet):
     self.header_line =      False  # Flag, default set to no header line
     self.write_header =     False  # Flag, set to not write header line
     self.file =             None   # File pointer to current file
+    self.offset_index =     False  # Flag, set to not use a record offset index
 
     self.col_start_end = None  # List of tuples with column starts and ends
+    self.col_struct =    None  # Struct to unpack all fields of a line
+    self.rec_offsets =   None  # Array with record offsets (if offset index)
+    self.gzip_members =  None  # Arrays with GZIP member offsets (if several)
     self.next_rec_num =  None
 
     self.rec_ident_field = -1    # Number of the record identifier field
@@ -1391,6 +2416,10 @@ class DataSetCOL(DataSet):
         auxiliary.check_is_flag('write_header', value)
         self.write_header = value
 
+      elif (keyword.startswith('offset_i')):
+        auxiliary.check_is_flag('offset_index', value)
+        self.offset_index = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -1438,6 +2467,11 @@ class DataSetCOL(DataSet):
       self.col_start_end.append((start_col, start_col+col_width))
       start_col += col_width
 
+    # Pre-compile a struct that unpacks all fields of a line at once
+    #
+    self.col_struct = struct.Struct(''.join(['%ds' % (e-s) for (s,e) in \
+                                             self.col_start_end]))
+
     auxiliary.check_is_string('file_name', self.file_name)
 
     # Now perform various checks for each access mode and open file - - - - - -
@@ -1609,7 +2643,8 @@ class DataSetCOL(DataSet):
               ('Header line', self.header_line),
               ('Write header', self.write_header),
               ('Column start and ends', self.col_start_end),
-              ('Record identifier field number', self.rec_ident_field)])
+              ('Record identifier field number', self.rec_ident_field),
+              ('Offset index', self.offset_index)])
 
   # ---------------------------------------------------------------------------
 
@@ -1629,6 +2664,8 @@ class DataSetCOL(DataSet):
     self.file_name =    None
     self.num_records =  None
     self.next_rec_num = None
+    self.rec_offsets =  None
+    self.gzip_members = None
 
     # A log message - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     #
@@ -1651,19 +2688,7 @@ class DataSetCOL(DataSet):
     if (file_line == ''):  # Reached end of file
       return {}
 
-    rec = []  # Extract fields from file string
-
-    for (s,e) in self.col_start_end:
-      field_val = file_line[s:e]  # Extract a field name
-
-      if (self.strip_fields == True):  # Strip leading and trailing whitespace
-        field_val =  field_val.strip()
-
-      if (self.miss_val != None):  # Check for missing values in record
-        if (field_val in self.miss_val):
-          field_val = ''  # Found a missing value
-
-      rec.append(field_val)
+    rec = self.__get_line_records__([file_line])[0]
 
     if (self.rec_ident_field == -1):  # Generate or get record identifier
       rec_ident = self.rec_ident+'-%d' % (self.next_rec_num)
@@ -1677,6 +2702,46 @@ class DataSetCOL(DataSet):
 
   # ---------------------------------------------------------------------------
 
+  def __get_line_records__(self, line_list):
+    """Extract the fields from all lines in the given list and return a list
+       with one record (list of field values) per line. Should not be used
+       from outside the module.
+
+       Lines that are long enough are unpacked with the pre-compiled struct,
+       shorter lines are sliced field by field. Missing values are only
+       searched for in records that contain at least one of them.
+    """
+
+    unpack_funct = self.col_struct.unpack_from  # Faster reference access
+    struct_size =  self.col_struct.size
+
+    rec_list = []
+
+    for file_line in line_list:
+
+      if (len(file_line) >= struct_size):
+        rec = unpack_funct(file_line)
+      else:  # Line too short for struct
+        rec = [file_line[s:e] for (s,e) in self.col_start_end]
+
+      if (self.strip_fields == True):  # Strip leading and trailing whitespace
+        rec_list.append(map(str.strip, rec))
+      else:
+        rec_list.append(list(rec))
+
+    if (self.miss_val != None):  # Check for missing values in records
+      miss_val_set = set(self.miss_val)
+
+      for rec in rec_list:
+        if (not miss_val_set.isdisjoint(rec)):
+          for i in range(len(rec)):
+            if (rec[i] in miss_val_set):  # Found a missing value
+              rec[i] = ''  # Replace with empty string
+
+    return rec_list
+
+  # ---------------------------------------------------------------------------
+
   def read(self, *recs):
     """Read and return one or more records.
        - If no argument is given return the next record in the data set.
@@ -1751,7 +2816,18 @@ class DataSetCOL(DataSet):
 
       # Check if the start record number is at the current position or not
       #
-      if (start_num != self.next_rec_num):
+      if ((start_num != self.next_rec_num) and (self.offset_index == True)):
+
+        rec_offsets = self.__get_offset_index__()
+
+        if (start_num >= len(rec_offsets)):  # No more records in data set
+          return {}
+
+        self.__seek_data_file__(rec_offsets[start_num])  # Seek to start record
+
+        self.next_rec_num = start_num  # Update record counter
+
+      elif (start_num != self.next_rec_num):
 
         self.file.close()  # Close currently open file
 
@@ -1828,31 +2904,152 @@ class DataSetCOL(DataSet):
     if (self.header_line == True):
       self.file.readline()
 
-    for file_line in self.file.xreadlines():
+    while True:
 
-      rec = []  # Extract fields from file string
+      # Read a block of lines and extract the fields of all of them
+      #
+      line_list = self.file.readlines(COL_READ_BLOCK_SIZE)
 
-      for (s,e) in self.col_start_end:
-        field_val = file_line[s:e]  # Extract a field name
+      if (line_list == []):  # Reached end of file
+        break
 
-        if (self.strip_fields == True):  # whitespace
-          field_val =  field_val.strip()
+      for rec in self.__get_line_records__(line_list):
 
-        if (self.miss_val != None):  # Check for missing values in record
-          if (field_val in self.miss_val):
-            field_val = ''  # Found a missing value
+        if (self.rec_ident_field == -1):  # Generate or get record identifier
+          rec_ident = self.rec_ident+'-%d' % (self.next_rec_num)
 
-        rec.append(field_val)
+        else:  # Get record identifier from the record itself
+          rec_ident = rec[self.rec_ident_field]
 
-      if (self.rec_ident_field == -1):  # Generate or get record identifier
-        rec_ident = self.rec_ident+'-%d' % (self.next_rec_num)
+        self.next_rec_num += 1
 
-      else:  # Get record identifier from the record itself
-        rec_ident = rec[self.rec_ident_field]
+        yield (rec_ident,rec)
 
-      self.next_rec_num += 1
+  # ---------------------------------------------------------------------------
 
-      yield (rec_ident,rec)
+  def read_batches(self, batch_size, fields=None):
+    """An iterator which will return (at most) 'batch_size' records per call
+       as a tuple (record identifier list, field value lists), with one field
+       value list (column) for each field in 'fields' (a list of field names,
+       default is all fields in the field list).
+
+       The file is first closed and then re-opened returning the first batch.
+       Only the given fields (and the record identifier field) are extracted
+       from the file lines.
+    """
+
+    if (self.file == None):
+      logging.exception('Data set not initialised')
+      raise Exception
+
+    if (self.access_mode != 'read'):
+      logging.exception('Data set not initialised for "read" access')
+      raise Exception
+
+    field_num_list = self.__get_batch_field_nums__(batch_size, fields)
+
+    self.file.close()  # Close currently open file
+
+    if (self.file_name.endswith('.gz')) or (self.file_name.endswith('.GZ')):
+      self.file = gzip.open(self.file_name) # Open gzipped file
+    else:
+      self.file = open(self.file_name,'r')  # Re-open file
+
+    self.next_rec_num = 0   # Initialise next record counter
+
+    # Skip over header (if there is one)
+    #
+    if (self.header_line == True):
+      self.file.readline()
+
+    line_iter = iter(self.file.readline, '')
+
+    while True:
+
+      line_list = list(itertools.islice(line_iter, batch_size))
+
+      if (line_list == []):  # No more records in data set
+        break
+
+      col_list = []
+
+      for field_num in field_num_list:
+        (s,e) = self.col_start_end[field_num]
+        col = [file_line[s:e] for file_line in line_list]
+        col_list.append(self.__clean_batch_column__(col))
+
+      if (self.rec_ident_field == -1):  # Generate record identifiers
+        rec_ident_list = []
+        for rec_num in xrange(self.next_rec_num,
+                              self.next_rec_num+len(line_list)):
+          rec_ident_list.append(self.rec_ident+'-%d' % (rec_num))
+
+      elif (self.rec_ident_field in field_num_list):
+        rec_ident_list = list(col_list[field_num_list.index(
+                                       self.rec_ident_field)])
+
+      else:  # Get record identifiers from the records themselves
+        (s,e) = self.col_start_end[self.rec_ident_field]
+        col = [file_line[s:e] for file_line in line_list]
+        rec_ident_list = self.__clean_batch_column__(col)
+
+      self.next_rec_num += len(line_list)
+
+      yield (rec_ident_list, col_list)
+
+  # ---------------------------------------------------------------------------
+
+  def get_shards(self, num_shards):
+    """Split the COL file into the given number of byte ranges and return a
+       list of tuples (start_pos, end_pos), see readshard().
+
+       GZIP compressed files are not split (one shard is returned).
+    """
+
+    return self.__get_file_shards__(num_shards)
+
+  # ---------------------------------------------------------------------------
+
+  def readshard(self, shard):
+    """An iterator which will return one record per call as a tuple (record
+       identifier, record field list) for all records that start within the
+       byte range of the given shard (a tuple (start_pos, end_pos) as returned
+       by get_shards()).
+
+       The file is opened separately, so several shards can be read at the
+       same time. If record identifiers are generated None is returned as
+       record identifier.
+    """
+
+    if (self.access_mode != 'read'):
+      logging.exception('Data set not initialised for "read" access')
+      raise Exception
+
+    if (self.file_name.endswith('.gz')) or (self.file_name.endswith('.GZ')):
+      shard_file = gzip.open(self.file_name) # Open gzipped file
+    else:
+      shard_file = open(self.file_name,'r')
+
+    line_iter = self.__read_file_shard__(shard_file, shard)
+
+    while True:
+
+      line_list = list(itertools.islice(line_iter, 10000))
+
+      if (line_list == []):  # End of shard reached
+        break
+
+      for rec in self.__get_line_records__(line_list):
+
+        if (self.rec_ident_field == -1):  # Record identifier is generated
+          rec_ident = None
+
+        else:  # Get record identifier from the record itself
+          rec_ident = rec[self.rec_ident_field]
+
+        yield (rec_ident,rec)
+
+    shard_file.close()
 
   # ---------------------------------------------------------------------------
 
@@ -2097,6 +3294,65 @@ class DataSetMemory(DataSet):
 
   # ---------------------------------------------------------------------------
 
+  def get_shards(self, num_shards):
+    """Split the records into the given number of ranges (in the order as
+       returned by readall()) and return a list with one list of record keys
+       per shard, see readshard().
+    """
+
+    auxiliary.check_is_integer('num_shards', num_shards)
+    auxiliary.check_is_positive('num_shards', num_shards)
+
+    rec_key_list = self.dict.keys()
+    num_rec_keys = len(rec_key_list)
+
+    shard_list = []
+
+    for i in range(num_shards):
+      shard_list.append(rec_key_list[num_rec_keys*i / num_shards: \
+                                     num_rec_keys*(i+1) / num_shards])
+
+    return shard_list
+
+  # ---------------------------------------------------------------------------
+
+  def readshard(self, shard):
+    """An iterator which will return one record per call as a tuple (record
+       identifier, record field list) for all records with the keys in the
+       given shard (a list as returned by get_shards()).
+    """
+
+    if (self.dict == None):
+      logging.exception('Data set not initialised')
+      raise Exception
+
+    for rec_key in shard:
+      rec = self.dict[rec_key]
+
+      if (self.strip_fields == True):  # Strip leading and trailing whitespace
+        rec = map(string.strip, rec)
+
+      if (self.miss_val != None):  # Check for missing values in record
+        clean_rec = []
+        miss_val_list = self.miss_val  # Faster reference access
+
+        for val in rec:
+          if (val in miss_val_list):  # Found a missing value
+            clean_rec.append('')  # Replace with empty string
+          else:
+            clean_rec.append(val)
+        rec = clean_rec
+
+      if (self.rec_ident_col == -1):  # Use the dictionary key
+        rec_ident = rec_key
+
+      else:  # Get record identifier from the record itself
+        rec_ident = rec[self.rec_ident_col]
+
+      yield (rec_ident,rec)
+
+  # ---------------------------------------------------------------------------
+
   def write(self, rec_dict):
     """Write one or more records into the data set.
 
@@ -2150,10 +3406,16 @@ class DataSetShelve(DataSet):
      The additional arguments (besides the base class arguments) which have to
      be set when this data set is initialised are:
 
-       file_name  A string containing the name of the underlying shelve file.
-       clear      A flag (True or False), when True the content of the shelve
-                  database file will be cleared when opened. Default value is
-                  False.
+       file_name      A string containing the name of the underlying shelve
+                      file.
+       clear          A flag (True or False), when True the content of the
+                      shelve database file will be cleared when opened. Default
+                      value is False.
+       sync_interval  The number of records written into the shelve after
+                      which it is synchronised with the database file. If set
+                      to 0 (default) the shelve is synchronised at the end of
+                      each call to write() or write_many(). Unsynchronised
+                      records are written when the data set is finalised.
   """
 
   # ---------------------------------------------------------------------------
@@ -2168,6 +3430,9 @@ class DataSetShelve(DataSet):
     self.file_name = None   # The name of the shelve file (without extensions)
     self.clear =     False  # Flag (True or False) for clearing the database
                             # when opening or not
+    self.sync_interval = 0  # Number of records written between synchronising
+
+    self.num_unsynced = 0  # Number of records written since last synchronised
 
     self.shelve =        None  # The 'shelve'fFile pointer to current file
     self.db =            None  # A reference to the underlying databas
@@ -2187,6 +3452,11 @@ class DataSetShelve(DataSet):
         auxiliary.check_is_flag('clear', value)
         self.clear = value
 
+      elif (keyword.startswith('sync')):
+        auxiliary.check_is_integer('sync_interval', value)
+        auxiliary.check_is_not_negative('sync_interval', value)
+        self.sync_interval = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -2241,6 +3511,7 @@ class DataSetShelve(DataSet):
 
     self.log([('Shelve file name', self.file_name),
               ('Clear flag', self.clear),
+              ('Synchronise interval', self.sync_interval),
               ('Record identifier column', self.rec_ident_col)])
 
   # ---------------------------------------------------------------------------
@@ -2389,6 +3660,72 @@ class DataSetShelve(DataSet):
 
   # ---------------------------------------------------------------------------
 
+  def get_shards(self, num_shards):
+    """Split the records into the given number of ranges (in the order as
+       returned by readall()) and return a list with one list of record keys
+       per shard, see readshard().
+
+       Shelves can only be read by several processes at the same time if they
+       are stored using the 'dumbdbm' module (which opens the data file for
+       each access), for all other database modules one shard is returned.
+    """
+
+    auxiliary.check_is_integer('num_shards', num_shards)
+    auxiliary.check_is_positive('num_shards', num_shards)
+
+    rec_key_list = list(self.shelve)
+    num_rec_keys = len(rec_key_list)
+
+    if (whichdb.whichdb(self.file_name) != 'dumbdbm'):
+      num_shards = 1
+
+    shard_list = []
+
+    for i in range(num_shards):
+      shard_list.append(rec_key_list[num_rec_keys*i / num_shards: \
+                                     num_rec_keys*(i+1) / num_shards])
+
+    return shard_list
+
+  # ---------------------------------------------------------------------------
+
+  def readshard(self, shard):
+    """An iterator which will return one record per call as a tuple (record
+       identifier, record field list) for all records with the keys in the
+       given shard (a list as returned by get_shards()).
+    """
+
+    if (self.shelve == None):
+      logging.exception('Data set not initialised')
+      raise Exception
+
+    for rec_key in shard:
+      rec = self.shelve[rec_key]
+
+      if (self.strip_fields == True):
+        rec = map(string.strip, rec)
+
+      if (self.miss_val != None):  # Check for missing values in record
+        clean_rec = []
+        miss_val_list = self.miss_val  # Faster reference access
+
+        for val in rec:
+          if (val in miss_val_list):  # Found a missing value
+            clean_rec.append('')  # Replace with empty string
+          else:
+            clean_rec.append(val)
+        rec = clean_rec
+
+      if (self.rec_ident_col == -1):  # Use the dictionary key
+        rec_ident = rec_key
+
+      else:  # Get record identifier from the record itself
+        rec_ident = rec[self.rec_ident_col]
+
+      yield (rec_ident,rec)
+
+  # ---------------------------------------------------------------------------
+
   def write(self, rec_dict):
     """Write one or more records into the data set.
 
@@ -2396,19 +3733,30 @@ class DataSetShelve(DataSet):
        (identifiers) are checked for duplicates - if found warnings are logged.
     """
 
+    self.write_many(rec_dict.iteritems())
+
+  # ---------------------------------------------------------------------------
+
+  def write_many(self, rec_iter):
+    """Write the records from the given iterable (like a list or an iterator),
+       which must return tuples (record identifier, record field list), into
+       the shelve.
+
+       The shelve is synchronised with the database file at the end, or every
+       'sync_interval' records if this is larger than 0.
+    """
+
     if (self.shelve == None):
       logging.exception('Data set not initialised')
       raise Exception
 
-    for rec_ident in rec_dict:
+    for (rec_ident, rec) in rec_iter:
       if (rec_ident in self.shelve):
         logging.warn('Record with identifer "%s" is already in the memory ' % \
                      (rec_ident)+'data set - overwrite old version.')
       else:
         self.num_records += 1  # This is a new record
 
-      rec = rec_dict[rec_ident]  # Get record as a list of values
-
       if (self.strip_fields == True):  # Strip leading and trailing whitespace
         rec = map(string.strip, rec)
 
@@ -2424,7 +3772,15 @@ class DataSetShelve(DataSet):
         rec = clean_rec
 
       self.shelve[rec_ident] = rec
+      self.num_unsynced += 1
 
-    self.shelve.sync()  # And make sure the database is updated
+      if ((self.sync_interval > 0) and \
+          (self.num_unsynced >= self.sync_interval)):
+        self.shelve.sync()  # Make sure the database is updated
+        self.num_unsynced = 0
+
+    if ((self.sync_interval == 0) and (self.num_unsynced > 0)):
+      self.shelve.sync()  # And make sure the database is updated
+      self.num_unsynced = 0
 
 # =============================================================================
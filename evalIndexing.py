@@ -775,7 +775,8 @@ for ds_name in experiment_name_list:
                                                  padd = True,
                                                  block_method = (min_len, \
                                                                  max_block),
-                                                 suffix_method = 'allsubstr')
+                                                 suffix_method = 'allsubstr',
+                                                 build_method = 'array')
 
         ds_index_list.append(['suffix-array-substr', sarray_index])
 
@@ -828,6 +829,29 @@ for ds_name in experiment_name_list:
 
         ds_index_list.append(['q-gram', qgram_index])
 
+  # MinHash LSH indexing (only if NumPy is available) - - - - - - - - - - - - -
+  #
+  if (indexing.imp_numpy == True):
+    for q in [2,3]:
+      for (num_bands, band_size) in [(20,4), (10,6)]:
+
+        for this_index_def in index_def_list:
+
+          lsh_index = indexing.MinHashLSHIndex(desc = 'MinHash LSH index: ' + \
+                                  'q=%d, bands=%d, size=%d' % \
+                                  (q, num_bands, band_size),
+                                  dataset1 = data_set1,
+                                  dataset2 = data_set2,
+                                  rec_comparator = rec_cmp,
+                                  progress=progress_precentage,
+                                  index_def = this_index_def,
+                                  padd = True,
+                                  q = q,
+                                  num_bands = num_bands,
+                                  band_size = band_size)
+
+          ds_index_list.append(['minhash-lsh', lsh_index])
+
   # Canopy indexing (threshold based) - - - - - - - - - - - - - - - - - - - - -
   #
   for q in [2,3]:
@@ -847,7 +871,8 @@ for ds_name in experiment_name_list:
                                        index_def = this_index_def,
                                        padd = True,
                                        q = q,
-                                       canopy_m = canopy_method)
+                                       canopy_m = canopy_method,
+                                       vectorised = indexing.imp_numpy)
 
         ds_index_list.append(['canopy-th', canopy_index])
 
@@ -870,7 +895,8 @@ for ds_name in experiment_name_list:
                                        index_def = this_index_def,
                                        padd = True,
                                        q = q,
-                                       canopy_m = canopy_method)
+                                       canopy_m = canopy_method,
+                                       vectorised = indexing.imp_numpy)
 
         ds_index_list.append(['canopy-nn', canopy_index])
 
@@ -975,7 +1001,7 @@ for ds_name in experiment_name_list:
     m =  0  # Number of matches
     nm = 0  # Number of non-matches
 
-    for (rec_id1, rec_id2_set) in index_method.rec_pair_dict.iteritems():
+    for (rec_id1, rec_id2_set) in index_method.__get_rec_pair_iter__():
 
       rec1 = index_method.rec_cache1[rec_id1]
 
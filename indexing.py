@@ -69,6 +69,8 @@
                              index.
      QGramIndex              Allows for fuzzy indexing with 'overlapping'
                              blocks, like clustering.
+     MinHashLSHIndex         Based on MinHash signatures of q-gram sets and
+                             locality sensitive hashing of signature bands.
      CanopyIndex             Based on TF-IDF/Jaccard and canopy clustering.
      StringMapIndex          Based on the string-map multi-dimensional mapping
                              algorithm combined with canopy clustering.
@@ -90,6 +92,11 @@
                              index and comparisons of record pairs are all done
                              in the run() routine.
 
+   The records needed for the comparisons are kept in a record cache, which
+   by default is a dictionary. The ColumnarRecordCache class provides a more
+   compact alternative that stores only the fields used in comparisons, one
+   column per field.
+
    When initialising an index its index variables have to be defined using the
    attribute 'index_def' (see more details below).
 
@@ -99,12 +106,16 @@
    - compact  Make the indexing data structures more compact (more efficient
               for accessing the record pairs).
    - run      Run the comparison step (i.e. compare record pairs) on the index.
+              For most indices the record pairs can be compared in parallel by
+              setting the 'num_workers' argument of run() to the number of
+              worker processes to be used.
 
    Main bottlenecks in the implemented indices are:
    - QGramIndex:    Creating of the sub-lists (recursively), especially for
                     long index values and low thresholds. Two different
                     functions are implemented and used for different threshold
-                    values.
+                    values. Setting 'qgram_method' to 'prefix' avoids the
+                    sub-lists by using prefix and count filtering instead.
    - SortingIndex:  The way the inverted index data is combined when a sliding
                     window is created.
    - CanopyIndex:   Creating canopies, again especially for index values having
@@ -116,18 +127,525 @@
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
 import csv
+import array
+import bisect
+import collections
+import cPickle
+import hashlib
 import heapq
 import gc
+import itertools
 import logging
 import math
+import mmap
+import multiprocessing
+import os
 import random
 import shelve
+import struct
+import sys
 import time
+import zlib
 
 import auxiliary
 import dataset
 import encode
 
+try:  # NumPy is used (if available) for vectorised canopy clustering
+  import numpy
+  imp_numpy = True
+except:
+  imp_numpy = False
+
+# =============================================================================
+# Format of index files written by Indexing.save() (a magic string, the format
+# version, and the position and length of the pickled meta data dictionary)
+
+INDEX_FILE_MAGIC =           'FEBRLIDX'
+INDEX_FILE_VERSION =         1
+INDEX_FILE_PREAMBLE_FORMAT = '<8sIQQ'
+INDEX_FILE_PREAMBLE_SIZE =   struct.calcsize(INDEX_FILE_PREAMBLE_FORMAT)
+
+# =============================================================================
+# Functions used by the worker processes when data sets are read and indexed
+# in parallel (see method Indexing.__records_into_inv_index_parallel__())
+
+build_worker_state = {}  # Set in each worker process when it is started
+
+def init_build_worker(index):
+  """Initialise a worker process with the index to be built.
+  """
+
+  build_worker_state['index'] = index
+
+# -----------------------------------------------------------------------------
+
+def index_dataset_shard(shard_task):
+  """Read and index the records in one shard of a data set. The given task is
+     a tuple (data set number (0 or 1), shard).
+
+     See method Indexing.__index_shard__() for the returned values.
+  """
+
+  (ds_index, shard) = shard_task
+
+  return build_worker_state['index'].__index_shard__(ds_index, shard)
+
+# =============================================================================
+# Functions used by the worker processes when record pairs are compared in
+# parallel (see method Indexing.__compare_rec_pairs_parallel__())
+
+compare_worker_state = {}  # Set in each worker process when it is started
+
+def init_compare_worker(rec_comparator, length_filter_perc, cut_off_threshold):
+  """Initialise a worker process with the record comparator, and the length
+     filter (normalised to be between 0.0 and 1.0) and cut-off threshold
+     values (both can be None).
+  """
+
+  compare_worker_state['rec_comparator'] =     rec_comparator
+  compare_worker_state['length_filter_perc'] = length_filter_perc
+  compare_worker_state['cut_off_threshold'] =  cut_off_threshold
+
+# -----------------------------------------------------------------------------
+
+def compare_rec_pair_shard(rec_pair_shard):
+  """Compare all record pairs in the given shard (a list of tuples (rec_ident1,
+     rec1, rec2_list) with rec2_list containing tuples (rec_ident2, rec2)).
+
+     Returns a list with tuples (rec_ident1, rec_ident2, weight_vector) for all
+     record pairs that were compared and not removed by the cut-off threshold,
+     and the number of record pairs removed by length filtering and by the
+     cut-off threshold.
+  """
+
+  rec_comparator =     compare_worker_state['rec_comparator']  # Shorthands
+  rec_comp =           rec_comparator.compare
+  length_filter_perc = compare_worker_state['length_filter_perc']
+  cut_off_threshold =  compare_worker_state['cut_off_threshold']
+
+  w_vec_list =                []
+  num_rec_pairs_filtered =    0
+  num_rec_pairs_below_thres = 0
+
+  rec_length_cache = {}
+
+  for (rec_ident1, rec1, rec2_list) in rec_pair_shard:
+
+    if (length_filter_perc != None):
+      rec1_len = len(''.join(rec1))
+
+    for (rec_ident2, rec2) in rec2_list:
+
+      if (length_filter_perc != None):
+        if (rec_ident2 in rec_length_cache):
+          rec2_len = rec_length_cache[rec_ident2]
+        else:
+          rec2_len = len(''.join(rec2))
+          rec_length_cache[rec_ident2] = rec2_len
+
+        perc_diff = float(abs(rec1_len - rec2_len)) / max(rec1_len, rec2_len)
+
+        if (perc_diff > length_filter_perc):
+          num_rec_pairs_filtered += 1
+          continue  # Difference too large, don't do comparison
+
+      w_vec = rec_comp(rec1, rec2)
+
+      if (cut_off_threshold == None) or (sum(w_vec) >= cut_off_threshold):
+        w_vec_list.append((rec_ident1, rec_ident2, w_vec))
+      else:
+        num_rec_pairs_below_thres += 1
+
+  rec_comparator.flush_cache()  # Commit weights added to cache files
+
+  return (w_vec_list, num_rec_pairs_filtered, num_rec_pairs_below_thres)
+
+# =============================================================================
+# Functions used by the worker processes when the chunks of records from the
+# large data set are processed in parallel (see method
+# BigMatchIndex.__compare_large_rec_chunks_parallel__())
+
+bigmatch_worker_state = {}  # Set in each worker process when it is started
+
+def init_bigmatch_worker(index, length_filter_perc, cut_off_threshold):
+  """Initialise a worker process with the BigMatch index, and the length
+     filter (normalised to be between 0.0 and 1.0) and cut-off threshold
+     values (both can be None).
+  """
+
+  bigmatch_worker_state['index'] =              index
+  bigmatch_worker_state['length_filter_perc'] = length_filter_perc
+  bigmatch_worker_state['cut_off_threshold'] =  cut_off_threshold
+
+# -----------------------------------------------------------------------------
+
+def compare_large_rec_chunk(large_rec_chunk):
+  """Compare the records in the given chunk from the large data set with the
+     records from the small data set.
+
+     See method BigMatchIndex.__compare_large_rec_chunk__() for the returned
+     values.
+  """
+
+  index =              bigmatch_worker_state['index']  # Shorthands
+  length_filter_perc = bigmatch_worker_state['length_filter_perc']
+  cut_off_threshold =  bigmatch_worker_state['cut_off_threshold']
+
+  chunk_result = index.__compare_large_rec_chunk__(large_rec_chunk,
+                                                   length_filter_perc,
+                                                   cut_off_threshold)
+
+  index.rec_comparator.flush_cache()  # Commit weights added to cache files
+
+  return chunk_result
+
+# =============================================================================
+
+class ColumnarRecordCache:
+  """A record cache that stores only the fields of records that are used by
+     the record comparator, with one column per used field rather than one
+     list per record. It can be used instead of a dictionary (or shelve) record
+     cache, and is created by an index if its 'rec_cache_storage' argument is
+     set to 'columnar' or 'columnar_buffer'.
+
+     Each record is given a row number (in the order records are added), and
+     a dictionary maps record identifiers to row numbers. Two storage methods
+     are possible for the columns:
+
+       intern  Each column is a list of interned strings, so a value that
+               occurs in many records is only stored once.
+       buffer  All values are stored in one character buffer, and each column
+               consists of two integer arrays with the start offsets and
+               lengths of its values in this buffer. Unicode values are stored
+               UTF-8 encoded (and returned as byte strings).
+
+     The dictionary methods (record access, membership test, length, keys,
+     values, items and their iterators, get, delete and clear) return and
+     accept records as lists with the same number of fields as the data set,
+     with all fields not used in comparisons set to the empty string ''.
+     Deleting a record only removes its identifier, its row (and values in
+     the buffer) are not re-used.
+
+     In addition, records can be accessed by row number, and whole columns
+     can be retrieved (for example for batch comparisons).
+
+     A cache with 'buffer' storage can also be set to use an existing read-only
+     character buffer (such as a memory-mapped index file, see the save() and
+     load() methods of indices) using the map_buffer() method, in which case
+     the values are not copied into memory. Such a cache cannot be modified.
+  """
+
+  def __init__(self, num_fields, field_ind_list, storage = 'intern'):
+    """Constructor. Arguments are the number of fields in the data set, the
+       list of the indices of the fields to be stored, and the storage method
+       (either 'intern' or 'buffer').
+    """
+
+    auxiliary.check_is_integer('num_fields', num_fields)
+    auxiliary.check_is_list('field_ind_list', field_ind_list)
+
+    if (storage not in ['intern', 'buffer']):
+      logging.exception('Illegal value for storage method, must be ' + \
+                        '"intern" or "buffer": "%s"' % (str(storage)))
+      raise Exception
+
+    self.num_fields =     num_fields
+    self.field_ind_list = sorted(field_ind_list)
+    self.storage =        storage
+
+    for field_ind in self.field_ind_list:
+      if ((field_ind < 0) or (field_ind >= num_fields)):
+        logging.exception('Field index %d is outside the range of fields ' % \
+                          (field_ind) + '(0 to %d)' % (num_fields-1))
+        raise Exception
+
+    self.clear()
+
+  # ---------------------------------------------------------------------------
+
+  def clear(self):
+    """Remove all records from the cache.
+    """
+
+    self.row_dict =       {}  # Record identifiers to row numbers
+    self.rec_ident_list = []  # Row numbers to record identifiers (None if the
+                              # record has been deleted)
+    self.is_mapped =   False  # True if an external buffer is used
+
+    num_columns = len(self.field_ind_list)
+
+    if (self.storage == 'intern'):
+      self.column_list = [[] for i in range(num_columns)]
+
+    else:
+      self.buffer =       array.array('c')
+      self.column_list = [(array.array('L'), array.array('L')) \
+                          for i in range(num_columns)]
+
+  # ---------------------------------------------------------------------------
+
+  def map_buffer(self, rec_ident_list, char_buffer, column_list):
+    """Set the content of a cache with 'buffer' storage to the records with
+       the given identifiers (in row order), with their values stored in the
+       given character buffer (which can be any object that returns strings
+       when sliced, like a memory-mapped file) at the positions given in the
+       list of column arrays (tuples with start offsets and lengths, one tuple
+       per stored field).
+
+       The character buffer is not copied, and the cache can not be modified
+       afterwards (until it is cleared).
+    """
+
+    if (self.storage != 'buffer'):
+      logging.exception('Only a record cache with "buffer" storage can be ' + \
+                        'mapped to a character buffer')
+      raise Exception
+
+    if (len(column_list) != len(self.field_ind_list)):
+      logging.exception('Number of columns given (%d) is different from ' % \
+                        (len(column_list)) + 'number of fields stored (%d)' % \
+                        (len(self.field_ind_list)))
+      raise Exception
+
+    for (start_array, length_array) in column_list:
+      if ((len(start_array) != len(rec_ident_list)) or \
+          (len(length_array) != len(rec_ident_list))):
+        logging.exception('Length of column arrays is different from ' + \
+                          'number of records: %d' % (len(rec_ident_list)))
+        raise Exception
+
+    self.rec_ident_list = list(rec_ident_list)
+    self.row_dict = dict(itertools.izip(self.rec_ident_list,
+                                        xrange(len(self.rec_ident_list))))
+    self.buffer =      char_buffer
+    self.column_list = column_list
+    self.is_mapped =   True
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __get_char_buffer__(self):
+    """Return the character buffer in a form that returns strings when sliced.
+    """
+
+    if (self.is_mapped == True):
+      return self.buffer
+    else:
+      return buffer(self.buffer)  # A read-only view, re-created on each call
+                                  # as the array might have been re-allocated
+
+  # ---------------------------------------------------------------------------
+
+  def __setitem__(self, rec_ident, rec):
+    """Add a record (a list of fields) to the cache, or replace the values of
+       an existing record.
+    """
+
+    if (self.is_mapped == True):
+      logging.exception('A record cache mapped to a buffer can not be modified')
+      raise Exception
+
+    rec_len = len(rec)
+
+    row = self.row_dict.get(rec_ident, None)
+
+    if (row == None):  # A new record, append a new row
+      row = len(self.rec_ident_list)
+      self.row_dict[rec_ident] = row
+      self.rec_ident_list.append(rec_ident)
+      is_new_row = True
+    else:
+      is_new_row = False
+
+    for i in range(len(self.field_ind_list)):
+      field_ind = self.field_ind_list[i]
+
+      if (field_ind < rec_len):
+        val = rec[field_ind]
+      else:
+        val = ''
+
+      if (self.storage == 'intern'):
+        if (type(val) == str):
+          val = intern(val)
+
+        if (is_new_row == True):
+          self.column_list[i].append(val)
+        else:
+          self.column_list[i][row] = val
+
+      else:
+        if (isinstance(val, unicode)):
+          val = val.encode('utf-8')
+
+        (start_array, length_array) = self.column_list[i]
+
+        start = len(self.buffer)
+        self.buffer.fromstring(val)
+
+        if (is_new_row == True):
+          start_array.append(start)
+          length_array.append(len(val))
+        else:
+          start_array[row] =  start
+          length_array[row] = len(val)
+
+  # ---------------------------------------------------------------------------
+
+  def __getitem__(self, rec_ident):
+    """Return the record with the given identifier as a list of fields.
+    """
+
+    return self.get_row(self.row_dict[rec_ident])
+
+  # ---------------------------------------------------------------------------
+
+  def __delitem__(self, rec_ident):
+    """Remove the record with the given identifier from the cache.
+    """
+
+    if (self.is_mapped == True):
+      logging.exception('A record cache mapped to a buffer can not be modified')
+      raise Exception
+
+    row = self.row_dict.pop(rec_ident)
+    self.rec_ident_list[row] = None
+
+    if (self.storage == 'intern'):  # Release the values
+      for column in self.column_list:
+        column[row] = ''
+    else:
+      for (start_array, length_array) in self.column_list:
+        length_array[row] = 0
+
+  # ---------------------------------------------------------------------------
+
+  def __contains__(self, rec_ident):
+    return rec_ident in self.row_dict
+
+  def has_key(self, rec_ident):
+    return rec_ident in self.row_dict
+
+  def __len__(self):
+    return len(self.row_dict)
+
+  def get(self, rec_ident, default = None):
+    row = self.row_dict.get(rec_ident, None)
+    if (row == None):
+      return default
+    return self.get_row(row)
+
+  # ---------------------------------------------------------------------------
+
+  def iterkeys(self):
+    """Iterate over the record identifiers (in the order records were added).
+    """
+
+    for rec_ident in self.rec_ident_list:
+      if (rec_ident != None):
+        yield rec_ident
+
+  __iter__ = iterkeys
+
+  def itervalues(self):
+    for row in xrange(len(self.rec_ident_list)):
+      if (self.rec_ident_list[row] != None):
+        yield self.get_row(row)
+
+  def iteritems(self):
+    for row in xrange(len(self.rec_ident_list)):
+      rec_ident = self.rec_ident_list[row]
+      if (rec_ident != None):
+        yield (rec_ident, self.get_row(row))
+
+  def keys(self):
+    return list(self.iterkeys())
+
+  def values(self):
+    return list(self.itervalues())
+
+  def items(self):
+    return list(self.iteritems())
+
+  # ---------------------------------------------------------------------------
+
+  def get_row_num(self, rec_ident):
+    """Return the row number of the record with the given identifier.
+    """
+
+    return self.row_dict[rec_ident]
+
+  # ---------------------------------------------------------------------------
+
+  def get_rec_ident(self, row):
+    """Return the identifier of the record in the given row (None if the
+       record has been deleted).
+    """
+
+    return self.rec_ident_list[row]
+
+  # ---------------------------------------------------------------------------
+
+  def get_row(self, row):
+    """Return the record in the given row as a list of fields (with all fields
+       not stored set to '').
+    """
+
+    rec = [''] * self.num_fields
+
+    if (self.storage == 'intern'):
+      for i in range(len(self.field_ind_list)):
+        rec[self.field_ind_list[i]] = self.column_list[i][row]
+
+    else:
+      char_buffer = self.__get_char_buffer__()
+
+      for i in range(len(self.field_ind_list)):
+        (start_array, length_array) = self.column_list[i]
+        start = start_array[row]
+        rec[self.field_ind_list[i]] = char_buffer[start:start+length_array[row]]
+
+    return rec
+
+  # ---------------------------------------------------------------------------
+
+  def get_column(self, field_ind, row_list = None):
+    """Return a list with the values of the given field (its column index in
+       the data set) for the given list of row numbers, or for all rows if no
+       row list is given (including the rows of deleted records, which are
+       set to '').
+    """
+
+    if (field_ind not in self.field_ind_list):
+      if ((field_ind < 0) or (field_ind >= self.num_fields)):
+        logging.exception('Field index %d is outside the range of fields ' % \
+                          (field_ind) + '(0 to %d)' % (self.num_fields-1))
+        raise Exception
+
+      if (row_list == None):  # Field is not stored, all values are empty
+        return [''] * len(self.rec_ident_list)
+      else:
+        return [''] * len(row_list)
+
+    column = self.column_list[self.field_ind_list.index(field_ind)]
+
+    if (row_list == None):
+      row_list = xrange(len(self.rec_ident_list))
+
+    if (self.storage == 'intern'):
+      return [column[row] for row in row_list]
+
+    char_buffer = self.__get_char_buffer__()
+    (start_array, length_array) = column
+
+    val_list = []
+
+    for row in row_list:
+      start = start_array[row]
+      val_list.append(char_buffer[start:start+length_array[row]])
+
+    return val_list
+
 # =============================================================================
 
 class Indexing:
@@ -254,6 +772,68 @@ class Indexing:
                         Default value is None, in which case the weight vectors
                         will not be written into a file but returned as a
                         dictionary.
+       stream_rec_pairs A flag, if set to True the record pairs will not be
+                        collected into a record pair dictionary when an index
+                        is compacted. Instead only the blocks of record
+                        identifiers are kept, and the (de-duplicated) record
+                        pairs are generated block by block in the run() method
+                        while they are being compared. Memory use then depends
+                        upon the number of records in the blocks rather than
+                        the total number of record pairs. Default is False.
+       intern_rec_idents
+                        A flag, if set to True each record identifier is
+                        replaced with a record number (an integer, the position
+                        of the record in its data set) when the records are
+                        loaded into the inverted index. Blocks then are stored
+                        as compact integer arrays, and the record pairs as
+                        sorted integer arrays (one per first record). The keys
+                        of the weight vector dictionary returned by run() are
+                        then pairs of record numbers, which can be translated
+                        back into record identifiers using the lists returned
+                        by get_rec_ident_lists() (for example in the output
+                        module functions SaveMatchStatusFile() and
+                        SaveMatchDataSet()). Record identifiers written into a
+                        weight vector file are always the original ones. This
+                        is only supported by indices that are built using an
+                        inverted index (blocking, sorting, q-gram, string map
+                        and suffix array indices), the constructors of other
+                        indices raise an exception. Default is False.
+       rec_cache_storage
+                        How the records (with the fields needed for the
+                        comparisons) are kept in memory. Possible values are
+                        'dict' (one list of fields per record stored in a
+                        dictionary, or in a shelve if a record cache file name
+                        is given), 'columnar' or 'columnar_buffer' (a
+                        ColumnarRecordCache with 'intern' or 'buffer' storage
+                        that only stores the used fields column-wise, see the
+                        documentation of this class). Default is 'dict'.
+       num_build_workers
+                        If set to a positive integer the data sets are split
+                        into shards (byte ranges of CSV and COL files, or
+                        ranges of records of memory and shelve data sets, see
+                        the get_shards() method of data sets), which are read
+                        and indexed by this number of worker processes. The
+                        partial inverted indices of the shards are then merged
+                        in the order of the shards (inserting index values in
+                        the order they first occur), so the index built is the
+                        same as when the data sets are read by one process.
+                        This is only supported by indices that are built using
+                        an inverted index (blocking, sorting, q-gram, string
+                        map and suffix array indices), the constructors of
+                        other indices raise an exception. It requires a
+                        platform that supports fork(). Default is None (no
+                        worker processes).
+       index_val_cache_size
+                        The maximum number of entries in the memo caches that
+                        are used when index values are computed. One cache per
+                        index definition maps original field values to their
+                        final (encoded and truncated) index values, so that
+                        encoding functions are only called once for repeated
+                        field values (like common surnames or suburb names).
+                        If a cache becomes full it is cleared. The number of
+                        cache hits and misses is logged after records have
+                        been indexed. If set to 0 no caches are used. Default
+                        is 100000.
 
      Note that skip_missing cannot be set to False for certain index methods,
      see their documentation for more details.
@@ -262,6 +842,17 @@ class Indexing:
      is initialised.
   """
 
+  # Status values an index can have to be saved (and loaded again), see
+  # the save() method. Set in derived classes that support this.
+  #
+  INDEX_SAVE_STATUS_LIST = []
+
+  # Names of the index specific instance variables that influence the content
+  # of an index, used in the fingerprint of a saved index (see the save()
+  # method). Set in derived classes.
+  #
+  INDEX_PARAM_NAMES = []
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, base_kwargs):
@@ -280,6 +871,9 @@ class Indexing:
     self.progress_report = 10
     self.log_funct =       None
     self.weight_vec_file = None
+    self.stream_rec_pairs = False
+    self.intern_rec_idents = False
+    self.num_build_workers = None
 
     self.index_def_proc = None        # Processed version of the index
                                       # definition for faster access to field
@@ -298,6 +892,8 @@ class Indexing:
                                       # should be file (shelve) based this will
                                       # be it's file name
     self.rec_cache2_file_name = None  # Same for data sets 2
+    self.rec_cache_storage = 'dict'   # How records are stored in the record
+                                      # caches (see above)
     self.num_rec_pairs = None         # The number of record pairs that will be
                                       # compared when the run() method is
                                       # called
@@ -308,6 +904,26 @@ class Indexing:
                                       # indices)
     self.comp_field_used2 = []        # Same for data set 2
     self.rec_length_cache = {}        # Used in lenth filtering in run() method
+    self.rec_pair_dict = {}           # Record pairs generated in compact()
+    self.rec_pair_block_list = []     # In streaming mode a list of blocks (of
+                                      # record identifiers) from which record
+                                      # pairs are generated in run()
+    self.rec_block_dict1 = {}         # In streaming mode, for each record from
+                                      # data set 1 the numbers of the blocks it
+                                      # is contained in
+    self.rec_block_dict2 = {}         # Same for data set 2
+    self.rec_ident_list1 = []         # With interned record identifiers, the
+                                      # identifiers of all records from data
+                                      # set 1 (position is record number)
+    self.rec_ident_list2 = []         # Same for data set 2
+    self.index_val_cache_size = 100000  # Maximum size of each index value
+                                        # memo cache
+    self.index_val_cache_list = None  # One memo cache (dictionary) per index
+                                      # definition, same structure as the
+                                      # processed index definitions
+    self.index_val_cache_hits =   0   # Number of index values found in and not
+    self.index_val_cache_misses = 0   # found in the memo caches since the last
+                                      # statistics were logged
 
     # Process base keyword arguments (all data set specific keywords were
     # processed in the derived class constructor)
@@ -347,6 +963,14 @@ class Indexing:
         auxiliary.check_is_string('rec_cache2_file_name', value)
         self.rec_cache2_file_name = value
 
+      elif (keyword.startswith('rec_cache_s')):
+        if (value not in ['dict', 'columnar', 'columnar_buffer']):
+          logging.exception('Illegal value for record cache storage, must ' + \
+                            'be "dict", "columnar" or "columnar_buffer": ' + \
+                            '"%s"' % (str(value)))
+          raise Exception
+        self.rec_cache_storage = value
+
       elif (keyword.startswith('rec_com')):
         self.rec_comparator = value
 
@@ -375,6 +999,25 @@ class Indexing:
           auxiliary.check_is_string('weight_vec_file', value)
         self.weight_vec_file = value
 
+      elif (keyword.startswith('stream')):
+        auxiliary.check_is_flag('stream_rec_pairs', value)
+        self.stream_rec_pairs = value
+
+      elif (keyword.startswith('intern')):
+        auxiliary.check_is_flag('intern_rec_idents', value)
+        self.intern_rec_idents = value
+
+      elif (keyword.startswith('num_build')):
+        if (value != None):
+          auxiliary.check_is_integer('num_build_workers', value)
+          auxiliary.check_is_positive('num_build_workers', value)
+        self.num_build_workers = value
+
+      elif (keyword.startswith('index_val')):
+        auxiliary.check_is_integer('index_val_cache_size', value)
+        auxiliary.check_is_not_negative('index_val_cache_size', value)
+        self.index_val_cache_size = value
+
       else:
         logging.exception('Illegal constructor argument keyword: '+keyword)
         raise Exception
@@ -441,6 +1084,25 @@ class Indexing:
     self.comp_field_used1.sort()
     self.comp_field_used2.sort()
 
+    # Create columnar record caches if required - - - - - - - - - - - - - - - -
+    #
+    if (self.rec_cache_storage != 'dict'):
+      if ((self.rec_cache1_file_name != None) or \
+          (self.rec_cache2_file_name != None)):
+        logging.exception('Record cache file names cannot be given for a ' + \
+                          'columnar record cache')
+        raise Exception
+
+      if (self.rec_cache_storage == 'columnar'):
+        storage = 'intern'
+      else:
+        storage = 'buffer'
+
+      self.rec_cache1 = ColumnarRecordCache(len(self.dataset1.field_list),
+                                            self.comp_field_used1, storage)
+      self.rec_cache2 = ColumnarRecordCache(len(self.dataset2.field_list),
+                                            self.comp_field_used2, storage)
+
     # Check if definition of indices is correct and fields are in the data sets
     #
     self.index_def_proc = []  # Checked and processed index definitions will be
@@ -517,6 +1179,14 @@ class Indexing:
 
     assert len(self.index_def) == len(self.index_def_proc)
 
+    # Create one empty index value memo cache per index definition - - - - - -
+    #
+    if (self.index_val_cache_size > 0):
+      self.index_val_cache_list = []
+      for index_def_list_proc in self.index_def_proc:
+        self.index_val_cache_list.append([{} for index_def_proc in \
+                                          index_def_list_proc])
+
     self.status = 'initialised'  # Status of the index (used by save and load
                                  # methods)
 
@@ -542,6 +1212,14 @@ class Indexing:
        This method builds an inverted index (one per index definition) as a
        Python dictionary with the keys being the indexing values (as returned
        by the _get_index_values__() method.
+
+       If record identifiers are interned, each record is given a record number
+       (its position in the data set) which is used instead of its identifier,
+       and the blocks are stored as integer arrays.
+
+       If a number of build worker processes is set, the data sets are read
+       and indexed in shards by these processes (see
+       __records_into_inv_index_parallel__()).
     """
 
     logging.info('Started to build inverted index:')
@@ -563,17 +1241,33 @@ class Indexing:
     # - the data set to be read
     # - the comparison fields which are used
     # - a list index (0 for data set 1, 1 for data set 2)
+    # - the list of record identifiers (if they are interned)
     #
+    self.rec_ident_list1 = []
+    self.rec_ident_list2 = []
+
     build_list = [(self.index1, self.rec_cache1, self.dataset1,
-                   self.comp_field_used1, 0)] # For data set 1
+                   self.comp_field_used1, 0,
+                   self.rec_ident_list1)] # For data set 1
 
     if (self.do_deduplication == False):  # If linkage append data set 2
       build_list.append((self.index2, self.rec_cache2, self.dataset2,
-                   self.comp_field_used2, 1))
+                   self.comp_field_used2, 1, self.rec_ident_list2))
+    else:
+      self.rec_ident_list2 = self.rec_ident_list1
+
+    intern_rec_idents = self.intern_rec_idents
+
+    if (self.num_build_workers != None):  # Worker processes read the shards
+      pool = multiprocessing.Pool(self.num_build_workers, init_build_worker,
+                                  (self,))
+    else:
+      pool = None
 
     # Reading loop over all records in one or both data set(s) - - - - - - - -
     #
-    for (index,rec_cache,dataset,comp_field_used_list,ds_index) in build_list:
+    for (index,rec_cache,dataset,comp_field_used_list,ds_index, \
+         rec_ident_list) in build_list:
 
       # Calculate a counter for the progress report
       #
@@ -585,68 +1279,273 @@ class Indexing:
 
       start_time = time.time()
 
-      rec_read = 0  # Number of records read from data set
+      if (pool != None):
+        try:
+          self.__records_into_inv_index_parallel__(pool, index, rec_cache,
+                                                   dataset, ds_index,
+                                                   rec_ident_list,
+                                                   progress_report_cnt,
+                                                   start_time)
+        except:
+          pool.terminate()
+          pool.join()
+          logging.exception('Parallel reading and indexing of data set ' + \
+                            '"%s" failed' % (dataset.description))
+          raise Exception
 
-      for (rec_ident, rec) in dataset.readall(): # Read all records in data set
+      else:  # Read records in this process
 
-        # Extract record fields needed for comparisons (set all others to '')
-        #
-        comp_rec = []
+        rec_read = 0  # Number of records read from data set
 
-        field_ind = 0
-        for field in rec:
-          if (field_ind in comp_field_used_list):
-            comp_rec.append(field.lower())  # Make them lower case
-          else:
-            comp_rec.append('')
-          field_ind += 1
+        for (rec_ident, rec) in dataset.readall(): # Read all records
 
-        rec_cache[rec_ident] = comp_rec  # Put into record cache
+          if (intern_rec_idents == True):  # Replace with record number
+            rec_ident_list.append(rec_ident)
+            rec_ident = rec_read
 
-        # Now get the index variable values for this record - - - - - - - - - -
-        #
-        rec_index_val_list = get_index_values_funct(rec, ds_index)
+          # Extract record fields needed for comparisons (set all others to '')
+          #
+          comp_rec = []
 
-        for i in range(num_indices):  # Put record identifier into all indices
+          field_ind = 0
+          for field in rec:
+            if (field_ind in comp_field_used_list):
+              comp_rec.append(field.lower())  # Make them lower case
+            else:
+              comp_rec.append('')
+            field_ind += 1
 
-          this_index = index[i]  # Shorthand
+          rec_cache[rec_ident] = comp_rec  # Put into record cache
 
-          block_val = rec_index_val_list[i]
+          # Now get the index variable values for this record - - - - - - - -
+          #
+          rec_index_val_list = get_index_values_funct(rec, ds_index)
 
-          if ((block_val != '') or (skip_missing == False)):
-            block_val_rec_list = this_index.get(block_val, [])
-            block_val_rec_list.append(rec_ident)
-            this_index[block_val] = block_val_rec_list
+          for i in range(num_indices):  # Put record identifier into indices
 
-        rec_read += 1
+            this_index = index[i]  # Shorthand
 
-        if ((rec_read % progress_report_cnt) == 0):
-          self.__log_build_progress__(rec_read,dataset.num_records,start_time)
+            block_val = rec_index_val_list[i]
+
+            if ((block_val != '') or (skip_missing == False)):
+              if (intern_rec_idents == True):
+                block_val_rec_list = this_index.get(block_val, None)
+                if (block_val_rec_list == None):
+                  block_val_rec_list = array.array('i')
+              else:
+                block_val_rec_list = this_index.get(block_val, [])
+              block_val_rec_list.append(rec_ident)
+              this_index[block_val] = block_val_rec_list
+
+          rec_read += 1
+
+          if ((rec_read % progress_report_cnt) == 0):
+            self.__log_build_progress__(rec_read, dataset.num_records,
+                                        start_time)
 
       used_sec_str = auxiliary.time_string(time.time()-start_time)
       rec_time_str = auxiliary.time_string((time.time()-start_time) / \
                                            dataset.num_records)
       logging.info('Read and indexed %d records in %s (%s per record)' % \
                    (dataset.num_records, used_sec_str, rec_time_str))
+      self.__log_index_val_cache_stats__()
       logging.info('')
 
-  # ---------------------------------------------------------------------------
-  # Get sub-list functions are used for the q-gram and BigMatch index
+    if (pool != None):
+      pool.close()
+      pool.join()
 
-  def __get_sublists1__(self, in_list, min_len):
-    """An iterative method to compute all combinations of sub-lists of the list
-       'in_list' of lengths down to 'min_len'.
+  # ---------------------------------------------------------------------------
 
-       This routine seems to be faster for larger 'min_len' values (compared to
-       length of the input list), i.e. which would correspond to less deep
-       recursive levels (that correspond to higher threshold values) compared
-       to the recursive method using sets given below.
+  def __records_into_inv_index_parallel__(self, pool, index, rec_cache,
+                                          dataset, ds_index, rec_ident_list,
+                                          progress_report_cnt, start_time):
+    """Read and index the records of one data set using the given pool of
+       worker processes, and put them into the given index (one inverted index
+       per index definition) and record cache.
+
+       The data set is split into shards (four per worker process), each of
+       which is read and indexed by a worker process (see __index_shard__()).
+       The partial inverted indices returned by the workers are merged in the
+       order of the shards, so the blocks contain the records in the same
+       order as if the data set was read by one process. The index values are
+       also inserted in the order of their first occurrence in the data set,
+       which gives the inverted index dictionaries the same insertion order
+       (and thus iteration order) as when the data set is read by one process.
+       Indices which depend upon this order (such as StringMapIndex, which
+       takes its first pivot string from the dictionary keys) therefore build
+       the same index in both cases.
     """
 
-    all_list = [in_list]
-    in_len =   len(in_list)
+    num_indices =       len(self.index_def)
+    intern_rec_idents = self.intern_rec_idents
 
-    if (in_len > min_len):
+    shard_list = dataset.get_shards(4*self.num_build_workers)
+
+    logging.info('  Read and index %d shards of data set "%s" using %d ' % \
+                 (len(shard_list), dataset.description,
+                  self.num_build_workers) + 'worker processes')
+
+    shard_task_list = [(ds_index, shard) for shard in shard_list]
+
+    rec_read = 0  # Number of records read from data set (over all shards)
+
+    for (shard_rec_ident_list, shard_comp_rec_list, shard_index_list,
+         num_cache_hits, num_cache_misses) in \
+        pool.imap(index_dataset_shard, shard_task_list):
+
+      # Get the record identifiers (or numbers) of the records in this shard
+      #
+      rec_key_list = []
+
+      for shard_rec_num in xrange(len(shard_rec_ident_list)):
+        rec_ident = shard_rec_ident_list[shard_rec_num]
+
+        if (rec_ident == None):  # Generate record identifier
+          rec_ident = '%s-%d' % (dataset.rec_ident, rec_read)
+
+        if (intern_rec_idents == True):  # Replace with record number
+          rec_ident_list.append(rec_ident)
+          rec_ident = rec_read
+
+        rec_cache[rec_ident] = shard_comp_rec_list[shard_rec_num]
+        rec_key_list.append(rec_ident)
+
+        rec_read += 1
+
+      # Merge the partial inverted indices of the shard into the index - - - -
+      #
+      for i in range(num_indices):
+        this_index = index[i]  # Shorthand
+
+        for (block_val, shard_rec_num_list) in shard_index_list[i]:
+          if (intern_rec_idents == True):
+            block_val_rec_list = this_index.get(block_val, None)
+            if (block_val_rec_list == None):
+              block_val_rec_list = array.array('i')
+          else:
+            block_val_rec_list = this_index.get(block_val, [])
+          block_val_rec_list.extend([rec_key_list[shard_rec_num] for \
+                                     shard_rec_num in shard_rec_num_list])
+          this_index[block_val] = block_val_rec_list
+
+      self.index_val_cache_hits +=   num_cache_hits
+      self.index_val_cache_misses += num_cache_misses
+
+      if ((rec_read / progress_report_cnt) > \
+          ((rec_read - len(rec_key_list)) / progress_report_cnt)):
+        self.__log_build_progress__(rec_read, dataset.num_records, start_time)
+
+    if (rec_read != dataset.num_records):
+      logging.exception('Read %d records from the shards of data set "%s" ' % \
+                        (rec_read, dataset.description) + 'which contains ' + \
+                        '%d records' % (dataset.num_records))
+      raise Exception
+
+  # ---------------------------------------------------------------------------
+
+  def __index_shard__(self, ds_index, shard):
+    """Read the records in the given shard of data set 1 (if the data set
+       number is 0) or data set 2 (if it is 1) and build a partial inverted
+       index for them. This method is run in a worker process.
+
+       Returns a tuple with:
+       - the list of record identifiers (None for generated identifiers) of
+         all records in the shard, in the order they were read
+       - a list of the records (with only the fields needed for comparisons)
+       - a list with one list per index definition, containing tuples
+         (index value, list of record numbers (positions in the shard)) in
+         the order the index values first occur in the shard
+       - the numbers of index value cache hits and misses
+    """
+
+    if (ds_index == 0):
+      dataset =              self.dataset1
+      comp_field_used_list = self.comp_field_used1
+    else:
+      dataset =              self.dataset2
+      comp_field_used_list = self.comp_field_used2
+
+    num_indices =            len(self.index_def)
+    get_index_values_funct = self.__get_index_values__  # Shorthands
+    skip_missing =           self.skip_missing
+
+    self.index_val_cache_hits =   0
+    self.index_val_cache_misses = 0
+
+    shard_rec_ident_list = []
+    shard_comp_rec_list =  []
+    shard_index_list =     [{} for i in range(num_indices)]
+    shard_val_list =       [[] for i in range(num_indices)]  # Value order
+
+    shard_rec_num = 0
+
+    for (rec_ident, rec) in dataset.readshard(shard):
+
+      shard_rec_ident_list.append(rec_ident)
+
+      # Extract record fields needed for comparisons (set all others to '')
+      #
+      comp_rec = []
+
+      field_ind = 0
+      for field in rec:
+        if (field_ind in comp_field_used_list):
+          comp_rec.append(field.lower())  # Make them lower case
+        else:
+          comp_rec.append('')
+        field_ind += 1
+
+      shard_comp_rec_list.append(comp_rec)
+
+      # Now get the index variable values for this record - - - - - - - - - - -
+      #
+      rec_index_val_list = get_index_values_funct(rec, ds_index)
+
+      for i in range(num_indices):
+
+        block_val = rec_index_val_list[i]
+
+        if ((block_val != '') or (skip_missing == False)):
+          this_index = shard_index_list[i]  # Shorthand
+
+          block_val_rec_list = this_index.get(block_val, None)
+          if (block_val_rec_list == None):  # Index value first seen
+            block_val_rec_list = []
+            this_index[block_val] = block_val_rec_list
+            shard_val_list[i].append(block_val)
+          block_val_rec_list.append(shard_rec_num)
+
+      shard_rec_num += 1
+
+    # Return index values in first occurrence order, see
+    # __records_into_inv_index_parallel__()
+    #
+    for i in range(num_indices):
+      this_index = shard_index_list[i]
+      shard_index_list[i] = [(block_val, this_index[block_val]) for \
+                             block_val in shard_val_list[i]]
+
+    return (shard_rec_ident_list, shard_comp_rec_list, shard_index_list,
+            self.index_val_cache_hits, self.index_val_cache_misses)
+
+  # ---------------------------------------------------------------------------
+  # Get sub-list functions are used for the q-gram and BigMatch index
+
+  def __get_sublists1__(self, in_list, min_len):
+    """An iterative method to compute all combinations of sub-lists of the list
+       'in_list' of lengths down to 'min_len'.
+
+       This routine seems to be faster for larger 'min_len' values (compared to
+       length of the input list), i.e. which would correspond to less deep
+       recursive levels (that correspond to higher threshold values) compared
+       to the recursive method using sets given below.
+    """
+
+    all_list = [in_list]
+    in_len =   len(in_list)
+
+    if (in_len > min_len):
 
       for i in xrange(in_len):
 
@@ -725,6 +1624,272 @@ class Indexing:
         for sub_list in unique_combinations_funct(in_list[i+1:], n-1):
           yield in_list[i] + sub_list
 
+  # ---------------------------------------------------------------------------
+  # Suffix array functions are used for the suffix array indices
+
+  def __build_suffix_array__(self, index_val_list):
+    """Build a suffix array over all the given index values.
+
+       The index values are concatenated into one string buffer (each followed
+       by a separator character), and the suffix array is an integer array of
+       the offsets of all suffixes in this buffer sorted alphabetically, where
+       each suffix ends with the separator of its index value. No suffix
+       strings are created, suffixes are sorted using buffer objects. The LCP
+       array is then calculated in linear time (Kasai et al., CPM 2001).
+
+       Returns a tuple (buffer string, suffix array, LCP array, value number
+       array, value end array), where the LCP array contains for each suffix
+       array position the length of the longest common prefix with the suffix
+       in the previous position, the value number array the number of the
+       index value each suffix belongs to, and the value end array the offset
+       of the separator ending each index value.
+    """
+
+    sep_char = chr(0)
+
+    suffix_buf = sep_char.join(index_val_list) + sep_char
+    buf_len =    len(suffix_buf)
+
+    offset_val_num = array.array('i', [0])*buf_len  # Value number per offset
+    val_end_list =   array.array('i')
+
+    offset = 0
+    for val_num in xrange(len(index_val_list)):
+      val_end = offset + len(index_val_list[val_num])
+      offset_val_num[offset:val_end] = array.array('i', [val_num]) * \
+                                       (val_end-offset)
+      val_end_list.append(val_end)
+      offset = val_end+1
+
+    # Sort the offsets of all suffixes (excluding separators) - - - - - - - - -
+    #
+    suffix_list = [o for o in xrange(buf_len) if (suffix_buf[o] != sep_char)]
+    suffix_list.sort(key = lambda o: buffer(suffix_buf, o))
+
+    suffix_array = array.array('i', suffix_list)
+    del suffix_list
+
+    num_suffix = len(suffix_array)
+
+    val_num_array = array.array('i', [offset_val_num[o] for o in suffix_array])
+    del offset_val_num
+
+    # Calculate the LCP array, with common prefixes ending at separators - - -
+    #
+    rank_array = array.array('i', [0])*buf_len
+    for p in xrange(num_suffix):
+      rank_array[suffix_array[p]] = p
+
+    lcp_array = array.array('i', [0])*num_suffix
+
+    h = 0
+    for o in xrange(buf_len):  # Process suffixes in buffer order
+      if (suffix_buf[o] == sep_char):
+        h = 0
+        continue
+
+      p = rank_array[o]
+
+      if (p > 0):
+        prev_o = suffix_array[p-1]
+        while ((suffix_buf[o+h] == suffix_buf[prev_o+h]) and \
+               (suffix_buf[o+h] != sep_char)):
+          h += 1
+        lcp_array[p] = h
+        if (h > 0):
+          h -= 1
+      else:
+        h = 0
+
+    del rank_array
+
+    return (suffix_buf, suffix_array, lcp_array, val_num_array, val_end_list)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __get_suffix_str__(self, suffix_array_data, suffix_range):
+    """Return the suffix string at the first position of the given suffix
+       array range (a tuple with the first and last position). A range with
+       negative positions stands for the empty string.
+    """
+
+    if (suffix_range[0] < 0):
+      return ''
+
+    (suffix_buf, suffix_array, lcp_array, val_num_array, val_end_list) = \
+                                                              suffix_array_data
+    p = suffix_range[0]
+
+    return suffix_buf[suffix_array[p]:val_end_list[val_num_array[p]]]
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __suffix_array_runs__(self, suffix_array_data):
+    """Generator that yields the ranges (tuples with the first and last suffix
+       array position) of all runs of equal suffixes in the suffix array, i.e.
+       of neighbouring suffixes that have an LCP equal to their length.
+    """
+
+    (suffix_buf, suffix_array, lcp_array, val_num_array, val_end_list) = \
+                                                              suffix_array_data
+    num_suffix = len(suffix_array)
+
+    if (num_suffix == 0):
+      return
+
+    lb =       0
+    prev_len = val_end_list[val_num_array[0]] - suffix_array[0]
+
+    for p in xrange(1, num_suffix):
+      this_len = val_end_list[val_num_array[p]] - suffix_array[p]
+
+      if ((this_len != prev_len) or (lcp_array[p] != this_len)):
+        yield (lb, p-1)
+        lb = p
+
+      prev_len = this_len
+
+    yield (lb, num_suffix-1)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __suffix_array_intervals__(self, suffix_array_data, min_len):
+    """Generator that yields the ranges (tuples with the first and last suffix
+       array position) of all LCP intervals with an LCP value of at least
+       'min_len' (Abouelhoda et al., JDA 2004), and of all single suffixes
+       that are at least 'min_len' long and longer than their LCP with both
+       neighbours.
+
+       Each of these ranges contains all suffixes that start with a certain
+       set of sub-strings (of length at least 'min_len'), and each such
+       sub-string corresponds to exactly one range.
+    """
+
+    (suffix_buf, suffix_array, lcp_array, val_num_array, val_end_list) = \
+                                                              suffix_array_data
+    num_suffix = len(suffix_array)
+
+    stack = [(0, 0)]  # Open intervals as (LCP value, first position)
+
+    for p in xrange(1, num_suffix+1):
+      if (p < num_suffix):
+        this_lcp = lcp_array[p]
+      else:
+        this_lcp = 0  # Close all intervals (except the root)
+
+      lb = p-1
+      while (this_lcp < stack[-1][0]):
+        (interval_lcp, lb) = stack.pop()
+        if (interval_lcp >= min_len):
+          yield (lb, p-1)
+
+      if (this_lcp > stack[-1][0]):
+        stack.append((this_lcp, lb))
+
+    # Single suffixes not contained in any LCP interval with their sub-strings
+    #
+    for p in xrange(num_suffix):
+      this_len = val_end_list[val_num_array[p]] - suffix_array[p]
+
+      if (p > 0):
+        max_lcp = lcp_array[p]
+      else:
+        max_lcp = 0
+      if (p < (num_suffix-1)):
+        max_lcp = max(max_lcp, lcp_array[p+1])
+
+      if ((this_len >= min_len) and (this_len > max_lcp)):
+        yield (p, p)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __suffix_array_into_index__(self, i, pad_str_pair, min_suffix_len,
+                                  max_block_size, suffix_method):
+    """Convert the basic inverted indices number 'i' (of both data sets for a
+       linkage) into suffix array based indices.
+
+       A suffix array is built over all (padded) index values, and the blocks
+       are ranges of suffix array positions, which are used as keys in the new
+       indices (instead of suffix strings). For the 'suffixonly' method these
+       are the runs of equal suffixes, for the 'allsubstr' method the LCP
+       intervals. As with suffix strings, index values shorter than
+       'min_suffix_len' only form a block with equal index values, and blocks
+       with more than 'max_block_size' records are marked with -1.
+
+       Returns a tuple with the suffix array data (needed to get the suffix
+       strings of blocks) and the length of the longest index value.
+    """
+
+    sep_char = chr(0)
+
+    (start_str, end_str) = pad_str_pair
+
+    index_list = [self.index1]
+
+    if (self.do_deduplication == False):  # If linkage append data set 2
+      index_list.append(self.index2)
+
+    index_val_list = []                # Padded index values of both data sets
+    val_rec_lists =  []                # Their record lists
+    val_ds_list =    array.array('b')  # And their data set numbers (0 or 1)
+
+    for ds_index in range(len(index_list)):
+      for (index_val, block_rec_list) in index_list[ds_index][i].iteritems():
+        index_val_list.append('%s%s%s' % (start_str, index_val, end_str))
+        val_rec_lists.append(block_rec_list)
+        val_ds_list.append(ds_index)
+
+      index_list[ds_index][i] = {}
+
+    new_index_list = [self.index1[i], self.index2[i]]
+
+    max_val_len = max([len(index_val) for index_val in index_val_list] + [0])
+    empty_val_num_list = [val_num for val_num in xrange(len(index_val_list)) \
+                          if (index_val_list[val_num] == '')]
+
+    suffix_array_data = self.__build_suffix_array__(index_val_list)
+    del index_val_list
+
+    (suffix_buf, suffix_array, lcp_array, val_num_array, val_end_list) = \
+                                                              suffix_array_data
+
+    def add_block(suffix_range, val_num_list):
+      block_rec_lists = ([], [])  # Records from data sets 1 and 2
+
+      for val_num in val_num_list:
+        block_rec_lists[val_ds_list[val_num]].extend(val_rec_lists[val_num])
+
+      for ds_index in [0,1]:
+        if (len(block_rec_lists[ds_index]) > max_block_size):
+          new_index_list[ds_index][suffix_range] = -1  # Too frequent
+        elif (block_rec_lists[ds_index] != []):
+          new_index_list[ds_index][suffix_range] = block_rec_lists[ds_index]
+
+    # Index values shorter than the minimum length only form blocks with equal
+    # index values (and the same for empty values, which have no suffixes).
+    # Note the buffer ends with a separator, so the character before the first
+    # suffix is a separator as well.
+    #
+    for (lb, rb) in self.__suffix_array_runs__(suffix_array_data):
+      run_len = val_end_list[val_num_array[lb]] - suffix_array[lb]
+
+      if ((run_len >= min_suffix_len) and (suffix_method == 'suffixonly')):
+        add_block((lb, rb), val_num_array[lb:rb+1])
+
+      elif (run_len < min_suffix_len):  # Only complete index values
+        add_block((lb, rb), [val_num_array[p] for p in xrange(lb, rb+1) \
+                   if (suffix_buf[suffix_array[p]-1] == sep_char)])
+
+    if (empty_val_num_list != []):
+      add_block((-1, -1), empty_val_num_list)
+
+    if (suffix_method == 'allsubstr'):
+      for (lb, rb) in self.__suffix_array_intervals__(suffix_array_data,
+                                                      min_suffix_len):
+        add_block((lb, rb), set(val_num_array[lb:rb+1]))
+
+    return (suffix_array_data, max_val_len)
+
   # ---------------------------------------------------------------------------
 
   def compact(self):
@@ -743,12 +1908,18 @@ class Indexing:
 
        This version does not modify the input record identifier list. It does
        create a local copy of the record identifer list which is then sorted.
+
+       In streaming mode the record identifiers are only stored as a block and
+       the record pairs are generated later in the run() method.
     """
 
+    if (self.stream_rec_pairs == True):
+      self.__add_rec_pair_block__(rec_id_list, None)
+      return
+
     rec_cnt = 1  # Counter for second record identifier
 
-    this_rec_id_list = rec_id_list[:]
-    this_rec_id_list.sort()
+    this_rec_id_list = sorted(rec_id_list)
     for rec_ident1 in this_rec_id_list:
 
       rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
@@ -770,1389 +1941,1861 @@ class Indexing:
   def __link_rec_pairs__(self, rec_id_list1, rec_id_list2, rec_pair_dict):
     """Create record pairs for a linkage using the given two record identifier
        lists and insert them into the given record pair dictionary.
+
+       In streaming mode the record identifiers are only stored as a block and
+       the record pairs are generated later in the run() method.
     """
 
+    if (self.stream_rec_pairs == True):
+      self.__add_rec_pair_block__(rec_id_list1, rec_id_list2)
+      return
+
+    if (len(rec_id_list2) == 0):
+      return
+
     for rec_ident1 in rec_id_list1:
-      for rec_ident2 in rec_id_list2:
 
-        rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
-        rec_ident2_set.add(rec_ident2)
-        rec_pair_dict[rec_ident1] = rec_ident2_set
+      rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+      rec_ident2_set.update(rec_id_list2)
+      rec_pair_dict[rec_ident1] = rec_ident2_set
 
   # ---------------------------------------------------------------------------
 
-  def run(self):
-    """Run the record pair comparison accoding to the index.
-       See implementations in derived classes for details.
-    """
-
-    logging.exception('Override abstract method in derived class')
-    raise Exception
+  def __add_rec_pair_block__(self, rec_id_list1, rec_id_list2):
+    """Store a block of record identifiers for streaming mode, where the record
+       pairs are generated in the run() method (by __stream_rec_pairs__()).
 
-  # ---------------------------------------------------------------------------
+       For a deduplication 'rec_id_list2' has to be None, and all pairs of
+       records within the first list will be generated, for a linkage all pairs
+       between records in the first and second list.
 
-  def __get_field_names_list__(self):
-    """Returns the list of all field comparison descriptions, to be used when
-       a weight vector file is written.
+       For each record the numbers of the blocks it is contained in are stored,
+       so that a record pair is only generated in the first block that contains
+       both of its records (which removes duplicate record pairs without having
+       to keep all record pairs in memory).
     """
 
-    field_names_list = []
-    for field_comp_tuple in self.rec_comparator.field_comparator_list:
-        field_names_list.append(field_comp_tuple[0].description)
-    return field_names_list
+    block_num = len(self.rec_pair_block_list)
 
-  # ---------------------------------------------------------------------------
+    block_list1 = list(set(rec_id_list1))  # Local copies without duplicates
+    block_list1.sort()
 
-  def __compare_rec_pairs_from_dict__(self, length_filter_perc = None,
-                                      cut_off_threshold = None):
-    """This method compares all the records pairs in the record pair dictionary
-       and puts the resulting weight vectors into a dictionary which is then
-       returned.
+    if (rec_id_list2 == None):  # A deduplication - - - - - - - - - - - - - - -
 
-       If the argument 'length_filter_perc' is set to a percentage value
-       between 0.0 and 100.0 the lengths of the concatenated record values in
-       the fields used for comparison will be calculated, and if the difference
-       is larger than the given percentage value the record pair will not be
-       compared. For example, if a record A has values with a total length of
-       12 characters and a record B values with a length of 16 characters, then
-       their percentage difference will be:
+      if (len(block_list1) < 2):
+        return  # No record pair in this block
 
-          |12-16| / (max(12,16) = 4 / 16 = 0.25 (25%)
+      block_list2 = None
 
-       So if the value of 'length_filter_perc' is set to 20 this record pair
-       will be filtered out and not compared.
+    else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-       Default value for 'length_filter_perc' is None, which means no length
-       filtering will be performed. For more information about filtering in the
-       record linkage process please refer to:
+      block_list2 = list(set(rec_id_list2))
+      block_list2.sort()
 
-       - Adaptive Filtering for Efficient Record Linkage
-         Lifang Gu and Rohan Baxter,
-         SIAM Data Mining conference, 2004.
+      if ((block_list1 == []) or (block_list2 == [])):
+        return
 
-       The second argument 'cut_off_threshold' can be set to a numerical value,
-       in which case all compared record pairs with a summed weight vector
-       value less than this threshold will not be stored in the weight vector
-       dictionary. Default value for 'cut_off_threshold' is None, which means
-       all compared record pairs will be stored in the weight vector
-       dictionary.
-    """
+      rec_block_dict2 = self.rec_block_dict2  # Shorthand
 
-    # Check if weight vector file should be written - - - - - - - - - - - - - -
-    #
-    if (self.weight_vec_file != None):
-      try:
-        weight_vec_fp = open(self.weight_vec_file, 'w')
-      except:
-        logging.exception('Cannot write weight vector file: %s' % \
-                          (self.weight_vec_file))
-        raise Exception
-      weight_vec_writer = csv.writer(weight_vec_fp)
+      for rec_ident in block_list2:
+        rec_block_list = rec_block_dict2.get(rec_ident, [])
+        rec_block_list.append(block_num)
+        rec_block_dict2[rec_ident] = rec_block_list
 
-      # Write header line with descriptions of field comparisons
-      #
-      weight_vec_header_line = ['rec_id1', 'rec_id2'] + \
-                                self.__get_field_names_list__()
-      weight_vec_writer.writerow(weight_vec_header_line)
+    rec_block_dict1 = self.rec_block_dict1  # Shorthand
 
-    # Calculate a counter for the progress report - - - - - - - - - - - - - - -
-    #
-    if (self.progress_report != None):
-      progress_report_cnt = max(1, int(self.num_rec_pairs / \
-                                   (100.0 / self.progress_report)))
-    else:  # So no progress report is being logged
-      progress_report_cnt = self.num_rec_pairs + 1
+    for rec_ident in block_list1:
+      rec_block_list = rec_block_dict1.get(rec_ident, [])
+      rec_block_list.append(block_num)
+      rec_block_dict1[rec_ident] = rec_block_list
 
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
-    comp_done =       0   # Number of comparisons done
+    self.rec_pair_block_list.append((block_list1, block_list2))
 
-    rec_cache1 =       self.rec_cache1  # Shorthands to make program faster
-    rec_pair_dict =    self.rec_pair_dict
-    rec_comp =         self.rec_comparator.compare
-    rec_length_cache = self.rec_length_cache
+  # ---------------------------------------------------------------------------
 
-    # Check length filter and cut-off threshold arguments - - - - - - - - - - -
-    #
-    if (length_filter_perc != None):
-      auxiliary.check_is_percentage('Length filter percentage',
-                                    length_filter_perc)
-      logging.info('  Length filtering set to %.1f%%' % (length_filter_perc))
-      length_filter_perc /= 100.0  # Normalise
+  def __stream_rec_pairs__(self):
+    """A generator that yields tuples (rec_ident1, rec_ident2_list) with the
+       record pairs from the blocks stored in streaming mode, one block after
+       the other.
 
-    if (cut_off_threshold != None):
-      auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
-      logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
+       A record pair is only generated for the first block that contains both
+       of its records, so each record pair is generated only once.
+    """
 
-    num_rec_pairs_filtered =    0  # Count number of removed record pairs
-    num_rec_pairs_below_thres = 0
+    rec_block_dict1 = self.rec_block_dict1  # Shorthands
 
-    # Set shorthand depending upon deduplication or linkage - - - - - - - - - -
-    #
-    if (self.do_deduplication == True):  # A deduplication run
-      rec_cache2 = self.rec_cache1
+    if (self.do_deduplication == True):
+      rec_block_dict2 = self.rec_block_dict1
     else:
-      rec_cache2 = self.rec_cache2
+      rec_block_dict2 = self.rec_block_dict2
 
-    start_time = time.time()
+    get_earlier_blocks = self.__get_earlier_blocks__
 
-    for rec_ident1 in rec_pair_dict:
+    block_num = 0
 
-      rec1 = rec_cache1[rec_ident1]  # Get the actual first record
+    for (block_list1, block_list2) in self.rec_pair_block_list:
 
-      if (length_filter_perc != None):
-        rec1_len = len(''.join(rec1))  # Get length in characters for record
+      if (block_list2 == None):  # A deduplication block - - - - - - - - - - - -
 
-      for rec_ident2 in rec_pair_dict[rec_ident1]:
+        block_len = len(block_list1)
 
-        rec2 = rec_cache2[rec_ident2]  # Get actual second record
+        for i in xrange(block_len-1):
+          rec_ident1 =   block_list1[i]
+          earlier_set1 = get_earlier_blocks(block_num,
+                                            rec_block_dict1[rec_ident1])
 
-        do_comp = True  # Flag, specify if comparison should be done
+          if (len(earlier_set1) == 0):  # First block of the first record
+            rec_ident2_list = block_list1[i+1:]
 
-        if (length_filter_perc != None):
-          if (rec_ident2 in rec_length_cache):  # Length is cached
-            rec2_len = rec_length_cache[rec_ident2]
           else:
-            rec2_len = len(''.join(rec2))
-            rec_length_cache[rec_ident2] = rec2_len
+            rec_ident2_list = []
 
-          perc_diff = float(abs(rec1_len - rec2_len)) / max(rec1_len, rec2_len)
+            for j in xrange(i+1, block_len):
+              rec_ident2 = block_list1[j]
 
-          if (perc_diff > length_filter_perc):
-            do_comp = False  # Difference too large, don't do comparison
-            num_rec_pairs_filtered += 1
+              assert rec_ident1 != rec_ident2
 
-        if (do_comp == True):
-          w_vec = rec_comp(rec1, rec2)  # Compare them
+              if (earlier_set1.isdisjoint(rec_block_dict2[rec_ident2])):
+                rec_ident2_list.append(rec_ident2)
 
-          if (cut_off_threshold == None) or (sum(w_vec) >= cut_off_threshold):
+          if (rec_ident2_list != []):
+            yield (rec_ident1, rec_ident2_list)
 
-            # Put result into weight vector dictionary
-            #
-            if (self.weight_vec_file == None):
-              weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-            else:
-              weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+      else:  # A linkage block - - - - - - - - - - - - - - - - - - - - - - - - -
 
-          else:
-            num_rec_pairs_below_thres += 1
+        for rec_ident1 in block_list1:
+          earlier_set1 = get_earlier_blocks(block_num,
+                                            rec_block_dict1[rec_ident1])
 
-        comp_done += 1  # Count all record pair comparisons (even if not done)
+          if (len(earlier_set1) == 0):  # First block of the first record
+            rec_ident2_list = block_list2
 
-        if ((comp_done % progress_report_cnt) == 0):
-          self.__log_comparison_progress__(comp_done, start_time)
+          else:
+            rec_ident2_list = []
 
-    used_sec_str = auxiliary.time_string(time.time()-start_time)
-    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                         self.num_rec_pairs)
-    logging.info('Compared %d record pairs in %s (%s per pair)' % \
-                 (self.num_rec_pairs, used_sec_str,rec_time_str))
-    if (length_filter_perc != None):
-      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
-                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
-    if (cut_off_threshold != None):
-      logging.info('  %d record pairs had summed weights below threshold ' % \
-                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
+            for rec_ident2 in block_list2:
+              if (earlier_set1.isdisjoint(rec_block_dict2[rec_ident2])):
+                rec_ident2_list.append(rec_ident2)
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+          if (rec_ident2_list != []):
+            yield (rec_ident1, rec_ident2_list)
 
-    if (self.weight_vec_file == None):
-      return [self.__get_field_names_list__(), weight_vec_dict]
-    else:
-      weight_vec_fp.close()
-      return None
+      block_num += 1
 
-  # ---------------------------------------------------------------------------
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-  def __find_closest__(self, sorted_list, elem):
-    """Binary search of the given element 'elem' in the given sorted list, and
-       return index of exact match or closest match (before where the element
-       would be).
+  def __get_earlier_blocks__(self, block_num, rec_block_list):
+    """Return a set with the numbers of the blocks before the block with the
+       given number that contain a record (with the given sorted list of block
+       numbers).
 
-       Used in BigMatch and Dedup indexing methods.
+       A record pair is generated in the block with the given number only if
+       the block numbers of its second record are disjoint from this set, that
+       is if no earlier block contains both records. As the set only contains
+       numbers smaller than the given block number, the test can be done on the
+       full block list of the second record.
     """
 
-    start = 0
-    end =   len(sorted_list)-1
+    return set(rec_block_list[:bisect.bisect_left(rec_block_list, block_num)])
 
-    while 1:
-      if (end < start):
-        return end  # Not found
+  # ---------------------------------------------------------------------------
 
-      middle = (start + end) / 2
-      middle_val = sorted_list[middle]  # Get the element from the middle
+  def __get_rec_pair_iter__(self):
+    """Return an iterator over tuples (rec_ident1, rec_ident2_list) of all
+       record pairs generated in the compact() method.
 
-      if (middle_val == elem):  # Found the key value
-        return middle
-      elif (elem < middle_val):
-        end = middle - 1
-      else:
-        start = middle + 1
+       In streaming mode the record pairs in the record pair dictionary (only
+       used by indices that do not store blocks) are followed by the record
+       pairs generated from the stored blocks.
+    """
+
+    if (self.stream_rec_pairs == True):
+      return itertools.chain(self.rec_pair_dict.iteritems(),
+                             self.__stream_rec_pairs__())
+    else:
+      return self.rec_pair_dict.iteritems()
 
   # ---------------------------------------------------------------------------
 
-  def load(self, index_file_name):
-    """Load a previously saved index from a binary file.
+  def __count_rec_pairs__(self):
+    """Count and return the number of record pairs generated in the compact()
+       method.
+
+       In streaming mode the record pairs are not generated before the run()
+       method, so the number returned is an upper bound that includes record
+       pairs occurring in more than one block. The exact number of record pairs
+       is then set when the record pairs are compared in run().
     """
 
-    pass  # To be done
+    num_rec_pairs = 0
+
+    for rec_ident2_set in self.rec_pair_dict.itervalues():
+      num_rec_pairs += len(rec_ident2_set)
+
+    if (self.stream_rec_pairs == True):
+      for (block_list1, block_list2) in self.rec_pair_block_list:
+        if (block_list2 == None):
+          num_rec_pairs += len(block_list1)*(len(block_list1)-1)/2
+        else:
+          num_rec_pairs += len(block_list1)*len(block_list2)
+
+    return num_rec_pairs
 
   # ---------------------------------------------------------------------------
 
-  def save(self, index_file_name):
-    """Save an index into a binary file.
+  def __check_inv_index_settings__(self):
+    """Check that settings which are only supported by indices that read the
+       records using __records_into_inv_index__() are not set. Called in the
+       constructors of indices that read the records in their own way.
     """
 
-    pass  # To be done
+    if (self.intern_rec_idents == True):
+      logging.exception('Interned record identifiers are not supported ' + \
+                        'by %s indices' % (self.__class__.__name__))
+      raise Exception
 
-    # have to check that data sets are the same (have same field lists)
+    if (self.num_build_workers != None):
+      logging.exception('Building with worker processes is not supported ' + \
+                        'by %s indices' % (self.__class__.__name__))
+      raise Exception
 
   # ---------------------------------------------------------------------------
 
-  def __get_index_values__(self, rec, data_set_num):
-    """For the given record (list of fields) extract and produce the indexing
-       values. Returns a list with the indexing variable values (one per index
-       definition).
-
-       The data set number can be 0 (if the record is from the first data set)
-       or 1 (if it is from the second data set).
+  def __pack_rec_pairs__(self):
+    """If record identifiers are interned, convert the sets of second record
+       numbers in the record pair dictionary into sorted integer arrays, which
+       need much less memory than sets.
     """
 
-    index_var_values = []
+    if (self.intern_rec_idents == False):
+      return
 
-    sep_str = self.index_sep_str
+    rec_pair_dict = self.rec_pair_dict  # Shorthand
 
-    assert (data_set_num == 0) or (data_set_num == 1)
+    for (rec_ident1, rec_ident2_set) in rec_pair_dict.items():
+      if (not isinstance(rec_ident2_set, array.array)):
+        rec_pair_dict[rec_ident1] = array.array('i', sorted(rec_ident2_set))
 
-    # Go through the index definitions and extract and process field values - -
-    #
-    for index_def_list in self.index_def_proc:
+  # ---------------------------------------------------------------------------
 
-      index_val_list = []
+  def get_rec_ident_lists(self):
+    """If record identifiers are interned return a tuple with two lists (for
+       data sets 1 and 2, the same list for a deduplication) that contain the
+       record identifiers at the positions given by the record numbers,
+       otherwise return None.
+    """
 
-      for index_def in index_def_list:  # Loop over all the index' definitions
+    if ((self.intern_rec_idents == False) or (self.rec_ident_list1 == [])):
+      return None
 
-        field_col = index_def[data_set_num]  # Column of the field to extract
+    return (self.rec_ident_list1, self.rec_ident_list2)
 
-        if (field_col >= len(rec)):
-          field_val = ''
-        else:
-          field_val = rec[field_col].lower()
+  # ---------------------------------------------------------------------------
 
-        if (field_val != ''):  # Field value is not empty
+  def run(self):
+    """Run the record pair comparison accoding to the index.
+       See implementations in derived classes for details.
+    """
 
-          # Check for sorting of words
-          #
-          if ((' ' in field_val) and (index_def[2] == True)):
-            word_list = field_val.split()
-            word_list.sort()
-            field_val = ' '.join(word_list)
-
-          if (index_def[3] == True):  # Reverse the index value
-            field_val = field_val[::-1]
-
-          funct_def = index_def[5]
-
-          if (funct_def != None):  # There is a function defined for this index
-            funct_call =    funct_def[0]  # The function itself
-            num_funct_arg = len(funct_def)
-
-            if (num_funct_arg == 1):  # No arguments
-              funct_val = funct_call(field_val)
-            elif (num_funct_arg == 2):  # One argument
-              funct_val = funct_call(field_val, funct_def[1])
-            elif (num_funct_arg == 3):  # Two arguments
-              funct_val = funct_call(field_val, funct_def[1], funct_def[2])
-            elif (num_funct_arg == 4):  # Three arguments
-              funct_val = funct_call(field_val, funct_def[1], funct_def[2],
-                                     funct_def[3])
-            else:
-              logging.exception('Too many arguments for function call: %s' % \
-                                (str(funct_def)))
-              raise Exception
-          else:
-           funct_val = field_val  # No function applied to the field value
+    logging.exception('Override abstract method in derived class')
+    raise Exception
 
-          if (index_def[4] != None):  # There is  maximum length
-            funct_val = funct_val[:index_def[4]]
+  # ---------------------------------------------------------------------------
 
-          index_val_list.append(funct_val)
+  def add_records(self, dataset_delta, data_set_num = 1,
+                  length_filter_perc = None, cut_off_threshold = None,
+                  num_workers = None):
+    """Add records to a compacted index and compare the new record pairs.
+       Only supported by some indices, see implementations in derived classes
+       for details.
+    """
 
-      # Make it a string and add to list of index values
-      #
-      index_val = sep_str.join(index_val_list)
+    logging.exception('Adding records is not possible for %s indices' % \
+                      (self.__class__.__name__))
+    raise Exception
 
-      index_var_values.append(index_val)
+  # ---------------------------------------------------------------------------
 
-    assert len(index_var_values) == len(self.index_def_proc)
+  def remove_records(self, rec_ident_list, data_set_num = 1):
+    """Remove records (and their record pairs) from a compacted index.
+       Only supported by some indices, see implementations in derived classes
+       for details.
+    """
 
-    return index_var_values
+    logging.exception('Removing records is not possible for %s indices' % \
+                      (self.__class__.__name__))
+    raise Exception
 
   # ---------------------------------------------------------------------------
 
-  def __open_shelve_file__(self, shelve_file_name):
-    """Open a shelve with the given file name, and clear all it's content.
-
-       Return the shelve.
+  def __get_incremental_data__(self, data_set_num):
+    """Check if records can be added to or removed from the index, and return
+       the data structures for the data set with the given number: its index,
+       the index of the other data set, the record cache, the dictionary with
+       the block values of all records, the list of record identifiers and
+       the dictionary with record numbers (both only used for interned record
+       identifiers).
+
+       Only used by indices that support incremental maintenance, which have
+       the attributes 'incremental', 'blocks_kept', 'rec_block_val_dict1/2'
+       and 'rec_num_dict1/2'.
     """
 
-    try:
-      this_shelve = shelve.open(shelve_file_name)
-    except:
-      logging.exception('Cannot open shelve: "%s"' % str(shelve_file_name))
+    if (self.incremental == False):
+      logging.exception('Index "%s" is not incremental, adding or removing ' % \
+                        (self.description) + 'records is not possible')
       raise Exception
 
-    for rec_key in this_shelve:  # Now clear the shelve and remove all entries
+    if ((self.status != 'compacted') or (self.blocks_kept == False)):
+      logging.exception('Index "%s" has not been compacted (with its ' % \
+                        (self.description) + 'blocks kept), adding or ' + \
+                        'removing records is not possible')
+      raise Exception
 
-        del this_shelve[rec_key]
+    if (data_set_num not in [1, 2]):
+      logging.exception('Data set number must be 1 or 2: %s' % \
+                        (str(data_set_num)))
+      raise Exception
 
-    this_shelve.sync()  # And make sure the database is updated
+    if ((data_set_num == 2) and (self.do_deduplication == True)):
+      logging.exception('For a deduplication records can only be added to ' + \
+                        'or removed from data set 1')
+      raise Exception
 
-    return this_shelve
+    if (data_set_num == 1):
+      return (self.index1, self.index2, self.rec_cache1,
+              self.rec_block_val_dict1, self.rec_ident_list1,
+              self.rec_num_dict1)
+    else:
+      return (self.index2, self.index1, self.rec_cache2,
+              self.rec_block_val_dict2, self.rec_ident_list2,
+              self.rec_num_dict2)
 
   # ---------------------------------------------------------------------------
 
-  def __log_build_progress__(self, records_read, num_records, start_time):
-    """Create a log message for the number of records read and indexed so far,
-       the time used, and an estimation of much longer it will take.
+  def __get_rec_block_vals__(self):
+    """For an incremental index, get the block values (as tuples (index
+       number, block value)) of all records in the inverted indices, and (if
+       record identifiers are interned) the record numbers of all record
+       identifiers.
     """
 
-    used_time = time.time() - start_time
-    perc_done = 100.0 * records_read / num_records
-    rec_time  = used_time / records_read  # Time per record read and indexed
-    togo_time = (num_records - records_read) * rec_time
+    num_indices = len(self.index_def)
 
-    used_sec_str = auxiliary.time_string(used_time)
-    rec_sec_str =  auxiliary.time_string(rec_time)
-    togo_sec_str = auxiliary.time_string(togo_time)
+    for (index, rec_block_val_dict) in [(self.index1,
+                                         self.rec_block_val_dict1),
+                                        (self.index2,
+                                         self.rec_block_val_dict2)]:
+      rec_block_val_dict.clear()
 
-    log_str = 'Read and indexed %d of %d records (%d%%) in %s (%s per' % \
-              (records_read, num_records, round(perc_done), used_sec_str,
-              rec_sec_str)+' record), estimated %s until finished.' % \
-              (togo_sec_str)
-    logging.info(log_str)
+      for i in range(num_indices):
+        for (block_val, block_rec_list) in index[i].iteritems():
+          for rec_key in block_rec_list:
+            rec_block_val_list = rec_block_val_dict.get(rec_key, [])
+            rec_block_val_list.append((i, block_val))
+            rec_block_val_dict[rec_key] = rec_block_val_list
+
+    if (self.intern_rec_idents == True):
+      self.rec_num_dict1 = dict(itertools.izip(self.rec_ident_list1,
+                                         xrange(len(self.rec_ident_list1))))
+      if (self.do_deduplication == True):
+        self.rec_num_dict2 = self.rec_num_dict1
+      else:
+        self.rec_num_dict2 = dict(itertools.izip(self.rec_ident_list2,
+                                         xrange(len(self.rec_ident_list2))))
 
-    if (self.log_funct != None):
-      self.log_funct(log_str)
+  # ---------------------------------------------------------------------------
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('    '+memory_usage_str)
+  def __check_delta_data_set__(self, dataset_delta, data_set_num):
+    """Check that the given data set, whose records are to be added to the
+       data set with the given number, has the same field names (in the same
+       order) as this data set.
+    """
+
+    if (data_set_num == 1):
+      dataset = self.dataset1
+    else:
+      dataset = self.dataset2
+
+    delta_field_names = [field_name for (field_name, field_data) in \
+                         dataset_delta.field_list]
+    field_names =       [field_name for (field_name, field_data) in \
+                         dataset.field_list]
+
+    if (delta_field_names != field_names):
+      logging.exception('Field names of data set "%s" are different from ' % \
+                        (dataset_delta.description) + 'the ones of data ' + \
+                        'set %d: %s / %s' % (data_set_num, delta_field_names,
+                                             field_names))
+      raise Exception
 
   # ---------------------------------------------------------------------------
 
-  def __log_comparison_progress__(self, comparison_count, start_time):
-    """Create a log message for the number of comparison done so far, the time
-       used, and an estimation of much longer it will take.
+  def __add_delta_rec__(self, rec_ident, rec, data_set_num, rec_cache,
+                        rec_ident_list, rec_num_dict):
+    """Put a record that is added to an incremental index into the given
+       record cache (with the fields not needed for comparisons set to ''),
+       and return its key in the index (its record number if record
+       identifiers are interned, otherwise its identifier). Records that are
+       already in the index are not allowed.
     """
 
-    used_time = time.time() - start_time
-    perc_done = int(round(100.0 * comparison_count / self.num_rec_pairs))
-    rec_time  = used_time / comparison_count  # Time per record pair comparison
-    togo_time = (self.num_rec_pairs - comparison_count) * rec_time
+    if (self.intern_rec_idents == True):
+      if (rec_ident in rec_num_dict):
+        logging.exception('Record "%s" is already in the index' % \
+                          (str(rec_ident)))
+        raise Exception
+      rec_key = len(rec_ident_list)
+      rec_ident_list.append(rec_ident)
+      rec_num_dict[rec_ident] = rec_key
 
-    used_sec_str = auxiliary.time_string(used_time)
-    rec_sec_str =  auxiliary.time_string(rec_time)
-    togo_sec_str = auxiliary.time_string(togo_time)
+    else:
+      if (rec_ident in rec_cache):
+        logging.exception('Record "%s" is already in the index' % \
+                          (str(rec_ident)))
+        raise Exception
+      rec_key = rec_ident
 
-    log_str = 'Compared %d of %d record pairs (%d%%) in %s (%s per ' % \
-              (comparison_count, self.num_rec_pairs, perc_done, used_sec_str,
-              rec_sec_str)+'pair), estimated %s until finished.' % \
-              (togo_sec_str)
-    logging.info(log_str)
+    if (data_set_num == 1):
+      comp_field_used = self.comp_field_used1
+    else:
+      comp_field_used = self.comp_field_used2
 
-    if (self.log_funct != None):
-      self.log_funct(log_str)
+    # Extract record fields needed for comparisons (set all others to '')
+    #
+    comp_rec = []
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('    '+memory_usage_str)
+    field_ind = 0
+    for field in rec:
+      if (field_ind in comp_field_used):
+        comp_rec.append(field.lower())  # Make them lower case
+      else:
+        comp_rec.append('')
+      field_ind += 1
+
+    rec_cache[rec_key] = comp_rec  # Put into record cache
+
+    return rec_key
 
   # ---------------------------------------------------------------------------
 
-  def log(self, instance_var_list = None):
-    """Write a log message with the basic index instance variables plus the
-       instance variable provided in the given input list (assumed to contain
-       pairs of names (strings) and values).
+  def __remove_delta_rec__(self, rec_ident, rec_cache, rec_ident_list,
+                           rec_num_dict):
+    """Check that a record that is removed from an incremental index is in
+       the index, and return its key in the index. If record identifiers are
+       interned its record number is not re-used. The record is removed from
+       the record cache later by the caller (once its blocks are updated).
     """
 
-    logging.info('')
-    logging.info('Index:                    "%s"' % (self.description))
-    logging.info('  Index status:           %s' % (self.status))
-    logging.info('  Data set 1:             %s' % (self.dataset1.description))
-    logging.info('  Data set 2:             %s' % (self.dataset2.description))
-    if (self.do_deduplication == True):
-      logging.info('  Data sets are the same: Deduplication')
-    else:
-      logging.info('  Data sets differ:       Linkage')
-    logging.info('  Record comparator:      %s' % \
-                 (self.rec_comparator.description))
-    logging.info('    Used fields indices from data set 1: %s' % \
-                 (str(self.comp_field_used1)))
-    logging.info('    Used fields indices from data set 2: %s' % \
-                 (str(self.comp_field_used2)))
-    logging.info('  Skip missing:           %s' % (str(self.skip_missing)))
-    logging.info('  Index separator string: "%s"' % (self.index_sep_str))
+    if (self.intern_rec_idents == True):
+      if (rec_ident not in rec_num_dict):
+        logging.exception('Record "%s" is not in the index' % \
+                          (str(rec_ident)))
+        raise Exception
+      rec_key = rec_num_dict.pop(rec_ident)
+      rec_ident_list[rec_key] = None  # Record number is not re-used
 
-    if (self.num_rec_pairs == None):
-      logging.info('  Number of record pairs: Not known yet')
-    else:
-      logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
-    if (self.progress_report == None):
-      logging.info('  No progress reported.')
     else:
-      logging.info('  Progress report every:  %d%%' % (self.progress_report))
-    if (self.weight_vec_file != None):
-      logging.info('  Weight vectors will be written into: %s' % \
-                   (self.weight_vec_file))
+      if (rec_ident not in rec_cache):
+        logging.exception('Record "%s" is not in the index' % \
+                          (str(rec_ident)))
+        raise Exception
+      rec_key = rec_ident
 
-    if (instance_var_list != None):
-      logging.info('  Index specific variables:')
+    return rec_key
 
-      max_name_len = 0
-      for (name, value) in instance_var_list:
-        max_name_len = max(max_name_len, len(name))
+  # ---------------------------------------------------------------------------
 
-      for (name, value) in instance_var_list:
-        pad_spaces = (max_name_len-len(name))*' '
-        logging.info('    %s %s' % (name+':'+pad_spaces, str(value)))
+  def __get_field_names_list__(self):
+    """Returns the list of all field comparison descriptions, to be used when
+       a weight vector file is written.
+    """
 
-    if (self.index_def != []):  # Index definitions are not empty - - - - - - -
-      logging.info('  Index definitions:')
-      for i in range(len(self.index_def)):
-        logging.info('    Index %d:' % (i))
+    field_names_list = []
+    for field_comp_tuple in self.rec_comparator.field_comparator_list:
+        field_names_list.append(field_comp_tuple[0].description)
+    return field_names_list
 
-        for j in range(len(self.index_def[i])):
-          index_def = self.index_def[i][j]
-          index_def_proc = self.index_def_proc[i][j]
+  # ---------------------------------------------------------------------------
 
-          logging.info('      Data set 1 and 2 field names: "%s" (at column' \
-                       % (index_def[0]) + ' %d) and "%s" (at column %d)' % \
-                       (index_def_proc[0], index_def[1], index_def_proc[1]))
-          logging.info('        Sort words flag set to %s' % \
-                       (str(index_def[2])))
-          logging.info('        Reverse flag set to %s' % (str(index_def[3])))
+  def __compare_rec_pairs_from_dict__(self, length_filter_perc = None,
+                                      cut_off_threshold = None,
+                                      num_workers = None,
+                                      rec_pair_dict = None):
+    """This method compares all the records pairs in the record pair dictionary
+       and puts the resulting weight vectors into a dictionary which is then
+       returned.
 
-          if (index_def_proc[4] == None):
-            logging.info('        No maximum length for index variable ' + \
-                         'specified')
-          else:
-            logging.info('        Maximum length for index variable: %d' % \
-                         (index_def_proc[4]))
-          if (index_def_proc[5] == None):
-            logging.info('        No function specified')
-          else:
-            funct_str = '        Function: %s' % (str(index_def_proc[5][0]))
-            param_str = ''
-            if (len(index_def_proc[5]) > 1):
-              param_str += ' with parameter(s): '
-              for p in index_def_proc[5][1:]:
-                param_str += str(p)+', '
-            logging.info(funct_str+param_str[:-2])
+       If the argument 'length_filter_perc' is set to a percentage value
+       between 0.0 and 100.0 the lengths of the concatenated record values in
+       the fields used for comparison will be calculated, and if the difference
+       is larger than the given percentage value the record pair will not be
+       compared. For example, if a record A has values with a total length of
+       12 characters and a record B values with a length of 16 characters, then
+       their percentage difference will be:
 
-  # ---------------------------------------------------------------------------
+          |12-16| / (max(12,16) = 4 / 16 = 0.25 (25%)
 
-  def get_index_stats(self):
-    """Extract and log information about the index.
+       So if the value of 'length_filter_perc' is set to 20 this record pair
+       will be filtered out and not compared.
+
+       Default value for 'length_filter_perc' is None, which means no length
+       filtering will be performed. For more information about filtering in the
+       record linkage process please refer to:
+
+       - Adaptive Filtering for Efficient Record Linkage
+         Lifang Gu and Rohan Baxter,
+         SIAM Data Mining conference, 2004.
+
+       The second argument 'cut_off_threshold' can be set to a numerical value,
+       in which case all compared record pairs with a summed weight vector
+       value less than this threshold will not be stored in the weight vector
+       dictionary. Default value for 'cut_off_threshold' is None, which means
+       all compared record pairs will be stored in the weight vector
+       dictionary.
+
+       The third argument 'num_workers' can be set to a positive integer larger
+       than 1, in which case the record pairs will be compared in parallel by
+       this number of worker processes (see __compare_rec_pairs_parallel__()
+       for details). Default value is None, which means all record pairs will
+       be compared in this process.
+
+       If the fourth argument 'rec_pair_dict' is given (a dictionary in the
+       same form as the record pair dictionary of the index) only the record
+       pairs in it are compared, and weight vectors are appended to the weight
+       vector file (if one is used) rather than overwriting it. This is used
+       when records are added to an index incrementally.
     """
 
-    pass
+    if (num_workers != None):
+      auxiliary.check_is_integer('Number of workers', num_workers)
+      auxiliary.check_is_positive('Number of workers', num_workers)
 
-# =============================================================================
+    # Get the record pairs to be compared - - - - - - - - - - - - - - - - - - -
+    #
+    if (rec_pair_dict == None):  # All record pairs of the index
+      rec_pair_iter = self.__get_rec_pair_iter__()
+      num_rec_pairs = self.num_rec_pairs
+    else:
+      rec_pair_iter = rec_pair_dict.iteritems()
+      num_rec_pairs = 0
+      for rec_ident2_set in rec_pair_dict.itervalues():
+        num_rec_pairs += len(rec_ident2_set)
 
-class FullIndex(Indexing):
-  """Class that implements a 'full' index which does not generate an index but
-     will compare all record pairs from the two data sets.
+    # Check if weight vector file should be written - - - - - - - - - - - - - -
+    #
+    if (self.weight_vec_file != None):
+      if (rec_pair_dict == None):
+        file_mode = 'w'
+      else:
+        file_mode = 'a'  # Append weight vectors of added record pairs
 
-     Note this will be very very slow for large data sets. The number of record
-     pairs to be compared corresponds to the number of records in the first
-     data set times the number of records in the second data set.
+      try:
+        weight_vec_fp = open(self.weight_vec_file, file_mode)
+      except:
+        logging.exception('Cannot write weight vector file: %s' % \
+                          (self.weight_vec_file))
+        raise Exception
+      weight_vec_writer = csv.writer(weight_vec_fp)
 
-     Note that the index definition will be ignored, as all record pairs will
-     be compared. Neither will length filtering nor the cut-off threshold be
-     applied.
-  """
+      # Write header line with descriptions of field comparisons
+      #
+      if (file_mode == 'w'):
+        weight_vec_header_line = ['rec_id1', 'rec_id2'] + \
+                                  self.__get_field_names_list__()
+        weight_vec_writer.writerow(weight_vec_header_line)
 
-  # ---------------------------------------------------------------------------
+    # Calculate a counter for the progress report - - - - - - - - - - - - - - -
+    #
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(num_rec_pairs / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = num_rec_pairs + 1
 
-  def __init__(self, **kwargs):
-    """No additional attributes needed, just call base class constructor.
-    """
+    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+    comp_done =       0   # Number of comparisons done
 
-    Indexing.__init__(self, kwargs)  # Initialise base class
+    rec_cache1 =       self.rec_cache1  # Shorthands to make program faster
+    rec_comp =         self.rec_comparator.compare
+    rec_length_cache = self.rec_length_cache
+    rec_ident_lists =  self.get_rec_ident_lists()
 
-    num_rec1 = self.dataset1.num_records
-    num_rec2 = self.dataset2.num_records
+    # Check length filter and cut-off threshold arguments - - - - - - - - - - -
+    #
+    if (length_filter_perc != None):
+      auxiliary.check_is_percentage('Length filter percentage',
+                                    length_filter_perc)
+      logging.info('  Length filtering set to %.1f%%' % (length_filter_perc))
+      length_filter_perc /= 100.0  # Normalise
 
-    if (num_rec1 < num_rec2):  # Make references to small and large data sets
-      self.ds_swapped = False
-      self.small_dataset = self.dataset1
-      self.large_dataset = self.dataset2
-    else:  # This will also hold for a deduplication
-      self.ds_swapped = True
-      self.small_dataset = self.dataset2
-      self.large_dataset = self.dataset1
+    if (cut_off_threshold != None):
+      auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
+      logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
 
-    if (self.do_deduplication == True):
-      assert num_rec1 == num_rec2
-      self.num_rec_pairs = num_rec1*(num_rec2-1)/2
+    num_rec_pairs_filtered =    0  # Count number of removed record pairs
+    num_rec_pairs_below_thres = 0
 
+    # Set shorthand depending upon deduplication or linkage - - - - - - - - - -
+    #
+    if (self.do_deduplication == True):  # A deduplication run
+      rec_cache2 = self.rec_cache1
     else:
-      self.num_rec_pairs = num_rec1*num_rec2
+      rec_cache2 = self.rec_cache2
 
-    self.log()
+    start_time = time.time()
 
-  # ---------------------------------------------------------------------------
+    if ((num_workers != None) and (num_workers > 1)):  # Parallel comparison
 
-  def build(self):
-    """Method to build an index data structure.
+      if (self.weight_vec_file == None):
+        weight_vec_writer = None
 
-       If the smaller data set is not memory based it will be loaded into
-       memory (as a dictionary) to make the comparisons faster.
+      [num_rec_pairs_filtered, num_rec_pairs_below_thres, comp_done] = \
+                 self.__compare_rec_pairs_parallel__(num_workers,
+                                                     length_filter_perc,
+                                                     cut_off_threshold,
+                                                     weight_vec_dict,
+                                                     weight_vec_writer,
+                                                     progress_report_cnt,
+                                                     start_time,
+                                                     rec_pair_iter)
+    else:
 
-       Otherwise nothing needs to be done.
-    """
+      for (rec_ident1, rec_ident2_list) in rec_pair_iter:
 
-    logging.info('')
-    logging.info('Built full index: "%s"' % (self.description))
+        rec1 = rec_cache1[rec_ident1]  # Get the actual first record
 
-    start_time = time.time()
+        if (length_filter_perc != None):
+          rec1_len = len(''.join(rec1))  # Get length in characters for record
 
-    small_data_set_dict = {}
+        for rec_ident2 in rec_ident2_list:
 
-    # Copy all records into the memory based dictionary - - - - - - - - - - - -
-    #
-    for (rec_ident, rec_list) in self.small_dataset.readall():
-      if (rec_ident in small_data_set_dict):
-        logging.exception('Duplicate record identifier "%s" in small data ' % \
-                          (rec_ident) + 'set')
+          rec2 = rec_cache2[rec_ident2]  # Get actual second record
 
-      rec_list_lower = []  # Make all values lowercase
-      for rec_val in rec_list:
-        rec_list_lower.append(rec_val.lower())
+          do_comp = True  # Flag, specify if comparison should be done
 
-      small_data_set_dict[rec_ident] = rec_list_lower
+          if (length_filter_perc != None):
+            if (rec_ident2 in rec_length_cache):  # Length is cached
+              rec2_len = rec_length_cache[rec_ident2]
+            else:
+              rec2_len = len(''.join(rec2))
+              rec_length_cache[rec_ident2] = rec2_len
 
-    # assert self.small_dataset.num_records == len(small_data_set_dict)
+            perc_diff = float(abs(rec1_len - rec2_len)) / \
+                        max(rec1_len, rec2_len)
 
-    self.small_data_set_dict = small_data_set_dict
+            if (perc_diff > length_filter_perc):
+              do_comp = False  # Difference too large, don't do comparison
+              num_rec_pairs_filtered += 1
 
-    logging.info('Built full index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+          if (do_comp == True):
+            w_vec = rec_comp(rec1, rec2)  # Compare them
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+            if (cut_off_threshold == None) or (sum(w_vec) >= cut_off_threshold):
 
-    self.status = 'built'  # Update index status
+              # Put result into weight vector dictionary
+              #
+              if (self.weight_vec_file == None):
+                weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+              elif (rec_ident_lists == None):
+                weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+              else:  # Write original record identifiers
+                weight_vec_writer.writerow([rec_ident_lists[0][rec_ident1],
+                                            rec_ident_lists[1][rec_ident2]] + \
+                                           w_vec)
 
-  # ---------------------------------------------------------------------------
+            else:
+              num_rec_pairs_below_thres += 1
 
-  def compact(self):
-    """Method to compact an index data structure.
+          comp_done += 1  # Count all record pair comparisons (even if not done)
 
-       Nothing needs to be done.
-    """
+          if ((comp_done % progress_report_cnt) == 0):
+            self.__log_comparison_progress__(comp_done, start_time)
 
-    logging.info('')
-    logging.info('Compact full index: "%s"' % (self.description))
-    logging.info('  Nothing needs to be done.')
+    # In streaming mode only now the exact number of record pairs is known
+    #
+    if ((rec_pair_dict == None) and (self.stream_rec_pairs == True)):
+      self.num_rec_pairs = comp_done
+    num_rec_pairs = comp_done
 
-    self.status = 'compacted'  # Update index status
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                         max(1, num_rec_pairs))
+    logging.info('Compared %d record pairs in %s (%s per pair)' % \
+                 (num_rec_pairs, used_sec_str,rec_time_str))
+    if (length_filter_perc != None):
+      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
+                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
+    if (cut_off_threshold != None):
+      logging.info('  %d record pairs had summed weights below threshold ' % \
+                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
 
-  # ---------------------------------------------------------------------------
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
-    """Iterate over all blocks in the index.
+    self.rec_comparator.flush_cache()  # Commit weights added to cache files
 
-       Compare all record pairs (quadratic complexity), and return a weight
-       vector dictionary with keys made of a tuple (record identifier 1,
-       record identifier 2), and corresponding values the comparison weights.
+    if (self.weight_vec_file == None):
+      return [self.__get_field_names_list__(), weight_vec_dict]
+    else:
+      weight_vec_fp.close()
+      return None
 
-       Length filtering and cut-off threshold will both be ignored.
-    """
+  # ---------------------------------------------------------------------------
 
-    logging.info('Started comparison of %d record pairs' % \
-                 (self.num_rec_pairs))
-    if (self.log_funct != None):
-      self.log_funct('Started comparison of %d record pairs' % \
-                     (self.num_rec_pairs))
+  def __compare_rec_pairs_parallel__(self, num_workers, length_filter_perc,
+                                     cut_off_threshold, weight_vec_dict,
+                                     weight_vec_writer, progress_report_cnt,
+                                     start_time, rec_pair_iter):
+    """Compare all record pairs (from the given iterator over tuples
+       (rec_ident1, rec_ident2_list)) using a pool of worker processes.
+
+       The record pairs are split into shards by the first record identifier,
+       and each shard is sent to a worker process together with the records
+       (from the record caches) it needs. The workers apply length filtering
+       and the cut-off threshold, compare the record pairs and return their
+       weight vectors, which are then put into the given weight vector
+       dictionary or written into the weight vector file (if the given writer
+       is not None).
+
+       The worker processes are forked when the pool is created, so the record
+       comparator does not need to be sent to them (this requires a platform
+       that supports fork(), such as Unix or Linux). Note that any caching done
+       by field comparators only happens within the worker processes, unless
+       the field comparators use a cache file (which is shared by all worker
+       processes).
+
+       Returns the number of record pairs removed by length filtering, the
+       number of record pairs with a summed weight below the cut-off threshold,
+       and the number of record pairs processed.
+    """
 
-    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'compacted'):  # Not necessary, but keep code consistent
-      logging.exception('Index "%s" has not been compacted, running ' % \
-                        (self.description)+'comparisons not possible')
-      raise Exception
+    SHARD_SIZE = 10000  # Approximate number of record pairs per shard
 
-    # Check if weight vector file should be written - - - - - - - - - - - - - -
-    #
-    if (self.weight_vec_file != None):
-      try:
-        weight_vec_fp = open(self.weight_vec_file, 'w')
-      except:
-        logging.exception('Cannot write weight vector file: %s' % \
-                          (self.weight_vec_file))
-        raise Exception
-      weight_vec_writer = csv.writer(weight_vec_fp)
+    logging.info('  Compare record pairs using %d worker processes' % \
+                 (num_workers))
 
-      # Write header line with descriptions of field comparisons
-      #
-      weight_vec_header_line = ['rec_id1', 'rec_id2'] + \
-                                self.__get_field_names_list__()
-      weight_vec_writer.writerow(weight_vec_header_line)
+    rec_cache1 = self.rec_cache1  # Shorthands
 
-    start_time = time.time()
+    if (self.do_deduplication == True):
+      rec_cache2 = self.rec_cache1
+    else:
+      rec_cache2 = self.rec_cache2
 
-    # Calculate a counter for the progress report - - - - - - - - - - - - - - -
-    #
-    if (self.progress_report != None):
-      progress_report_cnt = max(1, int(self.num_rec_pairs / \
-                                   (100.0 / self.progress_report)))
-    else:  # So no progress report is being logged
-      progress_report_cnt = self.num_rec_pairs + 1
+    rec_ident_lists = self.get_rec_ident_lists()
 
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+    num_rec_pairs_filtered =    0
+    num_rec_pairs_below_thres = 0
+    comp_done =                 0
 
-    comp_done = 0  # Counter for the number of comparisons done so far
+    pool = multiprocessing.Pool(num_workers, init_compare_worker,
+                                (self.rec_comparator, length_filter_perc,
+                                 cut_off_threshold))
 
-    compare_funct =       self.rec_comparator.compare  # Shorthands
-    small_data_set_dict = self.small_data_set_dict
-    rec_length_cache =    self.rec_length_cache
+    shard_result_list = []  # Results from workers in the order of shards
 
-    if (self.do_deduplication == True):  # A deduplication run - - - - - - - -
+    try:
 
-      # Need a sorted list of all record identifiers
-      #
-      small_data_set_rec_id_list = small_data_set_dict.keys()
-      small_data_set_rec_id_list.sort()
+      shard_iter = self.__get_rec_pair_shards__(rec_cache1, rec_cache2,
+                                                SHARD_SIZE, rec_pair_iter)
 
-      rec_cnt = 1  # Counter for second record identifier
+      while True:
 
-      for rec_ident1 in small_data_set_rec_id_list:
-        rec1 = small_data_set_dict[rec_ident1]  # Get values of first record
+        # Keep at most two shards per worker process waiting to be processed
+        #
+        while (len(shard_result_list) < 2*num_workers):
+          try:
+            (rec_pair_shard, shard_size) = shard_iter.next()
+          except StopIteration:
+            break
+          shard_result = pool.apply_async(compare_rec_pair_shard,
+                                          (rec_pair_shard,))
+          shard_result_list.append((shard_result, shard_size))
+          del rec_pair_shard
 
-        for rec_ident2 in small_data_set_rec_id_list[rec_cnt:]:
+        if (shard_result_list == []):
+          break  # All shards have been processed
 
-          assert rec_ident1 != rec_ident2  # Make sure they are different
+        (shard_result, shard_size) = shard_result_list.pop(0)
 
-          rec2 = small_data_set_dict[rec_ident2]  # Get values of second record
+        (w_vec_list, num_filtered, num_below_thres) = shard_result.get()
 
-          w_vec = compare_funct(rec1, rec2)  # Compare them
+        num_rec_pairs_filtered +=    num_filtered
+        num_rec_pairs_below_thres += num_below_thres
 
-          # Put result into weight vector dictionary
-          #
-          if (self.weight_vec_file == None):
+        if (weight_vec_writer == None):
+          for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
             weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-          else:
+        elif (rec_ident_lists == None):
+          for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
             weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+        else:  # Write original record identifiers
+          for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+            weight_vec_writer.writerow([rec_ident_lists[0][rec_ident1],
+                                        rec_ident_lists[1][rec_ident2]]+w_vec)
 
-          comp_done += 1
+        # Log progress if another report count of comparisons has been done
+        #
+        prev_comp_done = comp_done
+        comp_done +=     shard_size
 
-          if ((comp_done % progress_report_cnt) == 0):
-            self.__log_comparison_progress__(comp_done, start_time)
-
-        rec_cnt += 1
+        if ((comp_done / progress_report_cnt) > \
+            (prev_comp_done / progress_report_cnt)):
+          self.__log_comparison_progress__(comp_done, start_time)
 
-    else: # A linkage run - - - - - - - - - - - - - - - - - - - - - - - - - - -
+      pool.close()
 
-      for (rec_ident1, rec1) in self.large_dataset.readall():
+    except:
+      pool.terminate()
+      pool.join()
+      logging.exception('Parallel record pair comparison failed')
+      raise Exception
 
-        rec1_lower = []  # Make all values lowercase
-        for rec_val in rec1:
-          rec1_lower.append(rec_val.lower())
-        rec1 = rec1_lower
+    pool.join()
 
-        for (rec_ident2, rec2) in small_data_set_dict.iteritems():
+    return [num_rec_pairs_filtered, num_rec_pairs_below_thres, comp_done]
 
-          w_vec = compare_funct(rec1, rec2)  # Compare them
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-          # Put result into weight vector dictionary
-          #
-          if (self.weight_vec_file == None):
-            if (self.ds_swapped == True):
-              weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-            else:
-              weight_vec_dict[(rec_ident2, rec_ident1)] = w_vec
-          else:
-            if (self.ds_swapped == True):
-              weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
-            else:
-              weight_vec_writer.writerow([rec_ident2, rec_ident1]+w_vec)
+  def __get_rec_pair_shards__(self, rec_cache1, rec_cache2, shard_size,
+                              rec_pair_iter):
+    """A generator that yields shards of record pairs (taken from the given
+       record pair iterator) with approximately the given number of record
+       pairs, as tuples (rec_pair_shard, num_pairs).
 
-          comp_done += 1
+       A shard is a list of tuples (rec_ident1, rec1, rec2_list), where
+       rec2_list contains tuples (rec_ident2, rec2) of all records to be
+       compared with the first record.
+    """
 
-          if ((comp_done % progress_report_cnt) == 0):
-            self.__log_comparison_progress__(comp_done, start_time)
+    rec_pair_shard = []
+    num_pairs =      0
 
-    used_sec_str = auxiliary.time_string(time.time()-start_time)
-    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                         self.num_rec_pairs)
-    logging.info('Compared %d record pairs in %s (%s per pair)' % \
-                 (self.num_rec_pairs, used_sec_str,rec_time_str))
+    for (rec_ident1, rec_ident2_list) in rec_pair_iter:
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+      rec2_list = []
+      for rec_ident2 in rec_ident2_list:
+        rec2_list.append((rec_ident2, rec_cache2[rec_ident2]))
 
-    if (self.weight_vec_file == None):
-      return [self.__get_field_names_list__(), weight_vec_dict]
-    else:
-      weight_vec_fp.close()
-      return None
+      rec_pair_shard.append((rec_ident1, rec_cache1[rec_ident1], rec2_list))
+      num_pairs += len(rec2_list)
 
-# =============================================================================
+      if (num_pairs >= shard_size):
+        yield (rec_pair_shard, num_pairs)
 
-class BlockingIndex(Indexing):
-  """Class that implements the 'classical' blocking used for record linkage.
+        rec_pair_shard = []
+        num_pairs =      0
 
-     Records that have the same index variable values for an index are put into
-     the same blocks, and only records within a block are then compared.
-  """
+    if (rec_pair_shard != []):
+      yield (rec_pair_shard, num_pairs)
 
   # ---------------------------------------------------------------------------
 
-  def __init__(self, **kwargs):
-    """No additional attributes needed, just call base class constructor.
+  def __find_closest__(self, sorted_list, elem):
+    """Binary search of the given element 'elem' in the given sorted list, and
+       return index of exact match or closest match (before where the element
+       would be).
 
-       Note that number of record pairs will not be known after initialisation
-       (so it is left at value None).
+       Used in BigMatch and Dedup indexing methods.
     """
 
-    Indexing.__init__(self, kwargs)  # Initialise base class
+    start = 0
+    end =   len(sorted_list)-1
+
+    while 1:
+      if (end < start):
+        return end  # Not found
 
-    self.log()  # Log a message
+      middle = (start + end) / 2
+      middle_val = sorted_list[middle]  # Get the element from the middle
 
-  # ---------------------------------------------------------------------------
+      if (middle_val == elem):  # Found the key value
+        return middle
+      elif (elem < middle_val):
+        end = middle - 1
+      else:
+        start = middle + 1
 
-  def build(self):
-    """Method to build an index data structure.
+  # ---------------------------------------------------------------------------
 
-       Read all records from both files, extract blocking variables and then
-       insert records into blocks.
+  def load(self, index_file_name):
+    """Load an index from a binary file written by the save() method.
+
+       Returns True if the index was loaded, and False if the file does not
+       exist, was written with a different format version (or on a platform
+       with different integer sizes or byte order), or if it is out of date,
+       i.e. its fingerprint (of the data sets, the index definitions and the
+       index settings) differs from the one of this index. In these cases the
+       index has to be built (and compacted) again, for example:
+
+         if (my_index.load('my-index.bin') == False):
+           my_index.build()
+           my_index.compact()
+           my_index.save('my-index.bin')
+
+       The index file is memory-mapped. The values in the record caches are
+       not read into memory but accessed in the mapped file (the record caches
+       of a loaded index are ColumnarRecordCache instances with 'buffer'
+       storage), while the other index data structures are created from the
+       integer arrays stored in the file. The index status is set to the status
+       it had when it was saved ('built' or 'compacted').
     """
 
-    logging.info('')
-    logging.info('Build blocking index: "%s"' % (self.description))
+    auxiliary.check_is_string('index_file_name', index_file_name)
 
-    start_time = time.time()
+    if (self.status != 'initialised'):
+      logging.exception('Index "%s" has already been built, loading not ' % \
+                        (self.description)+'possible')
+      raise Exception
 
-    self.__records_into_inv_index__()
+    if (not os.path.isfile(index_file_name)):
+      logging.info('Index file "%s" does not exist' % (index_file_name))
+      return False
 
-    num_indices = len(self.index_def)
+    start_time = time.time()
 
-    # Now calculate number of record pairs - - - - - - - - - - - - - - - - - -
+    # Read and check the file preamble and the meta data - - - - - - - - - - -
     #
-    self.num_rec_pairs = 0
+    index_file = open(index_file_name, 'rb')
+    preamble_str = index_file.read(INDEX_FILE_PREAMBLE_SIZE)
 
-    largest_block_num_rec = -1  # Also keep the largest block size and value
-    largest_block_val = ''
-    largest_block_index_num = -1  # Index number of the largest block
+    if ((len(preamble_str) != INDEX_FILE_PREAMBLE_SIZE) or \
+        (preamble_str[:len(INDEX_FILE_MAGIC)] != INDEX_FILE_MAGIC)):
+      index_file.close()
+      logging.exception('File "%s" is not an index file' % (index_file_name))
+      raise Exception
 
-    for i in range(num_indices):
+    (magic_str, file_version, meta_offset, meta_length) = \
+                         struct.unpack(INDEX_FILE_PREAMBLE_FORMAT, preamble_str)
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+    if (file_version != INDEX_FILE_VERSION):
+      index_file.close()
+      logging.warn('Index file "%s" has format version %d (current ' % \
+                   (index_file_name, file_version) + 'version is %d), ' % \
+                   (INDEX_FILE_VERSION) + 'index has to be built again')
+      return False
 
-        logging.info('  Index %d for data set 1 contains %d blocks' % \
-                     (i, len(self.index1[i])))
+    index_file.seek(meta_offset)
+    meta_dict = cPickle.loads(index_file.read(meta_length))
 
-        for block_val in self.index1[i]: # Loop over all block values in index
-          block_num_recs = len(self.index1[i][block_val])
+    if ((meta_dict['class'] != self.__class__.__name__) or \
+        (meta_dict['fingerprint'] != self.__get_index_fingerprint__())):
+      index_file.close()
+      logging.warn('Index file "%s" is out of date (data sets, index ' % \
+                   (index_file_name) + 'definitions or settings have ' + \
+                   'changed), index has to be built again')
+      return False
 
-          if (block_num_recs > largest_block_num_rec):  # New largest block
-            largest_block_num_rec =   block_num_recs
-            largest_block_val =       block_val
-            largest_block_index_num = i
+    if ((meta_dict['byteorder'] != sys.byteorder) or \
+        (meta_dict['itemsizes'] != self.__get_index_file_itemsizes__())):
+      index_file.close()
+      logging.warn('Index file "%s" was written on a different platform' % \
+                   (index_file_name) + ', index has to be built again')
+      return False
 
-          self.num_rec_pairs += block_num_recs*(block_num_recs-1)/2
+    index_mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+    index_file.close()  # The memory-map stays valid
 
-      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    section_dict = meta_dict['sections']
 
-        logging.info('  Index %d for data set 1 contains %d blocks, and ' % \
-                     (i, len(self.index1[i]))+'for data set 2 contains %d' % \
-                     (len(self.index2[i]))+' blocks')
+    # Get the record identifiers and map the record caches - - - - - - - - - -
+    #
+    load_list = [(1, self.dataset1, self.comp_field_used1)]
+    if (self.do_deduplication == False):
+      load_list.append((2, self.dataset2, self.comp_field_used2))
 
-        for block_val in self.index1[i]: # Loop over all block values in index
-          block_num_recs1 = len(self.index1[i][block_val])
+    rec_key_lists = {}  # Keys used in the index for each row of a data set
 
-          if block_val in self.index2[i]:  # Blocking values is both data sets'
-                                           # index
-            block_num_recs2 = len(self.index2[i][block_val])
+    for (ds_num, dataset, comp_field_used) in load_list:
+      prefix = 'ds%d.' % (ds_num)
 
-            if (block_num_recs1 > largest_block_num_rec):  # New largest block
-              largest_block_num_rec =   block_num_recs1
-              largest_block_val =       block_val
-              largest_block_index_num = i
+      rec_ident_list = self.__read_index_str_list__(index_mmap, section_dict,
+                                                    prefix+'idents')
+      if (self.intern_rec_idents == True):
+        rec_key_list = range(len(rec_ident_list))
+      else:
+        rec_key_list = rec_ident_list
+
+      column_list = []
+      for i in range(len(comp_field_used)):
+        start_array =  self.__read_index_section__(index_mmap, section_dict,
+                                                   prefix+'starts%d' % (i))
+        length_array = self.__read_index_section__(index_mmap, section_dict,
+                                                   prefix+'lengths%d' % (i))
+        column_list.append((start_array, length_array))
+
+      rec_cache = ColumnarRecordCache(len(dataset.field_list), comp_field_used,
+                                      'buffer')
+      rec_cache.map_buffer(rec_key_list, index_mmap, column_list)
+
+      if (ds_num == 1):
+        self.rec_cache1 = rec_cache
+      else:
+        self.rec_cache2 = rec_cache
 
-            if (block_num_recs2 > largest_block_num_rec):  # New largest block
-              largest_block_num_rec =   block_num_recs2
-              largest_block_val =       block_val
-              largest_block_index_num = i
+      if (self.intern_rec_idents == True):
+        if (ds_num == 1):
+          self.rec_ident_list1 = rec_ident_list
+          self.rec_ident_list2 = rec_ident_list  # Changed if a linkage
+        else:
+          self.rec_ident_list2 = rec_ident_list
 
-            self.num_rec_pairs += block_num_recs1*block_num_recs2
+      rec_key_lists[ds_num] = rec_key_list
 
-    logging.info('Built blocking index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+    rec_key_list1 = rec_key_lists[1]
+    rec_key_list2 = rec_key_lists.get(2, rec_key_list1)
 
-    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
-    logging.info('  Largest block with value "%s" contains %d records' % \
-                 (largest_block_val, largest_block_num_rec)+' (in index %d)' \
-                 % (largest_block_index_num))
+    intern_rec_idents = self.intern_rec_idents  # Shorthand
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+    def get_rec_key_list(rec_num_array, rec_key_list):
+      if (intern_rec_idents == True):  # Record numbers are used directly
+        return rec_num_array
+      else:
+        return [rec_key_list[rec_num] for rec_num in rec_num_array]
 
-    self.status = 'built'  # Update index status
+    if (meta_dict['status'] == 'built'):  # Get the inverted indices - - - - -
 
-  # ---------------------------------------------------------------------------
+      for i in range(len(self.index_def)):
+        self.index1[i] = {}
+        self.index2[i] = {}
 
-  def compact(self):
-    """Method to compact an index data structure.
+      for (ds_num, index, rec_key_list) in [(1, self.index1, rec_key_list1),
+                                            (2, self.index2, rec_key_list2)]:
+        if ((ds_num == 2) and (self.do_deduplication == True)):
+          break
 
-       Make a dictionary of all record pairs over all indices, which removes
-       duplicate record pairs.
-    """
+        for i in range(len(self.index_def)):
+          prefix = 'ds%d.index%d.' % (ds_num, i)
 
-    NUM_BLOCK_PROGRESS_REPORT = 1000
+          block_val_list = self.__read_index_str_list__(index_mmap,
+                                                  section_dict, prefix+'keys')
+          block_lists = self.__read_index_int_lists__(index_mmap,
+                                                  section_dict, prefix+'blocks')
+          this_index = {}
 
-    logging.info('')
-    logging.info('Compact blocking index: "%s"' % (self.description))
+          for j in xrange(len(block_val_list)):
+            this_index[block_val_list[j]] = get_rec_key_list(block_lists[j],
+                                                             rec_key_list)
 
-    start_time = time.time()
+          index[i] = this_index
 
-    num_indices = len(self.index_def)
+    else:  # Get record pairs (and blocks in streaming mode) - - - - - - - - - -
 
-    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'built'):
-      logging.exception('Index "%s" has not been built, compacting is not ' % \
-                        (self.description)+'possible')
-      raise Exception
+      rec_num1_array = self.__read_index_section__(index_mmap, section_dict,
+                                                   'pairs.recs1')
+      rec_num2_lists = self.__read_index_int_lists__(index_mmap, section_dict,
+                                                     'pairs.recs2')
+      rec_pair_dict = {}
 
-    old_num_rec_pairs = self.num_rec_pairs  # Keep old number of record pairs
+      for j in xrange(len(rec_num1_array)):
+        rec_pair_dict[rec_key_list1[rec_num1_array[j]]] = \
+                              get_rec_key_list(rec_num2_lists[j], rec_key_list2)
 
-    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
-                        # as keys and sets of identifiers from data set 2 as
-                        # values
+      self.rec_pair_dict = rec_pair_dict
 
-    for i in range(num_indices):
+      if (self.stream_rec_pairs == True):
+        block_lists1 = self.__read_index_int_lists__(index_mmap, section_dict,
+                                                     'blocks1')
+        if (self.do_deduplication == False):
+          block_lists2 = self.__read_index_int_lists__(index_mmap,
+                                                       section_dict, 'blocks2')
+        self.rec_pair_block_list = []
 
-      istart_time = time.time()
+        for j in xrange(len(block_lists1)):
+          block_list1 = list(get_rec_key_list(block_lists1[j], rec_key_list1))
+          if (self.do_deduplication == True):
+            block_list2 = None
+          else:
+            block_list2 = list(get_rec_key_list(block_lists2[j],
+                                                rec_key_list2))
+          self.rec_pair_block_list.append((block_list1, block_list2))
 
-      num_blocks_done = 0
+        for (ds_num, rec_key_list) in [(1, rec_key_list1), (2, rec_key_list2)]:
+          if ((ds_num == 2) and (self.do_deduplication == True)):
+            break
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+          rec_block_lists = self.__read_index_int_lists__(index_mmap,
+                                    section_dict, 'ds%d.rec_blocks' % (ds_num))
+          rec_block_dict = {}
 
-        this_index = self.index1[i]  # Shorthand
+          for j in xrange(len(rec_key_list)):
+            rec_block_list = rec_block_lists[j]
+            if (len(rec_block_list) > 0):
+              rec_block_dict[rec_key_list[j]] = rec_block_list.tolist()
 
-        for block_val in this_index: # Loop over all block values in index
+          if (ds_num == 1):
+            self.rec_block_dict1 = rec_block_dict
+          else:
+            self.rec_block_dict2 = rec_block_dict
 
-          block_recs = this_index[block_val]  # All records in this block
+    self.num_rec_pairs = meta_dict['num_rec_pairs']
+    self.status =        meta_dict['status']
 
-          if (len(block_recs) > 1):
+    logging.info('Loaded %s index from file "%s" in %s' % \
+                 (self.status, index_file_name,
+                  auxiliary.time_string(time.time()-start_time)))
 
-            self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
+    return True
 
-          num_blocks_done += 1
+  # ---------------------------------------------------------------------------
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, len(this_index)))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+  def save(self, index_file_name):
+    """Save an index into a binary file, so it can be loaded again (using the
+       load() method) without having to build and compact it.
+
+       Only indices that are built or compacted can be saved, and not all index
+       types support this (see INDEX_SAVE_STATUS_LIST in the index classes).
+
+       The file contains a preamble with a magic string and the format version,
+       followed by sections with the record identifiers, the record cache
+       values (one character buffer with start and length arrays per field),
+       and either the inverted indices (block values and lists of record
+       numbers, for a built index) or the record pairs (for a compacted index,
+       in streaming mode also the blocks of records), all stored as integer
+       arrays using record numbers (positions of records in the saved lists of
+       record identifiers). A dictionary with the meta data (including the
+       positions of all sections, and a fingerprint of the data sets, index
+       definitions and settings used to check if a saved index is out of date)
+       is written at the end of the file.
+
+       Integer arrays are stored with native sizes and byte order, so an index
+       file can only be loaded on a similar platform.
+
+       The file is written under a temporary name first and then renamed, so an
+       existing index file is only replaced once the new one is complete.
+    """
 
-      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    auxiliary.check_is_string('index_file_name', index_file_name)
 
-        this_index1 = self.index1[i]  # Shorthands
-        this_index2 = self.index2[i]
+    if (self.status not in self.INDEX_SAVE_STATUS_LIST):
+      if (self.INDEX_SAVE_STATUS_LIST == []):
+        logging.exception('Saving of %s indices is not possible' % \
+                          (self.__class__.__name__))
+      else:
+        logging.exception('Index "%s" with status "%s" can not be saved ' % \
+                          (self.description, self.status) + '(must be: %s)' % \
+                          (str(self.INDEX_SAVE_STATUS_LIST)))
+      raise Exception
 
-        for block_val in this_index1: # Loop over all block values in index
+    start_time = time.time()
 
-          block_recs1 = this_index1[block_val]  # All records in this block
-                                                # from data set 1
-          if block_val in this_index2:  # Blocking values is both data sets'
-                                        # index
+    tmp_file_name = index_file_name+'.tmp'
 
-            block_recs2 = this_index2[block_val] # All records in this block
-                                                 # from data set 2
+    try:
+      index_file = open(tmp_file_name, 'wb')
+    except:
+      logging.exception('Cannot write index file: "%s"' % (tmp_file_name))
+      raise Exception
 
-            self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
+    index_file.write('\x00'*INDEX_FILE_PREAMBLE_SIZE)  # Written at the end
 
-          num_blocks_done += 1
+    section_dict = {}  # Names of sections with their positions and sizes
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, len(this_index1)))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+    # Write the record identifiers and the record caches - - - - - - - - - - -
+    #
+    save_list = [(1, self.rec_cache1, self.comp_field_used1,
+                  self.rec_ident_list1)]
+    if (self.do_deduplication == False):
+      save_list.append((2, self.rec_cache2, self.comp_field_used2,
+                        self.rec_ident_list2))
 
-      logging.info('  Compacted blocking index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
+    rec_key_lists = {}  # Keys used in the index for each row of a data set
+    rec_num_dicts = {}  # Record number for each key used in the index
 
-      self.index1[i].clear()  # Not needed anymore
-      self.index2[i].clear()
+    for (ds_num, rec_cache, comp_field_used, rec_ident_list) in save_list:
+      prefix = 'ds%d.' % (ds_num)
 
-      logging.info('    Explicitly run garbage collection')
-      gc.collect()
+      if (self.intern_rec_idents == True):
+        rec_key_list = range(len(rec_ident_list))
+      else:
+        rec_key_list = list(rec_cache.keys())
+        rec_ident_list = rec_key_list
+
+      for rec_ident in rec_ident_list:
+        if (not isinstance(rec_ident, str)):
+          index_file.close()
+          os.remove(tmp_file_name)
+          logging.exception('Only string record identifiers can be saved: ' + \
+                            '%s' % (repr(rec_ident)))
+          raise Exception
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+      self.__write_index_str_list__(index_file, section_dict, prefix+'idents',
+                                    rec_ident_list)
 
-    self.rec_pair_dict = rec_pair_dict
+      # All field values go into one character section, with the start offsets
+      # (positions in the file) and lengths stored per field
+      #
+      buffer_offset = self.__align_index_file__(index_file)
+
+      char_array =  array.array('c')
+      column_list = [(array.array('L'), array.array('L')) \
+                     for field_ind in comp_field_used]
+
+      for rec_key in rec_key_list:
+        rec = rec_cache[rec_key]
+        rec_len = len(rec)
+
+        for i in range(len(comp_field_used)):
+          field_ind = comp_field_used[i]
+          if (field_ind < rec_len):
+            val = rec[field_ind]
+            if (isinstance(val, unicode)):
+              val = val.encode('utf-8')
+          else:
+            val = ''
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+          (start_array, length_array) = column_list[i]
+          start_array.append(buffer_offset+len(char_array))
+          length_array.append(len(val))
+          char_array.fromstring(val)
 
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+      self.__write_index_section__(index_file, section_dict, prefix+'values',
+                                   char_array)
+      del char_array
 
-    logging.info('Compacted blocking index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Old number of record pairs: %d' % (old_num_rec_pairs))
-    logging.info('  New number of record pairs: %d' % (self.num_rec_pairs))
+      for i in range(len(comp_field_used)):
+        (start_array, length_array) = column_list[i]
+        self.__write_index_section__(index_file, section_dict,
+                                     prefix+'starts%d' % (i), start_array)
+        self.__write_index_section__(index_file, section_dict,
+                                     prefix+'lengths%d' % (i), length_array)
 
-    self.status = 'compacted'  # Update index status
+      rec_key_lists[ds_num] = rec_key_list
 
-  # ---------------------------------------------------------------------------
+      if (self.intern_rec_idents == True):
+        rec_num_dicts[ds_num] = None  # Keys are record numbers
+      else:
+        rec_num_dicts[ds_num] = dict(itertools.izip(rec_key_list,
+                                                    xrange(len(rec_key_list))))
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
-    """Iterate over all blocks in the index.
+    rec_num_dict1 = rec_num_dicts[1]
+    rec_num_dict2 = rec_num_dicts.get(2, rec_num_dict1)
 
-       Compare the record pairs as produced by the blocking process, and return
-       a weight vector dictionary with keys made of a tuple (record identifier
-       1, record identifier 2), and corresponding values the comparison
-       weights.
-    """
+    def get_rec_num_list(rec_key_list, rec_num_dict):
+      if (rec_num_dict == None):
+        return rec_key_list
+      else:
+        return [rec_num_dict[rec_key] for rec_key in rec_key_list]
 
-    logging.info('')
-    logging.info('Started comparison of %d record pairs' % \
-                 (self.num_rec_pairs))
-    if (self.log_funct != None):
-      self.log_funct('Started comparison of %d record pairs' % \
-                     (self.num_rec_pairs))
+    if (self.status == 'built'):  # Write the inverted indices - - - - - - - - -
 
-    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
+      for (ds_num, index, rec_num_dict) in [(1, self.index1, rec_num_dict1),
+                                            (2, self.index2, rec_num_dict2)]:
+        if ((ds_num == 2) and (self.do_deduplication == True)):
+          break
+
+        for i in range(len(self.index_def)):
+          prefix = 'ds%d.index%d.' % (ds_num, i)
+
+          block_val_list = index[i].keys()
+          self.__write_index_str_list__(index_file, section_dict,
+                                        prefix+'keys', block_val_list)
+          self.__write_index_int_lists__(index_file, section_dict,
+                                         prefix+'blocks',
+                     [get_rec_num_list(index[i][block_val], rec_num_dict) \
+                      for block_val in block_val_list])
+
+    else:  # Write the record pairs (and blocks in streaming mode) - - - - - - -
+
+      rec_key1_list = self.rec_pair_dict.keys()
+
+      self.__write_index_section__(index_file, section_dict, 'pairs.recs1',
+                   array.array('i', get_rec_num_list(rec_key1_list,
+                                                     rec_num_dict1)))
+      self.__write_index_int_lists__(index_file, section_dict, 'pairs.recs2',
+                   [get_rec_num_list(self.rec_pair_dict[rec_key1],
+                                     rec_num_dict2) \
+                    for rec_key1 in rec_key1_list])
+
+      if (self.stream_rec_pairs == True):
+        self.__write_index_int_lists__(index_file, section_dict, 'blocks1',
+                   [get_rec_num_list(block_list1, rec_num_dict1) \
+                    for (block_list1, block_list2) in self.rec_pair_block_list])
+        if (self.do_deduplication == False):
+          self.__write_index_int_lists__(index_file, section_dict, 'blocks2',
+                   [get_rec_num_list(block_list2, rec_num_dict2) \
+                    for (block_list1, block_list2) in self.rec_pair_block_list])
+
+        for (ds_num, rec_block_dict) in [(1, self.rec_block_dict1),
+                                         (2, self.rec_block_dict2)]:
+          if ((ds_num == 2) and (self.do_deduplication == True)):
+            break
+
+          self.__write_index_int_lists__(index_file, section_dict,
+                                         'ds%d.rec_blocks' % (ds_num),
+                   [rec_block_dict.get(rec_key, []) \
+                    for rec_key in rec_key_lists[ds_num]])
+
+    # Write the meta data and the preamble - - - - - - - - - - - - - - - - - -
     #
-    if (self.status != 'compacted'):
-      logging.exception('Index "%s" has not been compacted, running ' % \
-                        (self.description)+'comparisons not possible')
-      raise Exception
+    meta_dict = {'class':         self.__class__.__name__,
+                 'description':   self.description,
+                 'fingerprint':   self.__get_index_fingerprint__(),
+                 'status':        self.status,
+                 'num_rec_pairs': self.num_rec_pairs,
+                 'byteorder':     sys.byteorder,
+                 'itemsizes':     self.__get_index_file_itemsizes__(),
+                 'sections':      section_dict}
+
+    meta_offset = self.__align_index_file__(index_file)
+    meta_str = cPickle.dumps(meta_dict, 2)
+    index_file.write(meta_str)
+
+    index_file.seek(0)
+    index_file.write(struct.pack(INDEX_FILE_PREAMBLE_FORMAT, INDEX_FILE_MAGIC,
+                                 INDEX_FILE_VERSION, meta_offset,
+                                 len(meta_str)))
+    index_file.close()
+
+    if (os.path.exists(index_file_name)):
+      os.remove(index_file_name)
+    os.rename(tmp_file_name, index_file_name)
+
+    logging.info('Saved %s index into file "%s" (%d bytes) in %s' % \
+                 (self.status, index_file_name, meta_offset+len(meta_str),
+                  auxiliary.time_string(time.time()-start_time)))
 
-    # Compare the records
-    #
-    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-# =============================================================================
+  def __get_index_fingerprint__(self):
+    """Return a fingerprint (MD5 hex digest) of the data sets, the index
+       definitions and all settings that influence the content of an index.
+    """
 
-class SortingIndex(Indexing):
-  """Class that implements the 'sorted neighbourhood' indexing approach based
-     on an inverted index.
+    fingerprint_list = [INDEX_FILE_VERSION, self.__class__.__name__,
+                        self.index_def, self.index_sep_str, self.skip_missing,
+                        self.stream_rec_pairs, self.intern_rec_idents,
+                        self.do_deduplication, self.rec_cache_storage,
+                        self.comp_field_used1, self.comp_field_used2]
 
-     The index variable values are sorted alphabetically and then a window
-     (with user specified size) is moved over these sorted values. All records
-     in the blocks covered by the current window position are then compared to
-     each other.
+    for param_name in self.INDEX_PARAM_NAMES:  # Index specific settings
+      fingerprint_list.append((param_name, getattr(self, param_name)))
 
-     The additional argument (besides the base class arguments) which has to be
-     set when this index is initialised is:
+    fingerprint_list += [self.dataset1.get_fingerprint(),
+                         self.dataset2.get_fingerprint()]
 
-       window_size  A positive integer that gives the size of the moving window
-                    in number of index variable values.
+    return hashlib.md5(self.__get_fingerprint_str__(fingerprint_list)). \
+                                                                   hexdigest()
 
-     Note that a window_size of 1 will result in the same records being
-     compared as with the standard blocking approach (as a window of size 1
-     does not cover any neighbouring index variable values).
-  """
+  def __get_fingerprint_str__(self, value):
+    """Return a string representation of the given value that does not depend
+       upon memory addresses (functions and methods are given by their names).
+    """
 
-  # ---------------------------------------------------------------------------
+    if (isinstance(value, list) or isinstance(value, tuple)):
+      return '[%s]' % (','.join([self.__get_fingerprint_str__(v) \
+                                 for v in value]))
+    elif (isinstance(value, dict)):
+      return '{%s}' % (','.join(['%s:%s' % (self.__get_fingerprint_str__(k),
+                                            self.__get_fingerprint_str__(v)) \
+                                 for (k,v) in sorted(value.items())]))
+    elif (callable(value) and hasattr(value, '__name__')):
+      return '%s.%s' % (getattr(value, '__module__', ''), value.__name__)
+    else:
+      return repr(value)
 
-  def __init__(self, **kwargs):
-    """Constructor. Process the 'window_size' argument first, then call the
-       base class constructor.
+  def __get_index_file_itemsizes__(self):
+    """Return the sizes (in bytes) of the integer types used in index files.
     """
 
-    self.window_size = None  # Set the window size to not defined
+    return (array.array('i').itemsize, array.array('L').itemsize)
 
-    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
-                      # class constructor
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    for (keyword, value) in kwargs.items():
+  def __align_index_file__(self, index_file):
+    """Pad the index file with zero bytes so its length is a multiple of 8,
+       and return the new position.
+    """
 
-      if (keyword.startswith('window')):
-        auxiliary.check_is_integer('window_size', value)
-        auxiliary.check_is_positive('window_size', value)
-        self.window_size = value
+    file_pos = index_file.tell()
 
-      else:
-        base_kwargs[keyword] = value
+    if ((file_pos % 8) != 0):
+      index_file.write('\x00'*(8 - file_pos % 8))
+      file_pos = index_file.tell()
 
-    Indexing.__init__(self, base_kwargs)  # Initialise base class
+    return file_pos
 
-    # Make sure 'window_size' attribute is set - - - - - - - - - - - - - - - -
-    #
-    auxiliary.check_is_integer('window_size', self.window_size)
-    auxiliary.check_is_positive('window_size', self.window_size)
+  def __write_index_section__(self, index_file, section_dict, name,
+                              data_array):
+    """Write an array into the index file as a section with the given name.
+    """
 
-    self.log([('Window size', self.window_size)])  # Log a message
+    file_pos = self.__align_index_file__(index_file)
 
-  # ---------------------------------------------------------------------------
+    data_array.tofile(index_file)
 
-  def build(self):
-    """Method to build an index data structure.
+    section_dict[name] = (file_pos, data_array.typecode, len(data_array))
 
-       Read all records from both files, extract blocking variables and then
-       insert records into blocks.
+  def __write_index_str_list__(self, index_file, section_dict, name, str_list):
+    """Write a list of strings as a character section and an array of offsets
+       into it (one more than the number of strings).
     """
 
-    logging.info('')
-    logging.info('Build sorting index: "%s"' % (self.description))
+    offset_array = array.array('L', [0])
+    char_array =   array.array('c')
 
-    start_time = time.time()
+    for str_val in str_list:
+      char_array.fromstring(str_val)
+      offset_array.append(len(char_array))
 
-    self.__records_into_inv_index__()  # Read records and put into index
+    self.__write_index_section__(index_file, section_dict, name+'.chars',
+                                 char_array)
+    self.__write_index_section__(index_file, section_dict, name+'.offsets',
+                                 offset_array)
 
-    logging.info('Built sorting index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+  def __write_index_int_lists__(self, index_file, section_dict, name,
+                                int_lists):
+    """Write a list of integer lists as one array with all the integers and an
+       array of offsets into it (one more than the number of lists).
+    """
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+    offset_array = array.array('L', [0])
+    value_array =  array.array('i')
 
-    self.status = 'built'  # Update index status
+    for int_list in int_lists:
+      value_array.extend(int_list)
+      offset_array.append(len(value_array))
 
-  # ---------------------------------------------------------------------------
+    self.__write_index_section__(index_file, section_dict, name+'.values',
+                                 value_array)
+    self.__write_index_section__(index_file, section_dict, name+'.offsets',
+                                 offset_array)
 
-  def compact(self):
-    """Method to compact an index data structure.
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-       Make a dictionary of all record pairs over all indices, which removes
-       duplicate record pairs.
+  def __read_index_section__(self, index_mmap, section_dict, name):
+    """Return the section with the given name from a memory-mapped index file
+       as an array.
     """
 
-    NUM_BLOCK_PROGRESS_REPORT = 1000
-
-    logging.info('')
-    logging.info('Compact sorting index: "%s"' % (self.description))
-
-    start_time = time.time()
+    (file_pos, typecode, num_items) = section_dict[name]
 
-    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'built'):
-      logging.exception('Index "%s" has not been built, compacting is not ' % \
-                        (self.description)+'possible')
-      raise Exception
+    data_array = array.array(typecode)
+    data_array.fromstring(index_mmap[file_pos:file_pos + \
+                                     num_items*data_array.itemsize])
+    return data_array
 
-    num_indices = len(self.index_def)
+  def __read_index_str_list__(self, index_mmap, section_dict, name):
+    """Return a list of strings written with __write_index_str_list__().
+    """
 
-    dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
-    link_rec_pair_funct =  self.__link_rec_pairs__
-    w =                    self.window_size
+    (file_pos, typecode, num_chars) = section_dict[name+'.chars']
+    chars = index_mmap[file_pos:file_pos+num_chars]
 
-    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
-                        # as keys and sets of identifiers from data set 2 as
-                        # values
+    offset_array = self.__read_index_section__(index_mmap, section_dict,
+                                               name+'.offsets')
 
-    for i in range(num_indices):
+    return [chars[offset_array[i]:offset_array[i+1]] \
+            for i in xrange(len(offset_array)-1)]
 
-      istart_time = time.time()
+  def __read_index_int_lists__(self, index_mmap, section_dict, name):
+    """Return a list of integer arrays written with
+       __write_index_int_lists__().
+    """
 
-      num_blocks_done = 0
+    value_array =  self.__read_index_section__(index_mmap, section_dict,
+                                               name+'.values')
+    offset_array = self.__read_index_section__(index_mmap, section_dict,
+                                               name+'.offsets')
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+    return [value_array[offset_array[i]:offset_array[i+1]] \
+            for i in xrange(len(offset_array)-1)]
 
-        this_index = self.index1[i]  # Shorthand
+  # ---------------------------------------------------------------------------
 
-        w_block_len = [0]*w  # Counts of number of records in blocks in window
+  def __get_index_values__(self, rec, data_set_num):
+    """For the given record (list of fields) extract and produce the indexing
+       values. Returns a list with the indexing variable values (one per index
+       definition).
 
-        curr_window_recs = []  # List of record identifiers in current window
+       The data set number can be 0 (if the record is from the first data set)
+       or 1 (if it is from the second data set).
+    """
 
-        block_val_list = this_index.keys()  # Get all blocking values
-        block_val_list.sort()
+    index_var_values = []
 
-        num_block_vals = len(block_val_list)
+    sep_str = self.index_sep_str
 
-        for j in xrange(num_block_vals):  # Loop over all blocks
+    index_val_cache_list = self.index_val_cache_list  # None if not used
+    index_val_cache_size = self.index_val_cache_size
 
-          w_j = j % w  # Modulo window size
+    assert (data_set_num == 0) or (data_set_num == 1)
 
-          # Remove record identifiers from previous block
-          #
-          curr_window_recs = curr_window_recs[w_block_len[w_j]:]
+    # Go through the index definitions and extract and process field values - -
+    #
+    for i in range(len(self.index_def_proc)):
+      index_def_list = self.index_def_proc[i]
 
-          new_window_recs = set()
+      index_val_list = []
 
-          # Insert record identifiers from this block that are not in yet
-          #
-          for rec_ident in this_index[block_val_list[j]]:
+      for j in range(len(index_def_list)):  # Loop over the index' definitions
+        index_def = index_def_list[j]
 
-            if (rec_ident not in curr_window_recs):
-              new_window_recs.add(rec_ident)
+        field_col = index_def[data_set_num]  # Column of the field to extract
 
-          # Number of new records (previously not in window) from this block
-          #
-          w_block_len[w_j] = len(new_window_recs)
+        if (field_col >= len(rec)):
+          org_field_val = ''
+        else:
+          org_field_val = rec[field_col]
 
-          curr_window_recs += list(new_window_recs)
+        if (org_field_val == ''):  # Empty field values are not indexed
+          continue
 
-          if (len(curr_window_recs) > 1):
+        # Check if this field value has been processed before - - - - - - - - -
+        #
+        if (index_val_cache_list != None):
+          index_val_cache = index_val_cache_list[i][j]
 
-            dedup_rec_pair_funct(curr_window_recs, rec_pair_dict)
+          funct_val = index_val_cache.get(org_field_val, None)
 
-          num_blocks_done += 1
+          if (funct_val != None):
+            self.index_val_cache_hits += 1
+            index_val_list.append(funct_val)
+            continue
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, num_block_vals))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+          self.index_val_cache_misses += 1
 
-        del curr_window_recs
+        field_val = org_field_val.lower()
 
-      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        # Check for sorting of words
+        #
+        if ((' ' in field_val) and (index_def[2] == True)):
+          word_list = field_val.split()
+          word_list.sort()
+          field_val = ' '.join(word_list)
+
+        if (index_def[3] == True):  # Reverse the index value
+          field_val = field_val[::-1]
+
+        funct_def = index_def[5]
+
+        if (funct_def != None):  # There is a function defined for this index
+          funct_call =    funct_def[0]  # The function itself
+          num_funct_arg = len(funct_def)
+
+          if (num_funct_arg == 1):  # No arguments
+            funct_val = funct_call(field_val)
+          elif (num_funct_arg == 2):  # One argument
+            funct_val = funct_call(field_val, funct_def[1])
+          elif (num_funct_arg == 3):  # Two arguments
+            funct_val = funct_call(field_val, funct_def[1], funct_def[2])
+          elif (num_funct_arg == 4):  # Three arguments
+            funct_val = funct_call(field_val, funct_def[1], funct_def[2],
+                                   funct_def[3])
+          else:
+            logging.exception('Too many arguments for function call: %s' % \
+                              (str(funct_def)))
+            raise Exception
+        else:
+         funct_val = field_val  # No function applied to the field value
 
-        this_index1 = self.index1[i]  # Shorthands
-        this_index2 = self.index2[i]
+        if (index_def[4] != None):  # There is  maximum length
+          funct_val = funct_val[:index_def[4]]
 
-        w_block_len1 = [0]*w  # Counts of number of records in blocks in window
-        w_block_len2 = [0]*w
+        if (index_val_cache_list != None):  # Keep the index value
+          if (len(index_val_cache) >= index_val_cache_size):
+            index_val_cache.clear()  # Cache is full, start again
+          index_val_cache[org_field_val] = funct_val
 
-        curr_window_recs1 = []  # List of record identifiers in current window
-        curr_window_recs2 = []
+        index_val_list.append(funct_val)
 
-        block_val_list1 = this_index1.keys()  # Get all blocking values
-        block_val_list1.sort()
+      # Make it a string and add to list of index values
+      #
+      index_val = sep_str.join(index_val_list)
 
-        block_val_list2 = this_index2.keys()
-        block_val_list2.sort()
+      index_var_values.append(index_val)
 
-        num_block_vals1 = len(block_val_list1)
-        num_block_vals2 = len(block_val_list2)
+    assert len(index_var_values) == len(self.index_def_proc)
 
-        # Create a sorted combined list of all blocking values
-        #
-        comb_block_values = list(set(block_val_list1+block_val_list2))
-        comb_block_values.sort()
+    return index_var_values
 
-        j = 0  # Iteration counters in block values 1 and 2
-        k = 0
+  # ---------------------------------------------------------------------------
 
-        do_delete1 = False  # Flags, signalling if current window block
-        do_delete2 = False
+  def __log_index_val_cache_stats__(self):
+    """Log the number of hits and misses of the index value memo caches since
+       this method was called the last time, and reset these numbers.
+    """
 
-        # Loop over combined list of block values - - - - - - - - - - - - - - -
-        #
-        for block_val in comb_block_values:
+    if (self.index_val_cache_list == None):
+      return
 
-          if (block_val in block_val_list1):  # Advance window for data set 1
+    num_hits =   self.index_val_cache_hits
+    num_misses = self.index_val_cache_misses
+    num_lookups = num_hits + num_misses
 
-            w_j = j % w  # Modulo window size
+    if (num_lookups > 0):
+      hit_perc = 100.0 * num_hits / num_lookups
+    else:
+      hit_perc = 0.0
 
-            # Remove record identifiers from previous block
-            #
-            curr_window_recs1 = curr_window_recs1[w_block_len1[w_j]:]
+    num_cache_vals = 0
+    for index_val_cache_list in self.index_val_cache_list:
+      for index_val_cache in index_val_cache_list:
+        num_cache_vals += len(index_val_cache)
 
-            new_window_recs = set()
+    logging.info('  Index value caches: %d hits, %d misses (%.1f%% hit ' % \
+                 (num_hits, num_misses, hit_perc) + 'rate), %d values ' % \
+                 (num_cache_vals) + 'cached')
 
-            # Insert record identifiers from this block that are not in yet
-            #
-            for rec_ident in this_index1[block_val]:
+    self.index_val_cache_hits =   0
+    self.index_val_cache_misses = 0
 
-              if (rec_ident not in curr_window_recs1):
-                new_window_recs.add(rec_ident)
+  # ---------------------------------------------------------------------------
 
-            # Number of new records (previously not in window) from this block
-            #
-            w_block_len1[w_j] = len(new_window_recs)
+  def __open_shelve_file__(self, shelve_file_name):
+    """Open a shelve with the given file name, and clear all it's content.
 
-            curr_window_recs1 += list(new_window_recs)
+       Return the shelve.
+    """
 
-            j += 1  # Advance pointer into data set 1 blocks
+    try:
+      this_shelve = shelve.open(shelve_file_name)
+    except:
+      logging.exception('Cannot open shelve: "%s"' % str(shelve_file_name))
+      raise Exception
 
-          if (block_val in block_val_list2):  # Advance window for data set 2 -
+    for rec_key in this_shelve:  # Now clear the shelve and remove all entries
 
-            w_k = k % w  # Modulo window size
+        del this_shelve[rec_key]
 
-            # Remove record identifiers from previous block
-            #
-            curr_window_recs2 = curr_window_recs2[w_block_len2[w_k]:]
+    this_shelve.sync()  # And make sure the database is updated
 
-            new_window_recs = set()
+    return this_shelve
 
-            # Insert record identifiers from this block that are not in yet
-            #
-            for rec_ident in this_index2[block_val]:
+  # ---------------------------------------------------------------------------
 
-              if (rec_ident not in curr_window_recs2):
-                new_window_recs.add(rec_ident)
+  def __log_build_progress__(self, records_read, num_records, start_time):
+    """Create a log message for the number of records read and indexed so far,
+       the time used, and an estimation of much longer it will take.
+    """
 
-            # Number of new records (previously not in window) from this block
-            #
-            w_block_len2[w_k] = len(new_window_recs)
+    used_time = time.time() - start_time
+    perc_done = 100.0 * records_read / num_records
+    rec_time  = used_time / records_read  # Time per record read and indexed
+    togo_time = (num_records - records_read) * rec_time
 
-            curr_window_recs2 += list(new_window_recs)
+    used_sec_str = auxiliary.time_string(used_time)
+    rec_sec_str =  auxiliary.time_string(rec_time)
+    togo_sec_str = auxiliary.time_string(togo_time)
 
-            k += 1  # Advance pointer into data set 2 blocks
+    log_str = 'Read and indexed %d of %d records (%d%%) in %s (%s per' % \
+              (records_read, num_records, round(perc_done), used_sec_str,
+              rec_sec_str)+' record), estimated %s until finished.' % \
+              (togo_sec_str)
+    logging.info(log_str)
 
-          link_rec_pair_funct(curr_window_recs1, curr_window_recs2,
-                              rec_pair_dict)
+    if (self.log_funct != None):
+      self.log_funct(log_str)
 
-          num_blocks_done += 1
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('    '+memory_usage_str)
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, len(comb_block_values)))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+  # ---------------------------------------------------------------------------
 
-        del curr_window_recs1
-        del curr_window_recs2
+  def __log_comparison_progress__(self, comparison_count, start_time):
+    """Create a log message for the number of comparison done so far, the time
+       used, and an estimation of much longer it will take.
+    """
 
-      logging.info('  Compacted sorting index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
+    used_time = time.time() - start_time
+    perc_done = int(round(100.0 * comparison_count / self.num_rec_pairs))
+    rec_time  = used_time / comparison_count  # Time per record pair comparison
+    togo_time = (self.num_rec_pairs - comparison_count) * rec_time
 
-      self.index1[i].clear()  # Not needed anymore
-      self.index2[i].clear()
+    used_sec_str = auxiliary.time_string(used_time)
+    rec_sec_str =  auxiliary.time_string(rec_time)
+    togo_sec_str = auxiliary.time_string(togo_time)
 
-      logging.info('    Explicitly run garbage collection')
-      gc.collect()
+    log_str = 'Compared %d of %d record pairs (%d%%) in %s (%s per ' % \
+              (comparison_count, self.num_rec_pairs, perc_done, used_sec_str,
+              rec_sec_str)+'pair), estimated %s until finished.' % \
+              (togo_sec_str)
+    logging.info(log_str)
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+    if (self.log_funct != None):
+      self.log_funct(log_str)
 
-    self.rec_pair_dict = rec_pair_dict
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('    '+memory_usage_str)
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+  # ---------------------------------------------------------------------------
 
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+  def log(self, instance_var_list = None):
+    """Write a log message with the basic index instance variables plus the
+       instance variable provided in the given input list (assumed to contain
+       pairs of names (strings) and values).
+    """
 
-    logging.info('Compacted sorting index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+    logging.info('')
+    logging.info('Index:                    "%s"' % (self.description))
+    logging.info('  Index status:           %s' % (self.status))
+    logging.info('  Data set 1:             %s' % (self.dataset1.description))
+    logging.info('  Data set 2:             %s' % (self.dataset2.description))
+    if (self.do_deduplication == True):
+      logging.info('  Data sets are the same: Deduplication')
+    else:
+      logging.info('  Data sets differ:       Linkage')
+    logging.info('  Record comparator:      %s' % \
+                 (self.rec_comparator.description))
+    logging.info('    Used fields indices from data set 1: %s' % \
+                 (str(self.comp_field_used1)))
+    logging.info('    Used fields indices from data set 2: %s' % \
+                 (str(self.comp_field_used2)))
+    logging.info('  Skip missing:           %s' % (str(self.skip_missing)))
+    logging.info('  Record cache storage:   %s' % (self.rec_cache_storage))
+    logging.info('  Index value cache size: %d' % (self.index_val_cache_size))
+    if (self.num_build_workers != None):
+      logging.info('  Build worker processes: %d' % (self.num_build_workers))
+    logging.info('  Index separator string: "%s"' % (self.index_sep_str))
 
-    self.status = 'compacted'  # Update index status
+    if (self.num_rec_pairs == None):
+      logging.info('  Number of record pairs: Not known yet')
+    else:
+      logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+    if (self.progress_report == None):
+      logging.info('  No progress reported.')
+    else:
+      logging.info('  Progress report every:  %d%%' % (self.progress_report))
+    if (self.weight_vec_file != None):
+      logging.info('  Weight vectors will be written into: %s' % \
+                   (self.weight_vec_file))
 
-  # ---------------------------------------------------------------------------
+    if (instance_var_list != None):
+      logging.info('  Index specific variables:')
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
-    """Iterate over all blocks in the index.
+      max_name_len = 0
+      for (name, value) in instance_var_list:
+        max_name_len = max(max_name_len, len(name))
 
-       Compare the record pairs as produced by the sorting indexing process,
-       and return a weight vector dictionary with keys made of a tuple (record
-       identifier 1, record identifier 2), and corresponding values the
-       comparison weights.
-    """
+      for (name, value) in instance_var_list:
+        pad_spaces = (max_name_len-len(name))*' '
+        logging.info('    %s %s' % (name+':'+pad_spaces, str(value)))
 
-    logging.info('')
-    logging.info('Started comparison of %d record pairs' % \
-                 (self.num_rec_pairs))
-    if (self.log_funct != None):
-      self.log_funct('Started comparison of %d record pairs' % \
-                     (self.num_rec_pairs))
+    if (self.index_def != []):  # Index definitions are not empty - - - - - - -
+      logging.info('  Index definitions:')
+      for i in range(len(self.index_def)):
+        logging.info('    Index %d:' % (i))
 
-    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'compacted'):
-      logging.exception('Index "%s" has not been compacted, running ' % \
-                        (self.description)+'comparisons not possible')
-      raise Exception
+        for j in range(len(self.index_def[i])):
+          index_def = self.index_def[i][j]
+          index_def_proc = self.index_def_proc[i][j]
 
-    # Compare the records
-    #
-    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+          logging.info('      Data set 1 and 2 field names: "%s" (at column' \
+                       % (index_def[0]) + ' %d) and "%s" (at column %d)' % \
+                       (index_def_proc[0], index_def[1], index_def_proc[1]))
+          logging.info('        Sort words flag set to %s' % \
+                       (str(index_def[2])))
+          logging.info('        Reverse flag set to %s' % (str(index_def[3])))
 
+          if (index_def_proc[4] == None):
+            logging.info('        No maximum length for index variable ' + \
+                         'specified')
+          else:
+            logging.info('        Maximum length for index variable: %d' % \
+                         (index_def_proc[4]))
+          if (index_def_proc[5] == None):
+            logging.info('        No function specified')
+          else:
+            funct_str = '        Function: %s' % (str(index_def_proc[5][0]))
+            param_str = ''
+            if (len(index_def_proc[5]) > 1):
+              param_str += ' with parameter(s): '
+              for p in index_def_proc[5][1:]:
+                param_str += str(p)+', '
+            logging.info(funct_str+param_str[:-2])
 
-# =============================================================================
+  # ---------------------------------------------------------------------------
 
-class SortingArrayIndex(Indexing):
-  """Class that implements the 'sorted neighbourhood' indexing approach based
-     on a sorted array.
+  def get_index_stats(self):
+    """Extract and log information about the index.
+    """
 
-     The index variable values are sorted alphabetically and then a window
-     (with user specified size) is moved over these sorted values. All records
-     in the blocks covered by the current window position are then compared to
-     each other.
+    pass
 
-     The additional argument (besides the base class arguments) which has to be
-     set when this index is initialised is:
+# =============================================================================
 
-       window_size  A positive integer that gives the size of the moving window
-                    in number of index variable values.
+class FullIndex(Indexing):
+  """Class that implements a 'full' index which does not generate an index but
+     will compare all record pairs from the two data sets.
 
-     Note that a window_size of 1 will result in no records being compared with
-     each other (this is different from the previous SortingIndex above).
+     Note this will be very very slow for large data sets. The number of record
+     pairs to be compared corresponds to the number of records in the first
+     data set times the number of records in the second data set.
+
+     Note that the index definition will be ignored, as all record pairs will
+     be compared. Neither will length filtering nor the cut-off threshold be
+     applied.
   """
 
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the 'window_size' argument first, then call the
-       base class constructor.
+    """No additional attributes needed, just call base class constructor.
     """
 
-    self.window_size = None  # Set the window size to not defined
-
-    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
-                      # class constructor
-
-    for (keyword, value) in kwargs.items():
-
-      if (keyword.startswith('window')):
-        auxiliary.check_is_integer('window_size', value)
-        auxiliary.check_is_positive('window_size', value)
-        if (value == 1):
-          logging.exception('Window size must be larger than 1.')
-          raise Exception
+    Indexing.__init__(self, kwargs)  # Initialise base class
+    self.__check_inv_index_settings__()
 
-        self.window_size = value
+    num_rec1 = self.dataset1.num_records
+    num_rec2 = self.dataset2.num_records
 
-      else:
-        base_kwargs[keyword] = value
+    if (num_rec1 < num_rec2):  # Make references to small and large data sets
+      self.ds_swapped = False
+      self.small_dataset = self.dataset1
+      self.large_dataset = self.dataset2
+    else:  # This will also hold for a deduplication
+      self.ds_swapped = True
+      self.small_dataset = self.dataset2
+      self.large_dataset = self.dataset1
 
-    Indexing.__init__(self, base_kwargs)  # Initialise base class
+    if (self.do_deduplication == True):
+      assert num_rec1 == num_rec2
+      self.num_rec_pairs = num_rec1*(num_rec2-1)/2
 
-    # Make sure 'window_size' attribute is set - - - - - - - - - - - - - - - -
-    #
-    auxiliary.check_is_integer('window_size', self.window_size)
-    auxiliary.check_is_positive('window_size', self.window_size)
+    else:
+      self.num_rec_pairs = num_rec1*num_rec2
 
-    self.log([('Window size', self.window_size)])  # Log a message
+    self.log()
 
   # ---------------------------------------------------------------------------
 
   def build(self):
     """Method to build an index data structure.
 
-       Read all records from both files, extract blocking variables and then
-       insert records into blocks.
+       If the smaller data set is not memory based it will be loaded into
+       memory (as a dictionary) to make the comparisons faster.
+
+       Otherwise nothing needs to be done.
     """
 
     logging.info('')
-    logging.info('Build sorted array index: "%s"' % (self.description))
+    logging.info('Built full index: "%s"' % (self.description))
 
     start_time = time.time()
 
-    self.__records_into_inv_index__()  # Read records and put into index
+    small_data_set_dict = {}
 
-    logging.info('Built sorted array index in %s' % \
+    # Copy all records into the memory based dictionary - - - - - - - - - - - -
+    #
+    for (rec_ident, rec_list) in self.small_dataset.readall():
+      if (rec_ident in small_data_set_dict):
+        logging.exception('Duplicate record identifier "%s" in small data ' % \
+                          (rec_ident) + 'set')
+
+      rec_list_lower = []  # Make all values lowercase
+      for rec_val in rec_list:
+        rec_list_lower.append(rec_val.lower())
+
+      small_data_set_dict[rec_ident] = rec_list_lower
+
+    # assert self.small_dataset.num_records == len(small_data_set_dict)
+
+    self.small_data_set_dict = small_data_set_dict
+
+    logging.info('Built full index in %s' % \
                  (auxiliary.time_string(time.time()-start_time)))
 
     memory_usage_str = auxiliary.get_memory_usage()
@@ -2166,213 +3809,2617 @@ class SortingArrayIndex(Indexing):
   def compact(self):
     """Method to compact an index data structure.
 
-       Make a dictionary of all record pairs over all indices, which removes
-       duplicate record pairs.
+       Nothing needs to be done.
     """
 
-    NUM_BLOCK_PROGRESS_REPORT = 1000
-
     logging.info('')
-    logging.info('Compact sorted array index: "%s"' % (self.description))
+    logging.info('Compact full index: "%s"' % (self.description))
+    logging.info('  Nothing needs to be done.')
 
-    start_time = time.time()
+    self.status = 'compacted'  # Update index status
 
-    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'built'):
-      logging.exception('Index "%s" has not been built, compacting is not ' % \
-                        (self.description)+'possible')
-      raise Exception
+  # ---------------------------------------------------------------------------
 
-    num_indices = len(self.index_def)
+  def run(self, length_filter_perc = None, cut_off_threshold = None):
+    """Iterate over all blocks in the index.
 
-    dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
-    link_rec_pair_funct =  self.__link_rec_pairs__
-    w =                    self.window_size
+       Compare all record pairs (quadratic complexity), and return a weight
+       vector dictionary with keys made of a tuple (record identifier 1,
+       record identifier 2), and corresponding values the comparison weights.
 
-    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
-                        # as keys and sets of identifiers from data set 2 as
-                        # values
+       Length filtering and cut-off threshold will both be ignored.
+    """
 
-    for i in range(num_indices):
+    logging.info('Started comparison of %d record pairs' % \
+                 (self.num_rec_pairs))
+    if (self.log_funct != None):
+      self.log_funct('Started comparison of %d record pairs' % \
+                     (self.num_rec_pairs))
 
-      istart_time = time.time()
+    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'compacted'):  # Not necessary, but keep code consistent
+      logging.exception('Index "%s" has not been compacted, running ' % \
+                        (self.description)+'comparisons not possible')
+      raise Exception
 
-      num_blocks_done = 0
+    # Check if weight vector file should be written - - - - - - - - - - - - - -
+    #
+    if (self.weight_vec_file != None):
+      try:
+        weight_vec_fp = open(self.weight_vec_file, 'w')
+      except:
+        logging.exception('Cannot write weight vector file: %s' % \
+                          (self.weight_vec_file))
+        raise Exception
+      weight_vec_writer = csv.writer(weight_vec_fp)
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+      # Write header line with descriptions of field comparisons
+      #
+      weight_vec_header_line = ['rec_id1', 'rec_id2'] + \
+                                self.__get_field_names_list__()
+      weight_vec_writer.writerow(weight_vec_header_line)
 
-        this_index = self.index1[i]  # Shorthand
+    start_time = time.time()
 
-        rec_sorted_array = []  # The sorted array with the record identifiers
+    # Calculate a counter for the progress report - - - - - - - - - - - - - - -
+    #
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(self.num_rec_pairs / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = self.num_rec_pairs + 1
+
+    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+
+    comp_done = 0  # Counter for the number of comparisons done so far
+
+    compare_funct =       self.rec_comparator.compare  # Shorthands
+    small_data_set_dict = self.small_data_set_dict
+    rec_length_cache =    self.rec_length_cache
+
+    if (self.do_deduplication == True):  # A deduplication run - - - - - - - -
+
+      # Need a sorted list of all record identifiers
+      #
+      small_data_set_rec_id_list = small_data_set_dict.keys()
+      small_data_set_rec_id_list.sort()
+
+      rec_cnt = 1  # Counter for second record identifier
+
+      for rec_ident1 in small_data_set_rec_id_list:
+        rec1 = small_data_set_dict[rec_ident1]  # Get values of first record
+
+        for rec_ident2 in small_data_set_rec_id_list[rec_cnt:]:
+
+          assert rec_ident1 != rec_ident2  # Make sure they are different
+
+          rec2 = small_data_set_dict[rec_ident2]  # Get values of second record
+
+          w_vec = compare_funct(rec1, rec2)  # Compare them
+
+          # Put result into weight vector dictionary
+          #
+          if (self.weight_vec_file == None):
+            weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+          else:
+            weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+
+          comp_done += 1
+
+          if ((comp_done % progress_report_cnt) == 0):
+            self.__log_comparison_progress__(comp_done, start_time)
+
+        rec_cnt += 1
+
+    else: # A linkage run - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+      for (rec_ident1, rec1) in self.large_dataset.readall():
+
+        rec1_lower = []  # Make all values lowercase
+        for rec_val in rec1:
+          rec1_lower.append(rec_val.lower())
+        rec1 = rec1_lower
+
+        for (rec_ident2, rec2) in small_data_set_dict.iteritems():
+
+          w_vec = compare_funct(rec1, rec2)  # Compare them
+
+          # Put result into weight vector dictionary
+          #
+          if (self.weight_vec_file == None):
+            if (self.ds_swapped == True):
+              weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+            else:
+              weight_vec_dict[(rec_ident2, rec_ident1)] = w_vec
+          else:
+            if (self.ds_swapped == True):
+              weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+            else:
+              weight_vec_writer.writerow([rec_ident2, rec_ident1]+w_vec)
+
+          comp_done += 1
+
+          if ((comp_done % progress_report_cnt) == 0):
+            self.__log_comparison_progress__(comp_done, start_time)
+
+
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                         self.num_rec_pairs)
+    logging.info('Compared %d record pairs in %s (%s per pair)' % \
+                 (self.num_rec_pairs, used_sec_str,rec_time_str))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.rec_comparator.flush_cache()  # Commit weights added to cache files
+
+    if (self.weight_vec_file == None):
+      return [self.__get_field_names_list__(), weight_vec_dict]
+    else:
+      weight_vec_fp.close()
+      return None
+
+# =============================================================================
+
+class BlockingIndex(Indexing):
+  """Class that implements the 'classical' blocking used for record linkage.
+
+     Records that have the same index variable values for an index are put into
+     the same blocks, and only records within a block are then compared.
+
+     The additional argument (besides the base class arguments) which can be
+     set when a blocking index is initialised is:
+
+       incremental  A flag, if set to True the blocks are kept when the index
+                    is compacted (rather than being removed), so that records
+                    can later be added to and removed from the compacted index
+                    using the add_records() and remove_records() methods, with
+                    only the record pairs of the added records being generated
+                    and compared. For each record the blocks it is in are kept
+                    as well. This cannot be used in streaming mode (argument
+                    'stream_rec_pairs'). Default is False.
+
+     Very large blocks (for example of common surnames or postcodes) can
+     result in more record pairs than all other blocks together. The following
+     arguments can be used to limit them:
+
+       max_block_size      The maximum number of records (from one data set)
+                           a block can contain. Default is None (no limit).
+       max_block_pairs     The maximum number of record pairs a block can
+                           generate. Default is None (no limit).
+       large_block_method  What to do with blocks that exceed one of these
+                           limits. Possible values are:
+                           - 'drop'   Remove the block from the index. For
+                                      each large block an entry (index number,
+                                      block value, number of records from data
+                                      sets 1 and 2, number of record pairs) is
+                                      logged and added to the list
+                                      'large_block_list'.
+                           - 'split'  Split the block into sub-blocks
+                                      according to the values of the
+                                      'sub_block_def' index definition.
+                                      Sub-blocks that still exceed one of the
+                                      limits are dropped (and added to the
+                                      'large_block_list').
+                           - ('sort', window_size)
+                                      Sort the records in the block according
+                                      to their 'sub_block_def' values and only
+                                      compare records that are within the given
+                                      window size (sorted neighbourhood within
+                                      the block).
+                           Default is 'drop'.
+       sub_block_def       An index definition (a list of field definitions in
+                           the same format as the ones in 'index_def') that is
+                           used to split or sort large blocks. Records with an
+                           empty sub-block value are put together.
+
+     Large blocks are processed in the build() method, so the number of
+     record pairs (logged when the index is built) already takes them into
+     account. They cannot be limited in an incremental index.
+  """
+
+  INDEX_SAVE_STATUS_LIST = ['built', 'compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['incremental', 'max_block_size',
+                       'max_block_pairs', 'large_block_method',
+                       'sub_block_def']  # See Indexing.save()
+
+  SUB_BLOCK_SEP_STR = '\x1f'  # Separates block values and sub-block values
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, **kwargs):
+    """Constructor. Process the index specific arguments first, then call the
+       base class constructor.
+
+       Note that number of record pairs will not be known after initialisation
+       (so it is left at value None).
+    """
+
+    self.incremental = False
+
+    self.rec_block_val_dict1 = {}  # For incremental indices, the block values
+                                   # (as tuples (index number, block value)) of
+                                   # each record from data set 1
+    self.rec_block_val_dict2 = {}  # Same for data set 2
+    self.rec_num_dict1 =       {}  # For incremental indices with interned
+                                   # record identifiers, the record numbers of
+                                   # all record identifiers from data set 1
+    self.rec_num_dict2 =       {}  # Same for data set 2
+    self.blocks_kept =      False  # Set to True when an incremental index has
+                                   # been compacted (and its blocks were kept)
+
+    self.max_block_size =      None
+    self.max_block_pairs =     None
+    self.large_block_method = 'drop'
+    self.sub_block_def =       None
+    self.sub_block_def_proc =  None  # Processed version of the sub-block
+                                     # definition
+    self.sub_block_val_cache = None  # Index value memo cache for sub-blocks
+    self.large_block_list =    []    # Tuples (index number, block value,
+                                     # number of records from data sets 1 and
+                                     # 2, number of record pairs) of the blocks
+                                     # that exceeded the limits
+
+    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
+                      # class constructor
+
+    for (keyword, value) in kwargs.items():
+      if (keyword.startswith('increm')):
+        auxiliary.check_is_flag('incremental', value)
+        self.incremental = value
+
+      elif (keyword.startswith('max_block_s')):
+        if (value != None):
+          auxiliary.check_is_integer('max_block_size', value)
+          auxiliary.check_is_positive('max_block_size', value)
+        self.max_block_size = value
+
+      elif (keyword.startswith('max_block_p')):
+        if (value != None):
+          auxiliary.check_is_integer('max_block_pairs', value)
+          auxiliary.check_is_positive('max_block_pairs', value)
+        self.max_block_pairs = value
+
+      elif (keyword.startswith('large_b')):
+        self.large_block_method = value
+
+      elif (keyword.startswith('sub_b')):
+        auxiliary.check_is_list('sub_block_def', value)
+        self.sub_block_def = value
+
+      else:
+        base_kwargs[keyword] = value
+
+    # Check and process the sub-block definition as an additional index
+    # definition in the base class (it is removed again afterwards)
+    #
+    if (self.sub_block_def != None):
+      for keyword in base_kwargs:
+        if (keyword.startswith('index_d')):
+          auxiliary.check_is_list('index_def', base_kwargs[keyword])
+          base_kwargs[keyword] = base_kwargs[keyword] + [self.sub_block_def]
+
+    Indexing.__init__(self, base_kwargs)  # Initialise base class
+
+    if (self.sub_block_def != None):
+      self.index_def.pop()
+      self.sub_block_def_proc = self.index_def_proc.pop()
+      if (self.index_val_cache_list != None):
+        self.sub_block_val_cache = self.index_val_cache_list.pop()
+
+    # Check the large block method - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (isinstance(self.large_block_method, tuple)):
+      if ((len(self.large_block_method) != 2) or \
+          (self.large_block_method[0] != 'sort')):
+        logging.exception('Large block method tuple must be of the form ' + \
+                          '("sort", window_size): %s' % \
+                          (str(self.large_block_method)))
+        raise Exception
+      auxiliary.check_is_integer('Window size', self.large_block_method[1])
+      if (self.large_block_method[1] < 2):
+        logging.exception('Window size for large blocks must be at least 2:' \
+                          + ' %d' % (self.large_block_method[1]))
+        raise Exception
+
+    elif (self.large_block_method not in ['drop', 'split']):
+      logging.exception('Illegal value for large block method, must be ' + \
+                        '"drop", "split" or ("sort", window_size): %s' % \
+                        (str(self.large_block_method)))
+      raise Exception
+
+    if ((self.large_block_method != 'drop') and (self.sub_block_def == None)):
+      logging.exception('Large block method %s requires a sub-block ' % \
+                        (str(self.large_block_method)) + 'definition')
+      raise Exception
+
+    if ((self.incremental == True) and ((self.max_block_size != None) or \
+                                        (self.max_block_pairs != None))):
+      logging.exception('Large blocks can not be limited in an incremental ' + \
+                        'blocking index')
+      raise Exception
+
+    if ((self.incremental == True) and (self.stream_rec_pairs == True)):
+      logging.exception('An incremental blocking index can not be used in ' + \
+                        'streaming mode')
+      raise Exception
+
+    self.log([('Incremental', self.incremental),  # Log a message
+              ('Maximum block size', self.max_block_size),
+              ('Maximum block pairs', self.max_block_pairs),
+              ('Large block method', self.large_block_method),
+              ('Sub-block definition', self.sub_block_def)])
+
+  # ---------------------------------------------------------------------------
+
+  def build(self):
+    """Method to build an index data structure.
+
+       Read all records from both files, extract blocking variables and then
+       insert records into blocks.
+    """
+
+    logging.info('')
+    logging.info('Build blocking index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    if (self.sub_block_def_proc != None):
+
+      # Also build an inverted index of the sub-block values (as an additional
+      # index after all others), and then take it out of the index
+      #
+      self.index_def.append(self.sub_block_def)
+      self.index_def_proc.append(self.sub_block_def_proc)
+      if (self.index_val_cache_list != None):
+        self.index_val_cache_list.append(self.sub_block_val_cache)
+
+      self.__records_into_inv_index__()
+
+      self.index_def.pop()
+      self.index_def_proc.pop()
+      if (self.index_val_cache_list != None):
+        self.index_val_cache_list.pop()
+
+      sub_index1 = self.index1.pop(num_indices)
+      sub_index2 = self.index2.pop(num_indices)
+
+    else:
+      self.__records_into_inv_index__()
+
+      sub_index1 = None
+      sub_index2 = None
+
+    # Drop, split or sort blocks that are too large - - - - - - - - - - - - - -
+    #
+    if ((self.max_block_size != None) or (self.max_block_pairs != None)):
+      self.__limit_large_blocks__(sub_index1, sub_index2)
+
+    # For an incremental index get the block values of all records - - - - - -
+    #
+    if (self.incremental == True):
+      self.__get_rec_block_vals__()
+
+    # Now calculate number of record pairs - - - - - - - - - - - - - - - - - -
+    #
+    self.num_rec_pairs = 0
+
+    largest_block_num_rec = -1  # Also keep the largest block size and value
+    largest_block_val = ''
+    largest_block_index_num = -1  # Index number of the largest block
+
+    for i in range(num_indices):
+
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+
+        logging.info('  Index %d for data set 1 contains %d blocks' % \
+                     (i, len(self.index1[i])))
+
+        for block_val in self.index1[i]: # Loop over all block values in index
+          block_num_recs = len(self.index1[i][block_val])
+
+          if (block_num_recs > largest_block_num_rec):  # New largest block
+            largest_block_num_rec =   block_num_recs
+            largest_block_val =       block_val
+            largest_block_index_num = i
+
+          self.num_rec_pairs += block_num_recs*(block_num_recs-1)/2
+
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        logging.info('  Index %d for data set 1 contains %d blocks, and ' % \
+                     (i, len(self.index1[i]))+'for data set 2 contains %d' % \
+                     (len(self.index2[i]))+' blocks')
+
+        for block_val in self.index1[i]: # Loop over all block values in index
+          block_num_recs1 = len(self.index1[i][block_val])
+
+          if block_val in self.index2[i]:  # Blocking values is both data sets'
+                                           # index
+            block_num_recs2 = len(self.index2[i][block_val])
+
+            if (block_num_recs1 > largest_block_num_rec):  # New largest block
+              largest_block_num_rec =   block_num_recs1
+              largest_block_val =       block_val
+              largest_block_index_num = i
+
+            if (block_num_recs2 > largest_block_num_rec):  # New largest block
+              largest_block_num_rec =   block_num_recs2
+              largest_block_val =       block_val
+              largest_block_index_num = i
+
+            self.num_rec_pairs += block_num_recs1*block_num_recs2
+
+    logging.info('Built blocking index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+
+    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+    logging.info('  Largest block with value "%s" contains %d records' % \
+                 (largest_block_val, largest_block_num_rec)+' (in index %d)' \
+                 % (largest_block_index_num))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.status = 'built'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __limit_large_blocks__(self, sub_index1, sub_index2):
+    """Find all blocks that contain more than the maximum number of records or
+       that would generate more than the maximum number of record pairs, and
+       drop, split or sort them according to the large block method.
+
+       The given sub-block indices (one per data set) contain the sub-block
+       values of all records, they are only needed if large blocks are split
+       or sorted.
+
+       New blocks that still exceed one of the limits (for example if many
+       records in a large block have an empty or the same sub-block value) are
+       dropped, and added to 'large_block_list' as well.
+    """
+
+    max_block_size =  self.max_block_size  # Shorthands
+    max_block_pairs = self.max_block_pairs
+    sep_str =         self.SUB_BLOCK_SEP_STR
+
+    num_indices = len(self.index_def)
+
+    if (self.do_deduplication == True):
+      index_list = [self.index1]
+    else:
+      index_list = [self.index1, self.index2]
+
+    # Find all large blocks and estimate their number of record pairs - - - - -
+    #
+    self.large_block_list = []
+
+    for i in range(num_indices):
+
+      this_index1 = self.index1[i]  # Shorthands
+      this_index2 = index_list[-1][i]
+
+      for (block_val, block_recs1) in this_index1.iteritems():
+
+        if (block_val not in this_index2):
+          continue  # No record pairs in this block
+
+        num_block_recs1 = len(block_recs1)
+
+        if (self.do_deduplication == True):
+          num_block_recs2 = num_block_recs1
+          num_block_pairs = num_block_recs1*(num_block_recs1-1)/2
+        else:
+          num_block_recs2 = len(this_index2[block_val])
+          num_block_pairs = num_block_recs1*num_block_recs2
+
+        if (((max_block_size != None) and \
+             (max(num_block_recs1, num_block_recs2) > max_block_size)) or \
+            ((max_block_pairs != None) and \
+             (num_block_pairs > max_block_pairs))):
+          self.large_block_list.append((i, block_val, num_block_recs1,
+                                        num_block_recs2, num_block_pairs))
+
+    if (self.large_block_list == []):
+      logging.info('  No blocks exceed the maximum block size or number of ' + \
+                   'record pairs')
+      return
+
+    self.large_block_list.sort()
+
+    num_large_block_pairs = 0
+    for large_block in self.large_block_list:
+      num_large_block_pairs += large_block[4]
+
+    logging.warning('%d blocks exceed the maximum block size or number of ' % \
+                    (len(self.large_block_list)) + 'record pairs, they ' + \
+                    'would generate %d record pairs (method: %s)' % \
+                    (num_large_block_pairs, str(self.large_block_method)))
+
+    for (i, block_val, num_block_recs1, num_block_recs2, num_block_pairs) in \
+        self.large_block_list:
+      logging.info('    Index %d, block "%s": %d / %d records, %d record ' % \
+                   (i, block_val, num_block_recs1, num_block_recs2,
+                    num_block_pairs) + 'pairs')
+
+    if (self.large_block_method == 'drop'):  # Simply remove the large blocks
+      for large_block in self.large_block_list:
+        for index in index_list:
+          del index[large_block[0]][large_block[1]]
+      return
+
+    # Get the sub-block values of all records in large blocks - - - - - - - - -
+    #
+    rec_sub_val_dict_list = []
+
+    for (index, sub_index) in zip(index_list, [sub_index1, sub_index2]):
+
+      large_block_rec_set = set()
+      for large_block in self.large_block_list:
+        large_block_rec_set.update(index[large_block[0]][large_block[1]])
+
+      rec_sub_val_dict = {}
+
+      for (sub_block_val, sub_block_recs) in sub_index.iteritems():
+        for rec_ident in sub_block_recs:
+          if (rec_ident in large_block_rec_set):
+            rec_sub_val_dict[rec_ident] = sub_block_val
+
+      rec_sub_val_dict_list.append(rec_sub_val_dict)
+
+    # Replace each large block with sub-blocks or window blocks - - - - - - - -
+    #
+    new_block_dict_list = [{} for index in index_list]
+
+    for large_block in self.large_block_list:
+      (i, block_val) = large_block[:2]
+
+      if (self.large_block_method == 'split'):  # Split using sub-block values
+
+        for ds in range(len(index_list)):
+          rec_sub_val_dict = rec_sub_val_dict_list[ds]
+          new_block_dict =   new_block_dict_list[ds]
+
+          for rec_ident in index_list[ds][i][block_val]:
+            sub_block_val = block_val + sep_str + \
+                            rec_sub_val_dict.get(rec_ident, '')
+            new_block_recs = new_block_dict.get((i, sub_block_val), [])
+            new_block_recs.append(rec_ident)
+            new_block_dict[(i, sub_block_val)] = new_block_recs
+
+      else:  # Sorted neighbourhood within the block
+
+        window_size = self.large_block_method[1]
+
+        sort_list = []
+        for ds in range(len(index_list)):
+          rec_sub_val_dict = rec_sub_val_dict_list[ds]
+
+          for rec_ident in index_list[ds][i][block_val]:
+            sort_list.append((rec_sub_val_dict.get(rec_ident, ''), ds,
+                              rec_ident))
+        sort_list.sort()
+
+        for pos in xrange(max(1, len(sort_list)-window_size+1)):
+          window_block_val = block_val + sep_str + '%d' % (pos)
+
+          for (sub_block_val, ds, rec_ident) in \
+              sort_list[pos:pos+window_size]:
+            new_block_recs = new_block_dict_list[ds].get((i,
+                                                   window_block_val), [])
+            new_block_recs.append(rec_ident)
+            new_block_dict_list[ds][(i, window_block_val)] = new_block_recs
+
+      for index in index_list:
+        del index[i][block_val]
+
+    # Drop new blocks that still exceed one of the limits (for example if the
+    # sub-block value of many records is empty or the same) - - - - - - - - -
+    #
+    new_block_dict1 = new_block_dict_list[0]  # Shorthands
+    new_block_dict2 = new_block_dict_list[-1]
+
+    still_large_block_list = []
+
+    for ((i, new_block_val), new_block_recs1) in new_block_dict1.iteritems():
+
+      if ((i, new_block_val) not in new_block_dict2):
+        continue  # No record pairs in this block
+
+      num_block_recs1 = len(new_block_recs1)
+
+      if (self.do_deduplication == True):
+        num_block_recs2 = num_block_recs1
+        num_block_pairs = num_block_recs1*(num_block_recs1-1)/2
+      else:
+        num_block_recs2 = len(new_block_dict2[(i, new_block_val)])
+        num_block_pairs = num_block_recs1*num_block_recs2
+
+      if (((max_block_size != None) and \
+           (max(num_block_recs1, num_block_recs2) > max_block_size)) or \
+          ((max_block_pairs != None) and \
+           (num_block_pairs > max_block_pairs))):
+        still_large_block_list.append((i, new_block_val, num_block_recs1,
+                                       num_block_recs2, num_block_pairs))
+
+    if (still_large_block_list != []):
+      still_large_block_list.sort()
+
+      num_large_block_pairs = 0
+      for large_block in still_large_block_list:
+        num_large_block_pairs += large_block[4]
+
+        for new_block_dict in new_block_dict_list:
+          del new_block_dict[large_block[:2]]
+
+      logging.warning('%d new blocks still exceed the maximum block size or ' \
+                      % (len(still_large_block_list)) + 'number of record ' + \
+                      'pairs, they would generate %d record pairs and are ' % \
+                      (num_large_block_pairs) + 'dropped')
+
+      for (i, new_block_val, num_block_recs1, num_block_recs2,
+           num_block_pairs) in still_large_block_list:
+        logging.info('    Index %d, block "%s": %d / %d records, %d ' % \
+                     (i, new_block_val, num_block_recs1, num_block_recs2,
+                      num_block_pairs) + 'record pairs')
+
+      self.large_block_list += still_large_block_list
+
+    # Insert the new blocks into the index - - - - - - - - - - - - - - - - - -
+    #
+    for ds in range(len(index_list)):
+      index = index_list[ds]
+
+      for ((i, new_block_val), new_block_recs) in \
+          new_block_dict_list[ds].iteritems():
+        if (self.intern_rec_idents == True):
+          index[i][new_block_val] = array.array('i', new_block_recs)
+        else:
+          index[i][new_block_val] = new_block_recs
+
+    logging.info('  Replaced large blocks with %d new blocks' % \
+                 (len(new_block_dict_list[0])))
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+
+       Make a dictionary of all record pairs over all indices, which removes
+       duplicate record pairs.
+    """
+
+    NUM_BLOCK_PROGRESS_REPORT = 1000
+
+    logging.info('')
+    logging.info('Compact blocking index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    old_num_rec_pairs = self.num_rec_pairs  # Keep old number of record pairs
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      num_blocks_done = 0
+
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+
+        this_index = self.index1[i]  # Shorthand
+
+        for block_val in this_index: # Loop over all block values in index
+
+          block_recs = this_index[block_val]  # All records in this block
+
+          if (len(block_recs) > 1):
+
+            self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
+
+          num_blocks_done += 1
+
+          # Log progress report every XXX blocks processed - - - - - - - - - -
+          #
+          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d blocks' % \
+                         (num_blocks_done, len(this_index)))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        this_index1 = self.index1[i]  # Shorthands
+        this_index2 = self.index2[i]
+
+        for block_val in this_index1: # Loop over all block values in index
+
+          block_recs1 = this_index1[block_val]  # All records in this block
+                                                # from data set 1
+          if block_val in this_index2:  # Blocking values is both data sets'
+                                        # index
+
+            block_recs2 = this_index2[block_val] # All records in this block
+                                                 # from data set 2
+
+            self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
+
+          num_blocks_done += 1
+
+          # Log progress report every XXX blocks processed - - - - - - - - - -
+          #
+          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d blocks' % \
+                         (num_blocks_done, len(this_index1)))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+      logging.info('  Compacted blocking index %d in %s' % \
+                   (i, auxiliary.time_string(time.time()-istart_time)))
+
+      if (self.incremental == False):
+        self.index1[i].clear()  # Not needed anymore
+        self.index2[i].clear()
+
+        logging.info('    Explicitly run garbage collection')
+        gc.collect()
+
+        memory_usage_str = auxiliary.get_memory_usage()
+        if (memory_usage_str != None):
+          logging.info('      '+memory_usage_str)
+
+    self.rec_pair_dict = rec_pair_dict
+    self.blocks_kept =   self.incremental
+
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
+
+    logging.info('Compacted blocking index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Old number of record pairs: %d' % (old_num_rec_pairs))
+    logging.info('  New number of record pairs: %d' % (self.num_rec_pairs))
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
+    """Iterate over all blocks in the index.
+
+       Compare the record pairs as produced by the blocking process, and return
+       a weight vector dictionary with keys made of a tuple (record identifier
+       1, record identifier 2), and corresponding values the comparison
+       weights.
+    """
+
+    logging.info('')
+    logging.info('Started comparison of %d record pairs' % \
+                 (self.num_rec_pairs))
+    if (self.log_funct != None):
+      self.log_funct('Started comparison of %d record pairs' % \
+                     (self.num_rec_pairs))
+
+    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'compacted'):
+      logging.exception('Index "%s" has not been compacted, running ' % \
+                        (self.description)+'comparisons not possible')
+      raise Exception
+
+    # Compare the records
+    #
+    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
+                                                cut_off_threshold, num_workers)
+  # ---------------------------------------------------------------------------
+
+  def add_records(self, dataset_delta, data_set_num = 1,
+                  length_filter_perc = None, cut_off_threshold = None,
+                  num_workers = None):
+    """Add the records from the given data set to a compacted incremental
+       index, and generate and compare the new record pairs between the added
+       records and the records already in the index (as well as between the
+       added records themselves for a deduplication).
+
+       The data set 'dataset_delta' must have the same field names (in the
+       same order) as the data set the records are added to, which is given
+       by 'data_set_num' (1 or 2, must be 1 for a deduplication). Records with
+       an identifier that is already in the index are not allowed (remove them
+       first using remove_records()).
+
+       The blocks, record cache, record pair dictionary and number of record
+       pairs of the index are updated, so a later call to run() will compare
+       all record pairs. The arguments 'length_filter_perc',
+       'cut_off_threshold' and 'num_workers' are as for the run() method, and
+       the return value is the same as for run() but only contains the weight
+       vectors of the new record pairs (if a weight vector file is used they
+       are appended to it).
+    """
+
+    (index, other_index, rec_cache, rec_block_val_dict, rec_ident_list,
+     rec_num_dict) = self.__get_incremental_data__(data_set_num)
+
+    self.__check_delta_data_set__(dataset_delta, data_set_num)
+
+    logging.info('')
+    logging.info('Add records from data set "%s" to blocking index: "%s"' % \
+                 (dataset_delta.description, self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    get_index_values_funct = self.__get_index_values__  # Shorthands
+    skip_missing =           self.skip_missing
+    intern_rec_idents =      self.intern_rec_idents
+
+    new_rec_pair_dict = {}  # Only the new record pairs
+
+    num_rec_added = 0
+
+    for (rec_ident, rec) in dataset_delta.readall():
+
+      rec_key = self.__add_delta_rec__(rec_ident, rec, data_set_num, rec_cache,
+                                       rec_ident_list, rec_num_dict)
+
+      # Generate record pairs with all records in the same blocks, then insert
+      # the record into the blocks
+      #
+      rec_index_val_list = get_index_values_funct(rec, data_set_num-1)
+      rec_block_val_list = []
+
+      for i in range(num_indices):
+        block_val = rec_index_val_list[i]
+
+        if ((block_val == '') and (skip_missing == True)):
+          continue
+
+        rec_block_val_list.append((i, block_val))
+
+        if (self.do_deduplication == True):
+          for other_rec_key in index[i].get(block_val, []):
+            if (other_rec_key < rec_key):
+              (rec_key1, rec_key2) = (other_rec_key, rec_key)
+            else:
+              (rec_key1, rec_key2) = (rec_key, other_rec_key)
+            rec_key2_set = new_rec_pair_dict.get(rec_key1, set())
+            rec_key2_set.add(rec_key2)
+            new_rec_pair_dict[rec_key1] = rec_key2_set
+
+        elif (data_set_num == 1):
+          other_block_rec_list = other_index[i].get(block_val, [])
+          if (len(other_block_rec_list) > 0):
+            rec_key2_set = new_rec_pair_dict.get(rec_key, set())
+            rec_key2_set.update(other_block_rec_list)
+            new_rec_pair_dict[rec_key] = rec_key2_set
+
+        else:
+          for other_rec_key in other_index[i].get(block_val, []):
+            rec_key2_set = new_rec_pair_dict.get(other_rec_key, set())
+            rec_key2_set.add(rec_key)
+            new_rec_pair_dict[other_rec_key] = rec_key2_set
+
+        if (intern_rec_idents == True):
+          block_rec_list = index[i].get(block_val, None)
+          if (block_rec_list == None):
+            block_rec_list = array.array('i')
+        else:
+          block_rec_list = index[i].get(block_val, [])
+        block_rec_list.append(rec_key)
+        index[i][block_val] = block_rec_list
+
+      rec_block_val_dict[rec_key] = rec_block_val_list
+
+      num_rec_added += 1
+
+    # Insert the new record pairs into the record pair dictionary - - - - - - -
+    #
+    rec_pair_dict = self.rec_pair_dict  # Shorthand
+
+    num_new_rec_pairs = 0
+
+    for (rec_key1, rec_key2_set) in new_rec_pair_dict.iteritems():
+      num_new_rec_pairs += len(rec_key2_set)
+
+      if (rec_key1 in rec_pair_dict):
+        rec_key2_set = rec_key2_set.union(rec_pair_dict[rec_key1])
+
+      if (intern_rec_idents == True):
+        rec_pair_dict[rec_key1] = array.array('i', sorted(rec_key2_set))
+      else:
+        rec_pair_dict[rec_key1] = rec_key2_set
+
+    self.num_rec_pairs += num_new_rec_pairs
+
+    logging.info('Added %d records in %s, %d new record pairs (%d record ' % \
+                 (num_rec_added, auxiliary.time_string(time.time()-start_time),
+                  num_new_rec_pairs, self.num_rec_pairs) + 'pairs in total)')
+
+    if (num_new_rec_pairs == 0):
+      if (self.weight_vec_file == None):
+        return [self.__get_field_names_list__(), {}]
+      else:
+        return None
+
+    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
+                                                cut_off_threshold, num_workers,
+                                                new_rec_pair_dict)
+
+  # ---------------------------------------------------------------------------
+
+  def remove_records(self, rec_ident_list, data_set_num = 1):
+    """Remove the records with the given identifiers from the data set with
+       the given number (1 or 2, must be 1 for a deduplication) from a
+       compacted incremental index, i.e. from its blocks and record cache, and
+       remove all their record pairs from the record pair dictionary.
+
+       Returns the number of record pairs removed.
+    """
+
+    (index, other_index, rec_cache, rec_block_val_dict, index_rec_ident_list,
+     rec_num_dict) = self.__get_incremental_data__(data_set_num)
+
+    auxiliary.check_is_list('rec_ident_list', rec_ident_list)
+
+    logging.info('')
+    logging.info('Remove %d records from blocking index: "%s"' % \
+                 (len(rec_ident_list), self.description))
+
+    start_time = time.time()
+
+    rec_pair_dict = self.rec_pair_dict  # Shorthand
+
+    num_rec_pairs_removed = 0
+
+    for rec_ident in rec_ident_list:
+
+      rec_key = self.__remove_delta_rec__(rec_ident, rec_cache,
+                                          index_rec_ident_list, rec_num_dict)
+
+      # Remove the record from its blocks and get the records that were in the
+      # same blocks (the only ones it can be paired with)
+      #
+      other_rec_key_set = set()
+
+      for (i, block_val) in rec_block_val_dict.pop(rec_key, []):
+        block_rec_list = index[i][block_val]
+        block_rec_list.remove(rec_key)
+
+        if (len(block_rec_list) == 0):
+          del index[i][block_val]
+        elif (self.do_deduplication == True):
+          other_rec_key_set.update(block_rec_list)
+
+        if (data_set_num == 2):  # Pairs are stored with records from data set 1
+          other_rec_key_set.update(other_index[i].get(block_val, []))
+
+      # Remove the record pairs of the record - - - - - - - - - - - - - - - - -
+      #
+      if ((self.do_deduplication == True) or (data_set_num == 1)):
+        if (rec_key in rec_pair_dict):
+          num_rec_pairs_removed += len(rec_pair_dict[rec_key])
+          del rec_pair_dict[rec_key]
+
+      if ((self.do_deduplication == True) or (data_set_num == 2)):
+        for other_rec_key in other_rec_key_set:
+          rec_key2_list = rec_pair_dict.get(other_rec_key, [])
+
+          if (rec_key in rec_key2_list):
+            rec_key2_list.remove(rec_key)
+            num_rec_pairs_removed += 1
+
+            if (len(rec_key2_list) == 0):
+              del rec_pair_dict[other_rec_key]
+
+      del rec_cache[rec_key]
+      if (rec_key in self.rec_length_cache):
+        del self.rec_length_cache[rec_key]
+
+    self.num_rec_pairs -= num_rec_pairs_removed
+
+    logging.info('Removed %d records and %d record pairs in %s' % \
+                 (len(rec_ident_list), num_rec_pairs_removed,
+                  auxiliary.time_string(time.time()-start_time)))
+
+    return num_rec_pairs_removed
+
+# =============================================================================
+
+class SortingIndex(Indexing):
+  """Class that implements the 'sorted neighbourhood' indexing approach based
+     on an inverted index.
+
+     The index variable values are sorted alphabetically and then a window
+     (with user specified size) is moved over these sorted values. All records
+     in the blocks covered by the current window position are then compared to
+     each other.
+
+     The additional argument (besides the base class arguments) which has to be
+     set when this index is initialised is:
+
+       window_size  A positive integer that gives the size of the moving window
+                    in number of index variable values.
+
+     The following argument can also be set:
+
+       incremental  A flag, if set to True the blocks and their sorted index
+                    variable values are kept when the index is compacted, so
+                    that records can later be added to and removed from the
+                    compacted index using the add_records() and
+                    remove_records() methods. Only the record pairs of records
+                    whose window can have changed (the added or removed records
+                    and the records in the window_size blocks before a new or
+                    removed block) are generated again. This cannot be used in
+                    streaming mode (argument 'stream_rec_pairs'). Default is
+                    False.
+
+     Note that a window_size of 1 will result in the same records being
+     compared as with the standard blocking approach (as a window of size 1
+     does not cover any neighbouring index variable values).
+  """
+
+  INDEX_SAVE_STATUS_LIST = ['built', 'compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['window_size', 'incremental']  # See Indexing.save()
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, **kwargs):
+    """Constructor. Process the 'window_size' argument first, then call the
+       base class constructor.
+    """
+
+    self.window_size = None  # Set the window size to not defined
+    self.incremental = False
+
+    self.sorted_block_vals1 =  []  # For incremental indices, lists with the
+                                   # sorted block values of each index for
+                                   # data set 1
+    self.sorted_block_vals2 =  []  # Same for data set 2
+    self.rec_block_val_dict1 = {}  # For incremental indices, the block values
+                                   # (as tuples (index number, block value)) of
+                                   # each record from data set 1
+    self.rec_block_val_dict2 = {}  # Same for data set 2
+    self.rec_num_dict1 =       {}  # For incremental indices with interned
+                                   # record identifiers, the record numbers of
+                                   # all record identifiers from data set 1
+    self.rec_num_dict2 =       {}  # Same for data set 2
+    self.blocks_kept =      False  # Set to True when an incremental index has
+                                   # been compacted (and its blocks were kept)
+
+    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
+                      # class constructor
+
+    for (keyword, value) in kwargs.items():
+
+      if (keyword.startswith('window')):
+        auxiliary.check_is_integer('window_size', value)
+        auxiliary.check_is_positive('window_size', value)
+        self.window_size = value
+
+      elif (keyword.startswith('increm')):
+        auxiliary.check_is_flag('incremental', value)
+        self.incremental = value
+
+      else:
+        base_kwargs[keyword] = value
+
+    Indexing.__init__(self, base_kwargs)  # Initialise base class
+
+    # Make sure 'window_size' attribute is set - - - - - - - - - - - - - - - -
+    #
+    auxiliary.check_is_integer('window_size', self.window_size)
+    auxiliary.check_is_positive('window_size', self.window_size)
+
+    if ((self.incremental == True) and (self.stream_rec_pairs == True)):
+      logging.exception('An incremental sorting index can not be used in ' + \
+                        'streaming mode')
+      raise Exception
+
+    self.log([('Window size', self.window_size),  # Log a message
+              ('Incremental', self.incremental)])
+
+  # ---------------------------------------------------------------------------
+
+  def build(self):
+    """Method to build an index data structure.
+
+       Read all records from both files, extract blocking variables and then
+       insert records into blocks.
+    """
+
+    logging.info('')
+    logging.info('Build sorting index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    self.__records_into_inv_index__()  # Read records and put into index
+
+    logging.info('Built sorting index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.status = 'built'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+
+       Make a dictionary of all record pairs over all indices, which removes
+       duplicate record pairs.
+
+       The window is kept as a queue of the record identifier lists of the
+       blocks it covers, together with a dictionary that counts in how many of
+       these blocks each record is. When the window is moved by one block only
+       the record pairs that contain a record which was not in the window
+       before are generated.
+
+       For an incremental index the blocks and the sorted lists of their
+       values are kept.
+    """
+
+    NUM_BLOCK_PROGRESS_REPORT = 1000
+
+    logging.info('')
+    logging.info('Compact sorting index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    num_indices = len(self.index_def)
+
+    dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
+    link_rec_pair_funct =  self.__link_rec_pairs__
+    slide_window_funct =   self.__slide_window__
+    stream_rec_pairs =     self.stream_rec_pairs
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    self.sorted_block_vals1 = []
+    self.sorted_block_vals2 = []
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      num_blocks_done = 0
+
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+
+        this_index = self.index1[i]  # Shorthand
+
+        window_blocks = collections.deque()  # Blocks in the current window
+        window_rec_count = {}  # Number of window blocks that contain a record
+
+        block_val_list = this_index.keys()  # Get all blocking values
+        block_val_list.sort()
+
+        if (self.incremental == True):
+          self.sorted_block_vals1.append(block_val_list)
+
+        num_block_vals = len(block_val_list)
+
+        for j in xrange(num_block_vals):  # Loop over all blocks
+
+          new_window_recs = slide_window_funct(window_blocks, window_rec_count,
+                                               this_index[block_val_list[j]])
+
+          if ((new_window_recs != []) and (len(window_rec_count) > 1)):
+
+            if (stream_rec_pairs == True):
+              dedup_rec_pair_funct(window_rec_count.keys(), rec_pair_dict)
+
+            else:  # Only add record pairs with a new record
+
+              new_window_recs.sort()
+              num_new_recs = len(new_window_recs)
+
+              # Pairs of window records with larger new record identifiers
+              #
+              for rec_ident1 in window_rec_count:
+                pos = bisect.bisect_right(new_window_recs, rec_ident1)
+                if (pos < num_new_recs):
+                  rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+                  rec_ident2_set.update(new_window_recs[pos:])
+                  rec_pair_dict[rec_ident1] = rec_ident2_set
+
+              # Pairs of new records with larger old window record identifiers
+              #
+              if (len(window_rec_count) > num_new_recs):
+                new_window_rec_set = set(new_window_recs)
+                old_window_recs = [rec_ident for rec_ident in \
+                                   window_rec_count if rec_ident not in \
+                                   new_window_rec_set]
+                old_window_recs.sort()
+                num_old_recs = len(old_window_recs)
+
+                for rec_ident1 in new_window_recs:
+                  pos = bisect.bisect_right(old_window_recs, rec_ident1)
+                  if (pos < num_old_recs):
+                    rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+                    rec_ident2_set.update(old_window_recs[pos:])
+                    rec_pair_dict[rec_ident1] = rec_ident2_set
+
+          num_blocks_done += 1
+
+          # Log progress report every XXX blocks processed - - - - - - - - - -
+          #
+          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d blocks' % \
+                         (num_blocks_done, num_block_vals))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+        del window_blocks
+        del window_rec_count
+
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        this_index1 = self.index1[i]  # Shorthands
+        this_index2 = self.index2[i]
+
+        window_blocks1 = collections.deque()  # Blocks in the current windows
+        window_blocks2 = collections.deque()
+
+        window_rec_count1 = {}  # Number of window blocks that contain a record
+        window_rec_count2 = {}
+
+        block_val_list1 = this_index1.keys()  # Get all blocking values
+        block_val_list1.sort()
+
+        block_val_list2 = this_index2.keys()
+        block_val_list2.sort()
+
+        if (self.incremental == True):
+          self.sorted_block_vals1.append(block_val_list1)
+          self.sorted_block_vals2.append(block_val_list2)
+
+        num_block_vals1 = len(block_val_list1)
+        num_block_vals2 = len(block_val_list2)
+
+        # Create a sorted combined list of all blocking values
+        #
+        comb_block_values = list(set(block_val_list1+block_val_list2))
+        comb_block_values.sort()
+
+        j = 0  # Iteration counters in block values 1 and 2
+        k = 0
+
+        # Loop over combined list of block values - - - - - - - - - - - - - - -
+        #
+        for block_val in comb_block_values:
+
+          new_window_recs1 = []
+          new_window_recs2 = []
+
+          if ((j < num_block_vals1) and (block_val_list1[j] == block_val)):
+
+            # Advance window for data set 1
+            #
+            new_window_recs1 = slide_window_funct(window_blocks1,
+                                                  window_rec_count1,
+                                                  this_index1[block_val])
+            j += 1  # Advance pointer into data set 1 blocks
+
+          if ((k < num_block_vals2) and (block_val_list2[k] == block_val)):
+
+            # Advance window for data set 2
+            #
+            new_window_recs2 = slide_window_funct(window_blocks2,
+                                                  window_rec_count2,
+                                                  this_index2[block_val])
+            k += 1  # Advance pointer into data set 2 blocks
+
+          if ((new_window_recs1 != []) or (new_window_recs2 != [])):
+
+            if (stream_rec_pairs == True):
+              link_rec_pair_funct(window_rec_count1.keys(),
+                                  window_rec_count2.keys(), rec_pair_dict)
+
+            else:  # Only add record pairs with a new record
+
+              if (new_window_recs1 != []):
+                link_rec_pair_funct(new_window_recs1, window_rec_count2,
+                                    rec_pair_dict)
+              if (new_window_recs2 != []):
+                link_rec_pair_funct(window_rec_count1, new_window_recs2,
+                                    rec_pair_dict)
+
+          num_blocks_done += 1
+
+          # Log progress report every XXX blocks processed - - - - - - - - - -
+          #
+          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d blocks' % \
+                         (num_blocks_done, len(comb_block_values)))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+        del window_blocks1
+        del window_blocks2
+        del window_rec_count1
+        del window_rec_count2
+
+      logging.info('  Compacted sorting index %d in %s' % \
+                   (i, auxiliary.time_string(time.time()-istart_time)))
+
+      if (self.incremental == False):
+        self.index1[i].clear()  # Not needed anymore
+        self.index2[i].clear()
+
+        logging.info('    Explicitly run garbage collection')
+        gc.collect()
+
+        memory_usage_str = auxiliary.get_memory_usage()
+        if (memory_usage_str != None):
+          logging.info('      '+memory_usage_str)
+
+    if (self.incremental == True):
+      if (self.do_deduplication == True):
+        self.sorted_block_vals2 = self.sorted_block_vals1
+      self.__get_rec_block_vals__()
+
+    self.rec_pair_dict = rec_pair_dict
+    self.blocks_kept =   self.incremental
+
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
+
+    logging.info('Compacted sorting index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __slide_window__(self, window_blocks, window_rec_count, block_rec_list):
+    """Move the window given as a queue of blocks (lists of record
+       identifiers) and a dictionary with the number of these blocks each
+       record is in by one block. If the window is full its oldest block is
+       removed, then the given block is added.
+
+       Returns a list of the record identifiers from the given block that were
+       not in the window before.
+    """
+
+    if (len(window_blocks) == self.window_size):  # Remove the oldest block
+
+      for rec_ident in window_blocks.popleft():
+        rec_cnt = window_rec_count[rec_ident]
+        if (rec_cnt == 1):
+          del window_rec_count[rec_ident]
+        else:
+          window_rec_count[rec_ident] = rec_cnt - 1
+
+    new_window_recs = []
+
+    for rec_ident in block_rec_list:
+      rec_cnt = window_rec_count.get(rec_ident, 0)
+      if (rec_cnt == 0):
+        new_window_recs.append(rec_ident)
+      window_rec_count[rec_ident] = rec_cnt + 1
+
+    window_blocks.append(block_rec_list)
+
+    return new_window_recs
+
+  # ---------------------------------------------------------------------------
+
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
+    """Iterate over all blocks in the index.
+
+       Compare the record pairs as produced by the sorting indexing process,
+       and return a weight vector dictionary with keys made of a tuple (record
+       identifier 1, record identifier 2), and corresponding values the
+       comparison weights.
+    """
+
+    logging.info('')
+    logging.info('Started comparison of %d record pairs' % \
+                 (self.num_rec_pairs))
+    if (self.log_funct != None):
+      self.log_funct('Started comparison of %d record pairs' % \
+                     (self.num_rec_pairs))
+
+    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'compacted'):
+      logging.exception('Index "%s" has not been compacted, running ' % \
+                        (self.description)+'comparisons not possible')
+      raise Exception
+
+    # Compare the records
+    #
+    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
+                                                cut_off_threshold, num_workers)
+
+  # ---------------------------------------------------------------------------
+
+  def add_records(self, dataset_delta, data_set_num = 1,
+                  length_filter_perc = None, cut_off_threshold = None,
+                  num_workers = None):
+    """Add the records from the given data set to a compacted incremental
+       index, and compare the new record pairs.
+
+       The data set 'dataset_delta' must have the same field names (in the
+       same order) as the data set the records are added to, which is given
+       by 'data_set_num' (1 or 2, must be 1 for a deduplication). Records with
+       an identifier that is already in the index are not allowed (remove them
+       first using remove_records()).
+
+       New blocks move the blocks after them by one position, so records in
+       the window_size blocks before a new block can lose record pairs (which
+       are removed from the record pair dictionary) as well as get new ones.
+       The record pairs of these records and of the added records are
+       generated again, all other record pairs stay the same.
+
+       The blocks, record cache, record pair dictionary and number of record
+       pairs of the index are updated, so a later call to run() will compare
+       all record pairs. The arguments 'length_filter_perc',
+       'cut_off_threshold' and 'num_workers' are as for the run() method, and
+       the return value is the same as for run() but only contains the weight
+       vectors of the new record pairs (if a weight vector file is used they
+       are appended to it).
+    """
+
+    (index, other_index, rec_cache, rec_block_val_dict, rec_ident_list,
+     rec_num_dict) = self.__get_incremental_data__(data_set_num)
+
+    self.__check_delta_data_set__(dataset_delta, data_set_num)
+
+    logging.info('')
+    logging.info('Add records from data set "%s" to sorting index: "%s"' % \
+                 (dataset_delta.description, self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    if (data_set_num == 1):
+      sorted_block_vals = self.sorted_block_vals1
+    else:
+      sorted_block_vals = self.sorted_block_vals2
+
+    get_index_values_funct = self.__get_index_values__  # Shorthands
+    skip_missing =           self.skip_missing
+
+    new_rec_list = []  # Tuples (record key, list of block values)
+    new_block_val_sets = [set() for i in range(num_indices)]
+
+    for (rec_ident, rec) in dataset_delta.readall():
+
+      rec_key = self.__add_delta_rec__(rec_ident, rec, data_set_num, rec_cache,
+                                       rec_ident_list, rec_num_dict)
+
+      rec_index_val_list = get_index_values_funct(rec, data_set_num-1)
+      rec_block_val_list = []
+
+      for i in range(num_indices):
+        block_val = rec_index_val_list[i]
+
+        if ((block_val == '') and (skip_missing == True)):
+          continue
+
+        rec_block_val_list.append((i, block_val))
+
+        if (block_val not in index[i]):
+          new_block_val_sets[i].add(block_val)
+
+      new_rec_list.append((rec_key, rec_block_val_list))
+
+    # Get the records whose record pairs can change because of new blocks,
+    # and their record pairs before the new records are inserted - - - - - - -
+    #
+    new_sorted_block_vals = []
+    for i in range(num_indices):
+      new_sorted_block_vals.append(sorted(sorted_block_vals[i] + \
+                                          list(new_block_val_sets[i])))
+
+    change_rec_key_set = self.__get_window_change_recs__(index,
+                                                         new_sorted_block_vals,
+                                                         new_block_val_sets)
+
+    old_rec_pair_set = self.__get_window_rec_pairs__(change_rec_key_set,
+                                                     data_set_num)
+
+    # Insert the new records into their blocks - - - - - - - - - - - - - - - -
+    #
+    for (rec_key, rec_block_val_list) in new_rec_list:
+
+      for (i, block_val) in rec_block_val_list:
+        if (self.intern_rec_idents == True):
+          block_rec_list = index[i].get(block_val, None)
+          if (block_rec_list == None):
+            block_rec_list = array.array('i')
+        else:
+          block_rec_list = index[i].get(block_val, [])
+        block_rec_list.append(rec_key)
+        index[i][block_val] = block_rec_list
+
+      rec_block_val_dict[rec_key] = rec_block_val_list
+
+      change_rec_key_set.add(rec_key)
+
+    sorted_block_vals[:] = new_sorted_block_vals
+
+    new_rec_pair_set = self.__get_window_rec_pairs__(change_rec_key_set,
+                                                     data_set_num)
+
+    (num_rec_pairs_added, num_rec_pairs_removed, new_rec_pair_dict) = \
+                   self.__update_rec_pairs__(old_rec_pair_set, new_rec_pair_set)
+
+    logging.info('Added %d records in %s, %d new and %d removed record ' % \
+                 (len(new_rec_list),
+                  auxiliary.time_string(time.time()-start_time),
+                  num_rec_pairs_added, num_rec_pairs_removed) + \
+                 'pairs (%d record pairs in total)' % (self.num_rec_pairs))
+
+    if (num_rec_pairs_added == 0):
+      if (self.weight_vec_file == None):
+        return [self.__get_field_names_list__(), {}]
+      else:
+        return None
+
+    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
+                                                cut_off_threshold, num_workers,
+                                                new_rec_pair_dict)
+
+  # ---------------------------------------------------------------------------
+
+  def remove_records(self, rec_ident_list, data_set_num = 1):
+    """Remove the records with the given identifiers from the data set with
+       the given number (1 or 2, must be 1 for a deduplication) from a
+       compacted incremental index, i.e. from its blocks and record cache, and
+       remove all their record pairs from the record pair dictionary.
+
+       Blocks that become empty are removed, which moves the blocks after them
+       by one position, so records in the window_size blocks before a removed
+       block can get new record pairs. These are added to the record pair
+       dictionary (and compared by the next call to run()).
+
+       Returns the number of record pairs removed.
+    """
+
+    (index, other_index, rec_cache, rec_block_val_dict, index_rec_ident_list,
+     rec_num_dict) = self.__get_incremental_data__(data_set_num)
+
+    auxiliary.check_is_list('rec_ident_list', rec_ident_list)
+
+    logging.info('')
+    logging.info('Remove %d records from sorting index: "%s"' % \
+                 (len(rec_ident_list), self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    if (data_set_num == 1):
+      sorted_block_vals = self.sorted_block_vals1
+    else:
+      sorted_block_vals = self.sorted_block_vals2
+
+    rec_key_list = []
+
+    for rec_ident in rec_ident_list:
+
+      rec_key = self.__remove_delta_rec__(rec_ident, rec_cache,
+                                          index_rec_ident_list, rec_num_dict)
+      rec_key_list.append(rec_key)
+
+      del rec_cache[rec_key]
+      if (rec_key in self.rec_length_cache):
+        del self.rec_length_cache[rec_key]
+
+    # Get the blocks that become empty, the records whose record pairs can
+    # change because of this, and their record pairs - - - - - - - - - - - - -
+    #
+    num_block_recs_removed = {}
+
+    for rec_key in rec_key_list:
+      for block_key in rec_block_val_dict[rec_key]:
+        num_block_recs_removed[block_key] = \
+                                   num_block_recs_removed.get(block_key, 0) + 1
+
+    empty_block_val_sets = [set() for i in range(num_indices)]
+
+    for ((i, block_val), num_recs) in num_block_recs_removed.iteritems():
+      if (num_recs == len(index[i][block_val])):
+        empty_block_val_sets[i].add(block_val)
+
+    change_rec_key_set = self.__get_window_change_recs__(index,
+                                                         sorted_block_vals,
+                                                         empty_block_val_sets)
+    change_rec_key_set.update(rec_key_list)
+
+    old_rec_pair_set = self.__get_window_rec_pairs__(change_rec_key_set,
+                                                     data_set_num)
+
+    # Remove the records from their blocks - - - - - - - - - - - - - - - - - -
+    #
+    for rec_key in rec_key_list:
+
+      for (i, block_val) in rec_block_val_dict.pop(rec_key):
+        block_rec_list = index[i][block_val]
+        block_rec_list.remove(rec_key)
+
+        if (len(block_rec_list) == 0):
+          del index[i][block_val]
+
+    for i in range(num_indices):
+      if (len(empty_block_val_sets[i]) > 0):
+        sorted_block_vals[i] = [block_val for block_val in \
+                                sorted_block_vals[i] if block_val not in \
+                                empty_block_val_sets[i]]
+
+    change_rec_key_set.difference_update(rec_key_list)
+
+    new_rec_pair_set = self.__get_window_rec_pairs__(change_rec_key_set,
+                                                     data_set_num)
+
+    (num_rec_pairs_added, num_rec_pairs_removed, new_rec_pair_dict) = \
+                   self.__update_rec_pairs__(old_rec_pair_set, new_rec_pair_set)
+
+    logging.info('Removed %d records and %d record pairs in %s, %d new ' % \
+                 (len(rec_key_list), num_rec_pairs_removed,
+                  auxiliary.time_string(time.time()-start_time),
+                  num_rec_pairs_added) + 'record pairs')
+
+    return num_rec_pairs_removed
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __get_window_change_recs__(self, index, sorted_block_vals,
+                                 change_block_val_sets):
+    """Return the set of records (from the given index of one data set) whose
+       record pairs can change if the blocks with the values in the given sets
+       (one per index) are inserted or removed.
+
+       'sorted_block_vals' must contain the lists of sorted block values with
+       the inserted blocks, or (for removed blocks) before they are removed.
+       Only records in the window_size blocks before an inserted or removed
+       block can change the blocks their window reaches.
+    """
+
+    window_size = self.window_size  # Shorthand
+
+    change_rec_key_set = set()
+
+    for i in range(len(change_block_val_sets)):
+      block_vals = sorted_block_vals[i]
+
+      for change_block_val in change_block_val_sets[i]:
+        pos = bisect.bisect_left(block_vals, change_block_val)
+
+        for block_val in block_vals[max(0, pos-window_size):pos]:
+          if (block_val in index[i]):  # Not a new block
+            change_rec_key_set.update(index[i][block_val])
+
+    return change_rec_key_set
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __get_window_rec_pairs__(self, rec_key_set, data_set_num):
+    """Return the set of all record pairs (as tuples (record key 1, record key
+       2), with record key 1 smaller for a deduplication) that contain one of
+       the given records from the data set with the given number, generated
+       from the kept blocks in the same way as compact() does.
+
+       For a deduplication two records are paired if their blocks are less
+       than window_size positions apart. For a linkage the windows move over
+       the sorted block values of both data sets at the same time, so two
+       records are paired if the largest of their block values is smaller
+       than the block values window_size positions after each of their blocks
+       (in their own data set).
+    """
+
+    window_size = self.window_size  # Shorthand
+
+    if (data_set_num == 1):
+      rec_block_val_dict =      self.rec_block_val_dict1
+      this_index =              self.index1
+      other_index =             self.index2
+      sorted_block_vals =       self.sorted_block_vals1
+      other_sorted_block_vals = self.sorted_block_vals2
+    else:
+      rec_block_val_dict =      self.rec_block_val_dict2
+      this_index =              self.index2
+      other_index =             self.index1
+      sorted_block_vals =       self.sorted_block_vals2
+      other_sorted_block_vals = self.sorted_block_vals1
+
+    rec_pair_set = set()
+
+    for rec_key in rec_key_set:
+      for (i, block_val) in rec_block_val_dict[rec_key]:
+
+        block_vals = sorted_block_vals[i]
+        pos = bisect.bisect_left(block_vals, block_val)
+
+        if (self.do_deduplication == True):
+
+          for other_block_val in \
+              block_vals[max(0, pos-window_size+1):pos+window_size]:
+            for other_rec_key in this_index[i][other_block_val]:
+              if (other_rec_key < rec_key):
+                rec_pair_set.add((other_rec_key, rec_key))
+              elif (other_rec_key > rec_key):
+                rec_pair_set.add((rec_key, other_rec_key))
+
+        else:
+          other_block_vals = other_sorted_block_vals[i]
+
+          start_pos = max(0, bisect.bisect_right(other_block_vals,
+                                                 block_val) - window_size)
+          if (pos+window_size < len(block_vals)):
+            end_pos = bisect.bisect_left(other_block_vals,
+                                         block_vals[pos+window_size])
+          else:
+            end_pos = len(other_block_vals)
+
+          for other_block_val in other_block_vals[start_pos:end_pos]:
+            for other_rec_key in other_index[i][other_block_val]:
+              if (data_set_num == 1):
+                rec_pair_set.add((rec_key, other_rec_key))
+              else:
+                rec_pair_set.add((other_rec_key, rec_key))
+
+    return rec_pair_set
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __update_rec_pairs__(self, old_rec_pair_set, new_rec_pair_set):
+    """Remove the record pairs that are only in the old set from the record
+       pair dictionary, and add the ones that are only in the new set. Updates
+       the number of record pairs, and returns the numbers of added and
+       removed record pairs and a record pair dictionary with the added record
+       pairs.
+    """
+
+    rec_pair_dict = self.rec_pair_dict  # Shorthand
+
+    num_rec_pairs_removed = 0
+
+    for (rec_key1, rec_key2) in old_rec_pair_set - new_rec_pair_set:
+      rec_key2_list = rec_pair_dict[rec_key1]
+      rec_key2_list.remove(rec_key2)
+      num_rec_pairs_removed += 1
+
+      if (len(rec_key2_list) == 0):
+        del rec_pair_dict[rec_key1]
+
+    new_rec_pair_dict = {}  # Only the added record pairs
+
+    num_rec_pairs_added = 0
+
+    for (rec_key1, rec_key2) in new_rec_pair_set - old_rec_pair_set:
+      rec_key2_set = new_rec_pair_dict.get(rec_key1, set())
+      rec_key2_set.add(rec_key2)
+      new_rec_pair_dict[rec_key1] = rec_key2_set
+      num_rec_pairs_added += 1
+
+    for (rec_key1, rec_key2_set) in new_rec_pair_dict.iteritems():
+
+      if (rec_key1 in rec_pair_dict):
+        rec_key2_set = rec_key2_set.union(rec_pair_dict[rec_key1])
+
+      if (self.intern_rec_idents == True):
+        rec_pair_dict[rec_key1] = array.array('i', sorted(rec_key2_set))
+      else:
+        rec_pair_dict[rec_key1] = set(rec_key2_set)
+
+    self.num_rec_pairs += num_rec_pairs_added - num_rec_pairs_removed
+
+    return (num_rec_pairs_added, num_rec_pairs_removed, new_rec_pair_dict)
+
+
+# =============================================================================
+
+class SortingArrayIndex(Indexing):
+  """Class that implements the 'sorted neighbourhood' indexing approach based
+     on a sorted array.
+
+     The index variable values are sorted alphabetically and then a window
+     (with user specified size) is moved over these sorted values. All records
+     in the blocks covered by the current window position are then compared to
+     each other.
+
+     The additional argument (besides the base class arguments) which has to be
+     set when this index is initialised is:
+
+       window_size  A positive integer that gives the size of the moving window
+                    in number of index variable values.
+
+     Note that a window_size of 1 will result in no records being compared with
+     each other (this is different from the previous SortingIndex above).
+  """
+
+  INDEX_SAVE_STATUS_LIST = ['built', 'compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['window_size']  # See Indexing.save()
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, **kwargs):
+    """Constructor. Process the 'window_size' argument first, then call the
+       base class constructor.
+    """
+
+    self.window_size = None  # Set the window size to not defined
+
+    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
+                      # class constructor
+
+    for (keyword, value) in kwargs.items():
+
+      if (keyword.startswith('window')):
+        auxiliary.check_is_integer('window_size', value)
+        auxiliary.check_is_positive('window_size', value)
+        if (value == 1):
+          logging.exception('Window size must be larger than 1.')
+          raise Exception
+
+        self.window_size = value
+
+      else:
+        base_kwargs[keyword] = value
+
+    Indexing.__init__(self, base_kwargs)  # Initialise base class
+
+    # Make sure 'window_size' attribute is set - - - - - - - - - - - - - - - -
+    #
+    auxiliary.check_is_integer('window_size', self.window_size)
+    auxiliary.check_is_positive('window_size', self.window_size)
+
+    self.log([('Window size', self.window_size)])  # Log a message
+
+  # ---------------------------------------------------------------------------
+
+  def build(self):
+    """Method to build an index data structure.
+
+       Read all records from both files, extract blocking variables and then
+       insert records into blocks.
+    """
+
+    logging.info('')
+    logging.info('Build sorted array index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    self.__records_into_inv_index__()  # Read records and put into index
+
+    logging.info('Built sorted array index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.status = 'built'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+
+       Make a dictionary of all record pairs over all indices, which removes
+       duplicate record pairs.
+    """
+
+    NUM_BLOCK_PROGRESS_REPORT = 1000
+
+    logging.info('')
+    logging.info('Compact sorted array index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    num_indices = len(self.index_def)
+
+    dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
+    link_rec_pair_funct =  self.__link_rec_pairs__
+    w =                    self.window_size
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      num_blocks_done = 0
+
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+
+        this_index = self.index1[i]  # Shorthand
+
+        rec_sorted_array = []  # The sorted array with the record identifiers
+                               # of all records
+
+        # Sorting the unique blocking key values is faster than sorting all
+        # values once they are in the sorted array
+        #
+        block_val_list = this_index.keys()  # Get all blocking values
+        block_val_list.sort()
+
+        num_block_vals = len(block_val_list)
+
+        # Loop over all blocks in the inverted index
+        #
+        for block_key_val in block_val_list:
+
+          rec_id_list = this_index[block_key_val]
+          rec_sorted_array += rec_id_list
+
+        # Can be shorter if empty blocking key values occur that
+        #
+        assert len(rec_sorted_array) <= self.dataset1.num_records
+
+        # Now generate record pairs from the sliding window
+        #
+        for j in range(0, len(rec_sorted_array)-w+1):
+
+          # Get record identifiers in the current window
+          #
+          win_rec_id_list = rec_sorted_array[j:j+w][:]
+          assert len(win_rec_id_list) == w, \
+                 (j,w,self.dataset1.num_records,win_rec_id_list)
+          win_rec_id_list.sort()
+
+          ## Possibly improvement: Win pos 1 and all others separate code
+          rec_cnt = 1
+          for rec_ident1 in win_rec_id_list:
+            rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+            for rec_ident2 in win_rec_id_list[rec_cnt:]:
+              assert rec_ident1 != rec_ident2
+              rec_ident2_set.add(rec_ident2)
+            rec_pair_dict[rec_ident1] = rec_ident2_set
+            rec_cnt += 1
+
+          num_blocks_done += 1
+
+          # Log progress report every XXX blocks processed - - - - - - - - - -
+          #
+          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d blocks' % \
+                         (num_blocks_done, num_block_vals))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+        del rec_sorted_array
+
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        this_index1 = self.index1[i]  # Shorthands
+        this_index2 = self.index2[i]
+
+        rec_sorted_array = []  # The sorted array with the record identifiers
                                # of all records
 
-        # Sorting the unique blocking key values is faster than sorting all
-        # values once they are in the sorted array
+        # Get all unique blocking key values from both indices
+        #
+        block_val_set = set(this_index1.keys()+this_index2.keys())
+        block_val_list = list(block_val_set)
+        block_val_list.sort()
+
+        num_block_vals = len(block_val_list)
+
+        # Loop over all blocks in the inverted indices
+        #
+        for block_key_val in block_val_list:
+
+          rec_id_list1 = this_index1.get(block_key_val, [])
+          rec_id_list2 = this_index2.get(block_key_val, [])
+
+          # Merge lists of record identifiers
+          #
+          if (rec_id_list1 != []) and (rec_id_list2 != []):
+
+            # Split 0-1 into equal intervals and give each record a
+            # corresponding floating point number, then sort.
+            # For example:
+            # rec_id_list1=[a,b,c,d,e]
+            #   => [(0.167,a), (0.333,b), (0.5,c), (0.663,d), (0.833,e)]
+            # rec_id_list2=[x,y,z]
+            #   => [(0.25,x), (0.5,y), (0.75,z)]
+            # Merged list: [(0.167,a), (0.25,x), (0.333,b), (0.5,y), (0.5,c),
+            #               (0.663,d), (0.75,z), (0.833,e)]
+
+            merge_list = []
+
+            interval1 = 1.0 / (len(rec_id_list1)+1.0)
+            j = 1
+            for rec_ident in rec_id_list1:
+              merge_list.append((j*interval1, rec_ident, '1'))
+              assert j*interval1 > 0 and j*interval1 < 1
+              j += 1
+            interval2 = 1.0 / (len(rec_id_list2)+1.0)
+            j = 1
+            for rec_ident in rec_id_list2:
+              merge_list.append((j*interval2, rec_ident, '2'))
+              assert j*interval2 > 0 and j*interval2 < 1
+              j += 1
+
+            merge_list.sort()
+
+            assert len(merge_list) == len(rec_id_list1)+len(rec_id_list2)
+
+            for (val, rec_ident, src_index) in merge_list:
+              rec_sorted_array.append((rec_ident, src_index))
+
+          elif (rec_id_list1 == []):
+            for rec_ident in rec_id_list2:
+              rec_sorted_array.append((rec_ident, '2'))  # From index 2
+
+          elif (rec_id_list2 == []):
+            for rec_ident in rec_id_list1:
+              rec_sorted_array.append((rec_ident, '1'))  # From index 1
+
+        # Can be shorter if empty blocking key values occur
+        #
+        assert len(rec_sorted_array) <= (self.dataset1.num_records + \
+                                         self.dataset2.num_records), \
+          (len(rec_sorted_array), (self.dataset1.num_records + \
+                                         self.dataset2.num_records))
+
+        # Now generate record pairs from the sliding window
+        #
+        for j in range(0, len(rec_sorted_array)-w+1):
+
+          # Get record identifiers in the current window
+          #
+          win_rec_id_list = rec_sorted_array[j:j+w][:]
+          assert len(win_rec_id_list) == w, \
+                 (j,w,self.dataset1.num_records,win_rec_id_list)
+
+          rec_id_list1 = []  # Record identifiers from index 1
+          rec_id_list2 = []  # Record identifiers from index 2
+
+          for (rec_ident, source_index) in win_rec_id_list:
+            if (source_index == '1'):
+              rec_id_list1.append(rec_ident)
+            else:
+              rec_id_list2.append(rec_ident)
+
+          for rec_ident1 in rec_id_list1:
+            for rec_ident2 in rec_id_list2:
+
+              rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+              rec_ident2_set.add(rec_ident2)
+              rec_pair_dict[rec_ident1] = rec_ident2_set
+
+          num_blocks_done += 1
+
+          # Log progress report every XXX blocks processed - - - - - - - - - -
+          #
+          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d blocks' % \
+                         (num_blocks_done, num_block_vals))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+        del rec_sorted_array
+
+      logging.info('  Compacted sorting index %d in %s' % \
+                   (i, auxiliary.time_string(time.time()-istart_time)))
+
+      self.index1[i].clear()  # Not needed anymore
+      self.index2[i].clear()
+
+      logging.info('    Explicitly run garbage collection')
+      gc.collect()
+
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('      '+memory_usage_str)
+
+    self.rec_pair_dict = rec_pair_dict
+
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
+
+    logging.info('Compacted sorting index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
+    """Iterate over all blocks in the index.
+
+       Compare the record pairs as produced by the sorting indexing process,
+       and return a weight vector dictionary with keys made of a tuple (record
+       identifier 1, record identifier 2), and corresponding values the
+       comparison weights.
+    """
+
+    logging.info('')
+    logging.info('Started comparison of %d record pairs' % \
+                 (self.num_rec_pairs))
+    if (self.log_funct != None):
+      self.log_funct('Started comparison of %d record pairs' % \
+                     (self.num_rec_pairs))
+
+    # Check if index has been compacted - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'compacted'):
+      logging.exception('Index "%s" has not been compacted, running ' % \
+                        (self.description)+'comparisons not possible')
+      raise Exception
+
+    # Compare the records
+    #
+    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
+                                                cut_off_threshold, num_workers)
+
+# =============================================================================
+
+class AdaptSortingIndex(Indexing):
+  """Class that implements the adaptive sorted neighbourhood indexing approach
+     based on an inverted index and an adaptive construction of blocks based on
+     the similarities of neighbouring index key values.
+
+     For details see the following paper:
+
+     - Adaptive sorted neighborhood methods for efficient record linkage
+       S Yan, D Lee, M.Y Kan and L.C Giles.
+       Proceedings of the 7th ACM/IEEE-CS joint conference on Digital libraries
+       2007.
+
+     The index variable values are sorted alphabetically first, then a search
+     algorithm with adaptive window sizes is moved over the sorted index key
+     values, and blocks are generated where two adjacent values have an
+     approximate string similarity below a given threshold.
+
+     The initial implementation is a simplified  version of the above
+     description that compares all adjacent index key values in a liner fashion.
+
+     The additional argument (besides the base class arguments) which has to be
+     set when this index is initialised is:
+
+       str_cmp_funct  A function to compare two strings (as implemented in the
+                      stringcmp module).
+       str_cmp_thres  The threshold for the string comparison function, must
+                      be in (0..1).
+  """
+
+  INDEX_SAVE_STATUS_LIST = ['built', 'compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['str_cmp_funct', 'str_cmp_thres']  # See Indexing.save()
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, **kwargs):
+    """Constructor. Process the index specific arguments first, then call the
+       base class constructor.
+    """
+
+    self.str_cmp_funct = None
+    self.str_cmp_thres = None
+
+    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
+                      # class constructor
+
+    for (keyword, value) in kwargs.items():
+
+      if (keyword.startswith('str_cmp_f')):
+        auxiliary.check_is_function_or_method('str_cmp_funct', value)
+        self.str_cmp_funct = value
+
+      elif (keyword.startswith('str_cmp_t')):
+        auxiliary.check_is_normalised('str_cmp_thres', value)
+        self.str_cmp_thres = value
+
+      else:
+        base_kwargs[keyword] = value
+
+    Indexing.__init__(self, base_kwargs)  # Initialise base class
+
+    # Make sure parameters have been set - - - - - - - - - - - - - - - - - - -
+    #
+    auxiliary.check_is_function_or_method('str_cmp_funct', self.str_cmp_funct)
+    auxiliary.check_is_normalised('str_cmp_thres', self.str_cmp_thres)
+
+    # A log a message
+    #
+    self.log([('String comparison function',  self.str_cmp_funct),
+              ('String comparison threshold', self.str_cmp_thres)])
+
+  # ---------------------------------------------------------------------------
+
+  def build(self):
+    """Method to build an index data structure.
+
+       Read all records from both files, extract blocking variables and then
+       insert records into blocks.
+    """
+
+    logging.info('')
+    logging.info('Build adaptive sorted index: "%s"' % \
+                 (self.description))
+
+    start_time = time.time()
+
+    self.__records_into_inv_index__()  # Read records and put into index
+
+    logging.info('Built adaptive sorted index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.status = 'built'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+
+       Adaptively generate blocks according to the sorted index key values.
+
+       Make a dictionary of all record pairs over all indices, which removes
+       duplicate record pairs.
+    """
+
+    NUM_BLOCK_PROGRESS_REPORT = 1000
+
+    logging.info('')
+    logging.info('Compact adaptive sorted index: "%s"' % \
+                 (self.description))
+
+    start_time = time.time()
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    num_indices = len(self.index_def)
+
+    dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
+    link_rec_pair_funct =  self.__link_rec_pairs__
+
+    str_cmp_funct =  self.str_cmp_funct
+    str_cmp_thres =  self.str_cmp_thres
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      num_blocks_done = 0
+
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+
+        this_index = self.index1[i]  # Shorthand
+
+        index_val_list = this_index.keys()  # Sort all unique index key values
+        index_val_list.sort()
+
+        num_index_vals = len(index_val_list)
+
+#        win_start_index = 0  # Position in the index key value list of the
+#                             # start of the current window
+#        win_end_index =   0  # Make sure it works even if there is one index
+#                             # key value only
+#
+#        while (win_end_index < num_index_vals):
+#
+#          first_val = index_val_list[win_start_index]
+#          last_val =  index_val_list[win_end_index]
+#
+#          # Increase window size as long as index values are similar
+#          #
+#          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and \
+#                 (win_end_index < num_index_vals-1)):
+#            win_end_index += 1
+#            last_val =  index_val_list[win_end_index]
+#
+#          # Generate the list of record identifiers from this window
+#          #
+#          curr_win_record_set = set()
+#          for this_val in index_val_list[win_start_index:win_end_index+1]:
+#
+#            curr_rec_id_list = this_index[this_val]
+#
+#            curr_win_record_set = \
+#                               curr_win_record_set.union(set(curr_rec_id_list))
+#
+#          if (len(curr_win_record_set) > 1):
+#
+#            dedup_rec_pair_funct(list(curr_win_record_set), rec_pair_dict)
+#
+#          win_end_index += 1
+#          win_start_index = win_end_index
+
+        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        # The code below follows algorithm 2 from the above mentioned paper. It
+        # is more efficient than the above simple linear scan.
         #
-        block_val_list = this_index.keys()  # Get all blocking values
-        block_val_list.sort()
+        # The notation given in this algorithm will be used as much as possible.
+        #
+        block_start_index = 0
 
-        num_block_vals = len(block_val_list)
+        while (block_start_index < num_index_vals):
 
-        # Loop over all blocks in the inverted index
-        #
-        for block_key_val in block_val_list:
+          w_first = block_start_index
+          w = 1  # To make sure this works even with one single index key value
+          w_last = w_first + w
 
-          rec_id_list = this_index[block_key_val]
-          rec_sorted_array += rec_id_list
+          # Get the first and last index key values in the current window
+          #
+          first_val = index_val_list[w_first]
+          last_val =  index_val_list[w_last-1]
 
-        # Can be shorter if empty blocking key values occur that
-        #
-        assert len(rec_sorted_array) <= self.dataset1.num_records
+          # Enlargement phase: Move the window forward as long as index key
+          # values are similar
+          #
+          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
+                 (w_last < num_index_vals)):
+            w_first = w_last-1  # Make sure the windows overlap
+            w *= 2              # Geometric increase in the window size
+            w_last += w-1       # Adjust for overlap
+            if (w_last > num_index_vals):
+              w_last = num_index_vals  # Reached end of array
 
-        # Now generate record pairs from the sliding window
-        #
-        for j in range(0, len(rec_sorted_array)-w+1):
+            first_val = last_val
+            last_val =  index_val_list[w_last-1]
 
-          # Get record identifiers in the current window
+          # Retrenchment phase: Find the boundary pair (use simple linear scan)
+          # (the retrenchment phase as described in the above mentioned paper is
+          # yet to be implementd)
           #
-          win_rec_id_list = rec_sorted_array[j:j+w][:]
-          assert len(win_rec_id_list) == w, \
-                 (j,w,self.dataset1.num_records,win_rec_id_list)
-          win_rec_id_list.sort()
+          tmp_pos = block_start_index
 
-          ## Possibly improvement: Win pos 1 and all others separate code
-          rec_cnt = 1
-          for rec_ident1 in win_rec_id_list:
-            rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
-            for rec_ident2 in win_rec_id_list[rec_cnt:]:
-              assert rec_ident1 != rec_ident2
-              rec_ident2_set.add(rec_ident2)
-            rec_pair_dict[rec_ident1] = rec_ident2_set
-            rec_cnt += 1
+          # Take care of special case where last block is 1 index key value only
+          #
+          if (tmp_pos+1 == num_index_vals):
+            block_end_index = tmp_pos+1
+
+          else:
+            first_val =  index_val_list[tmp_pos]
+            second_val = index_val_list[tmp_pos+1]
+
+            while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
+                   ((tmp_pos+1) < num_index_vals)):
+              tmp_pos += 1
+              first_val =  second_val
+              second_val = index_val_list[tmp_pos]
+
+            block_end_index = tmp_pos+1
+
+          # Generate the list of record identifiers from this block
+          #
+          curr_win_record_set = set()
+          for this_val in index_val_list[block_start_index:block_end_index]:
+            curr_rec_id_list = this_index[this_val]
+
+            curr_win_record_set = \
+                                curr_win_record_set.union(set(curr_rec_id_list))
+
+          if (len(curr_win_record_set) > 1):
+            dedup_rec_pair_funct(list(curr_win_record_set), rec_pair_dict)
+
+          block_start_index = block_end_index
 
           num_blocks_done += 1
 
+          del curr_win_record_set
+
           # Log progress report every XXX blocks processed - - - - - - - - - -
           #
           if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
             logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, num_block_vals))
+                         (num_blocks_done, num_index_vals))
             memory_usage_str = auxiliary.get_memory_usage()
             if (memory_usage_str != None):
               logging.info('      '+memory_usage_str)
 
-        del rec_sorted_array
-
       else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
         this_index1 = self.index1[i]  # Shorthands
         this_index2 = self.index2[i]
 
-        rec_sorted_array = []  # The sorted array with the record identifiers
-                               # of all records
-
-        # Get all unique blocking key values from both indices
+        # Get and sort all unique index key values from both indices
         #
-        block_val_set = set(this_index1.keys()+this_index2.keys())
-        block_val_list = list(block_val_set)
-        block_val_list.sort()
-
-        num_block_vals = len(block_val_list)
+        index_val_set = set(this_index1.keys()+this_index2.keys())
+        index_val_list = list(index_val_set)
+        index_val_list.sort()
 
-        # Loop over all blocks in the inverted indices
-        #
-        for block_key_val in block_val_list:
+        num_index_vals = len(index_val_list)
 
-          rec_id_list1 = this_index1.get(block_key_val, [])
-          rec_id_list2 = this_index2.get(block_key_val, [])
+#        win_start_index = 0  # Position in the index key value list of the
+#                             # start of the current window
+#        win_end_index =   0  # Make sure it works even if there is one index
+#                             # key value only
+#
+#        while (win_end_index < num_index_vals):
+#
+#          first_val = index_val_list[win_start_index]
+#          last_val =  index_val_list[win_end_index]
+#
+#          # Increase window size as long as index values are similar
+#          #
+#          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and \
+#                 (win_end_index < num_index_vals-1)):
+#            win_end_index += 1
+#            last_val =  index_val_list[win_end_index]
+#
+#          # Generate the lists of record identifiers from this window
+#          #
+#          curr_win_record_set1 = set()
+#          curr_win_record_set2 = set()
+#
+#          for this_val in index_val_list[win_start_index:win_end_index+1]:
+#
+#            if (this_val in this_index1):
+#              curr_rec_id_list1 = this_index1[this_val]
+#
+#              curr_win_record_set1 = \
+#                             curr_win_record_set1.union(set(curr_rec_id_list1))
+#
+#            if (this_val in this_index2):
+#              curr_rec_id_list2 = this_index2[this_val]
+#
+#              curr_win_record_set2 = \
+#                             curr_win_record_set2.union(set(curr_rec_id_list2))
+#
+#          if ((len(curr_win_record_set1) > 0) and \
+#              (len(curr_win_record_set2) > 0)):
+#
+#            link_rec_pair_funct(list(curr_win_record_set1),
+#                                list(curr_win_record_set2), rec_pair_dict)
+#
+#          win_end_index += 1
+#          win_start_index = win_end_index
 
-          # Merge lists of record identifiers
-          #
-          if (rec_id_list1 != []) and (rec_id_list2 != []):
+        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        # The code below follows algorithm 2 from the above mentioned paper. It
+        # is more efficient than the above simple linear scan.
+        #
+        # The notation given in this algorithm will be used as much as possible.
+        #
+        block_start_index = 0
 
-            # Split 0-1 into equal intervals and give each record a
-            # corresponding floating point number, then sort.
-            # For example:
-            # rec_id_list1=[a,b,c,d,e]
-            #   => [(0.167,a), (0.333,b), (0.5,c), (0.663,d), (0.833,e)]
-            # rec_id_list2=[x,y,z]
-            #   => [(0.25,x), (0.5,y), (0.75,z)]
-            # Merged list: [(0.167,a), (0.25,x), (0.333,b), (0.5,y), (0.5,c),
-            #               (0.663,d), (0.75,z), (0.833,e)]
+        while (block_start_index < num_index_vals):
 
-            merge_list = []
+          w_first = block_start_index
+          w = 1  # To make sure this works even with one single index key value
+          w_last = w_first + w
 
-            interval1 = 1.0 / (len(rec_id_list1)+1.0)
-            j = 1
-            for rec_ident in rec_id_list1:
-              merge_list.append((j*interval1, rec_ident, '1'))
-              assert j*interval1 > 0 and j*interval1 < 1
-              j += 1
-            interval2 = 1.0 / (len(rec_id_list2)+1.0)
-            j = 1
-            for rec_ident in rec_id_list2:
-              merge_list.append((j*interval2, rec_ident, '2'))
-              assert j*interval2 > 0 and j*interval2 < 1
-              j += 1
+          # Get the first and last index key values in the current window
+          #
+          first_val = index_val_list[w_first]
+          last_val =  index_val_list[w_last-1]
 
-            merge_list.sort()
+          # Enlargement phase: Move the window forward as long as index key
+          # values are similar
+          #
+          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
+                 (w_last < num_index_vals)):
+            w_first = w_last-1  # Make sure the windows overlap
+            w *= 2              # Geometric increase in the window size
+            w_last += w-1       # Adjust for overlap
+            if (w_last > num_index_vals):
+              w_last = num_index_vals  # Reached end of array
 
-            assert len(merge_list) == len(rec_id_list1)+len(rec_id_list2)
+            first_val = last_val
+            last_val =  index_val_list[w_last-1]
 
-            for (val, rec_ident, src_index) in merge_list:
-              rec_sorted_array.append((rec_ident, src_index))
+          # Retrenchment phase: Find the boundary pair (use simple linear scan)
+          # (the retrenchment phase as described in the above mentioned paper is
+          # yet to be implementd)
+          #
+          #
+          tmp_pos = block_start_index
 
-          elif (rec_id_list1 == []):
-            for rec_ident in rec_id_list2:
-              rec_sorted_array.append((rec_ident, '2'))  # From index 2
+          # Take care of special case where last block is 1 index key value only
+          #
+          if (tmp_pos+1 == num_index_vals):
+            block_end_index = tmp_pos+1
 
-          elif (rec_id_list2 == []):
-            for rec_ident in rec_id_list1:
-              rec_sorted_array.append((rec_ident, '1'))  # From index 1
+          else:
+            first_val =  index_val_list[tmp_pos]
+            second_val = index_val_list[tmp_pos+1]
 
-        # Can be shorter if empty blocking key values occur
-        #
-        assert len(rec_sorted_array) <= (self.dataset1.num_records + \
-                                         self.dataset2.num_records), \
-          (len(rec_sorted_array), (self.dataset1.num_records + \
-                                         self.dataset2.num_records))
+            while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
+                   ((tmp_pos+1) < num_index_vals)):
+              tmp_pos += 1
+              first_val =  second_val
+              second_val = index_val_list[tmp_pos]
 
-        # Now generate record pairs from the sliding window
-        #
-        for j in range(0, len(rec_sorted_array)-w+1):
+            block_end_index = tmp_pos+1
 
-          # Get record identifiers in the current window
+          # Generate the list of record identifiers from this block
           #
-          win_rec_id_list = rec_sorted_array[j:j+w][:]
-          assert len(win_rec_id_list) == w, \
-                 (j,w,self.dataset1.num_records,win_rec_id_list)
+          curr_win_record_set1 = set()
+          curr_win_record_set2 = set()
 
-          rec_id_list1 = []  # Record identifiers from index 1
-          rec_id_list2 = []  # Record identifiers from index 2
+          for this_val in index_val_list[block_start_index:block_end_index]:
 
-          for (rec_ident, source_index) in win_rec_id_list:
-            if (source_index == '1'):
-              rec_id_list1.append(rec_ident)
-            else:
-              rec_id_list2.append(rec_ident)
+            if (this_val in this_index1):
+              curr_rec_id_list1 = this_index1[this_val]
 
-          for rec_ident1 in rec_id_list1:
-            for rec_ident2 in rec_id_list2:
+              curr_win_record_set1 = \
+                             curr_win_record_set1.union(set(curr_rec_id_list1))
 
-              rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
-              rec_ident2_set.add(rec_ident2)
-              rec_pair_dict[rec_ident1] = rec_ident2_set
+            if (this_val in this_index2):
+              curr_rec_id_list2 = this_index2[this_val]
+
+              curr_win_record_set2 = \
+                             curr_win_record_set2.union(set(curr_rec_id_list2))
+
+          if ((len(curr_win_record_set1) > 0) and \
+              (len(curr_win_record_set2) > 0)):
+            link_rec_pair_funct(list(curr_win_record_set1),
+                                list(curr_win_record_set2), rec_pair_dict)
+
+          block_start_index = block_end_index
 
           num_blocks_done += 1
 
+          del curr_win_record_set1, curr_win_record_set2
+
           # Log progress report every XXX blocks processed - - - - - - - - - -
           #
           if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
             logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, num_block_vals))
+                         (num_blocks_done, num_index_vals))
             memory_usage_str = auxiliary.get_memory_usage()
             if (memory_usage_str != None):
               logging.info('      '+memory_usage_str)
 
-        del rec_sorted_array
-
       logging.info('  Compacted sorting index %d in %s' % \
                    (i, auxiliary.time_string(time.time()-istart_time)))
 
@@ -2388,10 +6435,8 @@ class SortingArrayIndex(Indexing):
 
     self.rec_pair_dict = rec_pair_dict
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
-
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
 
     logging.info('Compacted sorting index in %s' % \
                  (auxiliary.time_string(time.time()-start_time)))
@@ -2401,7 +6446,8 @@ class SortingArrayIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
        Compare the record pairs as produced by the sorting indexing process,
@@ -2427,76 +6473,142 @@ class SortingArrayIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+                                                cut_off_threshold, num_workers)
 
-# =============================================================================
 
-class AdaptSortingIndex(Indexing):
-  """Class that implements the adaptive sorted neighbourhood indexing approach
-     based on an inverted index and an adaptive construction of blocks based on
-     the similarities of neighbouring index key values.
 
-     For details see the following paper:
 
-     - Adaptive sorted neighborhood methods for efficient record linkage
-       S Yan, D Lee, M.Y Kan and L.C Giles.
-       Proceedings of the 7th ACM/IEEE-CS joint conference on Digital libraries
-       2007.
 
-     The index variable values are sorted alphabetically first, then a search
-     algorithm with adaptive window sizes is moved over the sorted index key
-     values, and blocks are generated where two adjacent values have an
-     approximate string similarity below a given threshold.
 
-     The initial implementation is a simplified  version of the above
-     description that compares all adjacent index key values in a liner fashion.
+# =============================================================================
+
+class QGramIndex(Indexing):
+  """Class that implements an indexing structure based on q-grams and allows
+     for fuzzy 'blocking'.
+
+     This index implements a data structure based on q-grams (sub-strings of
+     length q, e.g. bigrams (q=2): 'peter' -> 'pe','et','te','er') and allows
+     for fuzzy blocking.
+
+     The basic idea is that the index variable values will be converted into a
+     list of q-grams, and sub-lists will be built using a user provided
+     threshold (a number between 0.0 and 1.0) of all possible combinations.
+     The resulting q-gram sub-lists will be inserted into an inverted index,
+     i.e. record identifiers in the blocks will be inserted into Python
+     dictionaries for each q-gram sub-list. This inverted index will then be
+     used to retrieve the blocks.
 
      The additional argument (besides the base class arguments) which has to be
      set when this index is initialised is:
 
-       str_cmp_funct  A function to compare two strings (as implemented in the
-                      stringcmp module).
-       str_cmp_thres  The threshold for the string comparison function, must
-                      be in (0..1).
+       q               The length of the q-grams to be used (must be at least
+                       1). The default value is 2 (i.e. bigrams)
+       padded          If set to True (default), the beginning and end of the
+                       strings will be padded with (q-1) special characters, if
+                       False no padding will be done.
+       threshold       A number between 0.0 (not included) and 1.0, according
+                       to which the q-gram sub-lists will be calculated.
+       qgram_method    Either 'sublist' (default) or 'prefix'. See below for
+                       details.
+
+     For example, assume an indexing definition contains:
+
+       index_def_1 = [['surname','sname',None,[]], ... ]
+
+     and with q=2 and the threshold set to 0.8. If a record value 'peter' is
+     given in the 'surname' field, the corresponding q-gram list will be
+     ['pe','et','te','er'] with four elements. With a threshold of 0.8, 4*0.8 =
+     3.2, rounded to 3, all sub-list combinations of length 3 are calculated.
+     For the given example they are:
+
+       ['pe','et','te']
+       ['pe','et','er']
+       ['pe','te','er']
+       ['et','te','er']
+
+     Converted back into strings, the all records with a given name value
+     'peter' will be inserted into the inverted index blocks with keys
+     'peette', 'peeter', 'peteer', and 'etteer'.
+
+     The lower the threshold, the shorter the sub-lists, but also the more
+     sub-lists there will be per field value, resulting in more (smaller
+     blocks) in the inverted index.
+
+     As the number of sub-lists grows exponentially with the number of q-grams
+     in a value, this is not feasible for long values (like addresses) and low
+     thresholds. If 'qgram_method' is set to 'prefix', no sub-lists are built.
+     Instead all pairs of index values that have at least as many q-grams in
+     common as the minimum sub-list length of both values (4*0.8 = 3.2,
+     rounded to 3, in the example above) are found using an inverted index of
+     q-grams, with prefix filtering and count (positional) filtering, as in
+     the All-Pairs and PPJoin similarity join algorithms. For details see:
+
+     - Efficient similarity joins for near duplicate detection
+       Chuan Xiao, Wei Wang, Xuemin Lin and Jeffrey Xu Yu,
+       WWW, Beijing, 2008.
+
+     Each such pair of index values becomes a block. The common q-grams do not
+     need to be in the same order in both values, so the record pairs are a
+     superset of the record pairs of the 'sublist' method.
   """
 
+  INDEX_SAVE_STATUS_LIST = ['compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['threshold', 'q', 'padded',
+                       'qgram_method']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the index specific arguments first, then call the
-       base class constructor.
+    """Constructor. Process the 'q', padded' and 'threshold' arguments first,
+       then call the base class constructor.
     """
 
-    self.str_cmp_funct = None
-    self.str_cmp_thres = None
+    self.padded =       True
+    self.q =            2
+    self.threshold =    None
+    self.qgram_method = 'sublist'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
 
     for (keyword, value) in kwargs.items():
 
-      if (keyword.startswith('str_cmp_f')):
-        auxiliary.check_is_function_or_method('str_cmp_funct', value)
-        self.str_cmp_funct = value
+      if (keyword.startswith('padd')):
+        auxiliary.check_is_flag('padded', value)
+        self.padded = value
 
-      elif (keyword.startswith('str_cmp_t')):
-        auxiliary.check_is_normalised('str_cmp_thres', value)
-        self.str_cmp_thres = value
+      elif (keyword == 'q'):
+        auxiliary.check_is_integer('q', value)
+        auxiliary.check_is_positive('q', value)
+        self.q = value
+
+      elif (keyword.startswith('thres')):
+        auxiliary.check_is_normalised('threshold', value)
+        self.threshold = value
+
+      elif (keyword.startswith('qgram_m')):
+        if (value not in ['sublist', 'prefix']):
+          logging.exception('Illegal value for "qgram_method": %s' % \
+                            (str(value)))
+          raise Exception
+        self.qgram_method = value
 
       else:
         base_kwargs[keyword] = value
 
     Indexing.__init__(self, base_kwargs)  # Initialise base class
 
-    # Make sure parameters have been set - - - - - - - - - - - - - - - - - - -
+    # Make sure 'threshold' attribute is set - - - - - - - - - - - - - - - - -
     #
-    auxiliary.check_is_function_or_method('str_cmp_funct', self.str_cmp_funct)
-    auxiliary.check_is_normalised('str_cmp_thres', self.str_cmp_thres)
+    auxiliary.check_is_normalised('threshold', self.threshold)
 
-    # A log a message
-    #
-    self.log([('String comparison function',  self.str_cmp_funct),
-              ('String comparison threshold', self.str_cmp_thres)])
+    self.log([('Threshold', self.threshold),
+              ('q', self.q),
+              ('Padded flag', self.padded),
+              ('Q-gram method', self.qgram_method)])  # Log a message
+
+    self.QGRAM_START_CHAR = chr(1)
+    self.QGRAM_END_CHAR =   chr(2)
 
   # ---------------------------------------------------------------------------
 
@@ -2507,16 +6619,136 @@ class AdaptSortingIndex(Indexing):
        insert records into blocks.
     """
 
-    logging.info('')
-    logging.info('Build adaptive sorted index: "%s"' % \
-                 (self.description))
+    logging.info('')
+    logging.info('Build %d-gram index: "%s"' % (self.q, self.description))
+
+    start_time = time.time()
+
+    # First build the basic (blocking) inverted index
+    #
+    self.__records_into_inv_index__()  # Read records and put into index
+
+    num_indices = len(self.index_def)
+
+    # Next create an index with keys being q-gram sub-list values - - - - - - -
+    #
+    self.qgram_index1 = {}
+    self.qgram_index2 = {}
+
+    for i in range(num_indices):  # Similar to basic index
+      self.qgram_index1[i] = {}  # Index for data set 1
+      self.qgram_index2[i] = {}  # Index for data set 2
+
+    q = self.q  # Shorthands
+    padded = self.padded
+    threshold = self.threshold
+
+    if (padded == True):  # More shorthands
+      start_str = (q-1)*self.QGRAM_START_CHAR
+      end_str =   (q-1)*self.QGRAM_END_CHAR
+
+    # Depending upon threshold values use one of two sub-list methods
+    # (the switch value of 0.75 was found experimentally)
+    #
+    if (self.threshold > 0.75):
+      qgram_sublist_funct = self.__get_sublists1__
+    else:
+      qgram_sublist_funct = self.__get_sublists2__
+
+    logging.info('Convert basic inverted index into %d-gram index' % (q))
+
+    num_blocks =       0
+    num_qgram_blocks = 0
+
+    for i in range(num_indices):
+
+      # Build a list of data structures needed for the build process
+      #
+      index_list = [(self.index1[i], self.qgram_index1[i],0)]  # For data set 1
+
+      if (self.do_deduplication == False):  # If linkage append data set 2
+        index_list.append((self.index2[i], self.qgram_index2[i],1))
+
+      if (self.qgram_method == 'prefix'):  # Join the index values - - - - - -
+
+        qstart_time = time.time()
+
+        num_blocks += len(self.index1[i])
+
+        if (self.do_deduplication == True):
+          qgram_index = self.qgram_index1[i]
+
+          for index_val in self.index1[i]:  # Records with the same value
+            qgram_index[index_val] = set([index_val])
+
+          for (index_val1, index_val2) in \
+              self.__qgram_prefix_join__(self.index1[i].keys(), None):
+            qgram_index[(index_val1, index_val2)] = set([index_val1,
+                                                         index_val2])
+
+        else:
+          num_blocks += len(self.index2[i])
+
+          for (index_val1, index_val2) in \
+              self.__qgram_prefix_join__(self.index1[i].keys(),
+                                         self.index2[i].keys()):
+            self.qgram_index1[i][(index_val1, index_val2)] = set([index_val1])
+            self.qgram_index2[i][(index_val1, index_val2)] = set([index_val2])
+
+        num_qgram_blocks += len(self.qgram_index1[i])
+
+        logging.info('  Built %d-gram index %d in %s' % \
+                     (q, i, auxiliary.time_string(time.time()-qstart_time)))
+
+        continue
+
+      for (basic_index, qgram_index, ds_index) in index_list:
+
+        qstart_time = time.time()
+
+        num_blocks += len(basic_index)
+
+        for index_val in basic_index:  # Loop over all the values in this index
+
+          if (padded == True):
+            qgram_str = '%s%s%s' % (start_str, index_val, end_str)
+          else:
+            qgram_str = index_val
+
+          # Create the q-gram list
+          #
+          qgram_list= [qgram_str[j:j+q] for j in xrange(len(qgram_str)-(q-1))]
+
+          # Calculate length of sub-lists needed and then create them
+          #
+          num_qgrams = len(qgram_list)
+
+          min_num_qgrams = max(1, int(num_qgrams*threshold))
+
+          qgram_sublists = qgram_sublist_funct(qgram_list, min_num_qgrams)
+
+          # Convert q-gram sub-lists into strings and insert into q-gram index
+          #
+          for qgram_sublist in qgram_sublists:
+
+            qgram_substr = ''.join(qgram_sublist)
+
+            qgram_index_set = qgram_index.get(qgram_substr, set())
+            qgram_index_set.add(index_val)
+            qgram_index[qgram_substr] = qgram_index_set
+
+        num_qgram_blocks += len(qgram_index)
 
-    start_time = time.time()
+        logging.info('  Built %d-gram index %d for data set %d in %s' % \
+               (q,i,ds_index+1,auxiliary.time_string(time.time()-qstart_time)))
 
-    self.__records_into_inv_index__()  # Read records and put into index
+    logging.info('Built %d-gram index in %s' % \
+                 (q, auxiliary.time_string(time.time()-start_time)))
 
-    logging.info('Built adaptive sorted index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of basic index blocks (number of different ' + \
+                 'index variable values): %d' % (num_blocks))
+    logging.info('  Number of %d-gram index blocks (number of different ' % \
+                 (q) + '%d-gram index values):  %d' % (q, num_qgram_blocks))
 
     memory_usage_str = auxiliary.get_memory_usage()
     if (memory_usage_str != None):
@@ -2526,332 +6758,318 @@ class AdaptSortingIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
-  def compact(self):
-    """Method to compact an index data structure.
+  def __get_qgram_tokens__(self, index_val):
+    """Return the list of q-grams of the given index value, with each q-gram
+       given as a tuple (q-gram, occurrence number) so that q-grams occurring
+       several times in the value are counted several times when sets of
+       tokens are intersected.
+    """
 
-       Adaptively generate blocks according to the sorted index key values.
+    q = self.q
 
-       Make a dictionary of all record pairs over all indices, which removes
-       duplicate record pairs.
-    """
+    if (self.padded == True):
+      qgram_str = '%s%s%s' % ((q-1)*self.QGRAM_START_CHAR, index_val,
+                              (q-1)*self.QGRAM_END_CHAR)
+    else:
+      qgram_str = index_val
 
-    NUM_BLOCK_PROGRESS_REPORT = 1000
+    qgram_count_dict = {}
+    token_list =       []
 
-    logging.info('')
-    logging.info('Compact adaptive sorted index: "%s"' % \
-                 (self.description))
+    for j in xrange(len(qgram_str)-(q-1)):
+      qgram = qgram_str[j:j+q]
+      qgram_count = qgram_count_dict.get(qgram, 0)
+      token_list.append((qgram, qgram_count))
+      qgram_count_dict[qgram] = qgram_count+1
 
-    start_time = time.time()
+    return token_list
 
-    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+  # ---------------------------------------------------------------------------
+
+  def __qgram_prefix_join__(self, index_val_list1, index_val_list2):
+    """Find all pairs of index values (one from each list) that have at
+       least as many q-grams in common as the minimum number of q-grams of
+       both values (according to the threshold).
+
+       If 'index_val_list2' is None pairs of different values within the first
+       list are found (for a deduplication), otherwise pairs between the two
+       lists.
+
+       Returns a list of tuples (index value 1, index value 2).
+    """
+
+    threshold = self.threshold
+
+    # Get the q-gram tokens of all values and count their frequencies - - - - -
     #
-    if (self.status != 'built'):
-      logging.exception('Index "%s" has not been built, compacting is not ' % \
-                        (self.description)+'possible')
-      raise Exception
+    token_freq_dict = {}
 
-    num_indices = len(self.index_def)
+    val_token_lists = []  # One list of (index value, token list) per data set
 
-    dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
-    link_rec_pair_funct =  self.__link_rec_pairs__
+    if (index_val_list2 == None):
+      index_val_lists = [index_val_list1]
+    else:
+      index_val_lists = [index_val_list1, index_val_list2]
 
-    str_cmp_funct =  self.str_cmp_funct
-    str_cmp_thres =  self.str_cmp_thres
+    for index_val_list in index_val_lists:
+      val_token_list = []
 
-    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
-                        # as keys and sets of identifiers from data set 2 as
-                        # values
+      for index_val in index_val_list:
+        token_list = self.__get_qgram_tokens__(index_val)
+        for token in token_list:
+          token_freq_dict[token] = token_freq_dict.get(token, 0) + 1
+        val_token_list.append((index_val, token_list))
 
-    for i in range(num_indices):
+      val_token_lists.append(val_token_list)
 
-      istart_time = time.time()
+    # Order tokens by their frequencies (rare tokens first), so the prefixes
+    # contain the rare tokens and the inverted lists probed are short
+    #
+    token_rank_dict = {}
+    for token in sorted(token_freq_dict, key=lambda t:(token_freq_dict[t],t)):
+      token_rank_dict[token] = len(token_rank_dict)
 
-      num_blocks_done = 0
+    # Convert into records (index value, number of q-grams, minimum number of
+    # common q-grams, sorted list of token ranks), sorted by number of q-grams
+    #
+    rec_lists = []
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+    for val_token_list in val_token_lists:
+      rec_list = []
 
-        this_index = self.index1[i]  # Shorthand
+      for (index_val, token_list) in val_token_list:
+        num_qgrams = len(token_list)
+        rank_list = sorted([token_rank_dict[token] for token in token_list])
+        rec_list.append((num_qgrams, index_val,
+                         max(1, int(num_qgrams*threshold)), rank_list))
 
-        index_val_list = this_index.keys()  # Sort all unique index key values
-        index_val_list.sort()
+      rec_list.sort()
+      rec_lists.append(rec_list)
 
-        num_index_vals = len(index_val_list)
+    del val_token_lists
+    del token_rank_dict
 
-#        win_start_index = 0  # Position in the index key value list of the
-#                             # start of the current window
-#        win_end_index =   0  # Make sure it works even if there is one index
-#                             # key value only
-#
-#        while (win_end_index < num_index_vals):
-#
-#          first_val = index_val_list[win_start_index]
-#          last_val =  index_val_list[win_end_index]
-#
-#          # Increase window size as long as index values are similar
-#          #
-#          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and \
-#                 (win_end_index < num_index_vals-1)):
-#            win_end_index += 1
-#            last_val =  index_val_list[win_end_index]
-#
-#          # Generate the list of record identifiers from this window
-#          #
-#          curr_win_record_set = set()
-#          for this_val in index_val_list[win_start_index:win_end_index+1]:
-#
-#            curr_rec_id_list = this_index[this_val]
-#
-#            curr_win_record_set = \
-#                               curr_win_record_set.union(set(curr_rec_id_list))
-#
-#          if (len(curr_win_record_set) > 1):
-#
-#            dedup_rec_pair_funct(list(curr_win_record_set), rec_pair_dict)
-#
-#          win_end_index += 1
-#          win_start_index = win_end_index
+    index_val_pair_list = []
 
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        # The code below follows algorithm 2 from the above mentioned paper. It
-        # is more efficient than the above simple linear scan.
-        #
-        # The notation given in this algorithm will be used as much as possible.
-        #
-        block_start_index = 0
+    # Values without any q-grams (only possible if not padded) are only
+    # similar to each other
+    #
+    empty_val_lists = []
+    for rec_list in rec_lists:
+      empty_val_lists.append([rec[1] for rec in rec_list if rec[0] == 0])
+
+    if (index_val_list2 == None):
+      empty_val_list = empty_val_lists[0]
+      for j in xrange(len(empty_val_list)):
+        for index_val2 in empty_val_list[j+1:]:
+          index_val_pair_list.append((empty_val_list[j], index_val2))
+    else:
+      for index_val1 in empty_val_lists[0]:
+        for index_val2 in empty_val_lists[1]:
+          index_val_pair_list.append((index_val1, index_val2))
 
-        while (block_start_index < num_index_vals):
+    # Inverted index with token ranks as keys and lists of (record number,
+    # position of token in record) as values
+    #
+    prefix_index = {}
 
-          w_first = block_start_index
-          w = 1  # To make sure this works even with one single index key value
-          w_last = w_first + w
+    probe_rec_list = rec_lists[0]
+    if (index_val_list2 == None):
+      index_rec_list = probe_rec_list
+    else:
+      index_rec_list = rec_lists[1]
 
-          # Get the first and last index key values in the current window
-          #
-          first_val = index_val_list[w_first]
-          last_val =  index_val_list[w_last-1]
+    def index_prefix(rec_num):  # Insert prefix of a record into inverted index
+      (num_qgrams, index_val, min_common, rank_list) = index_rec_list[rec_num]
 
-          # Enlargement phase: Move the window forward as long as index key
-          # values are similar
-          #
-          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
-                 (w_last < num_index_vals)):
-            w_first = w_last-1  # Make sure the windows overlap
-            w *= 2              # Geometric increase in the window size
-            w_last += w-1       # Adjust for overlap
-            if (w_last > num_index_vals):
-              w_last = num_index_vals  # Reached end of array
+      for pos in xrange(num_qgrams-min_common+1):
+        prefix_list = prefix_index.get(rank_list[pos], [])
+        prefix_list.append((rec_num, pos))
+        prefix_index[rank_list[pos]] = prefix_list
 
-            first_val = last_val
-            last_val =  index_val_list[w_last-1]
+    if (index_val_list2 != None):  # Index all values of the second list
+      for rec_num in xrange(len(index_rec_list)):
+        if (index_rec_list[rec_num][0] > 0):
+          index_prefix(rec_num)
 
-          # Retrenchment phase: Find the boundary pair (use simple linear scan)
-          # (the retrenchment phase as described in the above mentioned paper is
-          # yet to be implementd)
-          #
-          tmp_pos = block_start_index
+    # Probe the inverted index with the prefix of each value - - - - - - - - -
+    #
+    for probe_num in xrange(len(probe_rec_list)):
+      (num_qgrams1, index_val1, min_common1, rank_list1) = \
+                                                 probe_rec_list[probe_num]
+      if (num_qgrams1 == 0):
+        continue
 
-          # Take care of special case where last block is 1 index key value only
-          #
-          if (tmp_pos+1 == num_index_vals):
-            block_end_index = tmp_pos+1
+      common_count_dict = {}  # Number of common prefix tokens (count filter)
 
-          else:
-            first_val =  index_val_list[tmp_pos]
-            second_val = index_val_list[tmp_pos+1]
+      for pos1 in xrange(num_qgrams1-min_common1+1):
 
-            while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
-                   ((tmp_pos+1) < num_index_vals)):
-              tmp_pos += 1
-              first_val =  second_val
-              second_val = index_val_list[tmp_pos]
+        for (rec_num, pos2) in prefix_index.get(rank_list1[pos1], []):
+          common_count = common_count_dict.get(rec_num, 0)
 
-            block_end_index = tmp_pos+1
+          if (common_count < 0):  # Already filtered out
+            continue
 
-          # Generate the list of record identifiers from this block
+          (num_qgrams2, index_val2, min_common2, rank_list2) = \
+                                                   index_rec_list[rec_num]
+          min_common = max(min_common1, min_common2)
+
+          # Length filter and positional filter (an upper bound of the number
+          # of common tokens using the positions of this common token)
           #
-          curr_win_record_set = set()
-          for this_val in index_val_list[block_start_index:block_end_index]:
-            curr_rec_id_list = this_index[this_val]
+          if ((min(num_qgrams1, num_qgrams2) < min_common) or \
+              (common_count+1+min(num_qgrams1-pos1-1, num_qgrams2-pos2-1) < \
+               min_common)):
+            common_count_dict[rec_num] = -1
+          else:
+            common_count_dict[rec_num] = common_count+1
 
-            curr_win_record_set = \
-                                curr_win_record_set.union(set(curr_rec_id_list))
+      # Verify the candidates by counting all their common tokens
+      #
+      if (common_count_dict != {}):
+        rank_set1 = set(rank_list1)
 
-          if (len(curr_win_record_set) > 1):
-            dedup_rec_pair_funct(list(curr_win_record_set), rec_pair_dict)
+      for (rec_num, common_count) in common_count_dict.iteritems():
+        if (common_count > 0):
+          (num_qgrams2, index_val2, min_common2, rank_list2) = \
+                                                   index_rec_list[rec_num]
+          if (len(rank_set1.intersection(rank_list2)) >= \
+              max(min_common1, min_common2)):
+            index_val_pair_list.append((index_val1, index_val2))
 
-          block_start_index = block_end_index
+      if (index_val_list2 == None):  # Deduplication: Index after probing
+        index_prefix(probe_num)
 
-          num_blocks_done += 1
+    return index_val_pair_list
 
-          del curr_win_record_set
+  # ---------------------------------------------------------------------------
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, num_index_vals))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+  def compact(self):
+    """Method to compact an index data structure.
 
-      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+       Make a dictionary of all record pairs over all indices, which removes
+       duplicate record pairs.
 
-        this_index1 = self.index1[i]  # Shorthands
-        this_index2 = self.index2[i]
+       Finally calculate the total number of record pairs.
+    """
 
-        # Get and sort all unique index key values from both indices
-        #
-        index_val_set = set(this_index1.keys()+this_index2.keys())
-        index_val_list = list(index_val_set)
-        index_val_list.sort()
+    NUM_QGRAM_BLOCK_PROGRESS_REPORT = 1000
 
-        num_index_vals = len(index_val_list)
+    logging.info('')
+    logging.info('Compact %d-gram index: "%s"' % (self.q, self.description))
 
-#        win_start_index = 0  # Position in the index key value list of the
-#                             # start of the current window
-#        win_end_index =   0  # Make sure it works even if there is one index
-#                             # key value only
-#
-#        while (win_end_index < num_index_vals):
-#
-#          first_val = index_val_list[win_start_index]
-#          last_val =  index_val_list[win_end_index]
-#
-#          # Increase window size as long as index values are similar
-#          #
-#          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and \
-#                 (win_end_index < num_index_vals-1)):
-#            win_end_index += 1
-#            last_val =  index_val_list[win_end_index]
-#
-#          # Generate the lists of record identifiers from this window
-#          #
-#          curr_win_record_set1 = set()
-#          curr_win_record_set2 = set()
-#
-#          for this_val in index_val_list[win_start_index:win_end_index+1]:
-#
-#            if (this_val in this_index1):
-#              curr_rec_id_list1 = this_index1[this_val]
-#
-#              curr_win_record_set1 = \
-#                             curr_win_record_set1.union(set(curr_rec_id_list1))
-#
-#            if (this_val in this_index2):
-#              curr_rec_id_list2 = this_index2[this_val]
-#
-#              curr_win_record_set2 = \
-#                             curr_win_record_set2.union(set(curr_rec_id_list2))
-#
-#          if ((len(curr_win_record_set1) > 0) and \
-#              (len(curr_win_record_set2) > 0)):
-#
-#            link_rec_pair_funct(list(curr_win_record_set1),
-#                                list(curr_win_record_set2), rec_pair_dict)
-#
-#          win_end_index += 1
-#          win_start_index = win_end_index
+    start_time = time.time()
 
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        # The code below follows algorithm 2 from the above mentioned paper. It
-        # is more efficient than the above simple linear scan.
-        #
-        # The notation given in this algorithm will be used as much as possible.
-        #
-        block_start_index = 0
+    num_indices = len(self.index_def)
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
 
-        while (block_start_index < num_index_vals):
+      num_qgram_blocks_done = 0
 
-          w_first = block_start_index
-          w = 1  # To make sure this works even with one single index key value
-          w_last = w_first + w
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
 
-          # Get the first and last index key values in the current window
-          #
-          first_val = index_val_list[w_first]
-          last_val =  index_val_list[w_last-1]
+        this_qgram_index = self.qgram_index1[i]
+        this_index =       self.index1[i]
 
-          # Enlargement phase: Move the window forward as long as index key
-          # values are similar
-          #
-          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
-                 (w_last < num_index_vals)):
-            w_first = w_last-1  # Make sure the windows overlap
-            w *= 2              # Geometric increase in the window size
-            w_last += w-1       # Adjust for overlap
-            if (w_last > num_index_vals):
-              w_last = num_index_vals  # Reached end of array
+        for qgram_val in this_qgram_index:  # Loop over all q-gram values
 
-            first_val = last_val
-            last_val =  index_val_list[w_last-1]
+          block_recs = []  # Combined list of all record identifiers
 
-          # Retrenchment phase: Find the boundary pair (use simple linear scan)
-          # (the retrenchment phase as described in the above mentioned paper is
-          # yet to be implementd)
-          #
+          # All record identifiers from the basic index for this q-gram value
           #
-          tmp_pos = block_start_index
+          index_val_set = this_qgram_index[qgram_val]
 
-          # Take care of special case where last block is 1 index key value only
+          # Get all the indexing variable values for this gqram value
           #
-          if (tmp_pos+1 == num_index_vals):
-            block_end_index = tmp_pos+1
+          for index_val in index_val_set:
 
-          else:
-            first_val =  index_val_list[tmp_pos]
-            second_val = index_val_list[tmp_pos+1]
+            for block_rec in this_index[index_val]:
+              if (block_rec not in block_recs):
+                block_recs.append(block_rec)
 
-            while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
-                   ((tmp_pos+1) < num_index_vals)):
-              tmp_pos += 1
-              first_val =  second_val
-              second_val = index_val_list[tmp_pos]
+          if (len(block_recs) > 1):
 
-            block_end_index = tmp_pos+1
+            self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
 
-          # Generate the list of record identifiers from this block
+          num_qgram_blocks_done += 1
+
+          # Log progress report every XXX q-gram blocks processed
           #
-          curr_win_record_set1 = set()
-          curr_win_record_set2 = set()
+          if ((num_qgram_blocks_done % NUM_QGRAM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d %d-gram blocks' % \
+                         (num_qgram_blocks_done, len(this_qgram_index),
+                         self.q))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
 
-          for this_val in index_val_list[block_start_index:block_end_index]:
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-            if (this_val in this_index1):
-              curr_rec_id_list1 = this_index1[this_val]
+        this_qgram_index1 = self.qgram_index1[i]
+        this_qgram_index2 = self.qgram_index2[i]
+        this_index1 =       self.index1[i]
+        this_index2 =       self.index2[i]
 
-              curr_win_record_set1 = \
-                             curr_win_record_set1.union(set(curr_rec_id_list1))
+        for qgram_val in this_qgram_index1:  # Loop over all q-gram values
 
-            if (this_val in this_index2):
-              curr_rec_id_list2 = this_index2[this_val]
+          if (qgram_val in this_qgram_index2):  # A matching q-gram value
 
-              curr_win_record_set2 = \
-                             curr_win_record_set2.union(set(curr_rec_id_list2))
+            block_recs1 = []  # Combined list of all record identifiers
+            block_recs2 = []
 
-          if ((len(curr_win_record_set1) > 0) and \
-              (len(curr_win_record_set2) > 0)):
-            link_rec_pair_funct(list(curr_win_record_set1),
-                                list(curr_win_record_set2), rec_pair_dict)
+            # All record identifiers from the basic indices for this q-gram
+            #
+            index_val_set1 = this_qgram_index1[qgram_val]
 
-          block_start_index = block_end_index
+            # Get all the indexing variable values for this gqram value
+            #
+            for index_val1 in index_val_set1:
 
-          num_blocks_done += 1
+              for block_rec in this_index1[index_val1]:
+                if (block_rec not in block_recs1):
+                  block_recs1.append(block_rec)
 
-          del curr_win_record_set1, curr_win_record_set2
+            index_val_set2 = this_qgram_index2[qgram_val]
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
+            for index_val2 in index_val_set2:
+
+              for block_rec in this_index2[index_val2]:
+                if (block_rec not in block_recs2):
+                  block_recs2.append(block_rec)
+
+            self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
+
+          num_qgram_blocks_done += 1
+
+          # Log progress report every XXX q-gram blocks processed
           #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, num_index_vals))
+          if ((num_qgram_blocks_done % NUM_QGRAM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d %d-gram blocks' % \
+                         (num_qgram_blocks_done, len(self.qgram_index1[i]),
+                         self.q))
             memory_usage_str = auxiliary.get_memory_usage()
             if (memory_usage_str != None):
               logging.info('      '+memory_usage_str)
 
-      logging.info('  Compacted sorting index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
+      logging.info('  Compacted %d-gram index %d in %s' % \
+                   (self.q, i, auxiliary.time_string(time.time()-istart_time)))
 
-      self.index1[i].clear()  # Not needed anymore
+      self.qgram_index1[i].clear()  # Not needed anymore
+      self.qgram_index2[i].clear()
+      self.index1[i].clear()
       self.index2[i].clear()
 
       logging.info('    Explicitly run garbage collection')
@@ -2859,28 +7077,27 @@ class AdaptSortingIndex(Indexing):
 
       memory_usage_str = auxiliary.get_memory_usage()
       if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+        logging.info('    '+memory_usage_str)
 
     self.rec_pair_dict = rec_pair_dict
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
-
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
 
-    logging.info('Compacted sorting index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('Compacted %d-gram index in %s' % \
+                 (self.q, auxiliary.time_string(time.time()-start_time)))
     logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
 
     self.status = 'compacted'  # Update index status
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
-       Compare the record pairs as produced by the sorting indexing process,
-       and return a weight vector dictionary with keys made of a tuple (record
+       Compare the record pairs as produced by the q-gram indexing process, and
+       return a weight vector dictionary with keys made of a tuple (record
        identifier 1, record identifier 2), and corresponding values the
        comparison weights.
     """
@@ -2902,76 +7119,72 @@ class AdaptSortingIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
-
-
-
-
-
+                                                cut_off_threshold, num_workers)
 
 # =============================================================================
 
-class QGramIndex(Indexing):
-  """Class that implements an indexing structure based on q-grams and allows
-     for fuzzy 'blocking'.
-
-     This index implements a data structure based on q-grams (sub-strings of
-     length q, e.g. bigrams (q=2): 'peter' -> 'pe','et','te','er') and allows
-     for fuzzy blocking.
-
-     The basic idea is that the index variable values will be converted into a
-     list of q-grams, and sub-lists will be built using a user provided
-     threshold (a number between 0.0 and 1.0) of all possible combinations.
-     The resulting q-gram sub-lists will be inserted into an inverted index,
-     i.e. record identifiers in the blocks will be inserted into Python
-     dictionaries for each q-gram sub-list. This inverted index will then be
-     used to retrieve the blocks.
-
-     The additional argument (besides the base class arguments) which has to be
-     set when this index is initialised is:
-
-       q               The length of the q-grams to be used (must be at least
-                       1). The default value is 2 (i.e. bigrams)
-       padded          If set to True (default), the beginning and end of the
-                       strings will be padded with (q-1) special characters, if
-                       False no padding will be done.
-       threshold       A number between 0.0 (not included) and 1.0, according
-                       to which the q-gram sub-lists will be calculated.
-
-     For example, assume an indexing definition contains:
-
-       index_def_1 = [['surname','sname',None,[]], ... ]
+class MinHashLSHIndex(Indexing):
+  """Class that implements an indexing structure based on MinHash signatures
+     and locality sensitive hashing (LSH), which allows for fuzzy blocking.
 
-     and with q=2 and the threshold set to 0.8. If a record value 'peter' is
-     given in the 'surname' field, the corresponding q-gram list will be
-     ['pe','et','te','er'] with four elements. With a threshold of 0.8, 4*0.8 =
-     3.2, rounded to 3, all sub-list combinations of length 3 are calculated.
-     For the given example they are:
+     For details see:
 
-       ['pe','et','te']
-       ['pe','et','er']
-       ['pe','te','er']
-       ['et','te','er']
+     - On the resemblance and containment of documents
+       Andrei Z. Broder,
+       Compression and Complexity of Sequences, 1997.
 
-     Converted back into strings, the all records with a given name value
-     'peter' will be inserted into the inverted index blocks with keys
-     'peette', 'peeter', 'peteer', and 'etteer'.
+     - Mining of Massive Datasets, chapter 3
+       Anand Rajaraman and Jeffrey D. Ullman,
+       Cambridge University Press, 2011.
 
-     The lower the threshold, the shorter the sub-lists, but also the more
-     sub-lists there will be per field value, resulting in more (smaller
-     blocks) in the inverted index.
+     The basic idea is that the index variable values will be converted into a
+     set of q-grams (like in the QGramIndex), and a MinHash signature will be
+     calculated for each value, where each element of the signature is the
+     minimum value of a random hash function over the q-grams. The probability
+     of two values having the same element is their Jaccard similarity. The
+     signatures are then cut into bands of the same size, and values that have
+     the same signature in at least one band are inserted into the same block.
+
+     With 'num_bands' bands of 'band_size' elements each, two values with a
+     Jaccard similarity of s are in a common block with a probability of
+     1-(1-s^band_size)^num_bands. Larger band sizes result in fewer record
+     pairs, more bands in a higher recall.
+
+     The signatures are calculated with NumPy, which therefore is required.
+
+     The additional arguments (besides the base class arguments) which can be
+     set when this index is initialised are:
+
+       q            The length of the q-grams to be used (must be at least 1).
+                    The default value is 2 (i.e. bigrams)
+       padded       If set to True (default), the beginning and end of the
+                    strings will be padded with (q-1) special characters, if
+                    False no padding will be done.
+       num_bands    The number of bands the signatures are cut into. The
+                    default value is 20.
+       band_size    The number of signature elements in each band. The default
+                    value is 4.
+       random_seed  The seed used to generate the random hash functions, so
+                    that the blocks are the same every time an index is built.
+                    The default value is 42.
   """
 
+  INDEX_SAVE_STATUS_LIST = ['compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['q', 'padded', 'num_bands', 'band_size',
+                       'random_seed']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the 'q', padded' and 'threshold' arguments first,
-       then call the base class constructor.
+    """Constructor. Process the 'q', 'padded', 'num_bands', 'band_size' and
+       'random_seed' arguments first, then call the base class constructor.
     """
 
-    self.padded =    True
-    self.q =         2
-    self.threshold = None
+    self.padded =      True
+    self.q =           2
+    self.num_bands =   20
+    self.band_size =   4
+    self.random_seed = 42
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -2987,37 +7200,122 @@ class QGramIndex(Indexing):
         auxiliary.check_is_positive('q', value)
         self.q = value
 
-      elif (keyword.startswith('thres')):
-        auxiliary.check_is_normalised('threshold', value)
-        self.threshold = value
+      elif (keyword.startswith('num_b')):
+        auxiliary.check_is_integer('num_bands', value)
+        auxiliary.check_is_positive('num_bands', value)
+        self.num_bands = value
+
+      elif (keyword.startswith('band_s')):
+        auxiliary.check_is_integer('band_size', value)
+        auxiliary.check_is_positive('band_size', value)
+        self.band_size = value
+
+      elif (keyword.startswith('random_s')):
+        auxiliary.check_is_integer('random_seed', value)
+        self.random_seed = value
 
       else:
         base_kwargs[keyword] = value
 
-    Indexing.__init__(self, base_kwargs)  # Initialise base class
+    if (imp_numpy == False):
+      logging.exception('NumPy is not available, it is needed for the ' + \
+                        'MinHashLSHIndex')
+      raise Exception
 
-    # Make sure 'threshold' attribute is set - - - - - - - - - - - - - - - - -
-    #
-    auxiliary.check_is_normalised('threshold', self.threshold)
+    Indexing.__init__(self, base_kwargs)  # Initialise base class
 
-    self.log([('Threshold', self.threshold),
-              ('q', self.q),
-              ('Padded flag', self.padded)])  # Log a message
+    self.log([('q', self.q),
+              ('Padded flag', self.padded),
+              ('Number of bands', self.num_bands),
+              ('Band size', self.band_size),
+              ('Random seed', self.random_seed)])  # Log a message
 
     self.QGRAM_START_CHAR = chr(1)
     self.QGRAM_END_CHAR =   chr(2)
 
+    # Parameters of the random hash functions (a*x+b) mod p, with p being the
+    # Mersenne prime 2^61-1 (a and b are below 2^31 and the q-gram hash values
+    # below 2^32, so the unsigned 64-bit calculations cannot overflow)
+    #
+    self.HASH_PRIME = 2**61-1
+
+    num_hash = self.num_bands*self.band_size
+    hash_random = random.Random(self.random_seed)
+
+    self.hash_a = numpy.array([hash_random.randint(1, 2**31-1) for k in \
+                               xrange(num_hash)], numpy.uint64)
+    self.hash_b = numpy.array([hash_random.randint(0, 2**31-1) for k in \
+                               xrange(num_hash)], numpy.uint64)
+
+  # ---------------------------------------------------------------------------
+
+  def __get_qgram_hash_set__(self, index_val):
+    """Return the set of 32-bit hash values of the q-grams of the given index
+       value. If the value has no q-grams (it is shorter than q and not
+       padded) the value itself is used as its only q-gram.
+    """
+
+    q = self.q
+
+    if (self.padded == True):
+      qgram_str = '%s%s%s' % ((q-1)*self.QGRAM_START_CHAR, index_val,
+                              (q-1)*self.QGRAM_END_CHAR)
+    else:
+      qgram_str = index_val
+
+    qgram_hash_set = set([zlib.crc32(qgram_str[j:j+q]) & 0xffffffff \
+                          for j in xrange(len(qgram_str)-(q-1))])
+
+    if (len(qgram_hash_set) == 0):
+      qgram_hash_set.add(zlib.crc32(qgram_str) & 0xffffffff)
+
+    return qgram_hash_set
+
+  # ---------------------------------------------------------------------------
+
+  def __get_signatures__(self, index_val_list):
+    """Calculate the MinHash signatures of the given list of index values.
+
+       Returns a NumPy array with one row per index value and one column per
+       hash function.
+    """
+
+    hash_a =     self.hash_a  # Shorthands
+    hash_b =     self.hash_b
+    hash_prime = self.HASH_PRIME
+
+    qgram_hash_list = []  # Q-gram hash values of all index values
+    val_start_list =  []  # Position of the first q-gram of each index value
+
+    for index_val in index_val_list:
+      val_start_list.append(len(qgram_hash_list))
+      qgram_hash_list.extend(self.__get_qgram_hash_set__(index_val))
+
+    qgram_hash_array = numpy.array(qgram_hash_list, numpy.uint64)
+
+    # Apply all hash functions to all q-grams, then take the minimum over the
+    # q-grams of each index value
+    #
+    hash_matrix = (numpy.outer(qgram_hash_array, hash_a) + hash_b) % \
+                  numpy.uint64(hash_prime)
+
+    return numpy.minimum.reduceat(hash_matrix, val_start_list, axis=0)
+
   # ---------------------------------------------------------------------------
 
   def build(self):
     """Method to build an index data structure.
 
        Read all records from both files, extract blocking variables and then
-       insert records into blocks.
+       insert records into blocks. Then calculate the MinHash signatures of
+       all index variable values and insert the values into the LSH blocks of
+       their signature bands.
     """
 
+    SIGNATURE_BATCH_SIZE = 10000  # Number of values per NumPy calculation
+
     logging.info('')
-    logging.info('Build %d-gram index: "%s"' % (self.q, self.description))
+    logging.info('Build MinHash LSH index: "%s"' % (self.description))
 
     start_time = time.time()
 
@@ -3027,92 +7325,68 @@ class QGramIndex(Indexing):
 
     num_indices = len(self.index_def)
 
-    # Next create an index with keys being q-gram sub-list values - - - - - - -
-    #
-    self.qgram_index1 = {}
-    self.qgram_index2 = {}
-
-    for i in range(num_indices):  # Similar to basic index
-      self.qgram_index1[i] = {}  # Index for data set 1
-      self.qgram_index2[i] = {}  # Index for data set 2
-
-    q = self.q  # Shorthands
-    padded = self.padded
-    threshold = self.threshold
-
-    if (padded == True):  # More shorthands
-      start_str = (q-1)*self.QGRAM_START_CHAR
-      end_str =   (q-1)*self.QGRAM_END_CHAR
-
-    # Depending upon threshold values use one of two sub-list methods
-    # (the switch value of 0.75 was found experimentally)
+    band_size = self.band_size  # Shorthand
+
+    # Next create an index with keys being signature band values - - - - - - -
     #
-    if (self.threshold > 0.75):
-      qgram_sublist_funct = self.__get_sublists1__
-    else:
-      qgram_sublist_funct = self.__get_sublists2__
+    self.lsh_index1 = {}
+    self.lsh_index2 = {}
 
-    logging.info('Convert basic inverted index into %d-gram index' % (q))
+    for i in range(num_indices):  # Similar to basic index
+      self.lsh_index1[i] = {}  # Index for data set 1
+      self.lsh_index2[i] = {}  # Index for data set 2
 
-    num_blocks =       0
-    num_qgram_blocks = 0
+    logging.info('Calculate MinHash signatures with %d bands of %d values' % \
+                 (self.num_bands, band_size))
+
+    num_blocks =     0
+    num_lsh_blocks = 0
 
     for i in range(num_indices):
 
-      # Build a list of data structures needed for the build process
-      #
-      index_list = [(self.index1[i], self.qgram_index1[i],0)]  # For data set 1
+      index_list = [(self.index1[i], self.lsh_index1[i], 0)]  # For data set 1
 
       if (self.do_deduplication == False):  # If linkage append data set 2
-        index_list.append((self.index2[i], self.qgram_index2[i],1))
+        index_list.append((self.index2[i], self.lsh_index2[i], 1))
 
-      for (basic_index, qgram_index, ds_index) in index_list:
+      for (basic_index, lsh_index, ds_index) in index_list:
 
-        qstart_time = time.time()
+        lstart_time = time.time()
 
         num_blocks += len(basic_index)
 
-        for index_val in basic_index:  # Loop over all the values in this index
-
-          if (padded == True):
-            qgram_str = '%s%s%s' % (start_str, index_val, end_str)
-          else:
-            qgram_str = index_val
-
-          # Create the q-gram list
-          #
-          qgram_list= [qgram_str[j:j+q] for j in xrange(len(qgram_str)-(q-1))]
-
-          # Calculate length of sub-lists needed and then create them
-          #
-          num_qgrams = len(qgram_list)
+        index_val_list = basic_index.keys()
 
-          min_num_qgrams = max(1, int(num_qgrams*threshold))
+        for batch_start in xrange(0, len(index_val_list), SIGNATURE_BATCH_SIZE):
+          batch_val_list = index_val_list[batch_start:batch_start + \
+                                          SIGNATURE_BATCH_SIZE]
 
-          qgram_sublists = qgram_sublist_funct(qgram_list, min_num_qgrams)
+          signatures = self.__get_signatures__(batch_val_list)
 
-          # Convert q-gram sub-lists into strings and insert into q-gram index
+          # Insert index values into the blocks of all their bands
           #
-          for qgram_sublist in qgram_sublists:
+          for band in xrange(self.num_bands):
+            band_signatures = signatures[:,band*band_size:(band+1)*band_size]
 
-            qgram_substr = ''.join(qgram_sublist)
+            for j in xrange(len(batch_val_list)):
+              band_key = (band, band_signatures[j].tostring())
 
-            qgram_index_set = qgram_index.get(qgram_substr, set())
-            qgram_index_set.add(index_val)
-            qgram_index[qgram_substr] = qgram_index_set
+              lsh_index_set = lsh_index.get(band_key, set())
+              lsh_index_set.add(batch_val_list[j])
+              lsh_index[band_key] = lsh_index_set
 
-        num_qgram_blocks += len(qgram_index)
+        num_lsh_blocks += len(lsh_index)
 
-        logging.info('  Built %d-gram index %d for data set %d in %s' % \
-               (q,i,ds_index+1,auxiliary.time_string(time.time()-qstart_time)))
+        logging.info('  Built LSH index %d for data set %d in %s' % \
+               (i,ds_index+1,auxiliary.time_string(time.time()-lstart_time)))
 
-    logging.info('Built %d-gram index in %s' % \
-                 (q, auxiliary.time_string(time.time()-start_time)))
+    logging.info('Built MinHash LSH index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
 
     logging.info('  Number of basic index blocks (number of different ' + \
                  'index variable values): %d' % (num_blocks))
-    logging.info('  Number of %d-gram index blocks (number of different ' % \
-                 (q) + '%d-gram index values):  %d' % (q, num_qgram_blocks))
+    logging.info('  Number of LSH index blocks (number of different ' + \
+                 'signature band values):  %d' % (num_lsh_blocks))
 
     memory_usage_str = auxiliary.get_memory_usage()
     if (memory_usage_str != None):
@@ -3126,15 +7400,14 @@ class QGramIndex(Indexing):
     """Method to compact an index data structure.
 
        Make a dictionary of all record pairs over all indices, which removes
-       duplicate record pairs.
+       duplicate record pairs. As many bands result in the same sets of index
+       values, each different set is only processed once.
 
        Finally calculate the total number of record pairs.
     """
 
-    NUM_QGRAM_BLOCK_PROGRESS_REPORT = 1000
-
     logging.info('')
-    logging.info('Compact %d-gram index: "%s"' % (self.q, self.description))
+    logging.info('Compact MinHash LSH index: "%s"' % (self.description))
 
     start_time = time.time()
 
@@ -3155,98 +7428,62 @@ class QGramIndex(Indexing):
 
       istart_time = time.time()
 
-      num_qgram_blocks_done = 0
+      this_index1 = self.index1[i]  # Shorthands
+      this_index2 = self.index2[i]
 
       if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
 
-        this_qgram_index = self.qgram_index1[i]
-        this_index =       self.index1[i]
-
-        for qgram_val in this_qgram_index:  # Loop over all q-gram values
-
-          block_recs = []  # Combined list of all record identifiers
-
-          # All record identifiers from the basic index for this q-gram value
-          #
-          index_val_set = this_qgram_index[qgram_val]
-
-          # Get all the indexing variable values for this gqram value
-          #
-          for index_val in index_val_set:
-
-            for block_rec in this_index[index_val]:
-              if (block_rec not in block_recs):
-                block_recs.append(block_rec)
-
+        # Records with the same index value
+        #
+        for block_recs in this_index1.itervalues():
           if (len(block_recs) > 1):
-
             self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
 
-          num_qgram_blocks_done += 1
-
-          # Log progress report every XXX q-gram blocks processed
-          #
-          if ((num_qgram_blocks_done % NUM_QGRAM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d %d-gram blocks' % \
-                         (num_qgram_blocks_done, len(this_qgram_index),
-                         self.q))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
-
-      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
-
-        this_qgram_index1 = self.qgram_index1[i]
-        this_qgram_index2 = self.qgram_index2[i]
-        this_index1 =       self.index1[i]
-        this_index2 =       self.index2[i]
-
-        for qgram_val in this_qgram_index1:  # Loop over all q-gram values
+        # Blocks with several index values
+        #
+        index_val_set_set = set()
 
-          if (qgram_val in this_qgram_index2):  # A matching q-gram value
+        for index_val_set in self.lsh_index1[i].itervalues():
+          if (len(index_val_set) > 1):
+            index_val_set_set.add(frozenset(index_val_set))
 
-            block_recs1 = []  # Combined list of all record identifiers
-            block_recs2 = []
+        for index_val_set in index_val_set_set:
+          block_recs = []
+          for index_val in index_val_set:
+            block_recs += this_index1[index_val]
 
-            # All record identifiers from the basic indices for this q-gram
-            #
-            index_val_set1 = this_qgram_index1[qgram_val]
+          self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
 
-            # Get all the indexing variable values for this gqram value
-            #
-            for index_val1 in index_val_set1:
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-              for block_rec in this_index1[index_val1]:
-                if (block_rec not in block_recs1):
-                  block_recs1.append(block_rec)
+        this_lsh_index2 = self.lsh_index2[i]
 
-            index_val_set2 = this_qgram_index2[qgram_val]
+        index_val_set_set = set()
 
-            for index_val2 in index_val_set2:
+        for (band_key, index_val_set1) in self.lsh_index1[i].iteritems():
+          if (band_key in this_lsh_index2):
+            index_val_set_set.add((frozenset(index_val_set1),
+                                   frozenset(this_lsh_index2[band_key])))
 
-              for block_rec in this_index2[index_val2]:
-                if (block_rec not in block_recs2):
-                  block_recs2.append(block_rec)
+        for (index_val_set1, index_val_set2) in index_val_set_set:
+          block_recs1 = []
+          for index_val in index_val_set1:
+            block_recs1 += this_index1[index_val]
 
-            self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
+          block_recs2 = []
+          for index_val in index_val_set2:
+            block_recs2 += this_index2[index_val]
 
-          num_qgram_blocks_done += 1
+          self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
 
-          # Log progress report every XXX q-gram blocks processed
-          #
-          if ((num_qgram_blocks_done % NUM_QGRAM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d %d-gram blocks' % \
-                         (num_qgram_blocks_done, len(self.qgram_index1[i]),
-                         self.q))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+      logging.info('  Compacted LSH index %d in %s (%d different blocks)' % \
+                   (i, auxiliary.time_string(time.time()-istart_time),
+                    len(index_val_set_set)))
 
-      logging.info('  Compacted %d-gram index %d in %s' % \
-                   (self.q, i, auxiliary.time_string(time.time()-istart_time)))
+      del index_val_set_set
 
-      self.qgram_index1[i].clear()  # Not needed anymore
-      self.qgram_index2[i].clear()
+      self.lsh_index1[i].clear()  # Not needed anymore
+      self.lsh_index2[i].clear()
       self.index1[i].clear()
       self.index2[i].clear()
 
@@ -3259,25 +7496,24 @@ class QGramIndex(Indexing):
 
     self.rec_pair_dict = rec_pair_dict
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
-
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
 
-    logging.info('Compacted %d-gram index in %s' % \
-                 (self.q, auxiliary.time_string(time.time()-start_time)))
+    logging.info('Compacted MinHash LSH index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
     logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
 
     self.status = 'compacted'  # Update index status
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
-       Compare the record pairs as produced by the q-gram indexing process, and
-       return a weight vector dictionary with keys made of a tuple (record
-       identifier 1, record identifier 2), and corresponding values the
+       Compare the record pairs as produced by the MinHash LSH indexing
+       process, and return a weight vector dictionary with keys made of a tuple
+       (record identifier 1, record identifier 2), and corresponding values the
        comparison weights.
     """
 
@@ -3298,7 +7534,7 @@ class QGramIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+                                                cut_off_threshold, num_workers)
 
 # =============================================================================
 
@@ -3364,8 +7600,17 @@ class CanopyIndex(Indexing):
        delete_perc       Threshold for deleting common q-grams (if they appear
                          in more than this percentage of all records). Default
                          is None, in which case no q-grams will be deleted.
+       vectorised        If set to True the canopies will be extracted using a
+                         sparse matrix of index values and q-grams stored in
+                         NumPy arrays (see __vectorised_canopies__()), which is
+                         much faster for large data sets. This requires NumPy.
+                         Default is False.
   """
 
+  INDEX_SAVE_STATUS_LIST = ['compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['canopy_method', 'q', 'padded',
+                       'delete_perc', 'vectorised']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -3377,6 +7622,7 @@ class CanopyIndex(Indexing):
     self.q =              2
     self.padded =         True
     self.delete_perc =    None
+    self.vectorised =     False
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -3408,10 +7654,19 @@ class CanopyIndex(Indexing):
         auxiliary.check_is_percentage('delete_perc', value)
         self.delete_perc = value
 
+      elif (keyword.startswith('vector')):
+        auxiliary.check_is_flag('vectorised', value)
+        if ((value == True) and (imp_numpy == False)):
+          logging.exception('NumPy is not available, vectorised canopy ' + \
+                            'clustering is not possible')
+          raise Exception
+        self.vectorised = value
+
       else:
         base_kwargs[keyword] = value
 
     Indexing.__init__(self, base_kwargs)  # Initialise base class
+    self.__check_inv_index_settings__()
 
     # Check if canopy method and parameters given are OK - - - - - - - - - - -
     #
@@ -3459,7 +7714,8 @@ class CanopyIndex(Indexing):
     self.log([('Canopy method', self.canopy_method),
               ('q', self.q),
               ('Padded flag', self.padded),
-              ('Delete percentage', self.delete_perc)])  # Log a message
+              ('Delete percentage', self.delete_perc),
+              ('Vectorised flag', self.vectorised)])  # Log a message
 
     self.QGRAM_START_CHAR = chr(1)
     self.QGRAM_END_CHAR =   chr(2)
@@ -3640,6 +7896,7 @@ class CanopyIndex(Indexing):
                                            dataset.num_records)
       logging.info('Read and indexed %d records in %s (%s per record)' % \
                    (dataset.num_records, used_sec_str, rec_time_str))
+      self.__log_index_val_cache_stats__()
       memory_usage_str = auxiliary.get_memory_usage()
       if (memory_usage_str != None):
         logging.info('  '+memory_usage_str)
@@ -3881,8 +8138,6 @@ class CanopyIndex(Indexing):
 
     dedup_rec_pairs_funct = self.__dedup_rec_pairs__  # Shorthands
     link_rec_pair_funct =   self.__link_rec_pairs__
-    tfidf_canopy_funct =    self.__tfidf_canopy__
-    jaccard_canopy_funct =  self.__jaccard_canopy__
 
     # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
     #
@@ -3895,13 +8150,6 @@ class CanopyIndex(Indexing):
                         # as keys and sets of identifiers from data set 2 as
                         # values
 
-    # Select get canopy function according to canopy method
-    #
-    if (self.canopy_method[0] == 'tfidf'):  # Only needed for TF-IDF
-      do_tfidf = True
-    else:
-      do_tfidf = False
-
     for i in range(num_indices):
 
       istart_time = time.time()
@@ -3923,31 +8171,15 @@ class CanopyIndex(Indexing):
                    (i, total_num_rec, len(self.index1[i]))+'%d-grams' % \
                    (self.q))
 
-      # Loop over all values, extract canopies and delete records from values
-      # cache that are within the tight threshold of a canopy
-      #
-      while(len(this_index_val_cache) > 0):
-
-        # Get arbitrary record identifier and value from the values cache
-        #
-        (rec_ident, index_val) = this_index_val_cache.popitem()
-        this_index_val_cache[rec_ident] = index_val  # Put back in
-
-        # Get all records in this canopy - - - - - - - - - - - - - - - - - - -
-        #
-        if (do_tfidf == True):
-          canopy_recs = tfidf_canopy_funct(self.index1[i], index_val,
-                                          this_index_val_cache,
-                                          self.qgram_inv_doc_freq_cache[i],
-                                          self.max_qgram_count[i])
-        else:
-          canopy_recs = jaccard_canopy_funct(self.index1[i], index_val,
-                                             this_index_val_cache,
-                                             self.index_val_num_qgram[i])
+      if (self.vectorised == True):
+        canopy_iter = self.__vectorised_canopies__(i)
+      else:
+        canopy_iter = self.__dict_canopies__(i)
 
-        # Make sure center record is in its canopy
-        #
-        assert rec_ident in canopy_recs, (rec_ident,index_val,canopy_recs)
+      # Loop over all canopies extracted, records within the tight threshold
+      # of a canopy are deleted from the values cache
+      #
+      for (index_val, canopy_recs) in canopy_iter:
 
         num_canopy_rec = len(canopy_recs)
         num_canopies += 1
@@ -3965,77 +8197,350 @@ class CanopyIndex(Indexing):
 
           if (num_canopy_rec > 1):  # For deduplication at least two records
 
-            # Build record pairs from record identifiers in this canopy
-            #
-            dedup_rec_pairs_funct(canopy_recs, rec_pair_dict)
+            # Build record pairs from record identifiers in this canopy
+            #
+            dedup_rec_pairs_funct(canopy_recs, rec_pair_dict)
+
+        else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+          canopy_recs1 = []  # Need to separate records
+          canopy_recs2 = []
+
+          for ds_rec_ident in canopy_recs:
+            if (ds_rec_ident[0] == '0'):
+              canopy_recs1.append(ds_rec_ident[1:])
+            else:
+              canopy_recs2.append(ds_rec_ident[1:])
+
+          link_rec_pair_funct(canopy_recs1, canopy_recs2, rec_pair_dict)
+          del canopy_recs1
+          del canopy_recs2
+
+        del canopy_recs
+
+        # Log progress report every XXX canopies - - - - - - - - - - - - - - -
+        #
+        if ((num_canopies % NUM_CANOPY_PROGRESS_REPORT) == 0):
+          logging.info('    Created %d canopies; %d records and ' % \
+                       (num_canopies, len(self.index_val_cache[i])) + \
+                       '%d %d-grams' % (len(self.index1[i]), self.q)+' left')
+          memory_usage_str = auxiliary.get_memory_usage()
+          if (memory_usage_str != None):
+            logging.info('      '+memory_usage_str)
+
+      # Delete not needed index data to free-up memory - - - - - - - - - - - -
+      #
+      self.index1[i].clear()  # Not needed anymore
+      this_index_val_cache.clear()
+      self.qgram_inv_doc_freq_cache[i].clear()
+
+      logging.info('  Compacted canopy index %d in %s' % \
+                   (i, auxiliary.time_string(time.time()-istart_time)))
+      logging.info('    Produced %d canopies' % (num_canopies))
+      logging.info('      Smallest canopy with %d records and center ' % \
+                   (smallest_canopy_size)+'index value: "%s"' % \
+                   (smallest_canopy_center))
+      logging.info('      Largest canopy with %d records and center ' % \
+                   (largest_canopy_size)+'index value: "%s"' % \
+                   (largest_canopy_center))
+
+      logging.info('  Explicitly run garbage collection')
+      gc.collect()
+
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('    '+memory_usage_str)
+
+    self.rec_pair_dict = rec_pair_dict  # Save for later used in run()
+
+    self.__pack_rec_pairs__()
+    num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
+    self.num_rec_pairs = num_rec_pairs
+
+    logging.info('Compacted canopy index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of record pairs: %d' % (num_rec_pairs))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __dict_canopies__(self, i):
+    """Generator that extracts the canopies of index 'i' from the inverted
+       index and yields tuples (center index value, canopy record list).
+    """
+
+    this_index_val_cache = self.index_val_cache[i]  # Shorthand
+
+    while(len(this_index_val_cache) > 0):
+
+      # Get arbitrary record identifier and value from the values cache
+      #
+      (rec_ident, index_val) = this_index_val_cache.popitem()
+      this_index_val_cache[rec_ident] = index_val  # Put back in
+
+      # Get all records in this canopy
+      #
+      if (self.canopy_method[0] == 'tfidf'):
+        canopy_recs = self.__tfidf_canopy__(self.index1[i], index_val,
+                                            this_index_val_cache,
+                                            self.qgram_inv_doc_freq_cache[i],
+                                            self.max_qgram_count[i])
+      else:
+        canopy_recs = self.__jaccard_canopy__(self.index1[i], index_val,
+                                              this_index_val_cache,
+                                              self.index_val_num_qgram[i])
+
+      # Make sure center record is in its canopy
+      #
+      assert rec_ident in canopy_recs, (rec_ident,index_val,canopy_recs)
+
+      yield (index_val, canopy_recs)
+
+  # ---------------------------------------------------------------------------
+
+  def __vectorised_canopies__(self, i):
+    """Generator that extracts the canopies of index 'i' using a sparse
+       matrix stored in NumPy arrays, and yields tuples (center index value,
+       canopy record list).
+
+       Records with the same index value have the same similarity to any
+       canopy center, so the matrix has one row for each different index value
+       (and the records with this value) and one column for each q-gram. Its
+       non-zero entries are stored both by rows (CSR, to get the q-grams of a
+       canopy center) and by columns (CSC, to get the candidate rows that have
+       q-grams in common with a center). The similarities between a center and
+       all its candidates are calculated as one sparse dot product, and rows
+       are removed from the pool of records by setting an array mask (the
+       column arrays are compacted once more than half their rows have been
+       removed).
+
+       The similarities and the threshold and nearest neighbour methods are
+       the same as in __tfidf_canopy__() and __jaccard_canopy__(), with the
+       following differences:
+       - The canopy centers are taken in sorted order of their index values.
+       - A center is always in its canopy and always removed from the pool of
+         records.
+       - For the Jaccard nearest method the similarities of all candidates are
+         calculated (no early phase switch).
+    """
+
+    index =           self.index1[i]  # Shorthands
+    index_val_cache = self.index_val_cache[i]
+
+    do_tfidf =     (self.canopy_method[0] == 'tfidf')
+    do_threshold = (self.canopy_method[1] == 'threshold')
+
+    # Group the records by their index values - - - - - - - - - - - - - - - - -
+    #
+    val_rec_dict = {}
+
+    for (rec_ident, index_val) in index_val_cache.iteritems():
+      val_rec_list = val_rec_dict.get(index_val, [])
+      val_rec_list.append(rec_ident)
+      val_rec_dict[index_val] = val_rec_list
+
+    row_val_list =  sorted(val_rec_dict)
+    row_rec_lists = [val_rec_dict[index_val] for index_val in row_val_list]
+    num_rows =      len(row_val_list)
+
+    del val_rec_dict
+
+    row_num_recs = numpy.array(map(len, row_rec_lists), numpy.float64)
+
+    qgram_col_dict = {}  # Column numbers of all q-grams still in the index
+    for qgram in index:
+      qgram_col_dict[qgram] = len(qgram_col_dict)
+    num_cols = len(qgram_col_dict)
+
+    if (do_tfidf == True):
+      qgram_inv_doc_freq_cache = self.qgram_inv_doc_freq_cache[i]
+      max_qgram_count =          float(self.max_qgram_count[i])
+
+    # Build the rows of the matrix (CSR). For TF-IDF the row weights are the
+    # query weights W_qt and the column weights the normalised weights W_dt
+    # (see __tfidf_canopy__()), for Jaccard all weights are 1
+    #
+    row_ptr_list =    [0]
+    row_col_list =    []
+    row_weight_list = []
+    col_weight_list = []
+
+    for index_val in row_val_list:
+      qgram_dict = self.__qgram_list_to_dict__(self.__get_qgram_list__(
+                                                                   index_val))
+      if (do_tfidf == True):
+        W_d = 0.0  # Euclidean length over all q-grams, as calculated in build()
+        for (qgram, qgram_count) in qgram_dict.iteritems():
+          W_dt = qgram_inv_doc_freq_cache[qgram]*qgram_count / max_qgram_count
+          W_d += W_dt*W_dt
+        W_d = math.sqrt(W_d)
+
+      for (qgram, qgram_count) in qgram_dict.iteritems():
+        if (qgram in qgram_col_dict):  # Q-gram might have been deleted in
+                                       # build() because it was too common
+          row_col_list.append(qgram_col_dict[qgram])
+
+          if (do_tfidf == True):
+            inv_doc_freq = qgram_inv_doc_freq_cache[qgram]
+            row_weight_list.append(inv_doc_freq*qgram_count / max_qgram_count)
+            col_weight_list.append(inv_doc_freq * \
+                                   (qgram_count / max_qgram_count / W_d))
+
+      row_ptr_list.append(len(row_col_list))
+
+    del qgram_col_dict
+
+    row_ptr =    numpy.array(row_ptr_list, numpy.int64)
+    row_cols =   numpy.array(row_col_list, numpy.int64)
+    row_len =    numpy.diff(row_ptr)  # Number of q-grams of each row
+    del row_ptr_list
+    del row_col_list
+
+    # Build the columns of the matrix (CSC)
+    #
+    col_order =  numpy.argsort(row_cols, kind='mergesort')
+    col_rows =   numpy.repeat(numpy.arange(num_rows), row_len)[col_order]
+    col_of_ent = row_cols[col_order]  # Column of each entry, needed when the
+                                      # column arrays are compacted
+    col_ptr =    numpy.zeros(num_cols+1, numpy.int64)
+    col_ptr[1:] = numpy.cumsum(numpy.bincount(col_of_ent, minlength=num_cols))
+
+    if (do_tfidf == True):
+      row_weights = numpy.array(row_weight_list, numpy.float64)
+      col_weights = numpy.array(col_weight_list, numpy.float64)[col_order]
+      del row_weight_list
+      del col_weight_list
+
+    del col_order
+
+    active =       numpy.ones(num_rows, numpy.bool_)
+    num_active =   num_rows
+    num_removed =  0  # Rows removed since the column arrays were compacted
+    center_row =   0
+
+    # Extract canopies until all rows have been removed - - - - - - - - - - - -
+    #
+    while (num_active > 0):
+
+      while (active[center_row] == False):  # Next center in sorted order
+        center_row += 1
+
+      # Get the column entries of all q-grams of the center
+      #
+      center_cols = row_cols[row_ptr[center_row]:row_ptr[center_row+1]]
+      col_start =   col_ptr[center_cols]
+      col_len =     col_ptr[center_cols+1] - col_start
+      ent_pos =     numpy.arange(col_len.sum()) + \
+                    numpy.repeat(col_start - (numpy.cumsum(col_len)-col_len),
+                                 col_len)
 
-        else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - -
+      ent_rows = col_rows[ent_pos]
+      ent_mask = active[ent_rows]  # Only rows still in the pool of records
 
-          canopy_recs1 = []  # Need to separate records
-          canopy_recs2 = []
+      # Sparse dot product of the center row with all candidate rows
+      #
+      (cand_rows, cand_inv) = numpy.unique(ent_rows[ent_mask],
+                                           return_inverse=True)
+      if (do_tfidf == True):
+        center_weights = row_weights[row_ptr[center_row]:
+                                     row_ptr[center_row+1]]
+        ent_weights = col_weights[ent_pos] * numpy.repeat(center_weights,
+                                                          col_len)
+        cand_sims = numpy.bincount(cand_inv, weights=ent_weights[ent_mask],
+                                   minlength=len(cand_rows))
+        W_q = math.sqrt(numpy.dot(center_weights, center_weights))
+
+      else:  # Jaccard similarity from number of common q-grams
+        num_common = numpy.bincount(cand_inv, minlength=len(cand_rows))
+        cand_sims =  num_common / (row_len[cand_rows] + len(center_cols) - \
+                                   num_common).astype(numpy.float64)
+
+      # Select the rows in the canopy and the rows to be removed - - - - - - -
+      #
+      if (do_threshold == True):
+        if (do_tfidf == True):  # Unnormalised cosine similarities
+          canopy_mask = (cand_sims >= self.canopy_method[3]*W_q)
+          remove_mask = (cand_sims >= self.canopy_method[2]*W_q)
+        else:
+          canopy_mask = (cand_sims >= self.canopy_method[3])
+          remove_mask = (cand_sims >= self.canopy_method[2])
 
-          for ds_rec_ident in canopy_recs:
-            if (ds_rec_ident[0] == '0'):
-              canopy_recs1.append(ds_rec_ident[1:])
-            else:
-              canopy_recs2.append(ds_rec_ident[1:])
+      else:  # Nearest: Group rows with the same similarity, largest first
+        if (do_tfidf == True):
+          cand_sims = numpy.round(cand_sims, 10)
 
-            link_rec_pair_funct(canopy_recs1, canopy_recs2, rec_pair_dict)
-          del canopy_recs1
-          del canopy_recs2
+        (group_sims, group_inv) = numpy.unique(-cand_sims, return_inverse=True)
+        group_num_recs = numpy.bincount(group_inv,
+                                        weights=row_num_recs[cand_rows],
+                                        minlength=len(group_sims))
 
-        del canopy_recs
+        remove_nearest =  self.canopy_method[2]
+        cluster_nearest = self.canopy_method[3]
 
-        # Log progress report every XXX canopies - - - - - - - - - - - - - - -
-        #
-        if ((num_canopies % NUM_CANOPY_PROGRESS_REPORT) == 0):
-          logging.info('    Created %d canopies; %d records and ' % \
-                       (num_canopies, len(self.index_val_cache[i])) + \
-                       '%d %d-grams' % (len(self.index1[i]), self.q)+' left')
-          memory_usage_str = auxiliary.get_memory_usage()
-          if (memory_usage_str != None):
-            logging.info('      '+memory_usage_str)
+        num_canopy_recs = 0
+        num_remove_recs = 0
+        canopy_groups = []
+        remove_groups = []
 
-      # Delete not needed index data to free-up memory - - - - - - - - - - - -
-      #
-      self.index1[i].clear()  # Not needed anymore
-      this_index_val_cache.clear()
-      self.qgram_inv_doc_freq_cache[i].clear()
+        for group in xrange(len(group_sims)):
+          group_recs = group_num_recs[group]
 
-      logging.info('  Compacted canopy index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
-      logging.info('    Produced %d canopies' % (num_canopies))
-      logging.info('      Smallest canopy with %d records and center ' % \
-                   (smallest_canopy_size)+'index value: "%s"' % \
-                   (smallest_canopy_center))
-      logging.info('      Largest canopy with %d records and center ' % \
-                   (largest_canopy_size)+'index value: "%s"' % \
-                   (largest_canopy_center))
+          if ((num_canopy_recs + group_recs) <= cluster_nearest):
+            num_canopy_recs += group_recs
+            canopy_groups.append(group)
 
-      logging.info('  Explicitly run garbage collection')
-      gc.collect()
+            if ((num_remove_recs + group_recs) <= remove_nearest) or \
+               (num_remove_recs == 0):  # Make sure removal is not empty
+              num_remove_recs += group_recs
+              remove_groups.append(group)
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('    '+memory_usage_str)
+          else:
+            if (num_canopy_recs == 0):  # Make sure at least nearest neighbours
+              canopy_groups.append(group)  # are returned and removed
+              remove_groups.append(group)
+            break  # Exit loop, enough nearest neighbours found
 
-    num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+        canopy_mask = numpy.in1d(group_inv, canopy_groups)
+        remove_mask = numpy.in1d(group_inv, remove_groups)
 
-    for rec_ident2_set in rec_pair_dict.itervalues():
-      num_rec_pairs += len(rec_ident2_set)
+      canopy_rows = cand_rows[canopy_mask].tolist()
+      remove_rows = cand_rows[remove_mask].tolist()
 
-    self.rec_pair_dict = rec_pair_dict  # Save for later used in run()
-    self.num_rec_pairs = num_rec_pairs
+      if (center_row not in canopy_rows):
+        canopy_rows.append(center_row)
+      if (center_row not in remove_rows):
+        remove_rows.append(center_row)
 
-    logging.info('Compacted canopy index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Number of record pairs: %d' % (num_rec_pairs))
+      canopy_recs = []
+      for row in canopy_rows:
+        canopy_recs += row_rec_lists[row]
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+      # Remove rows from the pool of records and the values cache - - - - - - -
+      #
+      active[remove_rows] = False
+      num_active -=  len(remove_rows)
+      num_removed += len(remove_rows)
+
+      for row in remove_rows:
+        for rec_ident in row_rec_lists[row]:
+          del index_val_cache[rec_ident]
+
+      if ((num_removed > num_active) and (num_active > 0)):
+        ent_mask =    active[col_rows]  # Compact the column arrays
+        col_rows =    col_rows[ent_mask]
+        col_of_ent =  col_of_ent[ent_mask]
+        col_ptr[1:] = numpy.cumsum(numpy.bincount(col_of_ent,
+                                                  minlength=num_cols))
+        if (do_tfidf == True):
+          col_weights = col_weights[ent_mask]
+        num_removed = 0
 
-    self.status = 'compacted'  # Update index status
+      yield (row_val_list[center_row], canopy_recs)
 
   # ---------------------------------------------------------------------------
 
@@ -4465,7 +8970,8 @@ class CanopyIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
        Compare the record pairs as produced by the canopy clustering indexing
@@ -4491,7 +8997,7 @@ class CanopyIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+                                                cut_off_threshold, num_workers)
 
 # =============================================================================
 
@@ -4522,6 +9028,13 @@ class StringMapIndex(Indexing):
        Charu C. Aggarwal and Philip S. Yu,
        KDD 2000.
 
+     Alternatively a k-d tree can be built on the string coordinates, which
+     is searched for the nearest strings of a canopy center in increasing
+     order of their distances (best-first search, see: Distance browsing in
+     spatial databases, Gisli R. Hjaltason and Hanan Samet, ACM TODS, 1999).
+     Unlike the inverted grid, this finds the exact nearest strings in the
+     mapped space, and it does not depend on a grid resolution.
+
      The additional argument (besides the base class arguments) which has to be
      set when this index is initialised is:
 
@@ -4539,13 +9052,21 @@ class StringMapIndex(Indexing):
                         0.0 (totally different strings) and 1.0 (strings are
                         equal). Distances are then calculated as
                         (1.0-similarity value).
-       cache_dist       A flag, if set to True then all distance calculations
-                        done will be cached. This will speed up the index
-                        building process but use more memory. If set to False,
-                        distance calculations will not be cached. Default value
-                        is True.
+       cache_dist       A flag, if set to True then the distances between the
+                        pivot strings and all other strings will be cached.
+                        This will speed up the index building process but use
+                        more memory. If set to False, distance calculations
+                        will not be cached. Default value is True.
+       dist_cache_size  The maximum number of distances kept in the distance
+                        cache. If the cache is full the distances of the pivot
+                        string cached first are removed. Default value is
+                        1000000.
+       search_method    Either 'grid' (default) to use an inverted grid index,
+                        or 'tree' to use a k-d tree to find the nearest strings
+                        of canopy centers.
        grid_resolution  The inverted grid resolution in each dimensions, has to
-                        be a power of 10 number (e.g. 10,100,1000,etc.)
+                        be a power of 10 number (e.g. 10,100,1000,etc.) Only
+                        needed if the search method is 'grid'.
        canopy_method    Determines how the nearest (most similar) strings are
                         extracted into clusters. Possible are:
                           ('threshold', tight_threshold, loose_threshold)
@@ -4579,17 +9100,26 @@ class StringMapIndex(Indexing):
                                             remove nearest.
   """
 
+  INDEX_SAVE_STATUS_LIST = ['compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['dim', 'sub_dim', 'cache_dist',
+                       'dist_cache_size', 'search_method',
+                       'grid_resolution', 'canopy_method',
+                       'sim_funct']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the 'dim', 'sub_dim', 'sim_funct', 'cache_dist' and
-       'grid_resolution' arguments first, then call the base class constructor.
+    """Constructor. Process the 'dim', 'sub_dim', 'sim_funct', 'cache_dist',
+       'dist_cache_size', 'search_method' and 'grid_resolution' arguments
+       first, then call the base class constructor.
     """
 
     self.dim =              None
     self.sub_dim =          None
     self.sim_funct =        None
     self.cache_dist =       True
+    self.dist_cache_size =  1000000
+    self.search_method =    'grid'
     self.grid_resolution =  None
     self.canopy_method =    None
 
@@ -4616,6 +9146,18 @@ class StringMapIndex(Indexing):
         auxiliary.check_is_flag('cache_dist', value)
         self.cache_dist = value
 
+      elif (keyword.startswith('dist_c')):
+        auxiliary.check_is_integer('dist_cache_size', value)
+        auxiliary.check_is_positive('dist_cache_size', value)
+        self.dist_cache_size = value
+
+      elif (keyword.startswith('search_m')):
+        if (value not in ['grid', 'tree']):
+          logging.exception('Illegal value for "search_method": %s' % \
+                            (str(value)))
+          raise Exception
+        self.search_method = value
+
       elif (keyword.startswith('grid_r')):
         auxiliary.check_is_integer('grid_resolution', value)
         auxiliary.check_is_positive('grid_resolution', value)
@@ -4640,12 +9182,13 @@ class StringMapIndex(Indexing):
       raise Exception
 
     auxiliary.check_is_function_or_method('sim_funct', self.sim_funct)
-    auxiliary.check_is_integer('grid_resolution', self.grid_resolution)
-    auxiliary.check_is_positive('grid_resolution', self.grid_resolution)
-    if (self.grid_resolution not in [10,100,1000,10000]):
-      logging.exception('Argument "grid_resolution" is not a power of 10 ' + \
-                        'number: %d' % (elf.grid_resolution))
-      raise Exception
+    if (self.search_method == 'grid'):
+      auxiliary.check_is_integer('grid_resolution', self.grid_resolution)
+      auxiliary.check_is_positive('grid_resolution', self.grid_resolution)
+      if (self.grid_resolution not in [10,100,1000,10000]):
+        logging.exception('Argument "grid_resolution" is not a power of 10 '+\
+                          'number: %d' % (self.grid_resolution))
+        raise Exception
 
     # Check if canopy method and parameters given are OK - - - - - - - - - - -
     #
@@ -4690,12 +9233,17 @@ class StringMapIndex(Indexing):
     self.string_list = {}  # Dictionary with lists with strings from data sets
     self.coord =       {}  # String object coordinates, dim x (num. of strings)
     self.grid_index =  {}
+    self.tree_index =  {}  # K-d trees (root node and leaf node of each string)
 
     self.m = 5  # Number of iterations in __choose_pivot__() to get two strings
 
+    self.TREE_LEAF_SIZE = 8  # Maximum number of strings in a k-d tree leaf
+
     self.log([('Dimension', self.dim),
               ('Sub-space dimension', self.sub_dim),
               ('Cache distance calculations', self.cache_dist),
+              ('Distance cache size', self.dist_cache_size),
+              ('Search method', self.search_method),
               ('Inverted grid resolution', self.grid_resolution),
               ('Canopy method', self.canopy_method),
               ('Similarity function', self.sim_funct)])  # Log a message
@@ -4707,65 +9255,74 @@ class StringMapIndex(Indexing):
        Returns the indices of the two pivots in the string list.
     """
 
-    get_distance_funct = self.__get_distance__  # Shorthand
+    get_distances_funct = self.__get_distances__  # Shorthand
 
     # ind_a = random.randrange(num_string)
     ind_a = 0  # Simply take first
 
     for i in xrange(self.m):
 
-      max_dist = -1
-      ind_b =    -1  # Index of string at maximum distance from str_a
-
-      for j in xrange(num_string):  # Calculate distance to all other strings
-        dist = get_distance_funct(h, num_string, string_list, ind_a, j, coord)
-
-        if (dist > max_dist):
-          max_dist = dist
-          ind_b =    j
-
-      max_dist = -1
-      ind_a =    -1
+      # Index of string at maximum distance from str_a (the first if several)
+      #
+      dist_list = get_distances_funct(h, num_string, string_list, ind_a, coord)
+      ind_b =     dist_list.index(max(dist_list))
 
-      for j in xrange(num_string):  # Calculate distance to all other strings
-        dist = get_distance_funct(h, num_string, string_list, ind_b, j, coord)
-        if (dist > max_dist):
-          max_dist = dist
-          ind_a =    j
+      dist_list = get_distances_funct(h, num_string, string_list, ind_b, coord)
+      ind_a =     dist_list.index(max(dist_list))
 
     return (ind_a, ind_b)
 
   # ---------------------------------------------------------------------------
 
-  def __get_distance__(self, h, num_string, string_list, ind1, ind2, coord):
-    """Get distance of the two given strings (after strings have been projected
-       onto the first h-1 axis).
+  def __get_distances__(self, h, num_string, string_list, ind, coord):
+    """Get the list of distances of the given string to all strings (after
+       strings have been projected onto the first h-1 axis).
+
+       The string distances are calculated in one batch for all strings, and
+       then projected onto the axis one after the other. If distances are
+       cached, the list of distances of a string is kept for the last axis it
+       was projected onto, so it only needs to be projected onto the new axis
+       when it is used again in the next dimension.
     """
 
-    self.num_dist_calc += 1
+    comp_dist_cache = self.comp_dist_cache  # Shorthand
 
-    if ((self.cache_dist == True) and ((h,ind1,ind2) in self.comp_dist_cache)):
-      dist = self.comp_dist_cache[(h,ind1,ind2)]
+    if ((self.cache_dist == True) and (ind in comp_dist_cache) and \
+        (comp_dist_cache[ind][0] <= h)):
+      (dist_h, dist_list) = comp_dist_cache[ind]
 
-    else:
+    else:  # Calculate string distances to all strings
+      str1 =      string_list[ind]
+      sim_funct = self.sim_funct
+
+      dist_list = [1.0 - sim_funct(str1, str2) for str2 in string_list]
+      dist_h =    0
 
-      str1 = string_list[ind1]
-      str2 = string_list[ind2]
+      self.num_dist_calc += num_string
 
-      dist = 1.0 - self.sim_funct(str1, str2)  # Calculate string distance
+    # Project distances onto the axis not done yet
+    #
+    for i in xrange(dist_h, h):
+      i_coord_list = coord[i*num_string:(i+1)*num_string]
+      ind_coord =    i_coord_list[ind]
 
-      num_str_count = 0
-      for i in xrange(h):
-##        w = coord[i*num_string+ind1] - coord[i*num_string+ind2]
-        w = coord[num_str_count + ind1] - coord[num_str_count + ind2]
-        num_str_count += num_string
+      dist_list = [math.sqrt(abs(dist*dist - (ind_coord-c)*(ind_coord-c))) \
+                   for (dist, c) in itertools.izip(dist_list, i_coord_list)]
 
-        dist = math.sqrt(abs(dist*dist - w*w))
+    if (self.cache_dist == True):
 
-      if (self.cache_dist == True):
-        self.comp_dist_cache[(h,ind1,ind2)] = dist  # Save into cache
+      if (ind in comp_dist_cache):
+        del comp_dist_cache[ind]
 
-    return dist
+      else:  # Remove the oldest distances if the cache is full
+        max_cache_len = max(1, self.dist_cache_size / num_string)
+
+        while (len(comp_dist_cache) >= max_cache_len):
+          comp_dist_cache.popitem(last=False)
+
+      comp_dist_cache[ind] = (h, dist_list)  # Save into cache
+
+    return dist_list
 
   # ---------------------------------------------------------------------------
 
@@ -4798,11 +9355,12 @@ class StringMapIndex(Indexing):
       self.coord[i] =       {}
       self.grid_index[i] =  {}
 
-    choose_pivot_funct = self.__choose_pivot__  # Shorthands
-    get_distance_funct = self.__get_distance__
-    dim =                self.dim
+    choose_pivot_funct =  self.__choose_pivot__  # Shorthands
+    get_distances_funct = self.__get_distances__
+    dim =                 self.dim
 
-    grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[self.grid_resolution]
+    if (self.search_method == 'grid'):
+      grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[self.grid_resolution]
 
     for i in range(num_indices):
 
@@ -4825,7 +9383,10 @@ class StringMapIndex(Indexing):
 
       coord = self.coord[i]  # Shorthand
 
-      self.comp_dist_cache = {}  # Cache of calculated distances
+      # Cache of calculated distances, with string indices as keys and tuples
+      # (axis, distance list) as values, in the order they were cached
+      #
+      self.comp_dist_cache = collections.OrderedDict()
       self.num_dist_calc =   0   # Count the number of distance calculations
 
       logging.info('  Map index %d containing %d string values into a ' % \
@@ -4838,7 +9399,10 @@ class StringMapIndex(Indexing):
       for h in xrange(dim):  # Loop over dimensions
 
         (p1, p2) = choose_pivot_funct(h, num_string, string_list, coord)
-        dist = get_distance_funct(h, num_string, string_list, p1, p2, coord)
+
+        dist_list1 = get_distances_funct(h, num_string, string_list, p1, coord)
+        dist_list2 = get_distances_funct(h, num_string, string_list, p2, coord)
+        dist = dist_list1[p2]
 
         if (dist == 0.0):  # All coordinates in the h-th dimension are 0
           break
@@ -4850,8 +9414,8 @@ class StringMapIndex(Indexing):
         # Calculate coordinates of all strings on this axis
         #
         for j in xrange(num_string):
-          x = get_distance_funct(h, num_string, string_list, j, p1, coord)
-          y = get_distance_funct(h, num_string, string_list, j, p2, coord)
+          x = dist_list1[j]
+          y = dist_list2[j]
           coord[h_num_string+j] = (x*x + dist_square - y*y) / dist_two
 
         logging.info('    Processed dimension %d' % (h))
@@ -4859,12 +9423,15 @@ class StringMapIndex(Indexing):
       # Put coordinates into a data structure for efficient nearest neighbor -
       # search
       #
+      do_grid = (self.search_method == 'grid')
+
       index_grid = self.grid_index[i]  # Shorthand
 
-      for h in xrange(dim):  # One dictionary per dimension
-        index_grid[h] = {}
+      if (do_grid == True):
+        for h in xrange(dim):  # One dictionary per dimension
+          index_grid[h] = {}
 
-      logging.info('  Convert index %d into an inverted grid index' % (i))
+        logging.info('  Convert index %d into an inverted grid index' % (i))
 
       str_coord_dict = {}  # Convert coordinates array into a dictionary with
                            # strings as keys and their coordinates as values
@@ -4882,21 +9449,27 @@ class StringMapIndex(Indexing):
 
           str_coord.append(this_coord_val)
 
-          # Put into inverted grid index
-          #
-          round_coord_val = round(this_coord_val, grid_round_digit)
+          if (do_grid == True):  # Put into inverted grid index
 
-          # Each grid cell contains a set of string values in this cell
-          #
-          grid_str_set = index_grid[h].get(round_coord_val, set())
-          grid_str_set.add(str_val)
-          index_grid[h][round_coord_val] = grid_str_set
+            round_coord_val = round(this_coord_val, grid_round_digit)
+
+            # Each grid cell contains a set of string values in this cell
+            #
+            grid_str_set = index_grid[h].get(round_coord_val, set())
+            grid_str_set.add(str_val)
+            index_grid[h][round_coord_val] = grid_str_set
 
         str_coord_dict[str_val] = str_coord
 
       del coord  # Not needed anymore
       self.coord[i] = str_coord_dict
 
+      if (do_grid == False):
+        logging.info('  Build a k-d tree for index %d' % (i))
+
+        self.tree_index[i] = self.__build_tree__([str_coord_dict[str_val] \
+                                                  for str_val in string_list])
+
       logging.info('  Built string-map index %d with %d strings values ' % \
                    (i, num_string)+'in %s' % \
                    (auxiliary.time_string(time.time()-istart_time)))
@@ -4904,450 +9477,710 @@ class StringMapIndex(Indexing):
                    (self.num_dist_calc))
 
       if (self.cache_dist == True):
-        logging.info('    Length of cache: %d (in average %.2f distance ' % \
-                     (len(self.comp_dist_cache),
-                     float(self.num_dist_calc)/len(self.comp_dist_cache)) + \
-                     'calculations per cache entry)')
-        del self.comp_dist_cache
+        logging.info('    Distances of %d strings in cache' % \
+                     (len(self.comp_dist_cache)))
+      del self.comp_dist_cache
+
+      logging.info('    Explicitly run garbage collection')
+      gc.collect()
+
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('      '+memory_usage_str)
+
+    logging.info('Built string-map index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+
+    self.status = 'built'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __build_tree__(self, coord_list):
+    """Build a k-d tree on the given list of string coordinates.
+
+       Each node is a list [number of strings, lower bounds, upper bounds,
+       parent node, left child, right child, list of string indices] with the
+       string indices only set in leaf nodes (which have no children). Returns
+       a tuple (root node, list with the leaf node of each string).
+    """
+
+    dim = self.dim  # Shorthands
+    tree_leaf_size = self.TREE_LEAF_SIZE
+
+    leaf_node_list = [None]*len(coord_list)
+
+    root = [len(coord_list), None, None, None, None, None, None]
+
+    node_stack = [(root, range(len(coord_list)))]
+
+    while (node_stack != []):
+      (node, ind_list) = node_stack.pop()
+
+      lower = [min([coord_list[ind][h] for ind in ind_list]) \
+               for h in xrange(dim)]
+      upper = [max([coord_list[ind][h] for ind in ind_list]) \
+               for h in xrange(dim)]
+      node[1] = lower
+      node[2] = upper
+
+      # Split on the dimension with the largest spread
+      #
+      (spread, split_dim) = max([(upper[h]-lower[h], h) for h in xrange(dim)])
+
+      if ((len(ind_list) <= tree_leaf_size) or (spread == 0.0)):
+        node[6] = ind_list  # A leaf node
+        for ind in ind_list:
+          leaf_node_list[ind] = node
+
+      else:
+        ind_list.sort(key=lambda ind: coord_list[ind][split_dim])
+        mid = len(ind_list) / 2
+
+        node[4] = [mid,               None, None, node, None, None, None]
+        node[5] = [len(ind_list)-mid, None, None, node, None, None, None]
+
+        node_stack.append((node[4], ind_list[:mid]))
+        node_stack.append((node[5], ind_list[mid:]))
+
+    return (root, leaf_node_list)
+
+  # ---------------------------------------------------------------------------
+
+  def __tree_search__(self, tree_root, coord_list, center_ind, active):
+    """Generator that searches the k-d tree for the strings nearest to the
+       given center string, and yields tuples (distance, list of string
+       indices) in increasing order of distance, with all the strings that
+       have this distance.
+
+       Only strings marked as active are returned. As in the inverted grid
+       search, strings that differ from the center but have distance 0.0 get
+       a very small distance (0.0001).
+    """
+
+    dim = self.dim  # Shorthand
+
+    center_coord = coord_list[center_ind]
+
+    heap = [(0.0, 0, tree_root)]  # Nodes and strings with (minimum) distances
+    heap_cnt = 1  # Unique counter so nodes are never compared
+
+    group_dist =     None  # Distance and strings of the current group
+    group_ind_list = []
+
+    while (heap != []):
+      (dist, cnt, item) = heapq.heappop(heap)
+
+      if ((group_ind_list != []) and (dist > group_dist)):
+        yield (group_dist, group_ind_list)
+        group_ind_list = []
+
+      if (isinstance(item, list)):  # A tree node
+
+        if (item[6] != None):  # A leaf node, calculate string distances
+
+          for ind in item[6]:
+            if (active[ind] == True):
+              ind_coord = coord_list[ind]
+
+              edist = 0.0  # Calculate Euclidean distance
+              for h in xrange(dim):
+                dim_diff = abs(ind_coord[h] - center_coord[h])
+                edist += dim_diff*dim_diff
+              edist = math.sqrt(edist)
+
+              if ((edist == 0.0) and (ind != center_ind)):
+                edist = 0.0001
+
+              heapq.heappush(heap, (edist, heap_cnt, ind))
+              heap_cnt += 1
+
+        else:  # Add child nodes that still contain strings
+
+          for child_node in item[4:6]:
+            if (child_node[0] > 0):
+              lower = child_node[1]
+              upper = child_node[2]
+
+              min_dist = 0.0  # Minimum distance to the child's bounding box
+              for h in xrange(dim):
+                if (center_coord[h] < lower[h]):
+                  dim_diff = lower[h] - center_coord[h]
+                  min_dist += dim_diff*dim_diff
+                elif (center_coord[h] > upper[h]):
+                  dim_diff = center_coord[h] - upper[h]
+                  min_dist += dim_diff*dim_diff
+
+              heapq.heappush(heap, (math.sqrt(min_dist), heap_cnt, child_node))
+              heap_cnt += 1
+
+      else:  # A string
+        group_dist = dist
+        group_ind_list.append(item)
+
+    if (group_ind_list != []):
+      yield (group_dist, group_ind_list)
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+
+       An approach similar to canopy clustering is used by randomly picking a
+       string and then extracting its k nearest neighbours.
+
+       Finally calculate the total number of record pairs.
+    """
+
+    NUM_CANOPY_PROGRESS_REPORT = 100  # Log a message every XXX canopies
+
+    logging.info('')
+    logging.info('Compact string-map index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    dedup_rec_pairs_funct = self.__dedup_rec_pairs__  # Shorthands
+    link_rec_pair_funct =   self.__link_rec_pairs__
+    do_dedup =              self.do_deduplication
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      num_canopies = 0  # Count the number of canopies created
+
+      smallest_canopy_size =   999999
+      smallest_canopy_center = ''    # Indexing value of the smallest canopy
+      largest_canopy_size =    -99999
+      largest_canopy_center =  ''    # Indexing value of the largest canopy
+
+      this_index1 = self.index1[i]  # Shorthands to basic inverted index
+      if (do_dedup == False):  # A linkage
+        this_index2 = self.index2[i]
+
+      # Get the dictionary with strings in this index and their coordinates
+      #
+      str_coord_dict = self.coord[i]
+
+      # Total number of strings in this index
+      #
+      total_num_str = len(str_coord_dict)
+
+      logging.info('  Compacting index %d containing %d strings' % \
+                   (i, total_num_str))
+
+      if (self.search_method == 'grid'):
+        canopy_iter = self.__grid_canopies__(i)
+      else:
+        canopy_iter = self.__tree_canopies__(i)
+
+      # Loop over all canopies extracted, strings in the remove list of a
+      # canopy have been deleted from the string dictionary
+      #
+      for (center_str_val, canopy_recs1, canopy_recs2) in canopy_iter:
+
+        num_canopy_rec = len(canopy_recs1+canopy_recs2)
+        num_canopies += 1
+
+        if (num_canopy_rec < smallest_canopy_size):
+          smallest_canopy_size =   num_canopy_rec
+          smallest_canopy_center = center_str_val
+        elif (num_canopy_rec > largest_canopy_size):
+          largest_canopy_size =   num_canopy_rec
+          largest_canopy_center = center_str_val
+
+        # Retrieve all record identifiers for the cluster strings - - - - - - -
+        #
+        if (do_dedup == True):
+
+          if (len(canopy_recs1) > 1):  # For deduplication at least two records
+
+            # Build record pairs from record identifiers in this canopy
+            #
+            dedup_rec_pairs_funct(canopy_recs1, rec_pair_dict)
+
+        else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+          if ((len(canopy_recs1) > 0) and (len(canopy_recs2) > 0)):
+            link_rec_pair_funct(canopy_recs1, canopy_recs2, rec_pair_dict)
+
+        del canopy_recs1
+        del canopy_recs2
+
+        # Log progress report every XXX canopies - - - - - - - - - - - - - - -
+        #
+        if ((num_canopies % NUM_CANOPY_PROGRESS_REPORT) == 0):
+          logging.info('    Created %d canopies; %d strings left' % \
+                       (num_canopies, len(str_coord_dict)))
+          memory_usage_str = auxiliary.get_memory_usage()
+          if (memory_usage_str != None):
+            logging.info('      '+memory_usage_str)
+
+      # Delete not needed index data to free-up memory - - - - - - - - - - - -
+      #
+      this_index1.clear()  # Not needed anymore
+      if (do_dedup == False):
+        this_index2.clear()
+
+      logging.info('  Compacted canopy index %d in %s' % \
+                   (i, auxiliary.time_string(time.time()-istart_time)))
+      logging.info('    Produced %d canopies' % (num_canopies))
+      logging.info('      Smallest canopy with %d strings and center ' % \
+                   (smallest_canopy_size)+'index value: "%s"' % \
+                   (smallest_canopy_center))
+      logging.info('      Largest canopy with %d strings and center ' % \
+                   (largest_canopy_size)+'index value: "%s"' % \
+                   (largest_canopy_center))
 
-      logging.info('    Explicitly run garbage collection')
+      logging.info('  Explicitly run garbage collection')
       gc.collect()
 
       memory_usage_str = auxiliary.get_memory_usage()
       if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+        logging.info('    '+memory_usage_str)
 
-    logging.info('Built string-map index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+    self.rec_pair_dict = rec_pair_dict  # Save for later used in run()
 
-    self.status = 'built'  # Update index status
+    self.__pack_rec_pairs__()
+    num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
+    self.num_rec_pairs = num_rec_pairs
 
-  # ---------------------------------------------------------------------------
+    logging.info('Compacted canopy index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of record pairs: %d' % (num_rec_pairs))
 
-  def compact(self):
-    """Method to compact an index data structure.
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
 
-       An approach similar to canopy clustering is used by randomly picking a
-       string and then extracting its k nearest neighbours.
+    self.status = 'compacted'  # Update index status
 
-       Finally calculate the total number of record pairs.
+  # ---------------------------------------------------------------------------
+
+  def __get_canopy_params__(self):
+    """Return a tuple (do_nearest, remove, cluster) with the canopy method
+       parameters, with thresholds re-scaled to be distances.
     """
 
-    NUM_CANOPY_PROGRESS_REPORT = 100  # Log a message every XXX canopies
+    if (self.canopy_method[0] == 'nearest'):
+      return (True, self.canopy_method[1], self.canopy_method[2])
 
-    logging.info('')
-    logging.info('Compact string-map index: "%s"' % (self.description))
+    else:  # Re-scale similarity measure and make it a distance
+      return (False, (1.0-self.canopy_method[1])*math.sqrt(self.dim),
+              (1.0-self.canopy_method[2])*math.sqrt(self.dim))
 
-    start_time = time.time()
+  # ---------------------------------------------------------------------------
 
-    num_indices = len(self.index_def)
+  def __grid_canopies__(self, i):
+    """Generator that extracts the canopies of index 'i' using the inverted
+       grid index, and yields tuples (center string value, record identifiers
+       from data set 1, record identifiers from data set 2).
+    """
 
     grid_res = self.grid_resolution
     grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[grid_res]
 
     interval_size = 1.0/self.grid_resolution  # To get neighbouring grid cells
 
-    dedup_rec_pairs_funct = self.__dedup_rec_pairs__  # Shorthands
-    link_rec_pair_funct =   self.__link_rec_pairs__
-    sub_dim =               self.sub_dim
-    dim =                   self.dim
-    do_dedup =              self.do_deduplication
-
-    if (self.canopy_method[0] == 'nearest'):  # Shorthands
-      do_nearest = True
-      remove_nearest =  self.canopy_method[1]
-      cluster_nearest = self.canopy_method[2]
+    sub_dim =  self.sub_dim  # Shorthands
+    dim =      self.dim
+    do_dedup = self.do_deduplication
 
-    else:  # Re-scale similarity measure and make it a distance
-      do_nearest = False
-      tight_threshold = (1.0-self.canopy_method[1])*math.sqrt(dim)
-      loose_threshold = (1.0-self.canopy_method[2])*math.sqrt(dim)
+    (do_nearest, remove_param, cluster_param) = self.__get_canopy_params__()
 
-    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'built'):
-      logging.exception('Index "%s" has not been built, compacting is not ' % \
-                        (self.description)+'possible')
-      raise Exception
+    if (do_nearest == True):
+      remove_nearest =  remove_param
+      cluster_nearest = cluster_param
+    else:
+      tight_threshold = remove_param
+      loose_threshold = cluster_param
 
-    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
-                        # as keys and sets of identifiers from data set 2 as
-                        # values
+    index_grid = self.grid_index[i]  # Shorthand to inverted grid index
 
-    for i in range(num_indices):
+    this_index1 = self.index1[i]  # Shorthands to basic inverted index
+    if (do_dedup == False):  # A linkage
+      this_index2 = self.index2[i]
 
-      istart_time = time.time()
+    str_coord_dict = self.coord[i]
 
-      num_canopies = 0  # Count the number of canopies created
+    str_val_list = str_coord_dict.keys()  # List of the string values only
 
-      smallest_canopy_size =   999999
-      smallest_canopy_center = ''    # Indexing value of the smallest canopy
-      largest_canopy_size =    -99999
-      largest_canopy_center =  ''    # Indexing value of the largest canopy
+    # Loop over all string values, extract canopies and delete strings from
+    # string dicionary
+    #
+    while(len(str_val_list) > 0):
 
-      index_grid = self.grid_index[i]  # Shorthand to inverted grid index
+      # Get arbitrary (the first) string and its coordinates
+      #
+      # str_ind = random.randrange(len(str_val_list))
+      center_str_val =   str_val_list[0]
+      center_str_coord = str_coord_dict[center_str_val]
+
+      # In case not enough records can be extracted from the selected - - - -
+      # string's grid cell and its direct neighbour cells, the search
+      # has to be extended to more neighbouring cells.
+      # The following flag will be set to True if enough records have been
+      # extracted.
+      #
+      got_enough_records_for_canopy = False
 
-      this_index1 = self.index1[i]  # Shorthands to basic inverted index
-      if (do_dedup == False):  # A linkage
-        this_index2 = self.index2[i]
+      # Start with only one neighbouring grid cell in each direction
+      #
+      neighbour_offset = 0
 
-      # Get the dictionary with strings in this index and their coordinates
+      # Get all close neighbouring strings to the chosen center
       #
-      str_coord_dict = self.coord[i]
+      final_candidate_set = set()  # Union of all candiate sets
 
-      str_val_list = str_coord_dict.keys()  # List of the string values only
+      dist_comp_cache = {}  # Cache distance comparison made for this canopy
 
-      # Total number of strings in this index
+      # Until enough records extracted - - - - - - - - - - - - - - - - - - -
       #
-      total_num_str = len(str_val_list)
+      while (got_enough_records_for_canopy == False) and \
+            (neighbour_offset < grid_res/2):
 
-      logging.info('  Compacting index %d containing %d strings' % \
-                   (i, total_num_str))
+        neighbour_offset += 1
 
-      # Loop over all string values, extract canopies and delete strings from
-      # string dicionary
-      #
-      while(len(str_val_list) > 0):
+        for h in xrange(dim):  # Loop over dimensions
 
-        # Get arbitrary (the first) string and its coordinates
-        #
-        # str_ind = random.randrange(len(str_val_list))
-        center_str_val =   str_val_list[0]
-        center_str_coord = str_coord_dict[center_str_val]
-
-        # In case not enough records can be extracted from the selected - - - -
-        # string's grid cell and its direct neighbour cells, the search
-        # has to be extended to more neighbouring cells.
-        # The following flag will be set to True if enough records have been
-        # extracted.
-        #
-        got_enough_records_for_canopy = False
+          # Get the key value of the grid cell where this string is
+          #
+          this_cell_val = round(center_str_coord[h], grid_round_digit)
 
-        # Start with only one neighbouring grid cell in each direction
-        #
-        neighbour_offset = 0
+          # Get strings in the grid cell and check if center string is there
+          # (this is also the initial candidate set)
+          #
+          this_cand_set = index_grid[h][this_cell_val]
+          assert center_str_val in this_cand_set
 
-        # Get all close neighbouring strings to the chosen center
-        #
-        final_candidate_set = set()  # Union of all candiate sets
+          # Get neighbouring grid cells
+          #
+          previous_cell_val = this_cell_val - neighbour_offset*interval_size
+          next_cell_val =     this_cell_val + neighbour_offset*interval_size
 
-        dist_comp_cache = {}  # Cache distance comparison made for this canopy
+          if (previous_cell_val in index_grid[h]):
+            previous_cell_str_set = index_grid[h][previous_cell_val]
+            this_cand_set = this_cand_set.union(previous_cell_str_set)
 
-        # Until enough records extracted - - - - - - - - - - - - - - - - - - -
-        #
-        while (got_enough_records_for_canopy == False) and \
-              (neighbour_offset < grid_res/2):
+          if (next_cell_val in index_grid[h]):
+            next_cell_str_set = index_grid[h][next_cell_val]
+            this_cand_set = this_cand_set.union(next_cell_str_set)
 
-          neighbour_offset += 1
+          if ((h % sub_dim) == 0):  # Start new candidate set
+            candidate_set = this_cand_set
+          else:
+            candidate_set = candidate_set.intersection(this_cand_set)
 
-          for h in xrange(dim):  # Loop over dimensions
+            if (((h+1) % sub_dim) == 0):
 
-            # Get the key value of the grid cell where this string is
-            #
-            this_cell_val = round(center_str_coord[h], grid_round_digit)
+              # Union current candidate set with final candidate set
+              #
+              final_candidate_set = final_candidate_set.union(candidate_set)
+              del candidate_set
+              candidate_set = set()
 
-            # Get strings in the grid cell and check if center string is there
-            # (this is also the initial candidate set)
-            #
-            this_cand_set = index_grid[h][this_cell_val]
-            assert center_str_val in this_cand_set
+        if (len(candidate_set) > 0):
+          final_candidate_set = final_candidate_set.union(candidate_set)
 
-            # Get neighbouring grid cells
-            #
-            previous_cell_val = this_cell_val - neighbour_offset*interval_size
-            next_cell_val =     this_cell_val + neighbour_offset*interval_size
+        final_candidate_set_len = len(final_candidate_set)
 
-            if (previous_cell_val in index_grid[h]):
-              previous_cell_str_set = index_grid[h][previous_cell_val]
-              this_cand_set = this_cand_set.union(previous_cell_str_set)
+        # Calculate proper distances to each of these strings - - - - - - - -
+        #
+        dist_dict = {}  # Distances as keys and lists of strings as values
 
-            if (next_cell_val in index_grid[h]):
-              next_cell_str_set = index_grid[h][next_cell_val]
-              this_cand_set = this_cand_set.union(next_cell_str_set)
+        # Number of string pairs that differ but have distance zero
+        #
+        num_same_str_loc = 0
 
-            if ((h % sub_dim) == 0):  # Start new candidate set
-              candidate_set = this_cand_set
-            else:
-              candidate_set = candidate_set.intersection(this_cand_set)
+        for str_candidate_val in final_candidate_set:
 
-              if (((h+1) % sub_dim) == 0):
+          # Check if distance has already been calculated
+          #
+          if ((neighbour_offset > 1) and \
+              ((center_str_val,str_candidate_val) in dist_comp_cache)):
+            edist = dist_comp_cache[(center_str_val,str_candidate_val)]
 
-                # Union current candidate set with final candidate set
-                #
-                final_candidate_set = final_candidate_set.union(candidate_set)
-                del candidate_set
-                candidate_set = set()
+          else:  # Calculate Euclidean distance
 
-          if (len(candidate_set) > 0):
-            final_candidate_set = final_candidate_set.union(candidate_set)
+            # Get string coordinates first
+            #
+            str_candidate_coord = str_coord_dict[str_candidate_val]
 
-          final_candidate_set_len = len(final_candidate_set)
+            edist = 0.0  # Calculate Euclidean distance
 
-          # Calculate proper distances to each of these strings - - - - - - - -
-          #
-          dist_dict = {}  # Distances as keys and lists of strings as values
+            for h in xrange(dim):  # Loop over dimensions
+              dim_diff = abs(str_candidate_coord[h] - center_str_coord[h])
+              edist +=   dim_diff*dim_diff
+            edist = math.sqrt(edist)
 
-          # Number of string pairs that differ but have distance zero
-          #
-          num_same_str_loc = 0
+            # Check if strings that differ have non-zero distance
+            #
+            if ((edist == 0.0) and (center_str_val != str_candidate_val)):
+              num_same_str_loc += 1
 
-          for str_candidate_val in final_candidate_set:
+              # Change distance to a very small value, as otherwise lots of
+              # records will be put into the canopy
+              #
+              edist = 0.0001
 
-            # Check if distance has already been calculated
+            # Cache distance
             #
-            if ((neighbour_offset > 1) and \
-                ((center_str_val,str_candidate_val) in dist_comp_cache)):
-              edist = dist_comp_cache[(center_str_val,str_candidate_val)]
+            dist_comp_cache[(center_str_val,str_candidate_val)] = edist
 
-            else:  # Calculate Euclidean distance
+          # Put distance and string into distance dictionary
+          #
+          dist_str_list = dist_dict.get(edist, [])
+          dist_str_list.append(str_candidate_val)
+          dist_dict[edist] = dist_str_list
 
-              # Get string coordinates first
-              #
-              str_candidate_coord = str_coord_dict[str_candidate_val]
+        if (num_same_str_loc > 0):
+          logging.warning('%d string pairs that differ had Euclidean ' % \
+                          (num_same_str_loc) + 'distance of 0.0 (set to' + \
+                          ' a very small distance)')
 
-              edist = 0.0  # Calculate Euclidean distance
+        dist_heap = dist_dict.keys()
+        heapq.heapify(dist_heap)  # Heap of distances, easier to part. sort
 
-              for h in xrange(dim):  # Loop over dimensions
-                dim_diff = abs(str_candidate_coord[h] - center_str_coord[h])
-                edist +=   dim_diff*dim_diff
-              edist = math.sqrt(edist)
+        remove_str_list = []  # String values to be deleted
 
-              # Check if strings that differ have non-zero distance
-              #
-              if ((edist == 0.0) and (center_str_val != str_candidate_val)):
-                num_same_str_loc += 1
+        canopy_recs1 = [] # All record identifiers from data set 1 in canopy
+        canopy_recs2 = [] # Record identifiers from data set 2, linkage only
 
-                # Change distance to a very small value, as otherwise lots of
-                # records will be put into the canopy
-                #
-                edist = 0.0001
+        # Get and remove strings according to canopy method and - - - - - - -
+        # add corresponding record identifiers into canopies
+        #
+        while (dist_heap != []):
 
-              # Cache distance
-              #
-              dist_comp_cache[(center_str_val,str_candidate_val)] = edist
+          smallest_dist = heapq.heappop(dist_heap) # Smallest distance value
+          smallest_str_list = dist_dict[smallest_dist]  # Its string values
 
-            # Put distance and string into distance dictionary
-            #
-            dist_str_list = dist_dict.get(edist, [])
-            dist_str_list.append(str_candidate_val)
-            dist_dict[edist] = dist_str_list
+          this_str_val_recs1 = []  # All record identifiers for these strings
+          this_str_val_recs2 = []
 
-          if (num_same_str_loc > 0):
-            logging.warning('%d string pairs that differ had Euclidean ' % \
-                            (num_same_str_loc) + 'distance of 0.0 (set to' + \
-                            ' a very small distance)')
+          for str_val in smallest_str_list:  # Get record ident. of strings
 
-          dist_heap = dist_dict.keys()
-          heapq.heapify(dist_heap)  # Heap of distances, easier to part. sort
+            if (str_val in this_index1):
+              this_str_val_recs1 += this_index1[str_val]
+            if (do_dedup == False) and (str_val in this_index2):
+              this_str_val_recs2 += this_index2[str_val]
 
-          remove_str_list = []  # String values to be deleted
+          if (do_nearest == True):
 
-          canopy_recs1 = [] # All record identifiers from data set 1 in canopy
-          canopy_recs2 = [] # Record identifiers from data set 2, linkage only
+            comb_list_len = len(canopy_recs1) + len(canopy_recs2) + \
+                            len(this_str_val_recs1) + len(this_str_val_recs2)
 
-          # Get and remove strings according to canopy method and - - - - - - -
-          # add corresponding record identifiers into canopies
-          #
-          while (dist_heap != []):
+            if (comb_list_len <= cluster_nearest):  # Add more to canopy
+              canopy_recs1 += this_str_val_recs1
+              if (do_dedup == False):
+                canopy_recs2 += this_str_val_recs2
 
-            smallest_dist = heapq.heappop(dist_heap) # Smallest distance value
-            smallest_str_list = dist_dict[smallest_dist]  # Its string values
+              # Remove string (make sure at least closest will be removed)
+              #
+              if ((comb_list_len <= remove_nearest) or
+                  (len(remove_str_list) == 0)):
+                remove_str_list += smallest_str_list
 
-            this_str_val_recs1 = []  # All record identifiers for these strings
-            this_str_val_recs2 = []
+            else:
+              if ((canopy_recs1 == []) and (canopy_recs2 == [])):
+                canopy_recs1 = this_str_val_recs1
+                if (do_dedup == False):
+                  canopy_recs2 = this_str_val_recs2
+                remove_str_list = smallest_str_list
 
-            for str_val in smallest_str_list:  # Get record ident. of strings
+              break
 
-              if (str_val in this_index1):
-                this_str_val_recs1 += this_index1[str_val]
-              if (do_dedup == False) and (str_val in this_index2):
-                this_str_val_recs2 += this_index2[str_val]
+          else:  # Thresholds - - - - - - - - - - - - - - - - - - - - - - - -
 
-            if (do_nearest == True):
+            if (smallest_dist <= loose_threshold):  # Add to canopies
 
-              comb_list_len = len(canopy_recs1) + len(canopy_recs2) + \
-                              len(this_str_val_recs1) + len(this_str_val_recs2)
+              canopy_recs1 += this_str_val_recs1
+              if (do_dedup == False):  # A linkage
+                canopy_recs2 += this_str_val_recs2
 
-              if (comb_list_len <= cluster_nearest):  # Add more to canopy
-                canopy_recs1 += this_str_val_recs1
-                if (do_dedup == False):
-                  canopy_recs2 += this_str_val_recs2
+              # Remove string (make sure at least closest will be removed)
+              #
+              if ((smallest_dist < tight_threshold) or
+                  (len(remove_str_list) == 0)):
+                remove_str_list += smallest_str_list
 
-                # Remove string (make sure at least closest will be removed)
-                #
-                if ((comb_list_len <= remove_nearest) or
-                    (len(remove_str_list) == 0)):
-                  remove_str_list += smallest_str_list
+            else:
+              if ((canopy_recs1 == []) and (canopy_recs2 == [])):
+                canopy_recs1 = this_str_val_recs1
+                if (do_dedup == False):
+                  canopy_recs2 = this_str_val_recs2
+                remove_str_list = smallest_str_list
 
-              else:
-                if ((canopy_recs1 == []) and (canopy_recs2 == [])):
-                  canopy_recs1 = this_str_val_recs1
-                  if (do_dedup == False):
-                    canopy_recs2 = this_str_val_recs2
-                  remove_str_list = smallest_str_list
+              break  # Leave loop as threshold is reached
 
-                break
+        # Check if the candidate string set was big enough - - - - - - - - -
+        #
+        if ((len(dist_heap) == 0) and \
+            (((do_nearest == True) and (len(canopy_recs1)+len(canopy_recs2) \
+                                        < cluster_nearest)) or \
+             ((do_nearest == False) and (smallest_dist < loose_threshold)))):
+          #logging.warning('Extracted candidate set with %d string(s) ' % \
+          #                (final_candidate_set_len)+'was not enough to ' + \
+          #                'build canopy (using %d neighbouring cells)' % \
+          #                (neighbour_offset))
+          pass
+        else:
+          got_enough_records_for_canopy = True  # Enough records extracted
 
-            else:  # Thresholds - - - - - - - - - - - - - - - - - - - - - - - -
+      del this_str_val_recs1
+      del this_str_val_recs2
+      del dist_dict
+      del dist_heap
+      del dist_comp_cache
+      del final_candidate_set
 
-              if (smallest_dist <= loose_threshold):  # Add to canopies
+      # Make sure center string is in canopy and will be removed - - - - - -
+      #
+      assert center_str_val in remove_str_list
 
-                canopy_recs1 += this_str_val_recs1
-                if (do_dedup == False):  # A linkage
-                  canopy_recs2 += this_str_val_recs2
+      # Delete strings from remove list from index and string list - - - - -
+      #
+      for str_val in remove_str_list:
+        str_val_list.remove(str_val)
 
-                # Remove string (make sure at least closest will be removed)
-                #
-                if ((smallest_dist < tight_threshold) or
-                    (len(remove_str_list) == 0)):
-                  remove_str_list += smallest_str_list
+        if (do_dedup == True):
+          del this_index1[str_val]
+        else:
+          if (str_val in this_index1):
+            del this_index1[str_val]
+          if (str_val in this_index2):
+            del this_index2[str_val]
 
-              else:
-                if ((canopy_recs1 == []) and (canopy_recs2 == [])):
-                  canopy_recs1 = this_str_val_recs1
-                  if (do_dedup == False):
-                    canopy_recs2 = this_str_val_recs2
-                  remove_str_list = smallest_str_list
+        str_coord = str_coord_dict[str_val]  # Also remove from grid index
 
-                break  # Leave loop as threshold is reached
+        for h in xrange(dim):  # Loop over dimensions
 
-          # Check if the candidate string set was big enough - - - - - - - - -
-          #
-          if ((len(dist_heap) == 0) and \
-              (((do_nearest == True) and (len(canopy_recs1)+len(canopy_recs2) \
-                                          < cluster_nearest)) or \
-               ((do_nearest == False) and (smallest_dist < loose_threshold)))):
-            #logging.warning('Extracted candidate set with %d string(s) ' % \
-            #                (final_candidate_set_len)+'was not enough to ' + \
-            #                'build canopy (using %d neighbouring cells)' % \
-            #                (neighbour_offset))
-            pass
+          this_grid_cell_val = round(str_coord[h], grid_round_digit)
+          this_grid_cell_str_set = index_grid[h][this_grid_cell_val]
+          this_grid_cell_str_set.remove(str_val)
+          if (len(this_grid_cell_str_set) > 0):
+            index_grid[h][this_grid_cell_val] = this_grid_cell_str_set
           else:
-            got_enough_records_for_canopy = True  # Enough records extracted
+            del index_grid[h][this_grid_cell_val]  # All strings removed
 
-        del this_str_val_recs1
-        del this_str_val_recs2
-        del dist_dict
-        del dist_heap
-        del dist_comp_cache
-        del final_candidate_set
-
-        # Make sure center string is in canopy and will be removed - - - - - -
+        # Finally remove from string coordinates dictionary
         #
-        assert center_str_val in remove_str_list
+        del str_coord_dict[str_val]
 
-        # Delete strings from remove list from index and string list - - - - -
-        #
-        for str_val in remove_str_list:
-          str_val_list.remove(str_val)
+      del remove_str_list
 
-          if (do_dedup == True):
-            del this_index1[str_val]
-          else:
-            if (str_val in this_index1):
-              del this_index1[str_val]
-            if (str_val in this_index2):
-              del this_index2[str_val]
+      yield (center_str_val, canopy_recs1, canopy_recs2)
 
-          str_coord = str_coord_dict[str_val]  # Also remove from grid index
+  # ---------------------------------------------------------------------------
 
-          for h in xrange(dim):  # Loop over dimensions
+  def __tree_canopies__(self, i):
+    """Generator that extracts the canopies of index 'i' using the k-d tree,
+       and yields tuples (center string value, record identifiers from data
+       set 1, record identifiers from data set 2).
 
-            this_grid_cell_val = round(str_coord[h], grid_round_digit)
-            this_grid_cell_str_set = index_grid[h][this_grid_cell_val]
-            this_grid_cell_str_set.remove(str_val)
-            if (len(this_grid_cell_str_set) > 0):
-              index_grid[h][this_grid_cell_val] = this_grid_cell_str_set
-            else:
-              del index_grid[h][this_grid_cell_val]  # All strings removed
+       The strings are taken as canopy centers in the order of the string
+       list, and the nearest strings of a center are retrieved in increasing
+       order of their distances until the canopy method stops.
+    """
 
-          # Finally remove from string coordinates dictionary
-          #
-          del str_coord_dict[str_val]
+    do_dedup = self.do_deduplication  # Shorthand
 
-        del remove_str_list
+    (do_nearest, remove_param, cluster_param) = self.__get_canopy_params__()
 
-        num_canopy_rec = len(canopy_recs1+canopy_recs2)
-        num_canopies += 1
+    this_index1 = self.index1[i]  # Shorthands to basic inverted index
+    if (do_dedup == False):  # A linkage
+      this_index2 = self.index2[i]
 
-        if (num_canopy_rec < smallest_canopy_size):
-          smallest_canopy_size =   num_canopy_rec
-          smallest_canopy_center = center_str_val
-        elif (num_canopy_rec > largest_canopy_size):
-          largest_canopy_size =   num_canopy_rec
-          largest_canopy_center = center_str_val
+    str_coord_dict = self.coord[i]
+    string_list =    self.string_list[i]
+    coord_list =     [str_coord_dict[str_val] for str_val in string_list]
 
-        # Retrieve all record identifiers for the cluster strings - - - - - - -
-        #
-        if (do_dedup == True):
+    (tree_root, leaf_node_list) = self.tree_index[i]
 
-          if (len(canopy_recs1) > 1):  # For deduplication at least two records
+    active = [True]*len(string_list)  # Strings not removed yet
 
-            # Build record pairs from record identifiers in this canopy
-            #
-            dedup_rec_pairs_funct(canopy_recs1, rec_pair_dict)
+    for center_ind in xrange(len(string_list)):
 
-        else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - -
+      if (active[center_ind] == False):
+        continue
 
-          if ((len(canopy_recs1) > 0) and (len(canopy_recs2) > 0)):
-            link_rec_pair_funct(canopy_recs1, canopy_recs2, rec_pair_dict)
+      remove_ind_list = []  # Indices of strings to be removed
 
-        del canopy_recs1
-        del canopy_recs2
+      canopy_recs1 = []  # All record identifiers from data set 1 in canopy
+      canopy_recs2 = []  # Record identifiers from data set 2, linkage only
 
-        # Log progress report every XXX canopies - - - - - - - - - - - - - - -
-        #
-        if ((num_canopies % NUM_CANOPY_PROGRESS_REPORT) == 0):
-          logging.info('    Created %d canopies; %d strings left' % \
-                       (num_canopies, len(str_val_list)))
-          memory_usage_str = auxiliary.get_memory_usage()
-          if (memory_usage_str != None):
-            logging.info('      '+memory_usage_str)
+      for (dist, ind_list) in self.__tree_search__(tree_root, coord_list,
+                                                   center_ind, active):
 
-      # Delete not needed index data to free-up memory - - - - - - - - - - - -
-      #
-      this_index1.clear()  # Not needed anymore
-      if (do_dedup == False):
-        this_index2.clear()
+        this_str_val_recs1 = []  # All record identifiers for these strings
+        this_str_val_recs2 = []
 
-      logging.info('  Compacted canopy index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
-      logging.info('    Produced %d canopies' % (num_canopies))
-      logging.info('      Smallest canopy with %d strings and center ' % \
-                   (smallest_canopy_size)+'index value: "%s"' % \
-                   (smallest_canopy_center))
-      logging.info('      Largest canopy with %d strings and center ' % \
-                   (largest_canopy_size)+'index value: "%s"' % \
-                   (largest_canopy_center))
+        for ind in ind_list:  # Get record identifiers of strings
+          str_val = string_list[ind]
 
-      logging.info('  Explicitly run garbage collection')
-      gc.collect()
+          if (str_val in this_index1):
+            this_str_val_recs1 += this_index1[str_val]
+          if (do_dedup == False) and (str_val in this_index2):
+            this_str_val_recs2 += this_index2[str_val]
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('    '+memory_usage_str)
+        if (do_nearest == True):
+          comb_list_len = len(canopy_recs1) + len(canopy_recs2) + \
+                          len(this_str_val_recs1) + len(this_str_val_recs2)
+          add_to_canopy = (comb_list_len <= cluster_param)
+          add_to_remove = (comb_list_len <= remove_param)
 
-    num_rec_pairs = 0  # Count lengths of all record identifier sets - - - - -
+        else:  # Thresholds
+          add_to_canopy = (dist <= cluster_param)
+          add_to_remove = (dist < remove_param)
 
-    for rec_ident2_set in rec_pair_dict.itervalues():
-      num_rec_pairs += len(rec_ident2_set)
+        if (add_to_canopy == True):
+          canopy_recs1 += this_str_val_recs1
+          canopy_recs2 += this_str_val_recs2
 
-    self.rec_pair_dict = rec_pair_dict  # Save for later used in run()
-    self.num_rec_pairs = num_rec_pairs
+          # Remove strings (make sure at least closest will be removed)
+          #
+          if ((add_to_remove == True) or (remove_ind_list == [])):
+            remove_ind_list += ind_list
 
-    logging.info('Compacted canopy index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Number of record pairs: %d' % (num_rec_pairs))
+        else:
+          if ((canopy_recs1 == []) and (canopy_recs2 == [])):
+            canopy_recs1 =    this_str_val_recs1
+            canopy_recs2 =    this_str_val_recs2
+            remove_ind_list = ind_list
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+          break  # Enough nearest strings, or threshold reached
 
-    self.status = 'compacted'  # Update index status
+      # Make sure center string is in canopy and will be removed
+      #
+      assert center_ind in remove_ind_list
+
+      for ind in remove_ind_list:  # Remove strings from the tree
+        active[ind] = False
+
+        node = leaf_node_list[ind]
+        while (node != None):  # Update string counts up to the root
+          node[0] -= 1
+          node = node[3]
+
+        del str_coord_dict[string_list[ind]]
+
+      yield (string_list[center_ind], canopy_recs1, canopy_recs2)
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
        Compare the record pairs as produced by the string map canopy clustering
@@ -5373,7 +10206,7 @@ class StringMapIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+                                                cut_off_threshold, num_workers)
 
 # =============================================================================
 
@@ -5413,8 +10246,25 @@ class SuffixArrayIndex(Indexing):
                                       example for 'peter', the values 'pete',
                                       'eter', 'pet', 'ete', 'ter', etc. will
                                       be generated.
+       build_method   The way the suffix array is built. Possible are:
+                      - 'dict'   All suffix strings (or sub-strings) of all
+                                 index values are stored as keys in a
+                                 dictionary (default).
+                      - 'array'  A suffix array of integer offsets into one
+                                 buffer containing all index values is built,
+                                 and blocks are extracted from runs of equal
+                                 suffixes ('suffixonly') or from intervals of
+                                 suffixes with a long enough common prefix
+                                 ('allsubstr'). The blocks are the same as
+                                 with 'dict', but no suffix strings are
+                                 created, which needs much less memory for
+                                 long index values.
   """
 
+  INDEX_SAVE_STATUS_LIST = ['compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['block_method', 'suffix_method',
+                       'build_method', 'padded']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -5428,6 +10278,7 @@ class SuffixArrayIndex(Indexing):
     self.block_method =  None
     self.padded =        True
     self.suffix_method = None
+    self.build_method =  'dict'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -5451,6 +10302,14 @@ class SuffixArrayIndex(Indexing):
           raise Exception
         self.suffix_method = value
 
+      elif (keyword.startswith('build_m')):
+        auxiliary.check_is_string('build_method', value)
+        if (value not in ['dict', 'array']):
+          logging.exception('Illegal value for "build_method": %s ' % \
+                            (value) + ' (has to be either "dict" or "array")')
+          raise Exception
+        self.build_method = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -5473,6 +10332,7 @@ class SuffixArrayIndex(Indexing):
 
     self.log([('Blocking method', self.block_method),
               ('Suffix method', self.suffix_method),
+              ('Build method', self.build_method),
               ('Padded flag', self.padded)])
 
     self.START_CHAR = chr(1)
@@ -5483,8 +10343,13 @@ class SuffixArrayIndex(Indexing):
   def build(self):
     """Method to build an index data structure.
 
-       Read the data set(s) from file(s) and insert into suffix arrays (one per
-       index defintion), then remove unneeded suffix array entries.
+       Read the data set(s) from file(s) into a basic inverted index, then
+       insert the suffix strings of all index values into suffix arrays (one
+       per index defintion), and remove unneeded suffix array entries.
+
+       With the 'array' build method the suffix array blocks are extracted
+       from a suffix array built over all index values instead (see
+       __suffix_array_into_index__()).
     """
 
     logging.info('')
@@ -5492,19 +10357,13 @@ class SuffixArrayIndex(Indexing):
 
     start_time = time.time()
 
-    num_indices = len(self.index_def)
-
-    # Index data structure for blocks is one dictionary per index - - - - - - -
-    # (a suffix array, with suffix strings as keys and record
-    # identifiers as lists)
+    # First build the basic (blocking) inverted index
     #
-    for i in range(num_indices):
-      self.index1[i] = {}  # Index for data set 1
-      self.index2[i] = {}  # Index for data set 2
+    self.__records_into_inv_index__()  # Read records and put into index
 
-    get_index_values_funct = self.__get_index_values__  # Shorthands
-    skip_missing =           self.skip_missing
-    start_char =             self.START_CHAR
+    num_indices = len(self.index_def)
+
+    start_char =             self.START_CHAR  # Shorthands
     end_char =               self.END_CHAR
     padded =                 self.padded
     min_suffix_len =         self.block_method[0]
@@ -5519,129 +10378,97 @@ class SuffixArrayIndex(Indexing):
 
     max_suff_str_len = [0]*num_indices  # Record longest suffix strings
 
-    # A list of data structures needed for the build process:
-    # - the index data structure (dictionary)
-    # - the record cache
-    # - the data set to be read
-    # - the comparison fields which are used
-    # - a list index (0 for data set 1, 1 for data set 2)
-    #
-    build_list = [(self.index1, self.rec_cache1, self.dataset1,
-                   self.comp_field_used1, 0)] # For data set 1
+    index_list = [self.index1]  # The indices to be converted
 
     if (self.do_deduplication == False):  # If linkage append data set 2
-      build_list.append((self.index2, self.rec_cache2, self.dataset2,
-                   self.comp_field_used2, 1))
-
-    # Reading loop over all records in one or both data set(s) - - - - - - - -
-    #
-    for (index,rec_cache,dataset,comp_field_used_list,ds_index) in build_list:
-
-      # Calculate a counter for the progress report
-      #
-      if (self.progress_report != None):
-        progress_report_cnt = max(1, int(dataset.num_records / \
-                                     (100.0 / self.progress_report)))
-      else:  # So no progress report is being logged
-        progress_report_cnt = dataset.num_records + 1
-
-      istart_time = time.time()
-
-      rec_read = 0  # Number of records read from data set
-
-      for (rec_ident, rec) in dataset.readall(): # Read all records in data set
+      index_list.append(self.index2)
 
-        # Extract record fields needed for comparisons (set all others to '')
-        #
-        comp_rec = []
+    # Convert the basic inverted indices into suffix arrays (with suffix
+    # strings as keys and record identifiers as lists) - - - - - - - - - - - -
+    #
+    if (self.build_method == 'array'):
+      index_list = []  # Indices are converted using suffix arrays
 
-        field_ind = 0
-        for field in rec:
-          if (field_ind in comp_field_used_list):
-            comp_rec.append(field.lower())
-          else:
-            comp_rec.append('')
-          field_ind += 1
+      if (padded == True):
+        pad_str_pair = (start_char, end_char)
+      else:
+        pad_str_pair = ('', '')
 
-        rec_cache[rec_ident] = comp_rec  # Put into record cache
+      self.suffix_array_data = {}
 
-        # Now get the index variable values for this record - - - - - - - - - -
-        #
-        rec_index_val_list = get_index_values_funct(rec, ds_index)
+      for i in range(num_indices):
+        (self.suffix_array_data[i], max_suff_str_len[i]) = \
+               self.__suffix_array_into_index__(i, pad_str_pair, min_suffix_len,
+                                                max_block_size,
+                                                self.suffix_method)
 
-        for i in range(num_indices):  # Put record identifier into all indices
+    for index in index_list:
 
-          this_index = index[i]  # Shorthand
+      for i in range(num_indices):
 
-          index_val = rec_index_val_list[i]
+        basic_index = index[i]  # Shorthand
+        this_index =  {}        # The suffix array
 
-          if ((index_val != '') or (skip_missing == False)):
+        for (index_val, block_rec_list) in basic_index.iteritems():
 
-            if (padded == True):  # Add start and end characters
-              index_val = '%s%s%s' % (start_char, index_val, end_char)
+          if (padded == True):  # Add start and end characters
+            index_val = '%s%s%s' % (start_char, index_val, end_char)
 
-            index_val_len = len(index_val)
+          index_val_len = len(index_val)
 
-            max_suff_str_len[i] = max(max_suff_str_len[i], index_val_len)
+          max_suff_str_len[i] = max(max_suff_str_len[i], index_val_len)
 
-            # Create all suffix strings (up to minimum length) and insert them
-            # into the index
+          # Create all suffix strings (up to minimum length) and insert them
+          # into the index
 
-            # A set of all suffix string values for this index value
-            #
-            this_suffix_str_set = set()
-            this_suffix_str_set.add(index_val)  # Even if shorter than min_len
+          # A set of all suffix string values for this index value
+          #
+          this_suffix_str_set = set()
+          this_suffix_str_set.add(index_val)  # Even if shorter than min_len
 
-            if (do_all_suffix_str == True):  # Create all sub-string
+          if (do_all_suffix_str == True):  # Create all sub-string
 
-              # According to Akiko Aizawa (e-mail 8/03/2007) not only suffix
-              # strings are generated in their approach, but all sub-strings
-              # down to length min_suffix_len
+            # According to Akiko Aizawa (e-mail 8/03/2007) not only suffix
+            # strings are generated in their approach, but all sub-strings
+            # down to length min_suffix_len
 
-              # Outer loop over all sub-string length
+            # Outer loop over all sub-string length
+            #
+            #for s1 in range(index_val_len-1, min_suffix_len-1, -1):
+            for s1 in range(min_suffix_len, index_val_len+1):
+              # Inner loop over all possible sub-strings with this length
               #
-              #for s1 in range(index_val_len-1, min_suffix_len-1, -1):
-              for s1 in range(min_suffix_len, index_val_len+1):
-                # Inner loop over all possible sub-strings with this length
-                #
-                for s2 in range(index_val_len-s1+1):
-                  this_suffix_str = index_val[s2:s2+s1]
-                  this_suffix_str_set.add(this_suffix_str)
-            else:  # Only create the true suffixes of the index value string
-
-              for s in range(index_val_len-min_suffix_len+1):
-                this_suffix_str = index_val[s:]
+              for s2 in range(index_val_len-s1+1):
+                this_suffix_str = index_val[s2:s2+s1]
                 this_suffix_str_set.add(this_suffix_str)
+          else:  # Only create the true suffixes of the index value string
 
-            # Now insert all suffix strings into index
-            #
-            for this_suffix_str in this_suffix_str_set:
+            for s in range(index_val_len-min_suffix_len+1):
+              this_suffix_str = index_val[s:]
+              this_suffix_str_set.add(this_suffix_str)
 
-              suffix_str_rec_list = this_index.get(this_suffix_str, [])
+          # Now insert the records with this index value for all suffix strings
+          #
+          for this_suffix_str in this_suffix_str_set:
 
-              if (suffix_str_rec_list != -1):  # Not too many records yet
+            suffix_str_rec_list = this_index.get(this_suffix_str, [])
 
-                # Check if max_block records had this string value before
-                #
-                if (len(suffix_str_rec_list) < max_block_size):
-                  suffix_str_rec_list.append(rec_ident)
-                  this_index[this_suffix_str] = suffix_str_rec_list
-                else:  # Too many records have this value
-                  this_index[this_suffix_str] = -1 # Mark as being too frequent
+            if (suffix_str_rec_list != -1):  # Not too many records yet
 
-            del this_suffix_str_set
+              # Check if no more than max_block records have this string value
+              #
+              if ((len(suffix_str_rec_list) + len(block_rec_list)) <= \
+                  max_block_size):
+                suffix_str_rec_list.extend(block_rec_list)
+                this_index[this_suffix_str] = suffix_str_rec_list
+              else:  # Too many records have this value
+                this_index[this_suffix_str] = -1 # Mark as being too frequent
 
-        rec_read += 1
+          del this_suffix_str_set
 
-        if ((rec_read % progress_report_cnt) == 0):
-          self.__log_build_progress__(rec_read,dataset.num_records,start_time)
+        index[i] = this_index
 
-      used_sec_str = auxiliary.time_string(time.time()-istart_time)
-      rec_time_str = auxiliary.time_string((time.time()-istart_time) / \
-                                           dataset.num_records)
-      logging.info('Read and indexed %d records in %s (%s per record)' % \
-                   (dataset.num_records, used_sec_str, rec_time_str))
-      logging.info('')
+        del basic_index
 
     # Now remove unneeded entries in suffix array strings - - - - - - - - - - -
     #
@@ -5805,7 +10632,6 @@ class SuffixArrayIndex(Indexing):
       else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
         this_str_list1 = self.suffix_array_strings1[i]  # Shorthands
-        this_str_list2 = self.suffix_array_strings2[i]
         this_index1 =    self.index1[i]
         this_index2 =    self.index2[i]
 
@@ -5824,7 +10650,7 @@ class SuffixArrayIndex(Indexing):
           curr_str_val_records1 = this_index1[s] # Suffix array from data set 1
           curr_block_size1 =      len(curr_str_val_records1)
 
-          if s in this_str_list2:  # String is in both suffix arrays
+          if (s in this_index2):  # String is in both suffix arrays
 
             curr_str_val_records2 = this_index2[s]  # From data set 2
             curr_block_size2 =      len(curr_str_val_records2)
@@ -5855,6 +10681,9 @@ class SuffixArrayIndex(Indexing):
       self.index1[i].clear()  # Not needed anymore
       self.index2[i].clear()
 
+      if (self.build_method == 'array'):
+        self.suffix_array_data[i] = None
+
       logging.info('    Explicitly run garbage collection')
       gc.collect()
 
@@ -5864,10 +10693,8 @@ class SuffixArrayIndex(Indexing):
 
     self.rec_pair_dict = rec_pair_dict
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
-
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
 
     logging.info('Compacted suffix array index in %s' % \
                  (auxiliary.time_string(time.time()-start_time)))
@@ -5877,7 +10704,8 @@ class SuffixArrayIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
        Compare the record pairs as produced by the suffix array indexing
@@ -5903,7 +10731,7 @@ class SuffixArrayIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+                                                cut_off_threshold, num_workers)
 
 
 # =============================================================================
@@ -5940,8 +10768,18 @@ class RobustSuffixArrayIndex(Indexing):
                       stringcmp module).
        str_cmp_thres  The threshold for the string comparison function, must
                       be in (0..1).
+       build_method   The way the suffix array is built, either 'dict' (default)
+                      or 'array' (see SuffixArrayIndex for details). With
+                      'array', similar suffixes are merged by a scan over the
+                      runs of equal suffixes in the suffix array, and suffix
+                      strings are only created when they are compared.
   """
 
+  INDEX_SAVE_STATUS_LIST = ['compacted']  # See Indexing.save()
+  INDEX_PARAM_NAMES = ['block_method', 'str_cmp_funct',
+                       'str_cmp_thres', 'build_method',
+                       'padded']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -5956,6 +10794,7 @@ class RobustSuffixArrayIndex(Indexing):
     self.padded =        True
     self.str_cmp_funct = None
     self.str_cmp_thres = None
+    self.build_method =  'dict'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -5978,11 +10817,22 @@ class RobustSuffixArrayIndex(Indexing):
         auxiliary.check_is_normalised('str_cmp_thres', value)
         self.str_cmp_thres = value
 
+      elif (keyword.startswith('build_m')):
+        auxiliary.check_is_string('build_method', value)
+        if (value not in ['dict', 'array']):
+          logging.exception('Illegal value for "build_method": %s ' % \
+                            (value) + ' (has to be either "dict" or "array")')
+          raise Exception
+        self.build_method = value
+
       else:
         base_kwargs[keyword] = value
 
     Indexing.__init__(self, base_kwargs)  # Initialise base class
 
+    if (self.build_method == 'dict'):  # Records not read into inverted index
+      self.__check_inv_index_settings__()
+
     # Check if block method and parameters given are OK - - - - - - - - - - - -
     #
     auxiliary.check_is_not_none('block_method', self.block_method)
@@ -6000,6 +10850,7 @@ class RobustSuffixArrayIndex(Indexing):
     self.log([('Blocking method',             self.block_method),
               ('String comparison function',  self.str_cmp_funct),
               ('String comparison threshold', self.str_cmp_thres),
+              ('Build method',                self.build_method),
               ('Padded flag',                 self.padded)])
 
     self.START_CHAR = chr(1)
@@ -6010,7 +10861,8 @@ class RobustSuffixArrayIndex(Indexing):
   def build(self):
     """Method to build an index data structure.
 
-       This is the same as the build method for the SuffixArrayIndex.
+       This is the same as the build method for the SuffixArrayIndex (with
+       'suffixonly' suffixes).
     """
 
     logging.info('')
@@ -6052,6 +10904,26 @@ class RobustSuffixArrayIndex(Indexing):
       build_list.append((self.index2, self.rec_cache2, self.dataset2,
                    self.comp_field_used2, 1))
 
+    # With the 'array' build method read records into a basic inverted index,
+    # then convert it using suffix arrays
+    #
+    if (self.build_method == 'array'):
+      build_list = []
+
+      self.__records_into_inv_index__()
+
+      if (padded == True):
+        pad_str_pair = (start_char, end_char)
+      else:
+        pad_str_pair = ('', '')
+
+      self.suffix_array_data = {}
+
+      for i in range(num_indices):
+        (self.suffix_array_data[i], max_suff_str_len[i]) = \
+               self.__suffix_array_into_index__(i, pad_str_pair, min_suffix_len,
+                                                max_block_size, 'suffixonly')
+
     # Reading loop over all records in one or both data set(s) - - - - - - - -
     #
     for (index,rec_cache,dataset,comp_field_used_list,ds_index) in build_list:
@@ -6145,6 +11017,7 @@ class RobustSuffixArrayIndex(Indexing):
                                            dataset.num_records)
       logging.info('Read and indexed %d records in %s (%s per record)' % \
                    (dataset.num_records, used_sec_str, rec_time_str))
+      self.__log_index_val_cache_stats__()
       logging.info('')
 
     # Now remove unneeded entries in suffix array strings - - - - - - - - - - -
@@ -6265,6 +11138,7 @@ class RobustSuffixArrayIndex(Indexing):
     max_block_size = self.block_method[1]
     str_cmp_funct =  self.str_cmp_funct
     str_cmp_thres =  self.str_cmp_thres
+    build_method =   self.build_method
 
     num_indices = len(self.index_def)
 
@@ -6279,6 +11153,16 @@ class RobustSuffixArrayIndex(Indexing):
       num_strings_done = 0
       largest_block =    0
 
+      # With the 'array' build method the suffix array index keys are ranges
+      # in the suffix array, so get their strings only for comparisons
+      #
+      if (build_method == 'array'):
+        suffix_array_data = self.suffix_array_data[i]
+        get_str_funct = lambda suffix_range: \
+                          self.__get_suffix_str__(suffix_array_data, suffix_range)
+      else:
+        get_str_funct = lambda suffix_str: suffix_str
+
       if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
 
         this_str_list = self.suffix_array_strings1[i]  # Shorthands
@@ -6296,11 +11180,14 @@ class RobustSuffixArrayIndex(Indexing):
         j = 0
         while (j < (this_str_list_len-1)):
           this_str = this_str_list[j]  # Get current string
+          this_str_val = get_str_funct(this_str)
           k = j+1  # Compare with following strings until string similarity
                    # is below given threshold
 
           while ((k < this_str_list_len) and \
-                 (str_cmp_funct(this_str, this_str_list[k]) >= str_cmp_thres)):
+                 (str_cmp_funct(this_str_val,
+                                get_str_funct(this_str_list[k])) >= \
+                  str_cmp_thres)):
             k += 1
 
           if ((j+1) == k):  # Case 1: No merger, simply copy into merged index
@@ -6308,7 +11195,10 @@ class RobustSuffixArrayIndex(Indexing):
             merged_str_list.append(this_str)
 
           else:  # Merge strings
-            merged_str = this_str+'-'+this_str_list[k-1]  # New merged string
+            if (build_method == 'array'):  # Range covering all merged ranges
+              merged_str = (this_str[0], this_str_list[k-1][1])
+            else:
+              merged_str = this_str+'-'+this_str_list[k-1]  # New merged string
                                               # (first and last string value)
             merged_rec_set = set(this_index[this_str])
 
@@ -6377,12 +11267,15 @@ class RobustSuffixArrayIndex(Indexing):
         j = 0
         while (j < (comb_str_list_len-1)):
           this_str = comb_str_list[j]  # Get current string
+          this_str_val = get_str_funct(this_str)
 
           k = j+1  # Compare with following strings until string similarity
                    # is below given threshold
 
           while ((k < comb_str_list_len) and \
-                 (str_cmp_funct(this_str, comb_str_list[k]) >= str_cmp_thres)):
+                 (str_cmp_funct(this_str_val,
+                                get_str_funct(comb_str_list[k])) >= \
+                  str_cmp_thres)):
             k += 1
 
           if ((j+1) == k):  # Case 1: No merger, simply copy into merged index
@@ -6397,7 +11290,10 @@ class RobustSuffixArrayIndex(Indexing):
               merged_str_list.append(this_str)
 
           else:  # Merge strings
-            merged_str = this_str+'-'+comb_str_list[k-1]  # New merged string
+            if (build_method == 'array'):  # Range covering all merged ranges
+              merged_str = (this_str[0], comb_str_list[k-1][1])
+            else:
+              merged_str = this_str+'-'+comb_str_list[k-1]  # New merged string
                                               # (first and last string value)
             merged_rec_set1 = set(this_index1.get(this_str, []))
             merged_rec_set2 = set(this_index2.get(this_str, []))
@@ -6463,6 +11359,9 @@ class RobustSuffixArrayIndex(Indexing):
       self.index1[i].clear()  # Not needed anymore
       self.index2[i].clear()
 
+      if (build_method == 'array'):
+        self.suffix_array_data[i] = None
+
       logging.info('    Explicitly run garbage collection')
       gc.collect()
 
@@ -6472,10 +11371,8 @@ class RobustSuffixArrayIndex(Indexing):
 
     self.rec_pair_dict = rec_pair_dict
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
-
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+    self.__pack_rec_pairs__()
+    self.num_rec_pairs = self.__count_rec_pairs__()  # Count all record pairs
 
     logging.info('Compacted suffix array index in %s' % \
                  (auxiliary.time_string(time.time()-start_time)))
@@ -6485,7 +11382,8 @@ class RobustSuffixArrayIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
        Compare the record pairs as produced by the suffix array indexing
@@ -6511,7 +11409,7 @@ class RobustSuffixArrayIndex(Indexing):
     # Compare the records
     #
     return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+                                                cut_off_threshold, num_workers)
 
 
 # =============================================================================
@@ -6526,17 +11424,40 @@ class BigMatchIndex(Indexing):
      Records that have the same index variable values for an index are put into
      the same blocks, and only records within a block are then compared.
 
+     The large data set is read and processed in chunks of records (optionally
+     by several worker processes, see run()). If a weight vector file or sink
+     is set, the weight vectors of each chunk are passed on once the chunk has
+     been processed, so neither the records of the large data set nor the
+     weight vectors are kept in memory.
+
      The additional argument (besides the base class arguments) which has to be
      set when this index is initialised is:
 
-       block_method  Determines the blocking method used. It can be set to:
-                       ('block'),
-                       ('sort',window_size), or
-                       ('qgram',q,padded,threshold)
-                     with parameters similar to the corresponding indexing
-                     methods.
+       block_method     Determines the blocking method used. It can be set to:
+                          ('block'),
+                          ('sort',window_size), or
+                          ('qgram',q,padded,threshold)
+                        with parameters similar to the corresponding indexing
+                        methods.
+
+     The following arguments can also be set:
+
+       chunk_size       The number of records read from the large data set and
+                        processed together. Default value is 10000.
+       weight_vec_sink  Either a function or method, which is called with a
+                        list of tuples (rec_ident1, rec_ident2, weight_vector)
+                        for each chunk, or a queue (an object with a put()
+                        method, like Queue.Queue), into which these lists are
+                        put (followed by None once all chunks have been
+                        processed). Cannot be set together with the
+                        'weight_vec_file' argument. Default value is None, in
+                        which case the weight vectors are written into the
+                        weight vector file (if one is set) or returned in a
+                        dictionary.
   """
 
+  INDEX_PARAM_NAMES = ['block_method', 'chunk_size']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -6547,7 +11468,9 @@ class BigMatchIndex(Indexing):
        (so it is left at value None).
     """
 
-    self.block_method = None
+    self.block_method =    None
+    self.chunk_size =      10000
+    self.weight_vec_sink = None
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -6558,16 +11481,32 @@ class BigMatchIndex(Indexing):
         auxiliary.check_is_tuple('block_method', value)
         self.block_method = value
 
+      elif (keyword.startswith('chunk_s')):
+        auxiliary.check_is_integer('chunk_size', value)
+        auxiliary.check_is_positive('chunk_size', value)
+        self.chunk_size = value
+
+      elif (keyword.startswith('weight_vec_s')):
+        if ((value != None) and (not hasattr(value, 'put'))):
+          auxiliary.check_is_function_or_method('weight_vec_sink', value)
+        self.weight_vec_sink = value
+
       else:
         base_kwargs[keyword] = value
 
     Indexing.__init__(self, base_kwargs)  # Initialise base class
+    self.__check_inv_index_settings__()
 
     if (self.do_deduplication == True):
       logging.exception('BigMatchIndex can only be used for linkages, but ' + \
                         'not deduplications')
       raise Exception
 
+    if ((self.weight_vec_sink != None) and (self.weight_vec_file != None)):
+      logging.exception('Only one of "weight_vec_sink" and ' + \
+                        '"weight_vec_file" can be set')
+      raise Exception
+
     # Check if block method and parameters given are OK - - - - - - - - - - - -
     #
     auxiliary.check_is_not_none('block_method', self.block_method)
@@ -6624,9 +11563,11 @@ class BigMatchIndex(Indexing):
       self.small_comp_field = self.comp_field_used2
       self.large_comp_field = self.comp_field_used1
 
-    self.log([('Small data set', self.small_dataset.description),
-              ('Large data set',  self.large_dataset.description),
-              ('Blocking method', self.block_method)])
+    self.log([('Small data set',     self.small_dataset.description),
+              ('Large data set',     self.large_dataset.description),
+              ('Blocking method',    self.block_method),
+              ('Chunk size',         self.chunk_size),
+              ('Weight vector sink', self.weight_vec_sink)])
 
     self.QGRAM_START_CHAR = chr(1)
     self.QGRAM_END_CHAR =   chr(2)
@@ -6816,6 +11757,7 @@ class BigMatchIndex(Indexing):
                                            self.small_dataset.num_records)
     logging.info('Read and indexed %d records in %s (%s per record)' % \
                  (self.small_dataset.num_records, used_sec_str, rec_time_str))
+    self.__log_index_val_cache_stats__()
     logging.info('')
 
     logging.info('Built BigMatch index containing %d blocks in %s' % \
@@ -6845,15 +11787,25 @@ class BigMatchIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          num_workers = None):
     """Iterate over all blocks in the index.
 
-       Read the large data set and compare each record with the corresponding
-       records from the small data sets as stored in the index.
-
-       Compare the record pairs and return a weight vector dictionary with keys
-       made of a tuple (record identifier 1, record identifier 2), and
-       corresponding values the comparison weights.
+       Read the large data set in chunks of records and compare each record
+       with the corresponding records from the small data sets as stored in
+       the index.
+
+       Compare the record pairs, and pass the weight vectors of each chunk to
+       the weight vector file or sink (if one is set). In this case the
+       records and weight vectors of a chunk are discarded once it has been
+       processed, so memory use does not depend upon the size of the large
+       data set, and None is returned. Otherwise return a weight vector
+       dictionary with keys made of a tuple (record identifier 1, record
+       identifier 2), and corresponding values the comparison weights.
+
+       If 'num_workers' is set to a positive integer larger than 1, the chunks
+       are processed by this number of worker processes (see
+       __compare_large_rec_chunks_parallel__()).
     """
 
     logging.info('')
@@ -6869,6 +11821,10 @@ class BigMatchIndex(Indexing):
                         (self.description)+'comparisons not possible')
       raise Exception
 
+    if (num_workers != None):
+      auxiliary.check_is_integer('Number of workers', num_workers)
+      auxiliary.check_is_positive('Number of workers', num_workers)
+
     # Check if weight vector file should be written - - - - - - - - - - - - - -
     #
     if (self.weight_vec_file != None):
@@ -6886,9 +11842,10 @@ class BigMatchIndex(Indexing):
                                 self.__get_field_names_list__()
       weight_vec_writer.writerow(weight_vec_header_line)
 
-    start_time = time.time()
+    else:
+      weight_vec_writer = None
 
-    num_indices = len(self.index_def)
+    start_time = time.time()
 
     # Check length filter and cut-off threshold arguments - - - - - - - - - - -
     #
@@ -6902,6 +11859,176 @@ class BigMatchIndex(Indexing):
       auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
       logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
 
+    weight_vec_dict = {}  # Dictionary with calculated weight vectors (only
+                          # used if there is no weight vector file or sink)
+
+    chunk_iter = self.__get_large_rec_chunks__()
+
+    if ((num_workers != None) and (num_workers > 1)):  # Parallel comparison
+
+      [comp_done, num_rec_pairs_filtered, num_rec_pairs_below_thres] = \
+               self.__compare_large_rec_chunks_parallel__(num_workers,
+                                                          length_filter_perc,
+                                                          cut_off_threshold,
+                                                          weight_vec_dict,
+                                                          weight_vec_writer,
+                                                          start_time,
+                                                          chunk_iter)
+    else:
+
+      rec_read =                  0  # Number of records read from large set
+      comp_done =                 0  # Number of comparisons done
+      num_rec_pairs_filtered =    0  # Count number of removed record pairs
+      num_rec_pairs_below_thres = 0
+
+      for large_rec_chunk in chunk_iter:
+
+        (w_vec_list, num_comp, num_filtered, num_below_thres) = \
+                   self.__compare_large_rec_chunk__(large_rec_chunk,
+                                                    length_filter_perc,
+                                                    cut_off_threshold)
+
+        self.__emit_weight_vectors__(w_vec_list, weight_vec_dict,
+                                     weight_vec_writer)
+
+        comp_done +=                 num_comp
+        num_rec_pairs_filtered +=    num_filtered
+        num_rec_pairs_below_thres += num_below_thres
+
+        rec_read += len(large_rec_chunk)
+        self.__log_large_rec_progress__(rec_read, len(large_rec_chunk),
+                                        comp_done, start_time)
+
+    if (hasattr(self.weight_vec_sink, 'put')):
+      self.weight_vec_sink.put(None)  # Mark the end of the weight vectors
+
+    self.num_rec_pairs = comp_done
+
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    rec_read_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                              self.large_dataset.num_records)
+    if (comp_done > 0):
+      rec_comp_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                                comp_done)
+    else:
+      rec_comp_time_str = 0
+    logging.info('Read %d records in %s (%s per record)' % \
+                 (self.large_dataset.num_records, used_sec_str,
+                  rec_read_time_str))
+    logging.info('  Compared %d record pairs in %s (%s per pair)' % \
+                 (comp_done, used_sec_str, rec_comp_time_str))
+    if (length_filter_perc != None):
+      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
+                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
+    if (cut_off_threshold != None):
+      logging.info('  %d record pairs had summed weights below threshold ' % \
+                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.rec_comparator.flush_cache()  # Commit weights added to cache files
+
+    if (self.weight_vec_file != None):
+      weight_vec_fp.close()
+      return None
+    elif (self.weight_vec_sink != None):
+      return None
+    else:
+      return [self.__get_field_names_list__(), weight_vec_dict]
+
+  # ---------------------------------------------------------------------------
+
+  def __get_large_rec_chunks__(self):
+    """A generator that reads the large data set and yields lists of tuples
+       (rec_ident, rec) with 'chunk_size' records each (the last chunk can be
+       smaller).
+    """
+
+    chunk_size = self.chunk_size  # Shorthand
+
+    large_rec_chunk = []
+
+    for (large_rec_ident, large_rec) in self.large_dataset.readall():
+      large_rec_chunk.append((large_rec_ident, large_rec))
+
+      if (len(large_rec_chunk) == chunk_size):
+        yield large_rec_chunk
+        large_rec_chunk = []
+
+    if (large_rec_chunk != []):
+      yield large_rec_chunk
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __emit_weight_vectors__(self, w_vec_list, weight_vec_dict,
+                              weight_vec_writer):
+    """Pass the given list of tuples (rec_ident1, rec_ident2, weight_vector)
+       to the weight vector file (if the given writer is not None), the weight
+       vector sink (if one is set), or put them into the given weight vector
+       dictionary.
+    """
+
+    weight_vec_sink = self.weight_vec_sink  # Shorthand
+
+    if (weight_vec_writer != None):
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+
+    elif (weight_vec_sink == None):
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+
+    elif (hasattr(weight_vec_sink, 'put')):  # A queue
+      weight_vec_sink.put(w_vec_list)
+
+    else:  # A function or method
+      weight_vec_sink(w_vec_list)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __log_large_rec_progress__(self, rec_read, chunk_len, comp_done,
+                                 start_time):
+    """Log the progress of reading the large data set if another report count
+       of records has been read with the last chunk (which contained
+       'chunk_len' records).
+    """
+
+    num_records = self.large_dataset.num_records
+
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(num_records / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = num_records + 1
+
+    if ((rec_read / progress_report_cnt) > \
+        ((rec_read-chunk_len) / progress_report_cnt)):
+      self.__log_build_progress__(rec_read, num_records, start_time)
+      logging.info('    Number of comparisons done so far: %d (%.1f in ' % \
+                   (comp_done, float(comp_done)/rec_read)+'average per ' + \
+                   'record from the large data set)')
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __compare_large_rec_chunk__(self, large_rec_chunk, length_filter_perc,
+                                  cut_off_threshold):
+    """Compare each record in the given chunk (a list of tuples (rec_ident,
+       rec)) from the large data set with the corresponding records from the
+       small data set as stored in the index.
+
+       The argument 'length_filter_perc' has to be normalised (between 0.0 and
+       1.0) or None.
+
+       Returns a list of tuples (rec_ident1, rec_ident2, weight_vector) for all
+       record pairs that were compared and not removed by the cut-off
+       threshold, the number of record pairs processed, and the number of
+       record pairs removed by length filtering and by the cut-off threshold.
+    """
+
+    num_indices = len(self.index_def)
+
     num_rec_pairs_filtered =    0  # Count number of removed record pairs
     num_rec_pairs_below_thres = 0
 
@@ -6948,26 +12075,17 @@ class BigMatchIndex(Indexing):
     small_rec_cache =        self.small_rec_cache
     small_data_set_no =      self.small_data_set_no
 
-    # Calculate a counter for the progress report
-    #
-    if (self.progress_report != None):
-      progress_report_cnt = max(1, int(self.large_dataset.num_records / \
-                                   (100.0 / self.progress_report)))
-    else:  # So no progress report is being logged
-      progress_report_cnt = self.large_dataset.num_records + 1
-
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+    w_vec_list = []  # Weight vectors calculated for this chunk
 
-    rec_read =  0  # Number of records read from the large data set
     comp_done = 0  # Number of comparisons done
 
     # Set of all records from the small data set in a block
     #
     small_block_rec_set = set()
 
-    # Reading loop over all records in the large data set - - - - - - - - - - -
+    # Loop over all records in the chunk from the large data set - - - - - - -
     #
-    for (large_rec_ident, large_rec) in self.large_dataset.readall():
+    for (large_rec_ident, large_rec) in large_rec_chunk:
 
       if (length_filter_perc != None):  # Get length of record in characters
                                         # (only for fields used in matching)
@@ -7096,11 +12214,8 @@ class BigMatchIndex(Indexing):
 
                   if (cut_off_threshold == None) or \
                      (sum(w_vec) >= cut_off_threshold):
-                    if (self.weight_vec_file == None):
-                      weight_vec_dict[(small_rec_ident,large_rec_ident)]= w_vec
-                    else:
-                      weight_vec_writer.writerow([small_rec_ident,
-                                                  large_rec_ident]+w_vec)
+                    w_vec_list.append((small_rec_ident, large_rec_ident,
+                                       w_vec))
                   else:
                     num_rec_pairs_below_thres += 1
 
@@ -7109,11 +12224,8 @@ class BigMatchIndex(Indexing):
 
                   if (cut_off_threshold == None) or \
                      (sum(w_vec) >= cut_off_threshold):
-                    if (self.weight_vec_file == None):
-                      weight_vec_dict[(large_rec_ident,small_rec_ident)]= w_vec
-                    else:
-                      weight_vec_writer.writerow([large_rec_ident,
-                                                  small_rec_ident]+w_vec)
+                    w_vec_list.append((large_rec_ident, small_rec_ident,
+                                       w_vec))
                   else:
                     num_rec_pairs_below_thres += 1
 
@@ -7121,46 +12233,92 @@ class BigMatchIndex(Indexing):
 
       small_block_rec_set.clear()
 
-      rec_read += 1
+    return (w_vec_list, comp_done, num_rec_pairs_filtered,
+            num_rec_pairs_below_thres)
 
-      if ((rec_read % progress_report_cnt) == 0):
-        self.__log_build_progress__(rec_read, self.large_dataset.num_records,
-                                    start_time)
-        logging.info('    Number of comparisons done so far: %d (%.1f in ' % \
-                     (comp_done, float(comp_done)/rec_read)+'average per ' + \
-                     'record from the large data set)')
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    self.num_rec_pairs = comp_done
+  def __compare_large_rec_chunks_parallel__(self, num_workers,
+                                            length_filter_perc,
+                                            cut_off_threshold, weight_vec_dict,
+                                            weight_vec_writer, start_time,
+                                            chunk_iter):
+    """Process the chunks of records from the large data set (from the given
+       iterator) using a pool of worker processes.
+
+       The worker processes are forked when the pool is created, so they share
+       the index of the small data set and its record cache, and only the
+       chunks of records and the resulting weight vectors are sent between
+       processes (this requires a platform that supports fork(), such as Unix
+       or Linux). At most two chunks per worker process are waiting to be
+       processed at any time, and the weight vectors are passed on in the
+       order of the chunks.
+
+       Returns the number of record pairs processed, the number of record
+       pairs removed by length filtering and the number of record pairs with a
+       summed weight below the cut-off threshold.
+    """
 
-    used_sec_str = auxiliary.time_string(time.time()-start_time)
-    rec_read_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                              self.large_dataset.num_records)
-    if (comp_done > 0):
-      rec_comp_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                                comp_done)
-    else:
-      rec_comp_time_str = 0
-    logging.info('Read %d records in %s (%s per record)' % \
-                 (self.large_dataset.num_records, used_sec_str,
-                  rec_read_time_str))
-    logging.info('  Compared %d record pairs in %s (%s per pair)' % \
-                 (comp_done, used_sec_str, rec_comp_time_str))
-    if (length_filter_perc != None):
-      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
-                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
-    if (cut_off_threshold != None):
-      logging.info('  %d record pairs had summed weights below threshold ' % \
-                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
+    logging.info('  Process chunks of large data set using %d worker ' % \
+                 (num_workers) + 'processes')
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+    rec_read =                  0
+    comp_done =                 0
+    num_rec_pairs_filtered =    0
+    num_rec_pairs_below_thres = 0
 
-    if (self.weight_vec_file == None):
-      return [self.__get_field_names_list__(), weight_vec_dict]
-    else:
-      weight_vec_fp.close()
-      return None
+    pool = multiprocessing.Pool(num_workers, init_bigmatch_worker,
+                                (self, length_filter_perc, cut_off_threshold))
+
+    chunk_result_list = []  # Results from workers in the order of chunks
+
+    try:
+
+      while True:
+
+        # Keep at most two chunks per worker process waiting to be processed
+        #
+        while (len(chunk_result_list) < 2*num_workers):
+          try:
+            large_rec_chunk = chunk_iter.next()
+          except StopIteration:
+            break
+          chunk_result = pool.apply_async(compare_large_rec_chunk,
+                                          (large_rec_chunk,))
+          chunk_result_list.append((chunk_result, len(large_rec_chunk)))
+          del large_rec_chunk
+
+        if (chunk_result_list == []):
+          break  # All chunks have been processed
+
+        (chunk_result, chunk_len) = chunk_result_list.pop(0)
+
+        (w_vec_list, num_comp, num_filtered, num_below_thres) = \
+                                                             chunk_result.get()
+
+        self.__emit_weight_vectors__(w_vec_list, weight_vec_dict,
+                                     weight_vec_writer)
+        del w_vec_list
+
+        comp_done +=                 num_comp
+        num_rec_pairs_filtered +=    num_filtered
+        num_rec_pairs_below_thres += num_below_thres
+
+        rec_read += chunk_len
+        self.__log_large_rec_progress__(rec_read, chunk_len, comp_done,
+                                        start_time)
+
+      pool.close()
+
+    except:
+      pool.terminate()
+      pool.join()
+      logging.exception('Parallel processing of large data set failed')
+      raise Exception
+
+    pool.join()
+
+    return [comp_done, num_rec_pairs_filtered, num_rec_pairs_below_thres]
 
 # =============================================================================
 
@@ -7185,6 +12343,8 @@ class DedupIndex(Indexing):
                      methods.
   """
 
+  INDEX_PARAM_NAMES = ['block_method']  # See Indexing.save()
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -7210,6 +12370,7 @@ class DedupIndex(Indexing):
         base_kwargs[keyword] = value
 
     Indexing.__init__(self, base_kwargs)  # Initialise base class
+    self.__check_inv_index_settings__()
 
     if (self.do_deduplication == False):
       logging.exception('DedupIndex can only be used for deduplications, ' + \
@@ -7620,6 +12781,8 @@ class DedupIndex(Indexing):
     if (memory_usage_str != None):
       logging.info('  '+memory_usage_str)
 
+    self.rec_comparator.flush_cache()  # Commit weights added to cache files
+
     if (self.weight_vec_file == None):
       return [self.__get_field_names_list__(), weight_vec_dict]
     else:
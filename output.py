@@ -250,7 +250,8 @@ def GenerateHistogram(w_vec_dict, bin_width, file_name=None, match_sets=None):
 
 # -----------------------------------------------------------------------------
 
-def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
+def SaveMatchStatusFile(w_vec_dict, match_set, file_name,
+                        rec_ident_lists=None):
   """Save the matched record identifiers into a CVS file.
 
      This function saves the record identifiers of all record pairs that are in
@@ -260,13 +261,19 @@ def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
      - Summed matching weight from the corresponding weight vector
      - A unique match identifier (generated in the same way as the ones in the
        function SaveMatchDataSet below).
+
+     If the index used interned record identifiers (record numbers), then the
+     lists returned by the index method get_rec_ident_lists() have to be given
+     as 'rec_ident_lists', so the original record identifiers are written.
   """
 
   auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
   auxiliary.check_is_set('match_set', match_set)
   auxiliary.check_is_string('file_name', file_name)
 
-  match_rec_id_list = list(match_set)  # Make a list so it can be sorted
+  # Make a list with original record identifiers so it can be sorted
+  #
+  match_rec_id_list = __get_match_rec_id_list__(match_set, rec_ident_lists)
   match_rec_id_list.sort()
 
   if (len(match_set) > 0):
@@ -283,8 +290,8 @@ def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
     logging.exception('Cannot open file "%s" for writing' % (str(file_name)))
     raise IOError
 
-  for rec_id_tuple in match_rec_id_list:
-    w_vec = w_vec_dict[rec_id_tuple]
+  for (rec_id_tuple, w_vec_key) in match_rec_id_list:
+    w_vec = w_vec_dict[w_vec_key]
     w_sum = sum(w_vec)
 
     mid_count_str = '%s' % (mid_count)
@@ -301,8 +308,35 @@ def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
 
 # -----------------------------------------------------------------------------
 
+def __get_match_rec_id_list__(match_set, rec_ident_lists):
+  """Return a list with tuples (rec_id_tuple, match_tuple) for all record
+     pairs (match_tuple) in the given match set, with rec_id_tuple containing
+     the original record identifiers of the pair. If rec_ident_lists is not
+     None, the pairs in the match set are assumed to contain record numbers
+     which are translated into record identifiers using these two lists.
+  """
+
+  if (rec_ident_lists == None):
+    return [(rec_id_tuple, rec_id_tuple) for rec_id_tuple in match_set]
+
+  auxiliary.check_is_tuple('rec_ident_lists', rec_ident_lists)
+
+  rec_ident_list1, rec_ident_list2 = rec_ident_lists
+
+  match_rec_id_list = []
+
+  for rec_num_tuple in match_set:
+    rec_id_tuple = (rec_ident_list1[rec_num_tuple[0]],
+                    rec_ident_list2[rec_num_tuple[1]])
+    match_rec_id_list.append((rec_id_tuple, rec_num_tuple))
+
+  return match_rec_id_list
+
+# -----------------------------------------------------------------------------
+
 def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
-                     dataset2=None, id_field2=None, new_dataset_name2=None):
+                     dataset2=None, id_field2=None, new_dataset_name2=None,
+                     rec_ident_lists=None):
   """Save the original data set(s) with an additional field (attribute) that
      contains match identifiers.
 
@@ -326,6 +360,11 @@ def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
 
      For a deduplication, it is assumed that the second data set is set to
      None.
+
+     If the index used interned record identifiers (record numbers), then the
+     lists returned by the index method get_rec_ident_lists() have to be given
+     as 'rec_ident_lists', so the record pairs in the match set can be
+     translated back into record identifiers.
   """
 
   auxiliary.check_is_set('match_set', match_set)
@@ -341,7 +380,9 @@ def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
   else:
     do_link = False
 
-  match_rec_id_list = list(match_set)  # Make a list so it can be sorted
+  # Make a list with original record identifiers so it can be sorted
+  #
+  match_rec_id_list = __get_match_rec_id_list__(match_set, rec_ident_lists)
   match_rec_id_list.sort()
 
   if (len(match_set) > 0):
@@ -356,7 +397,7 @@ def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
   match_id_dict1 = {}  # For first data set
   match_id_dict2 = {}  # For second data set, not required for deduplication
 
-  for rec_id_tuple in match_rec_id_list:
+  for (rec_id_tuple, match_tuple) in match_rec_id_list:
     rec_id1, rec_id2 = rec_id_tuple
 
     mid_count_str = '%s' % (mid_count)
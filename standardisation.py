@@ -356,6 +356,8 @@ class RecordStandardiser:
 
     rec_read = 0  # Number of records read from data set
 
+    out_rec_list = []  # Standardised records not yet written
+
     # Loop over all records from input data set - - - - - - - - - - - - - - - -
     #
     for (rec_ident, in_rec) in self.in_dataset.readall():
@@ -412,9 +414,13 @@ class RecordStandardiser:
             out_rec[out_index] = out_field_list[i]
           i += 1
 
-      # Write the standardised record into the output data set
+      # Write the standardised records into the output data set in batches
       #
-      self.out_dataset.write({rec_ident:out_rec})
+      out_rec_list.append((rec_ident, out_rec))
+
+      if (len(out_rec_list) >= 10000):
+        self.out_dataset.write_many(out_rec_list)
+        out_rec_list = []
 
       rec_read += 1
 
@@ -441,6 +447,9 @@ class RecordStandardiser:
         if (memory_usage_str != None):
           logging.info('    '+memory_usage_str)
 
+    if (out_rec_list != []):  # Write the remaining standardised records
+      self.out_dataset.write_many(out_rec_list)
+
     # Finalise all component standardisers() - - - - - - - - - - - - - - - - -
     #
     for cs_details in self.comp_stand_list:
@@ -81,6 +81,15 @@ Comparison methods provided:
 
 See doc strings of individual functions for detailed documentation.
 
+If the stringcmpext module has been compiled (from stringcmpext.c, see
+INSTALL.txt), its inner loops are used by the 'editdist', 'jaro', 'winkler',
+'qgram', 'swdist', 'lcs' and 'editex' comparators (and the comparators based
+on them) for byte strings (not for unicode strings), with exactly the same
+results as the pure Python implementations, which are used otherwise. The pure
+Python 'editdist' and 'mod_editdist' comparators use a bit-parallel algorithm
+if the shorter string has at most BITPARALLEL_MAX_LEN characters, and dynamic
+programming for longer strings.
+
 If called from command line, a test routine is run which prints example
 approximate string comparisons for various string pairs.
 """
@@ -99,6 +108,15 @@ import encode  # For Phonix transformation routine (used in syllable alignment
                # distance)
 import mymath  # Contains arithmetic coder
 
+# Optional compiled inner loops of comparators (see stringcmpext.c), if not
+# available pure Python implementations are used
+#
+try:
+  import stringcmpext
+  imp_stringcmpext = True
+except:
+  imp_stringcmpext = False
+
 # =============================================================================
 # Special character used in the Jaro, Winkler and q-gram comparions functions.
 # Thanks to Luca Montecchiani (luca.mon@aliceposta.it).
@@ -107,6 +125,11 @@ JARO_MARKER_CHAR = chr(1)
 QGRAM_START_CHAR = chr(1)
 QGRAM_END_CHAR =   chr(2)
 
+# Maximum length of the shorter string for which the bit-parallel edit distance
+# algorithm is used (longer strings are compared using dynamic programming).
+#
+BITPARALLEL_MAX_LEN = 64
+
 # =============================================================================
 
 def do_stringcmp(cmp_method, str1, str2, min_threshold = None):
@@ -406,36 +429,41 @@ def jaro(str1, str2, min_threshold = None):
 
   halflen = max(len1,len2) / 2 - 1  # Or + 1?? PC 12/03/2009
 
-  ass1 = ''  # Characters assigned in str1
-  ass2 = ''  # Characters assigned in str2
+  if ((imp_stringcmpext == True) and (type(str1) == str) and \
+      (type(str2) == str)):
+    (common1, common2, ass1, ass2) = stringcmpext.jaro_assign(str1, str2,
+                                                              halflen)
+  else:
+    ass1 = ''  # Characters assigned in str1
+    ass2 = ''  # Characters assigned in str2
 
-  workstr1 = str1  # Copy of original string
-  workstr2 = str2
+    workstr1 = str1  # Copy of original string
+    workstr2 = str2
 
-  common1 = 0  # Number of common characters
-  common2 = 0
+    common1 = 0  # Number of common characters
+    common2 = 0
 
-  # Analyse the first string  - - - - - - - - - - - - - - - - - - - - - - - - -
-  #
-  for i in range(len1):
-    start = max(0,i-halflen)
-    end   = min(i+halflen+1,len2)
-    index = workstr2.find(str1[i],start,end)
-    if (index > -1):  # Found common character
-      common1 += 1
-      ass1 = ass1 + str1[i]
-      workstr2 = workstr2[:index]+JARO_MARKER_CHAR+workstr2[index+1:]
+    # Analyse the first string  - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    for i in range(len1):
+      start = max(0,i-halflen)
+      end   = min(i+halflen+1,len2)
+      index = workstr2.find(str1[i],start,end)
+      if (index > -1):  # Found common character
+        common1 += 1
+        ass1 = ass1 + str1[i]
+        workstr2 = workstr2[:index]+JARO_MARKER_CHAR+workstr2[index+1:]
 
-  # Analyse the second string - - - - - - - - - - - - - - - - - - - - - - - - -
-  #
-  for i in range(len2):
-    start = max(0,i-halflen)
-    end   = min(i+halflen+1,len1)
-    index = workstr1.find(str2[i],start,end)
-    if (index > -1):  # Found common character
-      common2 += 1
-      ass2 = ass2 + str2[i]
-      workstr1 = workstr1[:index]+JARO_MARKER_CHAR+workstr1[index+1:]
+    # Analyse the second string - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    for i in range(len2):
+      start = max(0,i-halflen)
+      end   = min(i+halflen+1,len1)
+      index = workstr1.find(str2[i],start,end)
+      if (index > -1):  # Found common character
+        common2 += 1
+        ass2 = ass2 + str2[i]
+        workstr1 = workstr1[:index]+JARO_MARKER_CHAR+workstr1[index+1:]
 
   if (common1 != common2):
     logging.error('Jaro: Wrong common values for strings "%s" and "%s"' % \
@@ -635,26 +663,32 @@ def qgram(str1, str2, q=2, common_divisor = 'average', min_threshold = None,
     qgram_str1 = str1
     qgram_str2 = str2
 
-  # Make a list of q-grams for both strings - - - - - - - - - - - - - - - - - -
-  #
-  qgram_list1 = [qgram_str1[i:i+q] for i in range(len(qgram_str1) - (q-1))]
-  qgram_list2 = [qgram_str2[i:i+q] for i in range(len(qgram_str2) - (q-1))]
-
-  # Get common q-grams  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  #
-  common = 0
+  if ((imp_stringcmpext == True) and (type(qgram_str1) == str) and \
+      (type(qgram_str2) == str)):
+    common = stringcmpext.qgram_common(qgram_str1, qgram_str2, q)
 
-  if (num_qgram1 < num_qgram2):  # Count using the shorter q-gram list
-    short_qgram_list = qgram_list1
-    long_qgram_list =  qgram_list2
   else:
-    short_qgram_list = qgram_list2
-    long_qgram_list =  qgram_list1
 
-  for q_gram in short_qgram_list:
-    if (q_gram in long_qgram_list):
-      common += 1
-      long_qgram_list.remove(q_gram)  # Remove the counted q-gram
+    # Make a list of q-grams for both strings  - - - - - - - - - - - - - - - -
+    #
+    qgram_list1 = [qgram_str1[i:i+q] for i in range(len(qgram_str1) - (q-1))]
+    qgram_list2 = [qgram_str2[i:i+q] for i in range(len(qgram_str2) - (q-1))]
+
+    # Get common q-grams - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    common = 0
+
+    if (num_qgram1 < num_qgram2):  # Count using the shorter q-gram list
+      short_qgram_list = qgram_list1
+      long_qgram_list =  qgram_list2
+    else:
+      short_qgram_list = qgram_list2
+      long_qgram_list =  qgram_list1
+
+    for q_gram in short_qgram_list:
+      if (q_gram in long_qgram_list):
+        common += 1
+        long_qgram_list.remove(q_gram)  # Remove the counted q-gram
 
   w = float(common) / float(divisor)
 
@@ -1001,27 +1035,49 @@ def editdist(str1, str2, min_threshold = None):
     str1, str2 = str2, str1
     n, m =       m, n
 
-  current = range(n+1)
+  if ((imp_stringcmpext == True) and (type(str1) == str) and \
+      (type(str2) == str)):
+    if (min_threshold != None):
+      dist = stringcmpext.editdist_dist(str1, str2, max_dist)
+    else:
+      dist = stringcmpext.editdist_dist(str1, str2, -1.0)
 
-  for i in range(1, m+1):
+    if (dist == None):
+      return 1.0 - float(max_dist+1) / float(max_len)
 
-    previous = current
-    current =  [i]+n*[0]
-    str2char = str2[i-1]
+  elif (n <= BITPARALLEL_MAX_LEN):  # Use bit-parallel algorithm
+    if (min_threshold != None):
+      dist = do_bitparallel_editdist(str1, str2, max_dist)
+    else:
+      dist = do_bitparallel_editdist(str1, str2)
 
-    for j in range(1,n+1):
-      substitute = previous[j-1]
-      if (str1[j-1] != str2char):
-        substitute += 1
+    if (dist == None):
+      return 1.0 - float(max_dist+1) / float(max_len)
 
-      # Get minimum of insert, delete and substitute
-      #
-      current[j] = min(previous[j]+1, current[j-1]+1, substitute)
+  else:
+    current = range(n+1)
 
-    if (min_threshold != None) and (min(current) > max_dist):
-      return 1.0 - float(max_dist+1) / float(max_len)
+    for i in range(1, m+1):
 
-  w = 1.0 - float(current[n]) / float(max_len)
+      previous = current
+      current =  [i]+n*[0]
+      str2char = str2[i-1]
+
+      for j in range(1,n+1):
+        substitute = previous[j-1]
+        if (str1[j-1] != str2char):
+          substitute += 1
+
+        # Get minimum of insert, delete and substitute
+        #
+        current[j] = min(previous[j]+1, current[j-1]+1, substitute)
+
+      if (min_threshold != None) and (min(current) > max_dist):
+        return 1.0 - float(max_dist+1) / float(max_len)
+
+    dist = current[n]
+
+  w = 1.0 - float(dist) / float(max_len)
 
   assert (w >= 0.0) and (w <= 1.0), 'Similarity weight outside 0-1: %f' % (w)
 
@@ -1091,42 +1147,55 @@ def mod_editdist(str1, str2, min_threshold = None):
     str1, str2 = str2, str1
     n, m =       m, n
 
-  d = []  # Table with the full distance matrix
+  if (n <= BITPARALLEL_MAX_LEN):  # Use bit-parallel algorithm
+    if (min_threshold != None):
+      dist = do_bitparallel_editdist(str1, str2, max_dist, True)
+    else:
+      dist = do_bitparallel_editdist(str1, str2, None, True)
 
-  current = range(n+1)
-  d.append(current)
+    if (dist == None):
+      return 1.0 - float(max_dist+1) / float(max_len)
 
-  for i in range(1,m+1):
+  else:
+    d = []  # Table with the full distance matrix
 
-    previous = current
-    current =  [i]+n*[0]
-    str2char = str2[i-1]
+    current = range(n+1)
+    d.append(current)
 
-    for j in range(1,n+1):
-      substitute = previous[j-1]
-      if (str1[j-1] != str2char):
-        substitute += 1
+    for i in range(1,m+1):
 
-      if (i == 1) or (j == 1):  # First characters, no transposition possible
+      previous = current
+      current =  [i]+n*[0]
+      str2char = str2[i-1]
 
-        # Get minimum of insert, delete and substitute
-        #
-        current[j] = min(previous[j]+1, current[j-1]+1, substitute)
+      for j in range(1,n+1):
+        substitute = previous[j-1]
+        if (str1[j-1] != str2char):
+          substitute += 1
+
+        if (i == 1) or (j == 1):  # First characters, no transposition possible
+
+          # Get minimum of insert, delete and substitute
+          #
+          current[j] = min(previous[j]+1, current[j-1]+1, substitute)
 
-      else:
-        if (str1[j-2] == str2[i-1]) and (str1[j-1] == str2[i-2]):
-          transpose = d[i-2][j-2] + 1
         else:
-          transpose = d[i-2][j-2] + 3
+          if (str1[j-2] == str2[i-1]) and (str1[j-1] == str2[i-2]):
+            transpose = d[i-2][j-2] + 1
+          else:
+            transpose = d[i-2][j-2] + 3
 
-        current[j] = min(previous[j]+1, current[j-1]+1, substitute, transpose)
+          current[j] = min(previous[j]+1, current[j-1]+1, substitute,
+                           transpose)
 
-    d.append(current)
+      d.append(current)
 
-    if (min_threshold != None) and (min(current) > max_dist):
-      return 1.0 - float(max_dist+1) / float(max_len)
+      if (min_threshold != None) and (min(current) > max_dist):
+        return 1.0 - float(max_dist+1) / float(max_len)
 
-  w = 1.0 - float(current[n]) / float(max_len)
+    dist = current[n]
+
+  w = 1.0 - float(dist) / float(max_len)
 
   assert (w >= 0.0) and (w <= 1.0), 'Similarity weight outside 0-1: %f' % (w)
 
@@ -1139,6 +1208,91 @@ def mod_editdist(str1, str2, min_threshold = None):
 
 # =============================================================================
 
+def do_bitparallel_editdist(str1, str2, max_dist = None, transpose = False):
+  """Subroutine to calculate the edit distance between the two input strings
+     using the bit-parallel algorithm by Myers (1999) in the formulation by
+     Hyyro (2001), which computes a full row of the distance matrix with a few
+     operations on bit vectors of length len(str1). If transpose is set to
+     True transpositions of adjacent characters are counted as one operation
+     (as in mod_editdist()).
+
+     Returns the distance, or None if a maximum distance is given and all the
+     values in a row of the distance matrix are larger than it (the condition
+     used to stop early in editdist() and mod_editdist()).
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  mask =     (1 << n) - 1
+  last_bit = 1 << (n-1)
+
+  # Bit vectors with the positions of each character in the first string
+  #
+  pos_vec_dict = {}
+  bit = 1
+  for c in str1:
+    pos_vec_dict[c] = pos_vec_dict.get(c, 0) | bit
+    bit <<= 1
+
+  vert_pos = mask  # Positive and negative vertical differences in a row
+  vert_neg = 0
+  diag_zero = 0    # Zero diagonal differences
+  prev_pos_vec = 0
+
+  dist = n  # Value in the last column of the current row
+
+  for c in str2:
+    pos_vec = pos_vec_dict.get(c, 0)
+
+    x = pos_vec | vert_neg
+    if (transpose == True):
+      x |= (((~diag_zero) & pos_vec) << 1) & prev_pos_vec
+      prev_pos_vec = pos_vec
+
+    diag_zero = (((pos_vec & vert_pos) + vert_pos) ^ vert_pos) | x
+    hori_pos = vert_neg | ~(diag_zero | vert_pos)
+    hori_neg = diag_zero & vert_pos
+
+    if (hori_pos & last_bit):
+      dist += 1
+    elif (hori_neg & last_bit):
+      dist -= 1
+
+    hori_pos = (hori_pos << 1) | 1
+    hori_neg = hori_neg << 1
+    vert_pos = (hori_neg | ~(diag_zero | hori_pos)) & mask
+    vert_neg = hori_pos & diag_zero & mask
+
+    # The row minimum can be at most the number of positive vertical
+    # differences smaller than the value in the last column
+    #
+    if (max_dist != None) and (dist > max_dist) and \
+       (dist - bin(vert_pos).count('1') > max_dist):
+      return None
+
+  # Row minima never decrease, so the last row decides if any row has all its
+  # values larger than the maximum distance
+  #
+  if (max_dist != None) and (dist > max_dist):
+    row_val = m  # Value in the first column of the last row
+    row_min = m
+    bit = 1
+    for j in range(n):
+      if (vert_pos & bit):
+        row_val += 1
+      elif (vert_neg & bit):
+        row_val -= 1
+        row_min = min(row_min, row_val)
+      bit <<= 1
+
+    if (row_min > max_dist):
+      return None
+
+  return dist
+
+# =============================================================================
+
 def editdist_edits(str1, str2):
   """Return approximate string comparator measure (between 0.0 and 1.0)
      using the edit (or Levenshtein) distance as well as a triplet with the
@@ -1371,42 +1525,47 @@ def swdist(str1, str2, common_divisor = 'average', min_threshold = None):
   approx_matches = {'a':0, 'b':5, 'd':1, 'e':0, 'g':2, 'i':0, 'j':2, 'l':3,
                     'm':4, 'n':4, 'o':0, 'p':5, 'r':3, 't':1, 'u':0, 'v':5}
 
-  best_score = 0  # Keep the best score while calculating table
+  if ((imp_stringcmpext == True) and (type(str1) == str) and \
+      (type(str2) == str)):
+    best_score = stringcmpext.swdist_score(str1, str2)
 
-  d = []  # Table with the full distance matrix
+  else:
+    best_score = 0  # Keep the best score while calculating table
 
-  for i in range(n+1):  # Initalise table
-    d.append([0.0]*(m+1))
+    d = []  # Table with the full distance matrix
 
-  for i in range(1,n+1):
-    for j in range(1,m+1):
+    for i in range(n+1):  # Initalise table
+      d.append([0.0]*(m+1))
 
-      match = d[i-1][j-1]
+    for i in range(1,n+1):
+      for j in range(1,m+1):
 
-      if (str1[i-1] == str2[j-1]):
-        match += match_score
-      else:
-        approx_match1 = approx_matches.get(str1[i-1],-1)
-        approx_match2 = approx_matches.get(str2[j-1],-1)
+        match = d[i-1][j-1]
 
-        if (approx_match1 >= 0) and (approx_match2 >= 0) and \
-           (approx_match1 == approx_match2):
-          match += approx_score
+        if (str1[i-1] == str2[j-1]):
+          match += match_score
         else:
-          match += mismatch_score
+          approx_match1 = approx_matches.get(str1[i-1],-1)
+          approx_match2 = approx_matches.get(str2[j-1],-1)
 
-      insert = 0
-      for k in range(1,i):
-        score = d[i-k][j] - gap_penalty - k*extension_penalty
-        insert = max(insert, score)
+          if (approx_match1 >= 0) and (approx_match2 >= 0) and \
+             (approx_match1 == approx_match2):
+            match += approx_score
+          else:
+            match += mismatch_score
 
-      delete = 0
-      for l in range(1,j):
-        score = d[i][j-l] - gap_penalty - l*extension_penalty
-        delete = max(delete, score)
+        insert = 0
+        for k in range(1,i):
+          score = d[i-k][j] - gap_penalty - k*extension_penalty
+          insert = max(insert, score)
 
-      d[i][j] = max(match, insert, delete, 0)
-      best_score = max(d[i][j], best_score)
+        delete = 0
+        for l in range(1,j):
+          score = d[i][j-l] - gap_penalty - l*extension_penalty
+          delete = max(delete, score)
+
+        d[i][j] = max(match, insert, delete, 0)
+        best_score = max(d[i][j], best_score)
 
   # best_score can be min(len(str1),len)str2))*match_score (if one string is
   # a sub-string ofd the other string).
@@ -1867,6 +2026,10 @@ def do_lcs(str1, str2):
      the common substring removed.
   """
 
+  if ((imp_stringcmpext == True) and (type(str1) == str) and \
+      (type(str2) == str)):
+    return stringcmpext.do_lcs(str1, str2)
+
   n = len(str1)
   m = len(str2)
 
@@ -2216,51 +2379,60 @@ def editex(str1, str2, min_threshold = None):
     str1, str2 = str2, str1
     n, m =       m, n
 
-  row = [0]*(m+1)  # Generate empty cost matrix
-  F = []
-  for i in range(n+1):
-    F.append(row[:])
+  if ((imp_stringcmpext == True) and (type(str1) == str) and \
+      (type(str2) == str)):
+    (dist, max_dist1, max_dist2) = stringcmpext.editex_costs(str1, str2)
 
-  F[1][0] = BIG_COSTS   # Initialise first row and first column of cost matrix
-  F[0][1] = BIG_COSTS
+  else:
+    row = [0]*(m+1)  # Generate empty cost matrix
+    F = []
+    for i in range(n+1):
+      F.append(row[:])
 
-  sum = BIG_COSTS
-  for i in range(2,n+1):
-    sum += delcost(str1[i-2], str1[i-1], groupsof_dict)
-    F[i][0] = sum
+    F[1][0] = BIG_COSTS   # Initialise first row and first column of cost matrix
+    F[0][1] = BIG_COSTS
 
-  sum = BIG_COSTS
-  for j in range(2,m+1):
-    sum += delcost(str2[j-2], str2[j-1], groupsof_dict)
-    F[0][j] = sum
+    sum = BIG_COSTS
+    for i in range(2,n+1):
+      sum += delcost(str1[i-2], str1[i-1], groupsof_dict)
+      F[i][0] = sum
 
-  for i in range(1,n+1):
+    sum = BIG_COSTS
+    for j in range(2,m+1):
+      sum += delcost(str2[j-2], str2[j-1], groupsof_dict)
+      F[0][j] = sum
 
-    if (i == 1):
-      inc1 = BIG_COSTS
-    else:
-      inc1 = delcost(str1[i-2], str1[i-1], groupsof_dict)
+    for i in range(1,n+1):
 
-    for j in range(1,m+1):
-      if (j == 1):
-        inc2 = BIG_COSTS
+      if (i == 1):
+        inc1 = BIG_COSTS
       else:
-        inc2 = delcost(str2[j-2], str2[j-1], groupsof_dict)
+        inc1 = delcost(str1[i-2], str1[i-1], groupsof_dict)
 
-      if (str1[i-1] == str2[j-1]):
-        diag = 0
-      else:
-        code1 = groupsof_dict.get(str1[i-1],-1)  # -1 is not a char
-        code2 = groupsof_dict.get(str2[j-1],-2)  # -2 if not a char
+      for j in range(1,m+1):
+        if (j == 1):
+          inc2 = BIG_COSTS
+        else:
+          inc2 = delcost(str2[j-2], str2[j-1], groupsof_dict)
 
-        if (code1 == code2):  # Same phonetic group
-          diag = SML_COSTS
+        if (str1[i-1] == str2[j-1]):
+          diag = 0
         else:
-          diag = BIG_COSTS
+          code1 = groupsof_dict.get(str1[i-1],-1)  # -1 is not a char
+          code2 = groupsof_dict.get(str2[j-1],-2)  # -2 if not a char
+
+          if (code1 == code2):  # Same phonetic group
+            diag = SML_COSTS
+          else:
+            diag = BIG_COSTS
+
+        F[i][j] = min(F[i-1][j]+inc1, F[i][j-1]+inc2, F[i-1][j-1]+diag)
 
-      F[i][j] = min(F[i-1][j]+inc1, F[i][j-1]+inc2, F[i-1][j-1]+diag)
+    dist =      F[n][m]
+    max_dist1 = F[0][m]
+    max_dist2 = F[n][0]
 
-  w = 1.0 - float(F[n][m]) / float(max(F[0][m],F[n][0]))
+  w = 1.0 - float(dist) / float(max(max_dist1,max_dist2))
 
   if (w < 0.0):
     w = 0.0
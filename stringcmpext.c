@@ -0,0 +1,571 @@
+/* ============================================================================
+ * AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+ * VERSION 1.3
+ *
+ * The contents of this file are subject to the ANUOS License Version 1.3
+ * (the "License"); you may not use this file except in compliance with
+ * the License. You may obtain a copy of the License at:
+ *
+ *   https://sourceforge.net/projects/febrl/
+ *
+ * Software distributed under the License is distributed on an "AS IS"
+ * basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+ * the License for the specific language governing rights and limitations
+ * under the License.
+ *
+ * The Original Software is: "stringcmpext.c"
+ *
+ * The Initial Developer of the Original Software is:
+ *   Dr Peter Christen (Research School of Computer Science, The Australian
+ *                      National University)
+ *
+ * Copyright (C) 2002 - 2011 the Australian National University and
+ * others. All Rights Reserved.
+ *
+ * Contributors:
+ *
+ * Alternatively, the contents of this file may be used under the terms
+ * of the GNU General Public License Version 2 or later (the "GPL"), in
+ * which case the provisions of the GPL are applicable instead of those
+ * above. The GPL is available at the following URL: http://www.gnu.org/
+ * If you wish to allow use of your version of this file only under the
+ * terms of the GPL, and not to allow others to use your version of this
+ * file under the terms of the ANUOS License, indicate your decision by
+ * deleting the provisions above and replace them with the notice and
+ * other provisions required by the GPL. If you do not delete the
+ * provisions above, a recipient may use your version of this file under
+ * the terms of any one of the ANUOS License or the GPL.
+ * ============================================================================
+ *
+ * Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+ *
+ * See: http://datamining.anu.edu.au/linkage.html
+ *
+ * ============================================================================
+ *
+ * Optional compiled inner loops for the approximate string comparators in
+ * the module stringcmp.py (editdist, jaro, winkler, qgram, swdist, lcs and
+ * editex).
+ *
+ * Each function computes exactly the intermediate values (common characters,
+ * counts, scores or costs) that the corresponding pure Python loops compute,
+ * all other processing (argument checks, minimum threshold checks and the
+ * final similarity calculation) is still done in stringcmp.py. The functions
+ * only accept byte strings (type 'str'), stringcmp.py uses the pure Python
+ * code for unicode strings.
+ *
+ * Compile with (see INSTALL.txt):
+ *
+ *   gcc -O2 -fPIC -shared `python-config --includes` -o stringcmpext.so \
+ *       stringcmpext.c
+ *
+ * ============================================================================
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+/* Character used to mark assigned characters in the Jaro comparator, must be
+ * the same as JARO_MARKER_CHAR in stringcmp.py
+ */
+#define JARO_MARKER_CHAR '\001'
+
+/* ============================================================================
+ * Edit distance: number of insertions, deletions and substitutions.
+ *
+ * Arguments: str1, str2, max_dist  (str1 not longer than str2, max_dist < 0
+ *                                   if there is no minimum threshold)
+ * Returns:   the edit distance, or None if all values in a row of the
+ *            distance matrix are larger than max_dist, see editdist() in
+ *            stringcmp.py
+ */
+
+static PyObject *editdist_dist(PyObject *self, PyObject *args)
+{
+  const char *str1, *str2;
+  Py_ssize_t n, m, i, j, row_min, dist;
+  Py_ssize_t *rows, *previous, *current, *tmp_row;
+  double max_dist;
+  char str2char;
+
+  if (!PyArg_ParseTuple(args, "s#s#d", &str1, &n, &str2, &m, &max_dist))
+    return NULL;
+
+  rows = (Py_ssize_t *) PyMem_Malloc(2*(n+1)*sizeof(Py_ssize_t));
+  if (rows == NULL)
+    return PyErr_NoMemory();
+  previous = rows;
+  current =  rows + (n+1);
+
+  for (j = 0; j <= n; j++)
+    current[j] = j;
+
+  for (i = 1; i <= m; i++) {
+    tmp_row = previous; previous = current; current = tmp_row;
+    str2char = str2[i-1];
+
+    current[0] = i;
+    row_min =    i;
+
+    for (j = 1; j <= n; j++) {
+      dist = previous[j-1];
+      if (str1[j-1] != str2char)
+        dist += 1;
+      if (previous[j]+1 < dist)
+        dist = previous[j]+1;
+      if (current[j-1]+1 < dist)
+        dist = current[j-1]+1;
+
+      current[j] = dist;
+      if (dist < row_min)
+        row_min = dist;
+    }
+
+    if ((max_dist >= 0.0) && (row_min > max_dist)) {
+      PyMem_Free(rows);
+      Py_RETURN_NONE;
+    }
+  }
+
+  dist = current[n];
+  PyMem_Free(rows);
+
+  return PyInt_FromSsize_t(dist);
+}
+
+/* ============================================================================
+ * Jaro: find common characters within half the length of the longer string.
+ *
+ * Arguments: str1, str2, halflen
+ * Returns:   (common1, common2, ass1, ass2), see jaro() in stringcmp.py
+ */
+
+static void jaro_assign_one(const char *str1, Py_ssize_t len1,
+                            char *workstr2, Py_ssize_t len2,
+                            Py_ssize_t halflen, char *ass1,
+                            Py_ssize_t *common1)
+{
+  Py_ssize_t i, k, start, end;
+
+  *common1 = 0;
+
+  for (i = 0; i < len1; i++) {
+    start = i - halflen;
+    if (start < 0)
+      start = 0;
+    end = i + halflen + 1;
+    if (end > len2)
+      end = len2;
+
+    for (k = start; k < end; k++) {
+      if (workstr2[k] == str1[i]) {  /* Found common character */
+        ass1[*common1] = str1[i];
+        (*common1)++;
+        workstr2[k] = JARO_MARKER_CHAR;
+        break;
+      }
+    }
+  }
+}
+
+static PyObject *jaro_assign(PyObject *self, PyObject *args)
+{
+  const char *str1, *str2;
+  Py_ssize_t len1, len2, halflen, common1, common2;
+  char *buf;
+  PyObject *result;
+
+  if (!PyArg_ParseTuple(args, "s#s#n", &str1, &len1, &str2, &len2, &halflen))
+    return NULL;
+
+  /* Work copies of both strings followed by the assigned characters */
+
+  buf = (char *) PyMem_Malloc(2*(len1+len2)+1);
+  if (buf == NULL)
+    return PyErr_NoMemory();
+
+  memcpy(buf, str1, len1);
+  memcpy(buf+len1, str2, len2);
+
+  jaro_assign_one(str1, len1, buf+len1, len2, halflen, buf+len1+len2,
+                  &common1);
+  jaro_assign_one(str2, len2, buf, len1, halflen, buf+2*len1+len2,
+                  &common2);
+
+  result = Py_BuildValue("nns#s#", common1, common2, buf+len1+len2, common1,
+                         buf+2*len1+len2, common2);
+  PyMem_Free(buf);
+
+  return result;
+}
+
+/* ============================================================================
+ * Q-gram: count the common q-grams of two strings, where each q-gram of the
+ * second string can only be counted once.
+ *
+ * Arguments: qgram_str1, qgram_str2, q  (strings padded if needed)
+ * Returns:   number of common q-grams, see qgram() in stringcmp.py
+ */
+
+static PyObject *qgram_common(PyObject *self, PyObject *args)
+{
+  const char *str1, *str2;
+  Py_ssize_t len1, len2, q, num1, num2, i, j, common;
+  char *used;
+
+  if (!PyArg_ParseTuple(args, "s#s#n", &str1, &len1, &str2, &len2, &q))
+    return NULL;
+
+  num1 = len1 - (q-1);
+  num2 = len2 - (q-1);
+
+  if ((num1 <= 0) || (num2 <= 0))
+    return PyInt_FromLong(0);
+
+  used = (char *) PyMem_Malloc(num2);
+  if (used == NULL)
+    return PyErr_NoMemory();
+  memset(used, 0, num2);
+
+  common = 0;
+
+  for (i = 0; i < num1; i++) {
+    for (j = 0; j < num2; j++) {
+      if ((used[j] == 0) && (memcmp(str1+i, str2+j, q) == 0)) {
+        used[j] = 1;  /* Remove the counted q-gram */
+        common++;
+        break;
+      }
+    }
+  }
+
+  PyMem_Free(used);
+
+  return PyInt_FromSsize_t(common);
+}
+
+/* ============================================================================
+ * Smith-Waterman: calculate the best local alignment score.
+ *
+ * Arguments: str1, str2
+ * Returns:   best score, see swdist() in stringcmp.py
+ */
+
+static int sw_approx_match(unsigned char c)
+{
+  /* {a,e,i,o,u} -> 0, {d,t} -> 1, {g,j} -> 2, {l,r} -> 3, {m,n} -> 4,
+   * {b,p,v} -> 5
+   */
+  switch (c) {
+    case 'a': case 'e': case 'i': case 'o': case 'u': return 0;
+    case 'd': case 't':                               return 1;
+    case 'g': case 'j':                               return 2;
+    case 'l': case 'r':                               return 3;
+    case 'm': case 'n':                               return 4;
+    case 'b': case 'p': case 'v':                     return 5;
+  }
+  return -1;
+}
+
+static PyObject *swdist_score(PyObject *self, PyObject *args)
+{
+  const char *str1, *str2;
+  Py_ssize_t n, m, i, j, k, m1;
+  long *d, match, insert, delete, score, best_score;
+  int approx_match1, approx_match2;
+
+  const long match_score =       5;
+  const long approx_score =      2;
+  const long mismatch_score =   -5;
+  const long gap_penalty =       5;
+  const long extension_penalty = 1;
+
+  if (!PyArg_ParseTuple(args, "s#s#", &str1, &n, &str2, &m))
+    return NULL;
+
+  m1 = m+1;
+
+  d = (long *) PyMem_Malloc((n+1)*m1*sizeof(long));
+  if (d == NULL)
+    return PyErr_NoMemory();
+  memset(d, 0, (n+1)*m1*sizeof(long));
+
+  best_score = 0;
+
+  for (i = 1; i <= n; i++) {
+    for (j = 1; j <= m; j++) {
+
+      match = d[(i-1)*m1+j-1];
+
+      if (str1[i-1] == str2[j-1])
+        match += match_score;
+      else {
+        approx_match1 = sw_approx_match((unsigned char) str1[i-1]);
+        approx_match2 = sw_approx_match((unsigned char) str2[j-1]);
+
+        if ((approx_match1 >= 0) && (approx_match2 >= 0) &&
+            (approx_match1 == approx_match2))
+          match += approx_score;
+        else
+          match += mismatch_score;
+      }
+
+      insert = 0;
+      for (k = 1; k < i; k++) {
+        score = d[(i-k)*m1+j] - gap_penalty - k*extension_penalty;
+        if (score > insert)
+          insert = score;
+      }
+
+      delete = 0;
+      for (k = 1; k < j; k++) {
+        score = d[i*m1+j-k] - gap_penalty - k*extension_penalty;
+        if (score > delete)
+          delete = score;
+      }
+
+      score = 0;
+      if (match > score)
+        score = match;
+      if (insert > score)
+        score = insert;
+      if (delete > score)
+        score = delete;
+
+      d[i*m1+j] = score;
+      if (score > best_score)
+        best_score = score;
+    }
+  }
+
+  PyMem_Free(d);
+
+  return PyInt_FromLong(best_score);
+}
+
+/* ============================================================================
+ * Longest common substring: extract the longest common substring.
+ *
+ * Arguments: str1, str2
+ * Returns:   (common substring, its length, str1 and str2 with the common
+ *            substring removed), see do_lcs() in stringcmp.py
+ */
+
+static PyObject *do_lcs(PyObject *self, PyObject *args)
+{
+  const char *str1, *str2, *tmp_str;
+  Py_ssize_t n, m, i, j, com_len, com_ans1, com_ans2, start1, start2;
+  Py_ssize_t *rows, *previous, *current, *tmp_row;
+  char *buf;
+  int swapped;
+  PyObject *result;
+
+  if (!PyArg_ParseTuple(args, "s#s#", &str1, &n, &str2, &m))
+    return NULL;
+
+  if (n > m) {  /* Make sure n <= m, to use O(min(n,m)) space */
+    tmp_str = str1; str1 = str2; str2 = tmp_str;
+    i = n; n = m; m = i;
+    swapped = 1;
+  }
+  else
+    swapped = 0;
+
+  rows = (Py_ssize_t *) PyMem_Malloc(2*(n+1)*sizeof(Py_ssize_t));
+  if (rows == NULL)
+    return PyErr_NoMemory();
+  previous = rows;
+  current =  rows + (n+1);
+  memset(current, 0, (n+1)*sizeof(Py_ssize_t));
+
+  com_len =  0;
+  com_ans1 = -1;
+  com_ans2 = -1;
+
+  for (i = 0; i < m; i++) {
+    tmp_row = previous; previous = current; current = tmp_row;
+    memset(current, 0, (n+1)*sizeof(Py_ssize_t));
+
+    for (j = 0; j < n; j++) {
+      if (str1[j] == str2[i]) {
+        if (j == 0)
+          current[j] = previous[n]+1;  /* Python index -1 */
+        else
+          current[j] = previous[j-1]+1;
+        if (current[j] > com_len) {
+          com_len =  current[j];
+          com_ans1 = j;
+          com_ans2 = i;
+        }
+      }
+    }
+  }
+
+  PyMem_Free(rows);
+
+  /* Remove common substring from input strings */
+
+  start1 = com_ans1-com_len+1;
+  start2 = com_ans2-com_len+1;
+
+  buf = (char *) PyMem_Malloc(n+m+1);
+  if (buf == NULL)
+    return PyErr_NoMemory();
+
+  memcpy(buf, str1, start1);
+  memcpy(buf+start1, str1+com_ans1+1, n-com_ans1-1);
+  memcpy(buf+n-com_len, str2, start2);
+  memcpy(buf+n-com_len+start2, str2+com_ans2+1, m-com_ans2-1);
+
+  if (swapped == 1)
+    result = Py_BuildValue("s#ns#s#", str1+start1, com_len, com_len,
+                           buf+n-com_len, m-com_len, buf, n-com_len);
+  else
+    result = Py_BuildValue("s#ns#s#", str1+start1, com_len, com_len,
+                           buf, n-com_len, buf+n-com_len, m-com_len);
+  PyMem_Free(buf);
+
+  return result;
+}
+
+/* ============================================================================
+ * Editex: calculate the editex cost matrix.
+ *
+ * Arguments: str1, str2  (spaces replaced, str1 not longer than str2)
+ * Returns:   (F[n][m], F[0][m], F[n][0]), see editex() in stringcmp.py
+ */
+
+#define BIG_COSTS 3  /* If characters are not in same group */
+#define SML_COSTS 2  /* If characters are in same group */
+
+static int editex_group(unsigned char c, int not_char)
+{
+  switch (c) {
+    case 'a': case 'e': case 'i': case 'o': case 'u': case 'y': return 0;
+    case 'b': case 'f': case 'p': case 'v':                     return 1;
+    case 'c': case 'g': case 'j': case 'k': case 'q': case 's':
+    case 'x': case 'z':                                         return 2;
+    case 'd': case 't':                                         return 3;
+    case 'l':                                                   return 4;
+    case 'm': case 'n':                                         return 5;
+    case 'r':                                                   return 6;
+    case 'h': case 'w': case '{':                               return 7;
+  }
+  return not_char;
+}
+
+static long editex_delcost(char char1, char char2)
+{
+  int code1, code2;
+
+  if (char1 == char2)
+    return 0;
+
+  code1 = editex_group((unsigned char) char1, -1);  /* -1 is not a char */
+  code2 = editex_group((unsigned char) char2, -2);  /* -2 if not a char */
+
+  if ((code1 == code2) || (code2 == 7))  /* Same or silent */
+    return SML_COSTS;
+  return BIG_COSTS;
+}
+
+static PyObject *editex_costs(PyObject *self, PyObject *args)
+{
+  const char *str1, *str2;
+  Py_ssize_t n, m, i, j, m1;
+  long *F, sum, inc1, inc2, diag, cost;
+  PyObject *result;
+
+  if (!PyArg_ParseTuple(args, "s#s#", &str1, &n, &str2, &m))
+    return NULL;
+
+  if ((n < 1) || (m < 1)) {
+    PyErr_SetString(PyExc_ValueError, "strings must not be empty");
+    return NULL;
+  }
+
+  m1 = m+1;
+
+  F = (long *) PyMem_Malloc((n+1)*m1*sizeof(long));
+  if (F == NULL)
+    return PyErr_NoMemory();
+  memset(F, 0, (n+1)*m1*sizeof(long));
+
+  F[1*m1+0] = BIG_COSTS;  /* Initialise first row and column of cost matrix */
+  F[0*m1+1] = BIG_COSTS;
+
+  sum = BIG_COSTS;
+  for (i = 2; i <= n; i++) {
+    sum += editex_delcost(str1[i-2], str1[i-1]);
+    F[i*m1+0] = sum;
+  }
+
+  sum = BIG_COSTS;
+  for (j = 2; j <= m; j++) {
+    sum += editex_delcost(str2[j-2], str2[j-1]);
+    F[0*m1+j] = sum;
+  }
+
+  for (i = 1; i <= n; i++) {
+
+    if (i == 1)
+      inc1 = BIG_COSTS;
+    else
+      inc1 = editex_delcost(str1[i-2], str1[i-1]);
+
+    for (j = 1; j <= m; j++) {
+      if (j == 1)
+        inc2 = BIG_COSTS;
+      else
+        inc2 = editex_delcost(str2[j-2], str2[j-1]);
+
+      if (str1[i-1] == str2[j-1])
+        diag = 0;
+      else if (editex_group((unsigned char) str1[i-1], -1) ==
+               editex_group((unsigned char) str2[j-1], -2))
+        diag = SML_COSTS;  /* Same phonetic group */
+      else
+        diag = BIG_COSTS;
+
+      cost = F[(i-1)*m1+j]+inc1;
+      if (F[i*m1+j-1]+inc2 < cost)
+        cost = F[i*m1+j-1]+inc2;
+      if (F[(i-1)*m1+j-1]+diag < cost)
+        cost = F[(i-1)*m1+j-1]+diag;
+
+      F[i*m1+j] = cost;
+    }
+  }
+
+  result = Py_BuildValue("lll", F[n*m1+m], F[0*m1+m], F[n*m1+0]);
+  PyMem_Free(F);
+
+  return result;
+}
+
+/* ============================================================================
+ * Module definition
+ */
+
+static PyMethodDef stringcmpext_methods[] = {
+  {"editdist_dist", editdist_dist, METH_VARARGS,
+   "Edit distance of two strings (None if above a maximum distance)."},
+  {"jaro_assign",   jaro_assign,   METH_VARARGS,
+   "Common characters of two strings for the Jaro comparator."},
+  {"qgram_common",  qgram_common,  METH_VARARGS,
+   "Number of common q-grams of two strings."},
+  {"swdist_score",  swdist_score,  METH_VARARGS,
+   "Best Smith-Waterman local alignment score of two strings."},
+  {"do_lcs",        do_lcs,        METH_VARARGS,
+   "Extract the longest common substring of two strings."},
+  {"editex_costs",  editex_costs,  METH_VARARGS,
+   "Final and maximum costs of the editex cost matrix."},
+  {NULL, NULL, 0, NULL}
+};
+
+PyMODINIT_FUNC initstringcmpext(void)
+{
+  Py_InitModule3("stringcmpext", stringcmpext_methods,
+                 "Compiled inner loops for the stringcmp module.");
+}
@@ -50,6 +50,7 @@
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
 import logging
+import os
 import sys
 import unittest
 sys.path.append('..')
@@ -2019,6 +2020,169 @@ class TestCase(unittest.TestCase):
   # ---------------------------------------------------------------------------
   # Test record comparator
   #
+  def testCachePolicies(self):
+
+    val_pair_list = [('peter','pete'),('paul','pauline'),('mary','marie'),
+                     ('john','jon'),('anne','ann')]
+
+    # LRU policy: the least recently used pair is removed
+    #
+    jfc = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                         max_cache_size = 3,
+                                         cache_policy = 'lru',
+                                         desc = 'FieldComparatorJaro LRU')
+    for (val1, val2) in val_pair_list[:3]:
+      jfc.compare(val1, val2)
+    jfc.compare('pete', 'peter')  # Swapped pair is a cache hit
+    jfc.compare('john', 'jon')    # Removes ('paul','pauline')
+
+    assert len(jfc.cache) == 3, len(jfc.cache)
+    assert ('paul','pauline') not in jfc.cache, jfc.cache.keys()
+    assert ('pete','peter') in jfc.cache, jfc.cache.keys()
+
+    cache_stats = jfc.get_cache_stats()
+    assert cache_stats['hits'] == 1, cache_stats
+    assert cache_stats['misses'] == 4, cache_stats
+    assert cache_stats['evicted'] == 1, cache_stats
+    assert cache_stats['size'] == 3, cache_stats
+
+    # Warning counts only include entries that are still in the cache
+    #
+    jfc = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                         max_cache_size = 2,
+                                         cache_policy = 'lru')
+    jfc.compare('peter', 'pete')
+    jfc.compare('peter', 'pete')
+    assert jfc.cache_warn_dict_counts[2] == 1, jfc.cache_warn_dict_counts
+    jfc.compare('paul', 'pauline')
+    jfc.compare('mary', 'marie')  # Removes ('pete','peter') (count 2)
+    assert jfc.cache_warn_dict_counts[2] == 0, jfc.cache_warn_dict_counts
+
+    # LFU policy: the pair with the smallest count is removed
+    #
+    jfc = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                         max_cache_size = 3,
+                                         cache_policy = 'lfu',
+                                         desc = 'FieldComparatorJaro LFU')
+    for (val1, val2) in val_pair_list[:3]:
+      jfc.compare(val1, val2)
+    jfc.compare('peter', 'pete')
+    jfc.compare('paul', 'pauline')
+    jfc.compare('peter', 'pete')
+    jfc.compare('mary', 'marie')
+    jfc.compare('john', 'jon')  # Removes ('paul','pauline') (count 2, oldest)
+    jfc.compare('anne', 'ann')  # Removes ('john','jon') (count 1)
+
+    assert len(jfc.cache) == 3, len(jfc.cache)
+    assert ('paul','pauline') not in jfc.cache, jfc.cache.keys()
+    assert ('john','jon') not in jfc.cache, jfc.cache.keys()
+    assert jfc.cache[('pete','peter')][1] == 3, jfc.cache
+    assert jfc.cache_num_evicted == 2, jfc.cache_num_evicted
+
+    # Many comparisons with a small cache, weights must not change
+    #
+    for cache_policy in ['none', 'lru', 'lfu']:
+      jfc = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                           max_cache_size = 10,
+                                           cache_policy = cache_policy)
+      jfc_no_cache = comparison.FieldComparatorJaro(threshold = 0.5)
+
+      for i in range(500):
+        val1 = str(1000 + (i*7) % 23)
+        val2 = str(1000 + (i*11) % 17)
+        assert jfc.compare(val1, val2) == jfc_no_cache.compare(val1, val2)
+        assert len(jfc.cache) <= 10, len(jfc.cache)
+        assert len(jfc.cache_heap) <= 4*10+64+1, len(jfc.cache_heap)
+
+        for warn_count in jfc.cache_warn_counts:  # Evicted entries not counted
+          assert jfc.cache_warn_dict_counts[warn_count] <= len(jfc.cache)
+
+      if (cache_policy == 'none'):
+        assert jfc.cache_num_evicted == 0
+        assert jfc.cache_num_not_cached > 0
+      else:
+        assert jfc.cache_num_evicted > 0
+        assert jfc.cache_num_not_cached == 0
+
+    # Cache file, shared by field comparators with the same settings
+    #
+    cache_file_name = './test-cache.sqlite'
+    if (os.path.exists(cache_file_name)):
+      os.remove(cache_file_name)
+
+    jfc1 = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                          cache_file = cache_file_name)
+    w_list1 = []
+    for (val1, val2) in val_pair_list:
+      w_list1.append(jfc1.compare(val1, val2))
+    jfc1.flush_cache()
+
+    assert jfc1.cache_num_store_hits == 0, jfc1.cache_num_store_hits
+
+    jfc2 = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                          cache_file = cache_file_name)
+    jfc3 = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                          cache_file = cache_file_name,
+                                          agree_weight = 5.0)
+    jfc4 = comparison.FieldComparatorWinkler(threshold = 0.5, do_cache = True,
+                                             cache_file = cache_file_name)
+    for i in range(len(val_pair_list)):
+      (val1, val2) = val_pair_list[i]
+      assert jfc2.compare(val2, val1) == w_list1[i]
+      jfc3.compare(val1, val2)
+      jfc4.compare(val1, val2)
+
+    assert jfc2.cache_num_store_hits == len(val_pair_list), \
+           jfc2.cache_num_store_hits
+    assert jfc2.cache_num_misses == 0, jfc2.cache_num_misses
+    assert jfc3.cache_num_store_hits == 0, jfc3.cache_num_store_hits
+    assert jfc4.cache_num_store_hits == 0, jfc4.cache_num_store_hits
+
+    jfc3.flush_cache()
+    jfc4.flush_cache()
+
+    # Cached weights are only reused with the same frequency table
+    #
+    freq_table = {}
+    for (val1, val2) in val_pair_list:
+      freq_table[val1] = len(val1)
+      freq_table[val2] = len(val2)
+    new_freq_table = freq_table.copy()  # Same sum of counts as old table
+    new_freq_table[val_pair_list[0][0]] += 1
+    new_freq_table[val_pair_list[0][1]] -= 1
+
+    for (val_freq_table, num_store_hits) in [(freq_table, 0),
+                                             (freq_table.copy(),
+                                              len(val_pair_list)),
+                                             (new_freq_table, 0)]:
+      jfc5 = comparison.FieldComparatorJaro(threshold = 0.5, do_cache = True,
+                                            cache_file = cache_file_name,
+                                            val_freq_table = val_freq_table)
+      for (val1, val2) in val_pair_list:
+        jfc5.compare(val1, val2)
+      jfc5.flush_cache()
+
+      assert jfc5.cache_num_store_hits == num_store_hits, \
+             (jfc5.cache_num_store_hits, num_store_hits)
+
+    os.remove(cache_file_name)
+
+    # Cache statistics of a record comparator
+    #
+    field_comp_list = [(jfc,  'gname', 'given_name'),
+                       (jfc2, 'surname', 'sname'),
+                       (comparison.FieldComparatorExactString(),
+                        'suburb', 'locality')]
+
+    rc = comparison.RecordComparator(self.test_data_set1, self.test_data_set2,
+                                     field_comp_list, 'Test record comparator')
+    cache_stats_list = rc.get_cache_stats()
+
+    assert len(cache_stats_list) == 3, cache_stats_list
+    assert cache_stats_list[0]['evicted'] == jfc.cache_num_evicted
+    assert cache_stats_list[1]['store_hits'] == len(val_pair_list)
+    assert cache_stats_list[2]['hits'] == 0
+
   def testRecordComparator(self):
 
     gn_jfc = comparison.FieldComparatorJaro(threshold = 0.6,
@@ -2091,6 +2255,135 @@ class TestCase(unittest.TestCase):
 
       rc.get_cache_stats()
 
+  def doBatchComparisonTest(self, fc, value_pair_list):
+
+    val1_list = [str(val_pair[0]) for val_pair in value_pair_list]
+    val2_list = [str(val_pair[1]) for val_pair in value_pair_list]
+
+    for (mw, daw, aw) in self.weight_values:
+      fc.set_weights(missing_w = mw, agree_w = aw, disagree_w = daw)
+
+      batch_w_list = fc.compare_batch(val1_list, val2_list)
+
+      assert len(batch_w_list) == len(val1_list), \
+             'Batch comparison returned wrong number of weights: %d ' % \
+             (len(batch_w_list))+'(should be %d)' % (len(val1_list))
+
+      for i in range(len(val1_list)):
+        w = fc.compare(val1_list[i], val2_list[i])
+
+        assert abs(batch_w_list[i] - w) < 1.0e-9, \
+               'Batch weight for "%s" / "%s" differs from compare() ' % \
+               (val1_list[i], val2_list[i]) + 'weight: %f / %f (%s)' % \
+               (batch_w_list[i], w, fc.description)
+
+  def testCompareBatch(self):
+
+    string_val_list = ['peter','paul','pete','peter christen','t','', 'n/a',
+                       'missing','2611','26l1','2602','260','2905','2066',
+                       '-12.5','13','13.0','100','99.5','1e3','abc']
+    date_val_list = ['09112006','09:11:2006','10/11/2006','11092006',
+                     '08112006','09112005','01012006','31122005','','n/a',
+                     '091106','101106','2006','99999999','31022006']
+
+    string_pair_list = []
+    for val1 in string_val_list:
+      for val2 in string_val_list:
+        string_pair_list.append((val1, val2))
+
+    date_pair_list = []
+    for val1 in date_val_list:
+      for val2 in date_val_list:
+        date_pair_list.append((val1, val2))
+
+    # Add the test pairs used in the other tests - - - - - - - - - - - - - - -
+    #
+    number_pair_list = self.exact_number_pairs + self.missing_number_pairs + \
+                       self.similar_number_pairs + \
+                       self.different_number_pairs + string_pair_list
+
+    string_pair_list += self.exact_string_pairs + \
+                        self.missing_string_pairs + \
+                        self.similar_string_pairs + \
+                        self.different_string_pairs
+
+    date_pair_list += self.exact_date_pairs + self.missing_date_pairs + \
+                      self.similar_date_pairs + self.different_date_pairs
+
+    missing_v = self.missing_values_list
+
+    string_fc_list = [
+      comparison.FieldComparatorExactString(missing_v = missing_v),
+      comparison.FieldComparatorTruncateString(num_char_compared = 3,
+                                               missing_v = missing_v),
+      comparison.FieldComparatorTruncateString(num_char_compared = 20,
+                                               missing_v = missing_v),
+      comparison.FieldComparatorKeyDiff(max_key_di = 2, missing_v = missing_v),
+      comparison.FieldComparatorKeyDiff(max_key_di = 4, missing_v = missing_v),
+      comparison.FieldComparatorJaro(threshold = 0.6, missing_v = missing_v),
+      comparison.FieldComparatorEditDist(threshold = 0.5,
+                                         missing_v = missing_v,
+                                         do_cache = True)]
+
+    number_fc_list = [
+      comparison.FieldComparatorNumericPerc(max_p = 0, missing_v = missing_v),
+      comparison.FieldComparatorNumericPerc(max_p = 20, missing_v = missing_v),
+      comparison.FieldComparatorNumericAbs(max_a = 0, missing_v = missing_v),
+      comparison.FieldComparatorNumericAbs(max_a = 10, missing_v = missing_v)]
+
+    for fc in string_fc_list:
+      self.doBatchComparisonTest(fc, string_pair_list)
+
+    for fc in number_fc_list:
+      self.doBatchComparisonTest(fc, number_pair_list)
+
+    for dp in [(3,3),(7,5),(1,3)]:
+      for d_format in ['ddmmyyyy','mmddyyyy','ddmmyy','mmddyy']:
+        dfc = comparison.FieldComparatorDate(max_day1=dp[0], max_day2 = dp[1],
+                                             date_format = d_format,
+                                             missing_v = missing_v)
+        self.doBatchComparisonTest(dfc, date_pair_list)
+
+    # Check the pure Python version as well - - - - - - - - - - - - - - - - - -
+    #
+    imp_numpy = comparison.imp_numpy
+    comparison.imp_numpy = False
+
+    for fc in string_fc_list[:4]:
+      self.doBatchComparisonTest(fc, string_pair_list)
+
+    comparison.imp_numpy = imp_numpy
+
+    # Compare batches of records - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    field_comp_list = [(string_fc_list[5], 'gname', 'given_name'),
+                       (string_fc_list[1], 'surname', 'sname'),
+                       (string_fc_list[0], 'suburb', 'locality'),
+                       (string_fc_list[3], 'postcode', 'zipcode'),
+                       (number_fc_list[1], 'streetnumb', 'street')]
+
+    rc = comparison.RecordComparator(self.test_data_set1, self.test_data_set2,
+                                     field_comp_list, 'Test record comparator')
+
+    rec_pair_list = []
+    for r1 in self.recs1:
+      for r2 in self.recs2:
+        rec_pair_list.append((r1, r2))
+
+    w_vec_batch = rc.compare_batch(rec_pair_list)
+
+    assert len(w_vec_batch) == len(rec_pair_list)
+
+    for i in range(len(rec_pair_list)):
+      w_vec = rc.compare(rec_pair_list[i][0], rec_pair_list[i][1])
+
+      assert len(w_vec_batch[i]) == len(w_vec), (w_vec_batch[i], w_vec)
+
+      for j in range(len(w_vec)):
+        assert abs(w_vec_batch[i][j] - w_vec[j]) < 1.0e-9, \
+               'Batch weight vector differs from compare() weight vector: ' + \
+               '%s / %s' % (str(w_vec_batch[i]), str(w_vec))
+
 # =============================================================================
 # Start tests when called from command line
 
@@ -49,6 +49,8 @@
 # =============================================================================
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
+import bz2
+import gzip
 import logging
 import os
 import string
@@ -1554,6 +1556,643 @@ class TestCase(unittest.TestCase):
       test_ds.finalise()
       test_ds = None
 
+  # ---------------------------------------------------------------------------
+
+  def testFingerprint(self):   # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test data set fingerprints"""
+
+    field_list = [('rec-id',0),('gname',1),('surname',2),('streetnumb',3),
+                  ('streetname_type',4),('suburb',5),('postcode',6)]
+
+    data_lines = open('./test-data.csv').readlines()
+    open('./test-data-fp.csv', 'w').writelines(data_lines)
+
+    fingerprint_list = []
+
+    for (rec_ident, miss_val, num_lines) in [('rec-id', None, 0),
+                                             ('rec-id', None, 0),
+                                             ('gname', None, 0),
+                                             ('rec-id', ['1'], 0),
+                                             ('rec-id', None, 1)]:
+      if (num_lines > 0):  # Change the data file
+        open('./test-data-fp.csv', 'w').writelines(data_lines[:-num_lines])
+
+      test_ds = dataset.DataSetCSV(description='A test CSV data set',
+                                   access_mode='read',
+                                   field_list=field_list,
+                                   rec_ident=rec_ident,
+                                   miss_val=miss_val,
+                                   header_line=False,
+                                   file_name='./test-data-fp.csv')
+      fingerprint = test_ds.get_fingerprint()
+
+      assert isinstance(fingerprint, str), \
+             'Fingerprint is not a string: %s' % (str(fingerprint))
+      assert fingerprint == test_ds.get_fingerprint(), \
+             'Fingerprint changes for same data set'
+      fingerprint_list.append(fingerprint)
+
+      test_ds.finalise()
+
+    assert fingerprint_list[0] == fingerprint_list[1], \
+           'Fingerprints of same data set differ: %s' % (str(fingerprint_list))
+    assert len(set(fingerprint_list)) == 4, \
+           'Fingerprints of different data sets are the same: %s' % \
+           (str(fingerprint_list))
+
+    os.remove('./test-data-fp.csv')
+
+  # ---------------------------------------------------------------------------
+
+  def testShards(self):   # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test reading data sets in shards"""
+
+    csv_field_list = [('rec-id',0),('gname',1),('surname',2),('streetnumb',3),
+                      ('streetname_type',4),('suburb',5),('postcode',6)]
+    col_field_list = [('rec-id',6),('gname',10),('surname',10),
+                      ('streetnumber',13),('address_1',19),('address_2',21),
+                      ('suburb',11),('postcode',8)]
+
+    mem_ds = dataset.DataSetMemory(description='A test Memory data set',
+                                   access_mode='readwrite',
+                                   field_list=csv_field_list,
+                                   rec_ident='rec-id')
+
+    for (ds_class, ds_args) in \
+        [(dataset.DataSetCSV, {'file_name':'./test-data.csv',
+                               'field_list':csv_field_list,
+                               'rec_ident':'rec-id'}),
+         (dataset.DataSetCSV, {'file_name':'./test-data.csv',
+                               'field_list':csv_field_list,
+                               'rec_ident':'gen-id'}),
+         (dataset.DataSetCSV, {'file_name':'./test-data.csv',
+                               'rec_ident':'rec_id', 'header_line':True}),
+         (dataset.DataSetCOL, {'file_name':'./test-data.col',
+                               'field_list':col_field_list,
+                               'rec_ident':'rec-id'}),
+         (dataset.DataSetCSV, {'file_name':'./test-data.csv.gz',
+                               'field_list':csv_field_list,
+                               'rec_ident':'rec-id'})]:
+
+      test_ds = ds_class(description='A test data set', access_mode='read',
+                         **ds_args)
+
+      all_rec_list = list(test_ds.readall())
+
+      if (mem_ds.num_records == 0):  # Records for the memory data set
+        mem_ds.write(dict(all_rec_list))
+
+      for num_shards in [1, 2, 3, 7, 50]:
+        shard_list = test_ds.get_shards(num_shards)
+
+        if (test_ds.file_name.endswith('.gz')):
+          assert len(shard_list) == 1, \
+                 'Compressed file was split into %d shards' % (len(shard_list))
+        else:
+          assert len(shard_list) == num_shards, \
+                 'Wrong number of shards: %d (should be %d)' % \
+                 (len(shard_list), num_shards)
+
+        shard_rec_list = []
+        for shard in shard_list:
+          shard_rec_list += list(test_ds.readshard(shard))
+
+        assert len(shard_rec_list) == len(all_rec_list), \
+               'Shards contain %d records, data set %d' % \
+               (len(shard_rec_list), len(all_rec_list))
+
+        for i in range(len(all_rec_list)):
+          (rec_ident, rec) = all_rec_list[i]
+
+          if (test_ds.rec_ident == 'gen-id'):  # Identifiers not known
+            assert shard_rec_list[i] == (None, rec), \
+                   'Shard record is different: %s / %s' % \
+                   (str(shard_rec_list[i]), str(rec))
+          else:
+            assert shard_rec_list[i] == (rec_ident, rec), \
+                   'Shard record is different: %s / %s' % \
+                   (str(shard_rec_list[i]), str((rec_ident, rec)))
+
+      test_ds.finalise()
+
+    # Records of a memory data set are split into ranges of record keys
+    #
+    all_rec_list = list(mem_ds.readall())
+
+    shard_list = mem_ds.get_shards(3)
+    assert len(shard_list) == 3, \
+           'Wrong number of shards: %d (should be 3)' % (len(shard_list))
+
+    shard_rec_list = []
+    for shard in shard_list:
+      shard_rec_list += list(mem_ds.readshard(shard))
+
+    assert shard_rec_list == all_rec_list, \
+           'Records in shards differ from records in memory data set'
+
+    mem_ds.finalise()
+
+  # ---------------------------------------------------------------------------
+
+  def testOffsetIndex(self):   # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test reading records using a record offset index"""
+
+    csv_field_list = [('rec-id',0),('gname',1),('surname',2),('streetnumb',3),
+                      ('streetname_type',4),('suburb',5),('postcode',6)]
+    col_field_list = [('rec-id',6),('gname',10),('surname',10),
+                      ('streetnumber',13),('address_1',19),('address_2',21),
+                      ('suburb',11),('postcode',8)]
+
+    for (ds_class, test_file, field_list) in \
+        [(dataset.DataSetCSV, './test-data.csv', csv_field_list),
+         (dataset.DataSetCSV, './test-data.csv.gz', csv_field_list),
+         (dataset.DataSetCOL, './test-data.col', col_field_list),
+         (dataset.DataSetCOL, './test-data.col.gz', col_field_list)]:
+
+      idx_file = './test-data-idx' + test_file[len('./test-data'):]
+      open(idx_file, 'wb').write(open(test_file, 'rb').read())
+
+      ds_list = []
+      for offset_index in [False, True]:
+        ds_list.append(ds_class(description='A test data set',
+                                access_mode='read',
+                                field_list=field_list,
+                                rec_ident='rec-id',
+                                offset_index=offset_index,
+                                file_name=idx_file))
+      (test_ds, test_idx_ds) = ds_list
+
+      for (start_num, num_recs) in [(5,3), (0,1), (17,10), (2,4), (20,1),
+                                    (11,2), (13,5), (1,20)]:
+        test_rec_dict = test_ds.read(start_num, num_recs)
+        test_idx_rec_dict = test_idx_ds.read(start_num, num_recs)
+
+        assert test_idx_rec_dict == test_rec_dict, \
+               'Records read using offset index differ: %s / %s' % \
+               (str(test_idx_rec_dict), str(test_rec_dict))
+        assert test_idx_ds.next_rec_num == test_ds.next_rec_num, \
+               'Wrong next record number: %d (should be %d)' % \
+               (test_idx_ds.next_rec_num, test_ds.next_rec_num)
+
+      assert len(test_idx_ds.rec_offsets) == test_idx_ds.num_records, \
+             'Offset index has %d records (should be %d)' % \
+             (len(test_idx_ds.rec_offsets), test_idx_ds.num_records)
+      assert os.path.isfile(idx_file+'.idx'), \
+             'Offset index file was not written'
+
+      rec_offsets = test_idx_ds.rec_offsets
+
+      test_ds.finalise()
+      test_idx_ds.finalise()
+
+      # Offsets are loaded from the index file, or calculated again if the
+      # data set file has changed
+      #
+      for (file_changed, num_records) in [(False, 21), (True, 20)]:
+        if (file_changed == True):
+          if (idx_file.endswith('.gz')):
+            data_lines = gzip.open(idx_file).readlines()
+            gzip.open(idx_file, 'wb').writelines(data_lines[1:])
+          else:
+            data_lines = open(idx_file).readlines()
+            open(idx_file, 'w').writelines(data_lines[1:])
+
+        ds_list = []
+        for offset_index in [False, True]:
+          ds_list.append(ds_class(description='A test data set',
+                                  access_mode='read',
+                                  field_list=field_list,
+                                  rec_ident='rec-id',
+                                  offset_index=offset_index,
+                                  file_name=idx_file))
+        (test_ds, test_idx_ds) = ds_list
+
+        test_rec_dict = test_ds.read(num_records-2, 2)
+        test_idx_rec_dict = test_idx_ds.read(num_records-2, 2)
+
+        assert test_idx_rec_dict == test_rec_dict, \
+               'Records read using offset index differ: %s / %s' % \
+               (str(test_idx_rec_dict), str(test_rec_dict))
+        assert len(test_idx_ds.rec_offsets) == num_records, \
+               'Offset index has %d records (should be %d)' % \
+               (len(test_idx_ds.rec_offsets), num_records)
+
+        if (file_changed == False):
+          assert test_idx_ds.rec_offsets == rec_offsets, \
+                 'Loaded record offsets differ from calculated offsets'
+
+        test_ds.finalise()
+        test_idx_ds.finalise()
+
+      os.remove(idx_file)
+      os.remove(idx_file+'.idx')
+
+  # ---------------------------------------------------------------------------
+
+  def testOffsetIndexGzipMembers(self):   # - - - - - - - - - - - - - - - - - -
+    """Test reading records from a GZIP file made of several members using a
+       record offset index"""
+
+    csv_field_list = [('rec-id',0),('gname',1),('surname',2),('streetnumb',3),
+                      ('streetname_type',4),('suburb',5),('postcode',6)]
+    col_field_list = [('rec-id',6),('gname',10),('surname',10),
+                      ('streetnumber',13),('address_1',19),('address_2',21),
+                      ('suburb',11),('postcode',8)]
+
+    for (ds_class, test_file, field_list) in \
+        [(dataset.DataSetCSV, './test-data.csv', csv_field_list),
+         (dataset.DataSetCOL, './test-data.col', col_field_list)]:
+
+      idx_file = './test-data-members' + test_file[len('./test-data'):] + '.gz'
+
+      # Write the file as several GZIP members of four lines each (followed by
+      # zero padding), like a BGZF file
+      #
+      data_lines = open(test_file).readlines()
+      gzip_file = open(idx_file, 'wb')
+      for i in range(0, len(data_lines), 4):
+        member_file = gzip.GzipFile(fileobj=gzip_file, mode='wb')
+        member_file.writelines(data_lines[i:i+4])
+        member_file.close()
+      gzip_file.write('\x00'*64)
+      gzip_file.close()
+
+      num_members = (len(data_lines)+3) / 4
+
+      for load_index in [False, True]:  # Calculate first, then load the index
+        ds_list = []
+        for offset_index in [False, True]:
+          ds_list.append(ds_class(description='A test data set',
+                                  access_mode='read',
+                                  field_list=field_list,
+                                  rec_ident='rec-id',
+                                  offset_index=offset_index,
+                                  file_name=idx_file))
+        (test_ds, test_idx_ds) = ds_list
+
+        for (start_num, num_recs) in [(5,3), (0,1), (17,4), (2,4), (20,1),
+                                      (11,2), (3,1), (1,20)]:
+          test_rec_dict = test_ds.read(start_num, num_recs)
+          test_idx_rec_dict = test_idx_ds.read(start_num, num_recs)
+
+          assert test_idx_rec_dict == test_rec_dict, \
+                 'Records read using offset index differ: %s / %s' % \
+                 (str(test_idx_rec_dict), str(test_rec_dict))
+
+        assert len(test_idx_ds.gzip_members[0]) == num_members, \
+               'Offset index has %d GZIP members (should be %d)' % \
+               (len(test_idx_ds.gzip_members[0]), num_members)
+        assert list(test_idx_ds.gzip_members[1]) == \
+               [len(''.join(data_lines[:i])) for i in \
+                range(0, len(data_lines), 4)], \
+               'Wrong uncompressed GZIP member offsets: %s' % \
+               (str(test_idx_ds.gzip_members[1]))
+
+        test_ds.finalise()
+        test_idx_ds.finalise()
+
+      os.remove(idx_file)
+      os.remove(idx_file+'.idx')
+
+  # ---------------------------------------------------------------------------
+
+  def testReadBatches(self):   # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test reading data sets in column oriented batches"""
+
+    csv_field_list = [('rec-id',0),('gname',1),('surname',2),('streetnumb',3),
+                      ('streetname_type',4),('suburb',5),('postcode',6)]
+    col_field_list = [('rec-id',6),('gname',10),('surname',10),
+                      ('streetnumber',13),('address_1',19),('address_2',21),
+                      ('suburb',11),('postcode',8)]
+
+    mem_ds = dataset.DataSetMemory(description='A test Memory data set',
+                                   access_mode='readwrite',
+                                   field_list=csv_field_list,
+                                   rec_ident='rec-id')
+
+    for (ds_class, ds_args) in \
+        [(dataset.DataSetCSV, {'file_name':'./test-data.csv',
+                               'field_list':csv_field_list,
+                               'rec_ident':'rec-id'}),
+         (dataset.DataSetCSV, {'file_name':'./test-data.csv.gz',
+                               'field_list':csv_field_list,
+                               'rec_ident':'gen-id', 'miss_val':['1']}),
+         (dataset.DataSetCOL, {'file_name':'./test-data.col',
+                               'field_list':col_field_list,
+                               'rec_ident':'rec-id'}),
+         (dataset.DataSetCOL, {'file_name':'./test-data.col',
+                               'field_list':col_field_list,
+                               'rec_ident':'gen-id', 'strip_fields':False}),
+         (None, None)]:
+
+      if (ds_class == None):
+        test_ds = mem_ds
+      else:
+        test_ds = ds_class(description='A test data set', access_mode='read',
+                           **ds_args)
+
+      all_rec_list = list(test_ds.readall())
+
+      if (mem_ds.num_records == 0):  # Records for the memory data set
+        mem_ds.write(dict(all_rec_list))
+
+      field_name_list = [field_data[0] for field_data in test_ds.field_list]
+
+      for fields in [None, field_name_list[1:3], [field_name_list[-1]],
+                     [field_name_list[2], field_name_list[0]]]:
+        if (fields == None):
+          field_num_list = range(len(field_name_list))
+        else:
+          field_num_list = map(field_name_list.index, fields)
+
+        for batch_size in [1, 4, 21, 100]:
+          batch_rec_list = []
+
+          for (rec_ident_list, col_list) in test_ds.read_batches(batch_size,
+                                                                 fields):
+            assert len(rec_ident_list) <= batch_size, \
+                   'Batch contains %d records (batch size is %d)' % \
+                   (len(rec_ident_list), batch_size)
+            assert len(col_list) == len(field_num_list), \
+                   'Batch contains %d columns (should be %d)' % \
+                   (len(col_list), len(field_num_list))
+
+            for i in range(len(rec_ident_list)):
+              batch_rec_list.append((rec_ident_list[i],
+                                     [col[i] for col in col_list]))
+
+          assert len(batch_rec_list) == len(all_rec_list), \
+                 'Batches contain %d records, data set %d' % \
+                 (len(batch_rec_list), len(all_rec_list))
+
+          for i in range(len(all_rec_list)):
+            (rec_ident, rec) = all_rec_list[i]
+            rec = [rec[field_num] for field_num in field_num_list]
+
+            assert batch_rec_list[i] == (rec_ident, rec), \
+                   'Batch record is different: %s / %s' % \
+                   (str(batch_rec_list[i]), str((rec_ident, rec)))
+
+      self.assertRaises(Exception, list, test_ds.read_batches(0))
+      self.assertRaises(Exception, list, test_ds.read_batches(10, ['xyz']))
+
+      test_ds.finalise()
+
+  # ---------------------------------------------------------------------------
+
+  def testCOLLineLengths(self):   # - - - - - - - - - - - - - - - - - - - - - -
+    """Test COL data sets with lines of different lengths"""
+
+    field_list = [('rec-id',4),('gname',6),('surname',7),('postcode',4)]
+
+    data_lines = ['r1  peter miller 2000\n',        # Exact length
+                  'r2  paul  smith  2600  extra\n', # Too long
+                  'r3  mary  n/a    \n',            # Too short
+                  'r4  n/a\n',                      # Too short
+                  '\n',                             # Empty line
+                  'r6    ann  n/a   0200']          # No line break
+
+    for test_file in ['./test-data-len.col', './test-data-len.col.gz']:
+
+      if (test_file.endswith('.gz')):
+        gzip.open(test_file, 'wb').writelines(data_lines)
+      else:
+        open(test_file, 'w').writelines(data_lines)
+
+      for (strip_fields, miss_val) in [(True, None), (True, ['n/a']),
+                                       (False, None), (False, ['n/a'])]:
+
+        # The records as extracted field by field
+        #
+        test_rec_list = []
+        for file_line in data_lines:
+          rec = []
+          for (s,e) in [(0,4),(4,10),(10,17),(17,21)]:
+            field_val = file_line[s:e]
+            if (strip_fields == True):
+              field_val = field_val.strip()
+            if ((miss_val != None) and (field_val in miss_val)):
+              field_val = ''
+            rec.append(field_val)
+          test_rec_list.append(rec)
+
+        test_ds = dataset.DataSetCOL(description='A test COL data set',
+                                     access_mode='read',
+                                     field_list=field_list,
+                                     rec_ident='gen-id',
+                                     strip_fields=strip_fields,
+                                     miss_val=miss_val,
+                                     file_name=test_file)
+
+        for rec_list in [[rec for (rec_ident, rec) in test_ds.readall()],
+                         [test_ds.read(0,1).values()[0]] + \
+                         [test_ds.read().values()[0] for i in range(5)],
+                         [rec for (rec_ident, rec) in \
+                          test_ds.readshard(test_ds.get_shards(1)[0])]]:
+          assert rec_list == test_rec_list, \
+                 'Records extracted wrongly: %s (should be %s)' % \
+                 (str(rec_list), str(test_rec_list))
+
+        test_ds.finalise()
+
+      os.remove(test_file)
+
+  # ---------------------------------------------------------------------------
+
+  def testCSVMultiFile(self):   # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test CSV data sets made of several (compressed) files"""
+
+    data_lines = open('./test-data.csv').readlines()
+
+    # Reading lines in a background thread, with lines split over blocks
+    #
+    for block_size in [13, 100000]:
+      threaded_file = dataset.ThreadedReadFile(open('./test-data.csv'),
+                                               block_size, 2)
+      file_lines = [threaded_file.readline()] + list(threaded_file)
+      threaded_file.close()
+
+      assert file_lines == data_lines, \
+             'Lines read in background thread differ: %s' % (str(file_lines))
+
+    # Write the records into parts, each with the header line
+    #
+    part_file_list = ['./test-data-part-1.csv', './test-data-part-2.csv.gz',
+                      './test-data-part-3.csv.bz2', './test-data-part-4.csv']
+    part_line_list = [data_lines[1:8], data_lines[8:9], data_lines[9:20],
+                      data_lines[20:]]
+
+    for (part_file_name, part_lines) in zip(part_file_list, part_line_list):
+      if (part_file_name.endswith('.gz')):
+        part_file = gzip.open(part_file_name, 'wb')
+      elif (part_file_name.endswith('.bz2')):
+        part_file = bz2.BZ2File(part_file_name, 'w')
+      else:
+        part_file = open(part_file_name, 'w')
+      part_file.writelines([data_lines[0]] + part_lines)
+      part_file.close()
+
+    for ds_rec_ident in ['rec_id', 'gen-id']:
+
+      test_ds = dataset.DataSetCSV(description='A test CSV data set',
+                                   access_mode='read',
+                                   rec_ident=ds_rec_ident,
+                                   header_line=True,
+                                   file_name='./test-data.csv')
+
+      all_rec_list = list(test_ds.readall())
+
+      for decompress_thread in [True, False]:
+        part_ds = dataset.DataSetCSV(description='A test CSV data set',
+                                     access_mode='read',
+                                     rec_ident=ds_rec_ident,
+                                     header_line=True,
+                                     decompress_thread=decompress_thread,
+                                     file_name='./test-data-part-*')
+
+        assert part_ds.file_name_list == part_file_list, \
+               'Wrong list of files: %s' % (str(part_ds.file_name_list))
+        assert part_ds.field_list == test_ds.field_list, \
+               'Wrong field list: %s' % (str(part_ds.field_list))
+        assert part_ds.num_records == test_ds.num_records, \
+               'Wrong number of records: %d (should be %d)' % \
+               (part_ds.num_records, test_ds.num_records)
+
+        part_rec_list = list(part_ds.readall())
+        assert part_rec_list == all_rec_list, \
+               'Records of files differ: %s / %s' % \
+               (str(part_rec_list), str(all_rec_list))
+
+        for (start_num, num_recs) in [(5,4), (0,1), (15,10), (8,1)]:
+          part_rec_dict = part_ds.read(start_num, num_recs)
+          test_rec_dict = test_ds.read(start_num, num_recs)
+          assert part_rec_dict == test_rec_dict, \
+                 'Records of files differ: %s / %s' % \
+                 (str(part_rec_dict), str(test_rec_dict))
+
+        for num_shards in [1, 4, 10]:
+          shard_list = part_ds.get_shards(num_shards)
+          assert len(shard_list) >= len(part_file_list), \
+                 'Less shards than files: %s' % (str(shard_list))
+
+          shard_rec_list = []
+          for shard in shard_list:
+            shard_rec_list += list(part_ds.readshard(shard))
+
+          for i in range(len(all_rec_list)):
+            (rec_ident, rec) = all_rec_list[i]
+            if (part_ds.rec_ident == 'gen-id'):  # Identifiers not known
+              rec_ident = None
+            assert shard_rec_list[i] == (rec_ident, rec), \
+                   'Shard record is different: %s / %s' % \
+                   (str(shard_rec_list[i]), str((rec_ident, rec)))
+
+        part_ds.finalise()
+
+      test_ds.finalise()
+
+    self.assertRaises(Exception, dataset.DataSetCSV, access_mode='read',
+                      rec_ident='rec_id', header_line=True,
+                      offset_index=True, file_name='./test-data-part-*')
+    self.assertRaises(IOError, dataset.DataSetCSV, access_mode='read',
+                      rec_ident='rec_id', header_line=True,
+                      file_name='./test-data-nopart-*')
+
+    for part_file_name in part_file_list:
+      os.remove(part_file_name)
+
+  # ---------------------------------------------------------------------------
+
+  def testWriteMany(self):   # - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test writing records with write_many() and buffered writing"""
+
+    field_list = [('rec-id',0),('gname',1),('surname',2),('streetnumb',3),
+                  ('streetname_type',4),('suburb',5),('postcode',6)]
+
+    test_ds = dataset.DataSetCSV(description='A test CSV data set',
+                                 access_mode='read',
+                                 field_list=field_list,
+                                 rec_ident='rec-id',
+                                 file_name='./test-data.csv')
+    all_rec_list = list(test_ds.readall())
+    test_ds.finalise()
+
+    # Write records one by one, and with write_many() with and without buffer
+    #
+    file_data_list = []
+
+    for (write_buffer_size, use_write_many) in [(0, False), (0, True),
+                                                (100, True), (65536, False)]:
+      write_ds = dataset.DataSetCSV(description='A test CSV data set',
+                                    access_mode='write',
+                                    field_list=field_list,
+                                    rec_ident='rec-id',
+                                    write_buffer_size=write_buffer_size,
+                                    file_name='./test-data-write.csv')
+      if (use_write_many == True):
+        write_ds.write_many(all_rec_list[:5])
+        write_ds.write_many(iter(all_rec_list[5:]))
+      else:
+        for (rec_ident, rec) in all_rec_list:
+          write_ds.write({rec_ident:rec})
+
+      assert write_ds.num_records == len(all_rec_list), \
+             'Wrong number of records written: %d (should be %d)' % \
+             (write_ds.num_records, len(all_rec_list))
+
+      if (write_buffer_size == 0):  # Written records are flushed
+        assert len(open('./test-data-write.csv').readlines()) == \
+               len(all_rec_list), 'Records not flushed into file'
+
+      write_ds.finalise()
+
+      file_data_list.append(open('./test-data-write.csv').read())
+
+    assert file_data_list == [file_data_list[0]]*len(file_data_list), \
+           'Written CSV files differ'
+
+    read_ds = dataset.DataSetCSV(description='A test CSV data set',
+                                 access_mode='read',
+                                 field_list=field_list,
+                                 rec_ident='rec-id',
+                                 file_name='./test-data-write.csv')
+    assert list(read_ds.readall()) == all_rec_list, \
+           'Records read back differ from written records'
+    read_ds.finalise()
+
+    os.remove('./test-data-write.csv')
+
+    # Memory and shelve data sets
+    #
+    for sync_interval in [None, 0, 1, 7]:
+      if (sync_interval == None):
+        write_ds = dataset.DataSetMemory(description='A test Memory data set',
+                                         access_mode='readwrite',
+                                         field_list=field_list,
+                                         rec_ident='rec-id')
+      else:
+        write_ds = dataset.DataSetShelve(description='A test Shelve data set',
+                                         access_mode='readwrite',
+                                         field_list=field_list,
+                                         rec_ident='rec-id',
+                                         clear=True,
+                                         sync_interval=sync_interval,
+                                         file_name='test-data-write.slv')
+
+      write_ds.write_many(iter(all_rec_list))
+
+      assert write_ds.num_records == len(all_rec_list), \
+             'Wrong number of records written: %d (should be %d)' % \
+             (write_ds.num_records, len(all_rec_list))
+      assert sorted(write_ds.readall()) == sorted(all_rec_list), \
+             'Records read back differ from written records'
+
+      write_ds.finalise()
+
+    for file_name in os.listdir('.'):
+      if (file_name.startswith('test-data-write.slv')):
+        os.remove(file_name)
+
 # =============================================================================
 # Start tests when called from command line
 
@@ -49,6 +49,11 @@
 # =============================================================================
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
+import array
+import copy
+import math
+import os
+import Queue
 import sets
 import sys
 import unittest
@@ -56,6 +61,8 @@ sys.path.append('..')
 
 import comparison  # Assumed to have been tested successfully
 import dataset     # Assumed to have been tested successfully
+import encode
+import output
 import stringcmp
 
 import indexing
@@ -677,6 +684,935 @@ class TestCase(unittest.TestCase):
 
       prev_w_vec_dict = this_w_vec_dict
 
+  def testBlockingIndexStreaming(self):  # - - - - - - - - - - - - - - - - - -
+    """Test BlockingIndex with streaming of record pairs"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      block_index = indexing.BlockingIndex(description = 'Test blocking index',
+                                           dataset1 = self.dataset1,
+                                           dataset2 = dataset2,
+                                           rec_comparator = rec_comp,
+                                           index_def = [index_def1,index_def2])
+      block_index.build()
+      block_index.compact()
+      [field_names_list, weight_vec_dict] = block_index.run()
+
+      stream_index = indexing.BlockingIndex(description = 'Test stream index',
+                                            dataset1 = self.dataset1,
+                                            dataset2 = dataset2,
+                                            rec_comparator = rec_comp,
+                                            stream_rec_pairs = True,
+                                            index_def = [index_def1,index_def2])
+
+      assert stream_index.stream_rec_pairs == True
+
+      stream_index.build()
+      stream_index.compact()
+
+      assert stream_index.status == 'compacted'
+      assert stream_index.rec_pair_dict == {}
+
+      # Before run() the number of record pairs is an upper bound only
+      #
+      assert stream_index.num_rec_pairs >= block_index.num_rec_pairs
+
+      [field_names_list, stream_w_vec_dict] = stream_index.run()
+
+      assert stream_index.num_rec_pairs == block_index.num_rec_pairs
+      assert len(stream_w_vec_dict) == stream_index.num_rec_pairs
+      assert len(stream_w_vec_dict) == len(weight_vec_dict)
+
+      for rec_id_pair in stream_w_vec_dict:
+        assert rec_id_pair in weight_vec_dict
+        assert stream_w_vec_dict[rec_id_pair] == weight_vec_dict[rec_id_pair]
+
+      # Test length filter and cut-off threshold
+      #
+      [field_names_list, this_w_vec_dict] = \
+                    stream_index.run(length_filter_perc = 20)
+      [field_names_list, prev_w_vec_dict] = \
+                    block_index.run(length_filter_perc = 20)
+      assert this_w_vec_dict == prev_w_vec_dict
+
+      [field_names_list, this_w_vec_dict] = \
+                    stream_index.run(cut_off_threshold = 0.5)
+      [field_names_list, prev_w_vec_dict] = \
+                    block_index.run(cut_off_threshold = 0.5)
+      assert this_w_vec_dict == prev_w_vec_dict
+
+  def testBlockingIndexParallel(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test BlockingIndex with parallel comparison of record pairs"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      block_index = indexing.BlockingIndex(description = 'Test blocking index',
+                                           dataset1 = self.dataset1,
+                                           dataset2 = dataset2,
+                                           rec_comparator = rec_comp,
+                                           progress = 5,
+                                           index_def = [index_def1,index_def2])
+      block_index.build()
+      block_index.compact()
+
+      for num_workers in [1, 2, 3]:
+
+        [field_names_list, weight_vec_dict] = block_index.run()
+        [field_names_list, par_w_vec_dict] = \
+                                   block_index.run(num_workers = num_workers)
+
+        assert len(par_w_vec_dict) == block_index.num_rec_pairs
+        assert par_w_vec_dict == weight_vec_dict
+
+        for lf in [50,20,5]:
+          [field_names_list, weight_vec_dict] = \
+                                   block_index.run(length_filter_perc = lf)
+          [field_names_list, par_w_vec_dict] = \
+                                   block_index.run(length_filter_perc = lf,
+                                                   num_workers = num_workers)
+          assert par_w_vec_dict == weight_vec_dict
+
+        for cot in [0.1, 0.5, 0.9]:
+          [field_names_list, weight_vec_dict] = \
+                                   block_index.run(cut_off_threshold = cot)
+          [field_names_list, par_w_vec_dict] = \
+                                   block_index.run(cut_off_threshold = cot,
+                                                   num_workers = num_workers)
+          assert par_w_vec_dict == weight_vec_dict
+
+  def testBlockingIndexInterned(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test BlockingIndex with interned record identifiers"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      block_index = indexing.BlockingIndex(description = 'Test blocking index',
+                                           dataset1 = self.dataset1,
+                                           dataset2 = dataset2,
+                                           rec_comparator = rec_comp,
+                                           index_def = [index_def1,index_def2])
+      block_index.build()
+      block_index.compact()
+      [field_names_list, weight_vec_dict] = block_index.run()
+
+      assert block_index.get_rec_ident_lists() == None
+
+      for stream_rec_pairs in [False, True]:
+        int_index = indexing.BlockingIndex(description = 'Test interned index',
+                                           dataset1 = self.dataset1,
+                                           dataset2 = dataset2,
+                                           rec_comparator = rec_comp,
+                                           stream_rec_pairs = stream_rec_pairs,
+                                           intern_rec_idents = True,
+                                           index_def = [index_def1,index_def2])
+        int_index.build()
+
+        for block_rec_list in int_index.index1[0].values():
+          assert isinstance(block_rec_list, array.array)
+
+        int_index.compact()
+
+        if (stream_rec_pairs == False):  # Upper bound only in streaming mode
+          assert int_index.num_rec_pairs == block_index.num_rec_pairs
+        else:
+          assert int_index.num_rec_pairs >= block_index.num_rec_pairs
+
+        for rec_ident2_list in int_index.rec_pair_dict.values():
+          assert isinstance(rec_ident2_list, array.array)
+          assert list(rec_ident2_list) == sorted(rec_ident2_list)
+
+        (rec_ident_list1, rec_ident_list2) = int_index.get_rec_ident_lists()
+
+        assert len(rec_ident_list1) == self.dataset1.num_records
+        assert len(rec_ident_list2) == dataset2.num_records
+
+        for num_workers in [None, 2]:
+          [field_names_list, int_w_vec_dict] = \
+                                   int_index.run(num_workers = num_workers)
+
+          assert len(int_w_vec_dict) == len(weight_vec_dict)
+
+          for (rec_num1, rec_num2) in int_w_vec_dict:
+            assert isinstance(rec_num1, int) and isinstance(rec_num2, int)
+
+            rec_id_pair = (rec_ident_list1[rec_num1],
+                           rec_ident_list2[rec_num2])
+            if (rec_id_pair not in weight_vec_dict):  # Deduplication
+              rec_id_pair = (rec_id_pair[1], rec_id_pair[0])
+
+            assert int_w_vec_dict[(rec_num1, rec_num2)] == \
+                   weight_vec_dict[rec_id_pair]
+
+      # Match status files must contain the original record identifiers
+      #
+      match_set = set(weight_vec_dict.keys())
+      output.SaveMatchStatusFile(weight_vec_dict, match_set,
+                                 'test-match-status.csv')
+      match_status_lines = open('test-match-status.csv').readlines()
+
+      if (dataset2 == self.dataset2):  # Pairs are the same for a linkage
+        int_match_set = set(int_w_vec_dict.keys())
+        output.SaveMatchStatusFile(int_w_vec_dict, int_match_set,
+                                   'test-match-status.csv',
+                                   int_index.get_rec_ident_lists())
+        assert open('test-match-status.csv').readlines() == \
+               match_status_lines
+
+      os.remove('test-match-status.csv')
+
+  # ---------------------------------------------------------------------------
+
+  def testInternedUnsupported(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test indices that do not support interned record identifiers"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]]]
+
+    index_args = {'description':'Test index', 'dataset1':self.dataset1,
+                  'dataset2':self.dataset2,
+                  'rec_comparator':self.rec_comp_link,
+                  'intern_rec_idents':True,
+                  'index_def':[index_def1,index_def2]}
+
+    self.assertRaises(Exception, indexing.FullIndex, **index_args)
+    self.assertRaises(Exception, indexing.CanopyIndex,
+                      canopy_method = ('tfidf', 'threshold', 0.9, 0.8),
+                      **index_args)
+
+    for build_method in ['dict', 'array']:
+      rsarray_args = index_args.copy()
+      rsarray_args.update({'block_method':(3,5),
+                           'str_cmp_funct':stringcmp.editdist,
+                           'str_cmp_thres':0.8,
+                           'build_method':build_method})
+
+      if (build_method == 'dict'):  # Records are not interned
+        self.assertRaises(Exception, indexing.RobustSuffixArrayIndex,
+                          **rsarray_args)
+      else:
+        rsarray_index = indexing.RobustSuffixArrayIndex(**rsarray_args)
+        rsarray_index.build()
+        rsarray_index.compact()
+
+        for rec_ident2_list in rsarray_index.rec_pair_dict.values():
+          assert isinstance(rec_ident2_list, array.array)
+
+  # ---------------------------------------------------------------------------
+
+  def testBlockingIndexIncremental(self):  # - - - - - - - - - - - - - - - - -
+    """Test adding and removing records to and from a blocking index"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    data_lines = open('./test-data.csv').readlines()
+    open('test-data-base.csv', 'w').writelines(data_lines[:15])
+    open('test-data-delta.csv', 'w').writelines(data_lines[:1]+data_lines[15:])
+
+    delta_rec_ident_list = []
+    for data_line in data_lines[15:]:
+      delta_rec_ident_list.append(data_line.split(',')[0])
+
+    base_dataset = dataset.DataSetCSV(description='Base test data set',
+                                      access_mode='read',
+                                      rec_ident='rec_id',
+                                      header_line=True,
+                                      file_name='test-data-base.csv')
+    delta_dataset = dataset.DataSetCSV(description='Delta test data set',
+                                       access_mode='read',
+                                       rec_ident='rec_id',
+                                       header_line=True,
+                                       file_name='test-data-delta.csv')
+
+    field_comp_list = []
+    for (field_comp, field_name1, field_name2) in \
+        self.rec_comp_link.field_comparator_list:
+      field_comp_list.append((field_comp, field_name1, field_name2))
+
+    # Test cases: (data set 1 and 2 of incremental index, number of the data
+    # set the records are added to, data sets 1 and 2 of the full index)
+    #
+    for (dataset1, dataset2, data_set_num, full_dataset1, full_dataset2) in \
+      [(base_dataset, base_dataset, 1, self.dataset1, self.dataset1),
+       (base_dataset, self.dataset2, 1, self.dataset1, self.dataset2),
+       (self.dataset1, base_dataset, 2, self.dataset1, self.dataset2)]:
+
+      for intern_rec_idents in [False, True]:
+        rec_comp = comparison.RecordComparator(dataset1, dataset2,
+                                               field_comp_list)
+        incr_index = indexing.BlockingIndex(description = 'Test index',
+                                          dataset1 = dataset1,
+                                          dataset2 = dataset2,
+                                          rec_comparator = rec_comp,
+                                          intern_rec_idents = intern_rec_idents,
+                                          incremental = True,
+                                          index_def = [index_def1,index_def2])
+
+        self.assertRaises(Exception, incr_index.add_records, delta_dataset,
+                          data_set_num)  # Not compacted yet
+
+        incr_index.build()
+        incr_index.compact()
+
+        assert incr_index.index1[0] != {}  # Blocks must be kept
+
+        [field_names_list, base_w_vec_dict] = incr_index.run()
+        base_num_rec_pairs = incr_index.num_rec_pairs
+
+        full_rec_comp = comparison.RecordComparator(full_dataset1,
+                                                    full_dataset2,
+                                                    field_comp_list)
+        full_index = indexing.BlockingIndex(description = 'Test index',
+                                          dataset1 = full_dataset1,
+                                          dataset2 = full_dataset2,
+                                          rec_comparator = full_rec_comp,
+                                          intern_rec_idents = intern_rec_idents,
+                                          index_def = [index_def1,index_def2])
+        full_index.build()
+        full_index.compact()
+        [field_names_list, full_w_vec_dict] = full_index.run()
+
+        # Translate weight vector keys into sorted record identifier pairs
+        #
+        def get_rec_id_w_vec_dict(index, w_vec_dict):
+          rec_ident_lists = index.get_rec_ident_lists()
+          rec_id_w_vec_dict = {}
+          for ((rec_id1, rec_id2), w_vec) in w_vec_dict.items():
+            if (rec_ident_lists != None):
+              rec_id1 = rec_ident_lists[0][rec_id1]
+              rec_id2 = rec_ident_lists[1][rec_id2]
+            if ((index.do_deduplication == True) and (rec_id1 > rec_id2)):
+              (rec_id1, rec_id2) = (rec_id2, rec_id1)
+            rec_id_w_vec_dict[(rec_id1, rec_id2)] = w_vec
+          return rec_id_w_vec_dict
+
+        base_w_vec_dict = get_rec_id_w_vec_dict(incr_index, base_w_vec_dict)
+        full_w_vec_dict = get_rec_id_w_vec_dict(full_index, full_w_vec_dict)
+
+        [field_names_list, new_w_vec_dict] = \
+                              incr_index.add_records(delta_dataset, data_set_num)
+        new_w_vec_dict = get_rec_id_w_vec_dict(incr_index, new_w_vec_dict)
+
+        # Only the new record pairs must have been compared
+        #
+        assert len(base_w_vec_dict) + len(new_w_vec_dict) == \
+               len(full_w_vec_dict)
+        for rec_id_pair in new_w_vec_dict:
+          assert rec_id_pair not in base_w_vec_dict
+          assert new_w_vec_dict[rec_id_pair] == full_w_vec_dict[rec_id_pair]
+
+        assert incr_index.num_rec_pairs == full_index.num_rec_pairs
+        [field_names_list, all_w_vec_dict] = incr_index.run()
+        assert get_rec_id_w_vec_dict(incr_index, all_w_vec_dict) == \
+               full_w_vec_dict
+
+        self.assertRaises(Exception, incr_index.add_records, delta_dataset,
+                          data_set_num)  # Records are already in index
+
+        # Removing the added records must give the original record pairs
+        #
+        num_removed = incr_index.remove_records(delta_rec_ident_list,
+                                                data_set_num)
+        assert num_removed == len(new_w_vec_dict)
+        assert incr_index.num_rec_pairs == base_num_rec_pairs
+        [field_names_list, all_w_vec_dict] = incr_index.run()
+        assert get_rec_id_w_vec_dict(incr_index, all_w_vec_dict) == \
+               base_w_vec_dict
+
+        self.assertRaises(Exception, incr_index.remove_records,
+                          delta_rec_ident_list[:1], data_set_num)
+
+        if (dataset1 == dataset2):  # Only data set 1 for a deduplication
+          self.assertRaises(Exception, incr_index.add_records, delta_dataset, 2)
+
+    # Indices that do not support adding records - - - - - - - - - - - - - - -
+    #
+    rec_comp = comparison.RecordComparator(base_dataset, base_dataset,
+                                           field_comp_list)
+    block_index = indexing.BlockingIndex(description = 'Test index',
+                                         dataset1 = base_dataset,
+                                         dataset2 = base_dataset,
+                                         rec_comparator = rec_comp,
+                                         index_def = [index_def1,index_def2])
+    block_index.build()
+    block_index.compact()
+    self.assertRaises(Exception, block_index.add_records, delta_dataset)
+
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      description = 'Test index', dataset1 = base_dataset,
+                      dataset2 = base_dataset, rec_comparator = rec_comp,
+                      index_def = [index_def1,index_def2], incremental = True,
+                      stream_rec_pairs = True)
+
+    sort_index = indexing.SortingIndex(description = 'Test index',
+                                       dataset1 = base_dataset,
+                                       dataset2 = base_dataset,
+                                       rec_comparator = rec_comp,
+                                       window_size = 3,
+                                       index_def = [index_def1,index_def2])
+    sort_index.build()
+    sort_index.compact()
+    self.assertRaises(Exception, sort_index.add_records, delta_dataset)
+    self.assertRaises(Exception, sort_index.remove_records,
+                      delta_rec_ident_list)
+
+    base_dataset.finalise()
+    delta_dataset.finalise()
+    os.remove('test-data-base.csv')
+    os.remove('test-data-delta.csv')
+
+  # ---------------------------------------------------------------------------
+
+  def testBlockingIndexLargeBlocks(self):  # - - - - - - - - - - - - - - - - -
+    """Test BlockingIndex with limited block sizes"""
+
+    index_def1 = [['postcode','postcode',False,False,1,[]]]
+    sub_block_def = [['given_name','given_name',False,False,1,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      index_args = {'description':'Test large blocks',
+                    'dataset1':self.dataset1, 'dataset2':dataset2,
+                    'rec_comparator':rec_comp, 'index_def':[index_def1]}
+
+      block_index = indexing.BlockingIndex(**index_args)
+      block_index.build()
+
+      block_size_dict = {}  # Number of records of all blocks in data set 1
+      for (block_val, block_recs) in block_index.index1[0].items():
+        block_size_dict[block_val] = len(block_recs)
+
+      block_index.compact()
+
+      all_pair_set = set()
+      for (rec_ident1, rec_ident2_set) in block_index.rec_pair_dict.items():
+        for rec_ident2 in rec_ident2_set:
+          all_pair_set.add((rec_ident1, rec_ident2))
+
+      max_block_size = max(block_size_dict.values()) - 1
+
+      for large_block_method in ['drop', 'split', ('sort', 2)]:
+
+        large_index = indexing.BlockingIndex(max_block_size = max_block_size,
+                                     large_block_method = large_block_method,
+                                     sub_block_def = sub_block_def,
+                                     **index_args)
+        assert large_index.index_def == [index_def1]
+
+        large_index.build()
+
+        assert len(large_index.large_block_list) > 0
+        for (i, block_val, num_recs1, num_recs2, num_pairs) in \
+            large_index.large_block_list:
+          assert i == 0
+          if (block_val in block_size_dict):
+            assert num_recs1 == block_size_dict[block_val]
+          else:  # A sub-block that still exceeded the limit
+            assert large_block_method == 'split'
+          assert max(num_recs1, num_recs2) > max_block_size
+          assert block_val not in large_index.index1[0]
+
+        for block_recs in large_index.index1[0].values():
+          if (large_block_method in ['drop', 'split']):
+            assert len(block_recs) <= max_block_size
+          else:
+            assert len(block_recs) <= 2
+
+        est_num_rec_pairs = large_index.num_rec_pairs
+
+        large_index.compact()
+
+        assert large_index.num_rec_pairs <= est_num_rec_pairs
+        assert large_index.num_rec_pairs < block_index.num_rec_pairs
+
+        for (rec_ident1, rec_ident2_set) in large_index.rec_pair_dict.items():
+          for rec_ident2 in rec_ident2_set:
+            assert (rec_ident1, rec_ident2) in all_pair_set
+
+      # Splitting with a sub-block value that is the same for all records in
+      # a block does not make the block smaller, so it has to be dropped
+      #
+      for max_limit_dict in [{'max_block_size':max_block_size},
+                             {'max_block_pairs':1}]:
+
+        large_index = indexing.BlockingIndex(large_block_method = 'split',
+                                             sub_block_def = index_def1,
+                                             **dict(index_args.items() + \
+                                                    max_limit_dict.items()))
+        large_index.build()
+
+        large_block_val_set = set()
+        for (i, block_val, num_recs1, num_recs2, num_pairs) in \
+            large_index.large_block_list:
+          large_block_val_set.add(block_val)
+
+        for large_block_val in large_block_val_set:
+          if (large_block_val in block_size_dict):
+            assert large_block_val+large_index.SUB_BLOCK_SEP_STR + \
+                   large_block_val in large_block_val_set, large_block_val
+
+        for (block_val, block_recs1) in large_index.index1[0].items():
+          if (large_index.do_deduplication == True):
+            num_pairs = len(block_recs1)*(len(block_recs1)-1)/2
+          else:
+            num_pairs = len(block_recs1) * \
+                        len(large_index.index2[0].get(block_val, []))
+
+          if ('max_block_size' in max_limit_dict):
+            assert len(block_recs1) <= max_block_size
+          else:
+            assert num_pairs <= 1
+
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      large_block_method = 'split', max_block_size = 2,
+                      **index_args)
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      large_block_method = ('sort', 1), max_block_size = 2,
+                      sub_block_def = sub_block_def, **index_args)
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      large_block_method = 'sample', max_block_pairs = 2,
+                      **index_args)
+    self.assertRaises(Exception, indexing.BlockingIndex, incremental = True,
+                      max_block_pairs = 2, **index_args)
+
+  # ---------------------------------------------------------------------------
+
+  def testParallelBuild(self):  # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test building indices using worker processes"""
+
+    index_def1 = [['surname','surname',False,False,None,[encode.dmetaphone]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (index_class, index_args) in \
+        [(indexing.BlockingIndex, {}),
+         (indexing.SortingIndex, {'window_size':3}),
+         (indexing.QGramIndex, {'q':2, 'threshold':0.8}),
+         (indexing.SuffixArrayIndex, {'suffix_method':'suffixonly',
+                                      'block_method':(2,10)}),
+         (indexing.StringMapIndex, {'canopy_method':('nearest', 2, 3),
+                                    'dim':15, 'sub_dim':2,
+                                    'grid_resolution':10,
+                                    'sim_funct':stringcmp.editdist})]:
+
+      for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                   (self.dataset1, self.rec_comp_dedupl)]:
+
+        index_args.update({'description':'Test parallel build',
+                           'dataset1':self.dataset1, 'dataset2':dataset2,
+                           'rec_comparator':rec_comp,
+                           'index_def':[index_def1,index_def2]})
+
+        serial_index = index_class(**index_args)
+        serial_index.build()
+        serial_index1 = copy.deepcopy(serial_index.index1)  # Before compact()
+        serial_index2 = copy.deepcopy(serial_index.index2)
+        serial_keys1 =  [serial_index.index1[i].keys() for i in range(2)]
+        serial_index.compact()
+
+        for intern_rec_idents in [False, True]:
+          par_index = index_class(num_build_workers = 2,
+                                  intern_rec_idents = intern_rec_idents,
+                                  **index_args)
+          par_index.build()
+
+          if (intern_rec_idents == False):
+            assert par_index.rec_cache1 == serial_index.rec_cache1
+            assert par_index.rec_cache2 == serial_index.rec_cache2
+
+            for i in range(2):  # Same blocks with records in same order
+              assert par_index.index1[i] == serial_index1[i]
+              assert par_index.index2[i] == serial_index2[i]
+              assert par_index.index1[i].keys() == serial_keys1[i]
+
+          else:  # Record numbers must be positions in the data sets
+            assert par_index.rec_ident_list1 == self.rec_ident1
+
+            for i in range(2):
+              for (block_val, block_recs) in par_index.index1[i].items():
+                assert [par_index.rec_ident_list1[rec_num] for rec_num in \
+                        block_recs] == serial_index1[i][block_val]
+
+          par_index.compact()
+          assert par_index.num_rec_pairs > 0
+
+          if (intern_rec_idents == False):  # Same record pairs generated
+            assert par_index.rec_pair_dict == serial_index.rec_pair_dict
+
+    self.assertRaises(Exception, indexing.BlockingIndex, num_build_workers = 0,
+                      **index_args)
+
+    # Indices that do not read records into an inverted index
+    #
+    index_args = {'description':'Test parallel build',
+                  'dataset1':self.dataset1, 'dataset2':self.dataset2,
+                  'rec_comparator':self.rec_comp_link,
+                  'index_def':[index_def1,index_def2]}
+
+    self.assertRaises(Exception, indexing.FullIndex, num_build_workers = 2,
+                      **index_args)
+    self.assertRaises(Exception, indexing.CanopyIndex, num_build_workers = 2,
+                      canopy_method = ('tfidf', 'threshold', 0.9, 0.8),
+                      **index_args)
+
+  # ---------------------------------------------------------------------------
+
+  def testColumnarRecCache(self):  # - - - - - - - - - - - - - - - - - - - - -
+    """Test the columnar record cache"""
+
+    for storage in ['intern', 'buffer']:
+      rec_cache = indexing.ColumnarRecordCache(5, [3,1], storage)
+
+      assert rec_cache.field_ind_list == [1,3]
+      assert len(rec_cache) == 0
+      assert rec_cache.get('r1') == None
+
+      rec_cache['r1'] = ['a','peter','b','miller','c']
+      rec_cache['r2'] = ['a','paul','b']  # Short record
+      rec_cache['r3'] = ['','',u'',u'smith','']
+
+      assert len(rec_cache) == 3
+      assert 'r2' in rec_cache
+      assert rec_cache.has_key('r3')
+      assert 'r4' not in rec_cache
+
+      assert rec_cache['r1'] == ['','peter','','miller','']
+      assert rec_cache['r2'] == ['','paul','','','']
+      assert rec_cache['r3'] == ['','','','smith','']
+      assert rec_cache.get_row(1) == rec_cache['r2']
+      assert rec_cache.get_row_num('r3') == 2
+      assert rec_cache.get_rec_ident(2) == 'r3'
+
+      assert rec_cache.keys() == ['r1','r2','r3']
+      assert rec_cache.values() == [rec_cache['r1'], rec_cache['r2'],
+                                    rec_cache['r3']]
+      assert dict(rec_cache.items()) == {'r1':rec_cache['r1'],
+                                         'r2':rec_cache['r2'],
+                                         'r3':rec_cache['r3']}
+      assert list(rec_cache) == rec_cache.keys()
+
+      assert rec_cache.get_column(1) == ['peter','paul','']
+      assert rec_cache.get_column(3, [2,0]) == ['smith','miller']
+      assert rec_cache.get_column(4) == ['','','']
+
+      rec_cache['r2'] = ['x','pauline','y','jones']  # Replace a record
+      assert rec_cache['r2'] == ['','pauline','','jones','']
+      assert len(rec_cache) == 3
+
+      del rec_cache['r1']
+      assert len(rec_cache) == 2
+      assert 'r1' not in rec_cache
+      assert rec_cache.keys() == ['r2','r3']
+      assert rec_cache.get_column(1) == ['','pauline','']
+
+      rec_cache.clear()
+      assert len(rec_cache) == 0
+      assert rec_cache.keys() == []
+
+      if (storage == 'intern'):  # Values are shared between records
+        rec_cache['r1'] = ['',''.join(['pe','ter']),'','','']
+        rec_cache['r2'] = ['',''.join(['pet','er']),'','','']
+        assert rec_cache.get_column(1)[0] is rec_cache.get_column(1)[1]
+
+    # Indices using a columnar record cache must give the same results - - - -
+    #
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+      w_vec_dict_list = []
+
+      for rec_cache_storage in ['dict', 'columnar', 'columnar_buffer']:
+        block_index = indexing.BlockingIndex(description = 'Test index',
+                                           dataset1 = self.dataset1,
+                                           dataset2 = dataset2,
+                                           rec_comparator = rec_comp,
+                                           rec_cache_storage=rec_cache_storage,
+                                           index_def = [index_def1,index_def2])
+        block_index.build()
+
+        assert len(block_index.rec_cache1) == self.dataset1.num_records
+        if (rec_cache_storage != 'dict'):
+          assert isinstance(block_index.rec_cache1,
+                            indexing.ColumnarRecordCache)
+          assert block_index.rec_cache1.field_ind_list == \
+                 block_index.comp_field_used1
+
+        block_index.compact()
+        [field_names_list, weight_vec_dict] = \
+                                     block_index.run(length_filter_perc = 50)
+        w_vec_dict_list.append(weight_vec_dict)
+
+        [field_names_list, weight_vec_dict] = block_index.run(num_workers = 2)
+        w_vec_dict_list.append(weight_vec_dict)
+
+      assert w_vec_dict_list[0] == w_vec_dict_list[2] == w_vec_dict_list[4]
+      assert w_vec_dict_list[1] == w_vec_dict_list[3] == w_vec_dict_list[5]
+
+  # ---------------------------------------------------------------------------
+
+  def testIndexSaveLoad(self):  # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test saving and loading of indices"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    index_file_name = 'test-index.bin'
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+      for (stream_rec_pairs, intern_rec_idents) in [(False, False),
+                                                    (True, False),
+                                                    (False, True),
+                                                    (True, True)]:
+        index_args = {'description':'Test index',
+                      'dataset1':self.dataset1,
+                      'dataset2':dataset2,
+                      'rec_comparator':rec_comp,
+                      'stream_rec_pairs':stream_rec_pairs,
+                      'intern_rec_idents':intern_rec_idents,
+                      'index_def':[index_def1,index_def2]}
+
+        block_index = indexing.BlockingIndex(**index_args)
+
+        self.assertRaises(Exception, block_index.save, index_file_name)
+
+        block_index.build()
+        block_index.save(index_file_name)  # Save a built index
+
+        loaded_index = indexing.BlockingIndex(**index_args)
+        assert loaded_index.load(index_file_name) == True
+        assert loaded_index.status == 'built'
+        assert loaded_index.index1 == block_index.index1
+        if (dataset2 == self.dataset2):
+          assert loaded_index.index2 == block_index.index2
+        assert isinstance(loaded_index.rec_cache1,
+                          indexing.ColumnarRecordCache)
+        assert len(loaded_index.rec_cache1) == self.dataset1.num_records
+
+        for rec_ident in block_index.rec_cache1:
+          assert loaded_index.rec_cache1[rec_ident] == \
+                 block_index.rec_cache1[rec_ident]
+
+        self.assertRaises(Exception, loaded_index.load, index_file_name)
+
+        block_index.compact()
+        [field_names_list, weight_vec_dict] = block_index.run()
+
+        loaded_index.compact()
+        assert loaded_index.run() == [field_names_list, weight_vec_dict]
+        assert loaded_index.num_rec_pairs == block_index.num_rec_pairs
+
+        block_index.save(index_file_name)  # Save a compacted index
+
+        loaded_index = indexing.BlockingIndex(**index_args)
+        assert loaded_index.load(index_file_name) == True
+        assert loaded_index.status == 'compacted'
+        assert loaded_index.num_rec_pairs == block_index.num_rec_pairs
+        assert loaded_index.get_rec_ident_lists() == \
+               block_index.get_rec_ident_lists()
+        assert loaded_index.run() == [field_names_list, weight_vec_dict]
+        assert loaded_index.run(num_workers = 2) == \
+               [field_names_list, weight_vec_dict]
+
+        # A changed index definition or setting makes the saved index invalid
+        #
+        index_args['index_def'] = [index_def1]
+        changed_index = indexing.BlockingIndex(**index_args)
+        assert changed_index.load(index_file_name) == False
+
+        index_args['index_def'] = [index_def1,index_def2]
+        index_args['intern_rec_idents'] = not intern_rec_idents
+        changed_index = indexing.BlockingIndex(**index_args)
+        assert changed_index.load(index_file_name) == False
+
+        changed_index = indexing.SortingIndex(window_size = 3, **index_args)
+        assert changed_index.load(index_file_name) == False
+
+    # Fingerprints only depend upon the settings of an index - - - - - - - - -
+    #
+    index_args = {'description':'Test index',
+                  'dataset1':self.dataset1,
+                  'dataset2':self.dataset2,
+                  'rec_comparator':self.rec_comp_link,
+                  'index_def':[index_def1,index_def2]}
+
+    fingerprint = indexing.BlockingIndex(**index_args). \
+                                               __get_index_fingerprint__()
+    assert indexing.BlockingIndex(**index_args). \
+                                  __get_index_fingerprint__() == fingerprint
+    assert indexing.BlockingIndex(rec_cache_storage = 'columnar',
+                                  **index_args). \
+                                  __get_index_fingerprint__() != fingerprint
+    assert indexing.BlockingIndex(max_block_size = 10, **index_args). \
+                                  __get_index_fingerprint__() != fingerprint
+
+    fingerprint = indexing.SortingIndex(window_size = 3, **index_args). \
+                                                  __get_index_fingerprint__()
+    assert indexing.SortingIndex(window_size = 4, **index_args). \
+                                  __get_index_fingerprint__() != fingerprint
+
+    fingerprint = indexing.BigMatchIndex(block_method = ('block',),
+                                         weight_vec_sink = Queue.Queue(),
+                                         **index_args). \
+                                         __get_index_fingerprint__()
+    assert indexing.BigMatchIndex(block_method = ('block',),
+                                  weight_vec_sink = Queue.Queue(),
+                                  **index_args). \
+                                  __get_index_fingerprint__() == fingerprint
+    assert indexing.BigMatchIndex(block_method = ('sort',3),
+                                  weight_vec_sink = Queue.Queue(),
+                                  **index_args). \
+                                  __get_index_fingerprint__() != fingerprint
+
+    # A changed data set makes the saved index invalid - - - - - - - - - - - -
+    #
+    data_file_name = 'test-data-copy.csv'
+    data_lines = open('./test-data.csv').readlines()
+    open(data_file_name, 'w').writelines(data_lines)
+
+    for changed_data_lines in [data_lines[:-1],
+                               data_lines[:-2]+[data_lines[-1]]]:
+      test_dataset = dataset.DataSetCSV(description='Test data set copy',
+                                        access_mode='read',
+                                        rec_ident='rec_id',
+                                        header_line=True,
+                                        file_name=data_file_name)
+      test_rec_comp = comparison.RecordComparator(test_dataset, test_dataset,
+                    [(comparison.FieldComparatorExactString(desc = 'Exact'),
+                      'surname', 'surname')])
+      index_args = {'description':'Test index',
+                    'dataset1':test_dataset,
+                    'dataset2':test_dataset,
+                    'rec_comparator':test_rec_comp,
+                    'index_def':[index_def1,index_def2]}
+
+      block_index = indexing.BlockingIndex(**index_args)
+      block_index.build()
+      block_index.compact()
+      block_index.save(index_file_name)
+
+      assert indexing.BlockingIndex(**index_args).load(index_file_name) == True
+
+      open(data_file_name, 'w').writelines(changed_data_lines)
+      os.utime(data_file_name, (0, 0))  # Make sure modification time changes
+
+      test_dataset = dataset.DataSetCSV(description='Test data set copy',
+                                        access_mode='read',
+                                        rec_ident='rec_id',
+                                        header_line=True,
+                                        file_name=data_file_name)
+      test_rec_comp = comparison.RecordComparator(test_dataset, test_dataset,
+                    [(comparison.FieldComparatorExactString(desc = 'Exact'),
+                      'surname', 'surname')])
+      index_args['dataset1'] = test_dataset
+      index_args['dataset2'] = test_dataset
+      index_args['rec_comparator'] = test_rec_comp
+
+      assert indexing.BlockingIndex(**index_args).load(index_file_name) == False
+
+    # Files that do not exist or are not index files - - - - - - - - - - - - -
+    #
+    os.remove(index_file_name)
+    block_index = indexing.BlockingIndex(**index_args)
+    assert block_index.load(index_file_name) == False
+
+    self.assertRaises(Exception, block_index.load, './test-data.csv')
+
+    full_index = indexing.FullIndex(**index_args)
+    full_index.build()
+    full_index.compact()
+
+    self.assertRaises(Exception, full_index.save, index_file_name)
+    assert not os.path.exists(index_file_name)
+
+    os.remove(data_file_name)
+
+  # ---------------------------------------------------------------------------
+
+  def testIndexValueCache(self):  # - - - - - - - - - - - - - - - - - - - - - -
+    """Test memo caches of index values"""
+
+    index_def1 = [['surname','surname',False,False,None,[encode.dmetaphone]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['suburb','suburb',False,False,3,[encode.dmetaphone, 4]],
+                  ['postcode','postcode',False,False,None,
+                   [encode.get_substring,0,2]]]
+
+    index_args = {'description':'Test index value cache',
+                  'dataset1':self.dataset1, 'dataset2':self.dataset2,
+                  'rec_comparator':self.rec_comp_link,
+                  'index_def':[index_def1,index_def2], 'index_sep_str':'_'}
+
+    no_cache_index = indexing.BlockingIndex(index_val_cache_size = 0,
+                                            **index_args)
+    assert no_cache_index.index_val_cache_list == None
+
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      index_val_cache_size = -1, **index_args)
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      index_val_cache_size = 'big', **index_args)
+
+    for cache_size in [100000, 5, 1]:
+      cache_index = indexing.BlockingIndex(index_val_cache_size = cache_size,
+                                           **index_args)
+      assert len(cache_index.index_val_cache_list) == 2
+      assert len(cache_index.index_val_cache_list[0]) == 1
+      assert len(cache_index.index_val_cache_list[1]) == 3
+
+      for rep in range(2):  # Second time all values must be in the cache
+        for (rec_ident, rec) in self.dataset1.readall():
+
+          for data_set_num in [0, 1]:
+            assert cache_index.__get_index_values__(rec, data_set_num) == \
+                   no_cache_index.__get_index_values__(rec, data_set_num)
+
+      for index_val_cache_list in cache_index.index_val_cache_list:
+        for index_val_cache in index_val_cache_list:
+          assert len(index_val_cache) <= cache_size
+
+      assert cache_index.index_val_cache_hits > 0
+      if (cache_size == 100000):
+        assert cache_index.index_val_cache_hits >= \
+               cache_index.index_val_cache_misses
+
+      cache_index.__log_index_val_cache_stats__()
+      assert cache_index.index_val_cache_hits == 0
+      assert cache_index.index_val_cache_misses == 0
+
+    # Built indices must be the same with and without caches
+    #
+    no_cache_index.build()
+    no_cache_index.compact()
+
+    cache_index = indexing.BlockingIndex(**index_args)
+    cache_index.build()
+    cache_index.compact()
+
+    for i in range(2):
+      assert cache_index.index1[i] == {}  # Cleared when compacted
+    assert cache_index.rec_pair_dict == no_cache_index.rec_pair_dict
+    assert cache_index.num_rec_pairs == no_cache_index.num_rec_pairs
+
   # ---------------------------------------------------------------------------
 
   def testSortingIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - -
@@ -888,6 +1824,221 @@ class TestCase(unittest.TestCase):
 
       prev_w_vec_dict = this_w_vec_dict
 
+  # ---------------------------------------------------------------------------
+
+  def testSortingIndexIncremental(self):  # - - - - - - - - - - - - - - - - - -
+    """Test adding and removing records to and from a sorting index"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    data_lines = open('./test-data.csv').readlines()
+    open('test-data-base.csv', 'w').writelines(data_lines[:15])
+    open('test-data-delta.csv', 'w').writelines(data_lines[:1]+data_lines[15:])
+    open('test-data-rest.csv', 'w').writelines(data_lines[:1]+data_lines[4:15])
+
+    delta_rec_ident_list = []
+    for data_line in data_lines[15:]:
+      delta_rec_ident_list.append(data_line.split(',')[0])
+
+    rest_rec_ident_list = []  # Base records that are removed second
+    for data_line in data_lines[1:4]:
+      rest_rec_ident_list.append(data_line.split(',')[0])
+
+    ds_dict = {}
+    for ds_name in ['base', 'delta', 'rest']:
+      ds_dict[ds_name] = dataset.DataSetCSV(description='Test data set',
+                                            access_mode='read',
+                                            rec_ident='rec_id',
+                                            header_line=True,
+                                     file_name='test-data-%s.csv' % (ds_name))
+
+    field_comp_list = []
+    for (field_comp, field_name1, field_name2) in \
+        self.rec_comp_link.field_comparator_list:
+      field_comp_list.append((field_comp, field_name1, field_name2))
+
+    # Translate weight vector keys into sorted record identifier pairs
+    #
+    def get_rec_id_w_vec_dict(index, w_vec_dict):
+      rec_ident_lists = index.get_rec_ident_lists()
+      rec_id_w_vec_dict = {}
+      for ((rec_id1, rec_id2), w_vec) in w_vec_dict.items():
+        if (rec_ident_lists != None):
+          rec_id1 = rec_ident_lists[0][rec_id1]
+          rec_id2 = rec_ident_lists[1][rec_id2]
+        if ((index.do_deduplication == True) and (rec_id1 > rec_id2)):
+          (rec_id1, rec_id2) = (rec_id2, rec_id1)
+        rec_id_w_vec_dict[(rec_id1, rec_id2)] = w_vec
+      return rec_id_w_vec_dict
+
+    # Build a sorting index on the given data sets and return it (compacted)
+    # together with its weight vectors
+    #
+    def get_sort_index(dataset1, dataset2, window_size, intern_rec_idents,
+                       incremental):
+      rec_comp = comparison.RecordComparator(dataset1, dataset2,
+                                             field_comp_list)
+      sort_index = indexing.SortingIndex(description = 'Test index',
+                                         dataset1 = dataset1,
+                                         dataset2 = dataset2,
+                                         rec_comparator = rec_comp,
+                                         window_size = window_size,
+                                         intern_rec_idents = intern_rec_idents,
+                                         incremental = incremental,
+                                         index_def = [index_def1,index_def2])
+      sort_index.build()
+      sort_index.compact()
+      [field_names_list, w_vec_dict] = sort_index.run()
+      return (sort_index, get_rec_id_w_vec_dict(sort_index, w_vec_dict))
+
+    # Test cases: (data set 1 and 2 of incremental index, number of the data
+    # set the records are added to, data sets 1 and 2 of the full index, data
+    # sets 1 and 2 of the index without the removed base records)
+    #
+    base_ds = ds_dict['base']
+    rest_ds = ds_dict['rest']
+
+    for (dataset1, dataset2, data_set_num, full_dataset1, full_dataset2,
+         rest_dataset1, rest_dataset2) in \
+      [(base_ds, base_ds, 1, self.dataset1, self.dataset1, rest_ds, rest_ds),
+       (base_ds, self.dataset2, 1, self.dataset1, self.dataset2, rest_ds,
+        self.dataset2),
+       (self.dataset1, base_ds, 2, self.dataset1, self.dataset2,
+        self.dataset1, rest_ds)]:
+
+      for window_size in [1, 2, 3]:
+        for intern_rec_idents in [False, True]:
+
+          (incr_index, base_w_vec_dict) = get_sort_index(dataset1, dataset2,
+                                          window_size, intern_rec_idents, True)
+          base_num_rec_pairs = incr_index.num_rec_pairs
+
+          assert incr_index.index1[0] != {}  # Blocks must be kept
+
+          (full_index, full_w_vec_dict) = get_sort_index(full_dataset1,
+                                                         full_dataset2,
+                                                         window_size,
+                                                         intern_rec_idents,
+                                                         False)
+
+          [field_names_list, new_w_vec_dict] = \
+                        incr_index.add_records(ds_dict['delta'], data_set_num)
+          new_w_vec_dict = get_rec_id_w_vec_dict(incr_index, new_w_vec_dict)
+
+          # Only record pairs that were not in the index must be compared
+          #
+          for rec_id_pair in new_w_vec_dict:
+            assert rec_id_pair not in base_w_vec_dict
+            assert new_w_vec_dict[rec_id_pair] == \
+                   full_w_vec_dict[rec_id_pair]
+          for rec_id_pair in full_w_vec_dict:
+            assert (rec_id_pair in base_w_vec_dict) or \
+                   (rec_id_pair in new_w_vec_dict)
+
+          assert incr_index.num_rec_pairs == full_index.num_rec_pairs
+          [field_names_list, all_w_vec_dict] = incr_index.run()
+          assert get_rec_id_w_vec_dict(incr_index, all_w_vec_dict) == \
+                 full_w_vec_dict
+
+          self.assertRaises(Exception, incr_index.add_records,
+                            ds_dict['delta'], data_set_num)
+
+          # Removing the added records must give the original record pairs
+          #
+          incr_index.remove_records(delta_rec_ident_list, data_set_num)
+          assert incr_index.num_rec_pairs == base_num_rec_pairs
+          [field_names_list, all_w_vec_dict] = incr_index.run()
+          assert get_rec_id_w_vec_dict(incr_index, all_w_vec_dict) == \
+                 base_w_vec_dict
+
+          # Removing base records must give the same record pairs as an index
+          # built without them
+          #
+          (rest_index, rest_w_vec_dict) = get_sort_index(rest_dataset1,
+                                                         rest_dataset2,
+                                                         window_size,
+                                                         intern_rec_idents,
+                                                         False)
+
+          incr_index.remove_records(rest_rec_ident_list, data_set_num)
+          assert incr_index.num_rec_pairs == rest_index.num_rec_pairs
+          [field_names_list, all_w_vec_dict] = incr_index.run()
+          assert get_rec_id_w_vec_dict(incr_index, all_w_vec_dict) == \
+                 rest_w_vec_dict
+
+          self.assertRaises(Exception, incr_index.remove_records,
+                            rest_rec_ident_list[:1], data_set_num)
+
+    self.assertRaises(Exception, indexing.SortingIndex,
+                      description = 'Test index', dataset1 = base_ds,
+                      dataset2 = base_ds, rec_comparator = self.rec_comp_dedupl,
+                      window_size = 2, index_def = [index_def1,index_def2],
+                      incremental = True, stream_rec_pairs = True)
+
+    for ds_name in ['base', 'delta', 'rest']:
+      ds_dict[ds_name].finalise()
+      os.remove('test-data-%s.csv' % (ds_name))
+
+  # ---------------------------------------------------------------------------
+
+  def testSortingIndexWindow(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test SortingIndex sliding window against all window positions"""
+
+    index_def1 = [['surname','surname',False,False,1,[]]]
+    index_def2 = [['given_name','given_name',False,False,1,[]]]
+
+    for window_size in [1, 2, 3, 5]:
+
+      sort_index = indexing.SortingIndex(description = 'Test sorting index',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = self.dataset1,
+                                         rec_comparator = self.rec_comp_dedupl,
+                                         index_def = [index_def1,index_def2],
+                                         window_size = window_size)
+      sort_index.build()
+
+      # Get all record pairs from the blocks in all window positions
+      #
+      test_pair_set = set()
+
+      for i in range(2):
+        block_val_list = sorted(sort_index.index1[i].keys())
+
+        for j in range(len(block_val_list)):
+          window_recs = set()
+          for block_val in block_val_list[max(0,j-window_size+1):j+1]:
+            window_recs.update(sort_index.index1[i][block_val])
+
+          for rec_ident1 in window_recs:
+            for rec_ident2 in window_recs:
+              if (rec_ident1 < rec_ident2):
+                test_pair_set.add((rec_ident1, rec_ident2))
+
+      # Test the queue and counts used to move the window
+      #
+      window_blocks = indexing.collections.deque()
+      window_rec_count = {}
+
+      for block_val in block_val_list:
+        new_recs = sort_index.__slide_window__(window_blocks, window_rec_count,
+                                               sort_index.index1[1][block_val])
+        assert len(window_blocks) <= window_size
+        assert new_recs == list(sort_index.index1[1][block_val])
+        assert sum(window_rec_count.values()) == \
+               sum([len(block) for block in window_blocks])
+
+      sort_index.compact()
+
+      rec_pair_set = set()
+      for (rec_ident1, rec_ident2_set) in sort_index.rec_pair_dict.items():
+        for rec_ident2 in rec_ident2_set:
+          rec_pair_set.add((rec_ident1, rec_ident2))
+
+      assert rec_pair_set == test_pair_set
+      assert sort_index.num_rec_pairs == len(test_pair_set)
+
   def testSortingIndexDedupl(self):  # - - - - - - - - - - - - - - - - - - - -
     """Test SortingIndex deduplication"""
 
@@ -2248,6 +3399,200 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testQGramIndexPrefix(self):  # - - - - - - - - - - - - - - - - - - - - -
+    """Test QGramIndex with prefix and count filtering"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['address_1','address_1',False,False,None,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+      do_dedup = (dataset2 == self.dataset1)
+
+      for t in [0.9, 0.8, 0.5]:
+        for (q, padded) in [(2, True), (3, False)]:
+
+          prefix_index = indexing.QGramIndex(description = 'Test Q-Gram index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = dataset2,
+                                             rec_comparator = rec_comp,
+                                             padded = padded,
+                                             q = q,
+                                             threshold = t,
+                                             qgram_method = 'prefix',
+                                             index_def = [index_def1,
+                                                          index_def2])
+          assert prefix_index.qgram_method == 'prefix'
+
+          prefix_index.build()
+
+          # Compare the pairs of index values found with all pairs of values
+          # that have enough q-grams in common
+          #
+          for i in range(2):
+            index_vals1 = prefix_index.index1[i].keys()
+            if (do_dedup == True):
+              index_vals2 = index_vals1
+            else:
+              index_vals2 = prefix_index.index2[i].keys()
+
+            val_pair_set = set()
+
+            for index_val1 in index_vals1:
+              token_set1 = set(prefix_index.__get_qgram_tokens__(index_val1))
+              min_common1 = max(1, int(len(token_set1)*t))
+
+              for index_val2 in index_vals2:
+                if ((do_dedup == True) and (index_val1 >= index_val2)):
+                  continue
+                token_set2 = set(prefix_index.__get_qgram_tokens__(index_val2))
+                min_common2 = max(1, int(len(token_set2)*t))
+
+                if (len(token_set1 & token_set2) >= max(min_common1,
+                                                        min_common2)):
+                  val_pair_set.add((index_val1, index_val2))
+
+            prefix_val_pair_set = set()
+            for qgram_val in prefix_index.qgram_index1[i]:
+              if (isinstance(qgram_val, tuple)):
+                if (do_dedup == True):
+                  prefix_val_pair_set.add(tuple(sorted(qgram_val)))
+                else:
+                  prefix_val_pair_set.add(qgram_val)
+
+            assert prefix_val_pair_set == val_pair_set, (t, q, i)
+
+          prefix_index.compact()
+
+          # All record pairs of the sub-list method must be included
+          #
+          if (t >= 0.8):
+            sublist_index = indexing.QGramIndex(description = 'Test index',
+                                                dataset1 = self.dataset1,
+                                                dataset2 = dataset2,
+                                                rec_comparator = rec_comp,
+                                                padded = padded,
+                                                q = q,
+                                                threshold = t,
+                                                index_def = [index_def1])
+            sublist_index.build()
+            sublist_index.compact()
+
+            for (rec_ident1, rec_ident2_set) in \
+                sublist_index.rec_pair_dict.items():
+              assert rec_ident2_set.issubset( \
+                       prefix_index.rec_pair_dict.get(rec_ident1, set()))
+
+    self.assertRaises(Exception, indexing.QGramIndex, threshold = 0.8,
+                      qgram_method = 'subset', description = 'Test index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+
+  # ---------------------------------------------------------------------------
+
+  def testMinHashLSHIndex(self):  # - - - - - - - - - - - - - - - - - - - - - -
+    """Test MinHashLSHIndex"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['address_1','address_1',False,False,None,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      for (num_bands, band_size, q, padded) in [(20, 4, 2, True),
+                                                (10, 2, 3, False),
+                                                (1, 1, 1, True)]:
+
+        lsh_index = indexing.MinHashLSHIndex(description = 'Test LSH index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = dataset2,
+                                             rec_comparator = rec_comp,
+                                             num_bands = num_bands,
+                                             band_size = band_size,
+                                             q = q,
+                                             padded = padded,
+                                             index_def = [index_def1,
+                                                          index_def2])
+        assert lsh_index.num_bands == num_bands
+        assert lsh_index.band_size == band_size
+
+        lsh_index.build()
+
+        # Signatures must be the minimum hash values over the q-grams
+        #
+        index_val_list = lsh_index.index1[0].keys()
+        signatures = lsh_index.__get_signatures__(index_val_list)
+        assert signatures.shape == (len(index_val_list), num_bands*band_size)
+
+        for j in range(len(index_val_list)):
+          qgram_hash_set = lsh_index.__get_qgram_hash_set__(index_val_list[j])
+          for k in range(num_bands*band_size):
+            min_hash = min([(x*long(lsh_index.hash_a[k]) + \
+                             long(lsh_index.hash_b[k])) % lsh_index.HASH_PRIME \
+                            for x in qgram_hash_set])
+            assert long(signatures[j,k]) == min_hash
+
+        # Each index value must be in one block per band
+        #
+        for i in range(2):
+          num_vals = sum([len(val_set) for val_set in \
+                          lsh_index.lsh_index1[i].itervalues()])
+          assert num_vals == num_bands*len(lsh_index.index1[i])
+
+        lsh_index.compact()
+        assert lsh_index.num_rec_pairs > 0
+
+        # All record pairs with the same index values must be included
+        #
+        block_index = indexing.BlockingIndex(description = 'Test index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = dataset2,
+                                             rec_comparator = rec_comp,
+                                             index_def = [index_def1,
+                                                          index_def2])
+        block_index.build()
+        block_index.compact()
+        assert lsh_index.num_rec_pairs >= block_index.num_rec_pairs
+
+        for (rec_ident1, rec_ident2_set) in block_index.rec_pair_dict.items():
+          assert set(rec_ident2_set).issubset( \
+                   set(lsh_index.rec_pair_dict.get(rec_ident1, [])))
+
+      # The same random seed must result in the same record pairs
+      #
+      for seed in [1, 2]:
+        lsh_index2 = indexing.MinHashLSHIndex(description = 'Test LSH index',
+                                              dataset1 = self.dataset1,
+                                              dataset2 = dataset2,
+                                              rec_comparator = rec_comp,
+                                              random_seed = seed,
+                                              index_def = [index_def1])
+        lsh_index2.build()
+        lsh_index2.compact()
+        lsh_index3 = indexing.MinHashLSHIndex(description = 'Test LSH index',
+                                              dataset1 = self.dataset1,
+                                              dataset2 = dataset2,
+                                              rec_comparator = rec_comp,
+                                              random_seed = seed,
+                                              index_def = [index_def1])
+        lsh_index3.build()
+        lsh_index3.compact()
+        assert lsh_index2.rec_pair_dict == lsh_index3.rec_pair_dict
+
+    self.assertRaises(Exception, indexing.MinHashLSHIndex, num_bands = 0,
+                      description = 'Test LSH index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+    self.assertRaises(Exception, indexing.MinHashLSHIndex, band_size = 2.5,
+                      description = 'Test LSH index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+
+  # ---------------------------------------------------------------------------
+
   def testCanopyIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - -
     """Test CanopyIndex linkage"""
 
@@ -2786,6 +4131,81 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testCanopyIndexVectorised(self):  # - - - - - - - - - - - - - - - - - -
+    """Test CanopyIndex with vectorised canopy clustering"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['address_1','address_1',False,False,None,[]]]
+
+    for canopy_method in [('tfidf',   'threshold', 0.9, 0.8),
+                          ('tfidf',   'threshold', 0.8, 0.5),
+                          ('jaccard', 'threshold', 0.8, 0.6),
+                          ('tfidf',   'nearest',   2, 4),
+                          ('jaccard', 'nearest',   2, 4)]:
+
+      for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                   (self.dataset1, self.rec_comp_dedupl)]:
+
+        vec_index = indexing.CanopyIndex(description = 'Test canopy index',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = dataset2,
+                                         rec_comparator = rec_comp,
+                                         canopy_method = canopy_method,
+                                         vectorised = True,
+                                         index_def = [index_def1,index_def2])
+        assert vec_index.vectorised == True
+
+        dict_index = indexing.CanopyIndex(description = 'Test canopy index',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = dataset2,
+                                          rec_comparator = rec_comp,
+                                          canopy_method = canopy_method,
+                                          index_def = [index_def1,index_def2])
+        vec_index.build()
+        dict_index.build()
+
+        # Each canopy must be the same as the one extracted from the inverted
+        # index for the same center
+        #
+        for i in range(2):
+          index_val_cache = dict_index.index_val_cache[i]
+
+          for (center_val, canopy_recs) in vec_index.__vectorised_canopies__(i):
+            assert center_val == min(index_val_cache.values())
+
+            if (canopy_method[0] == 'tfidf'):
+              dict_canopy_recs = dict_index.__tfidf_canopy__(
+                                   dict_index.index1[i], center_val,
+                                   index_val_cache,
+                                   dict_index.qgram_inv_doc_freq_cache[i],
+                                   dict_index.max_qgram_count[i])
+            else:
+              dict_canopy_recs = dict_index.__jaccard_canopy__(
+                                   dict_index.index1[i], center_val,
+                                   index_val_cache,
+                                   dict_index.index_val_num_qgram[i])
+
+            assert sorted(canopy_recs) == sorted(dict_canopy_recs), \
+                   (canopy_method, center_val)
+
+            assert sorted(vec_index.index_val_cache[i]) == \
+                   sorted(index_val_cache)
+
+          assert vec_index.index_val_cache[i] == {}
+
+        vec_index.build()
+        vec_index.compact()
+        assert vec_index.num_rec_pairs > 0
+
+    self.assertRaises(Exception, indexing.CanopyIndex, vectorised = 'yes',
+                      canopy_method = ('jaccard', 'threshold', 0.8, 0.6),
+                      description = 'Test canopy index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+
+  # ---------------------------------------------------------------------------
+
   def testStringMapIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - -
     """Test StringMapIndex linkage"""
 
@@ -3318,6 +4738,93 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testStringMapIndexTree(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test StringMapIndex with a k-d tree and a bounded distance cache"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',False,False,None,[]]]
+
+    for canopy_method in [('threshold', 0.9, 0.8), ('nearest', 2, 4)]:
+
+      for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                   (self.dataset1, self.rec_comp_dedupl)]:
+
+        strmap_args = {'description':'Test str-map index',
+                       'dataset1':self.dataset1, 'dataset2':dataset2,
+                       'rec_comparator':rec_comp,
+                       'canopy_method':canopy_method, 'dim':5, 'sub_dim':1,
+                       'sim_funct':stringcmp.jaro,
+                       'index_def':[index_def1,index_def2]}
+
+        grid_index = indexing.StringMapIndex(grid_resolution = 100,
+                                             **strmap_args)
+        grid_index.build()
+
+        # Coordinates must not depend on the caching of distances
+        #
+        for cache_args in [{'cache_dist':False}, {'dist_cache_size':50}]:
+          cache_index = indexing.StringMapIndex(grid_resolution = 100,
+                                                **dict(strmap_args,
+                                                       **cache_args))
+          cache_index.build()
+          assert cache_index.coord == grid_index.coord
+
+        tree_index = indexing.StringMapIndex(search_method = 'tree',
+                                             **strmap_args)
+        assert tree_index.search_method == 'tree'
+        assert tree_index.grid_resolution == None
+
+        tree_index.build()
+        assert tree_index.coord == grid_index.coord
+
+        # The tree search must return all strings ordered by their distances
+        #
+        for i in range(2):
+          string_list = tree_index.string_list[i]
+          coord_list = [tree_index.coord[i][str_val] for str_val in \
+                        string_list]
+          (tree_root, leaf_node_list) = tree_index.tree_index[i]
+          active = [True]*len(string_list)
+
+          for center_ind in range(len(string_list)):
+            prev_dist = -1.0
+            search_ind_list = []
+
+            for (dist, ind_list) in tree_index.__tree_search__(tree_root,
+                                      coord_list, center_ind, active):
+              assert dist > prev_dist
+              prev_dist = dist
+
+              for ind in ind_list:
+                dim_diff_sum = 0.0
+                for h in range(5):
+                  dim_diff = coord_list[ind][h] - coord_list[center_ind][h]
+                  dim_diff_sum += dim_diff*dim_diff
+
+                if (ind == center_ind):
+                  assert dist == 0.0
+                else:
+                  assert abs(max(math.sqrt(dim_diff_sum), 0.0001) - dist) < \
+                         0.000001
+
+              search_ind_list += ind_list
+
+            assert sorted(search_ind_list) == range(len(string_list))
+
+        tree_index.compact()
+        assert tree_index.num_rec_pairs > 0
+
+        for i in range(2):  # All strings have been put into canopies
+          assert tree_index.coord[i] == {}
+
+    self.assertRaises(Exception, indexing.StringMapIndex,
+                      search_method = 'kdtree', **strmap_args)
+    self.assertRaises(Exception, indexing.StringMapIndex,
+                      dist_cache_size = 0, search_method = 'tree',
+                      **strmap_args)
+
+  # ---------------------------------------------------------------------------
+
   def testBigMatchIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - -
     """Test BigMatchIndex linkage"""
 
@@ -3560,6 +5067,113 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testBigMatchIndexStreaming(self):  # - - - - - - - - - - - - - - - - - -
+    """Test BigMatchIndex with chunks, weight vector sinks and workers"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    rec_comp = self.rec_comp_link  # Shorthand
+
+    for block_method in [('block',), ('sort',3), ('qgram',2,True,0.8)]:
+
+      bigmatch_index = indexing.BigMatchIndex(description = 'Test index',
+                                              dataset1 = self.dataset1,
+                                              dataset2 = self.dataset2,
+                                              rec_comparator = rec_comp,
+                                              block_method = block_method,
+                                              index_def = [index_def1,
+                                                           index_def2])
+      assert bigmatch_index.chunk_size == 10000
+      assert bigmatch_index.weight_vec_sink == None
+
+      bigmatch_index.build()
+      bigmatch_index.compact()
+      [field_names_list, weight_vec_dict] = bigmatch_index.run()
+      num_rec_pairs = bigmatch_index.num_rec_pairs
+
+      assert len(weight_vec_dict) > 0
+
+      # Small chunks and sinks must result in the same weight vectors
+      #
+      for (chunk_size, num_workers) in [(1, None), (7, None), (5, 2)]:
+
+        w_vec_list = []  # Weight vectors given to a function
+
+        def add_w_vecs(chunk_w_vec_list):
+          w_vec_list.extend(chunk_w_vec_list)
+
+        bigmatch_index = indexing.BigMatchIndex(description = 'Test index',
+                                                dataset1 = self.dataset1,
+                                                dataset2 = self.dataset2,
+                                                rec_comparator = rec_comp,
+                                                block_method = block_method,
+                                                chunk_size = chunk_size,
+                                                weight_vec_sink = add_w_vecs,
+                                                index_def = [index_def1,
+                                                             index_def2])
+        assert bigmatch_index.chunk_size == chunk_size
+
+        bigmatch_index.build()
+        bigmatch_index.compact()
+        assert bigmatch_index.run(num_workers = num_workers) == None
+        assert bigmatch_index.num_rec_pairs == num_rec_pairs
+
+        assert len(w_vec_list) == len(weight_vec_dict)
+        for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+          assert weight_vec_dict[(rec_ident1, rec_ident2)] == w_vec
+
+        w_vec_queue = Queue.Queue()  # Weight vectors put into a queue
+
+        bigmatch_index = indexing.BigMatchIndex(description = 'Test index',
+                                                dataset1 = self.dataset1,
+                                                dataset2 = self.dataset2,
+                                                rec_comparator = rec_comp,
+                                                block_method = block_method,
+                                                chunk_size = chunk_size,
+                                                weight_vec_sink = w_vec_queue,
+                                                index_def = [index_def1,
+                                                             index_def2])
+        bigmatch_index.build()
+        bigmatch_index.compact()
+        bigmatch_index.run(num_workers = num_workers)
+
+        queue_weight_vec_dict = {}
+        num_chunks = 0
+
+        w_vec_list = w_vec_queue.get()
+        while (w_vec_list != None):
+          for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+            queue_weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+          num_chunks += 1
+          w_vec_list = w_vec_queue.get()
+
+        assert queue_weight_vec_dict == weight_vec_dict
+        assert num_chunks == int(math.ceil(float(len(self.rec_ident2)) / \
+                                           chunk_size))
+
+    self.assertRaises(Exception, indexing.BigMatchIndex, chunk_size = 0,
+                      block_method = ('block',), description = 'Test index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+    self.assertRaises(Exception, indexing.BigMatchIndex,
+                      weight_vec_sink = 'file.csv',
+                      block_method = ('block',), description = 'Test index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+    self.assertRaises(Exception, indexing.BigMatchIndex,
+                      weight_vec_sink = Queue.Queue(),
+                      weight_vec_file = 'bigmatch-w-vecs.csv',
+                      block_method = ('block',), description = 'Test index',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+
+  # ---------------------------------------------------------------------------
+
   def testDedupIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - - -
     """Test DedupIndex deduplication"""
 
@@ -4275,6 +5889,125 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testSuffixArrayIndexArray(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test suffix array indices built with the 'array' build method"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['address_1','address_1',False,False,None,[]]]
+
+    # Check suffix array and LCP array against sorted suffix strings
+    #
+    sarray_index = indexing.SuffixArrayIndex(description = 'Test index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = self.dataset2,
+                                             rec_comparator = self.rec_comp_link,
+                                             block_method = (3, 10),
+                                             suffix_method = 'suffixonly',
+                                             build_method = 'array',
+                                             index_def = [index_def1])
+    assert sarray_index.build_method == 'array'
+
+    index_val_list = ['peter', 'pete', 'eter', 'anna', 'nana', 'a', 'peter']
+
+    (suffix_buf, suffix_array, lcp_array, val_num_array, val_end_list) = \
+      suffix_array_data = sarray_index.__build_suffix_array__(index_val_list)
+
+    suffix_str_list = []
+    for val_num in range(len(index_val_list)):
+      index_val = index_val_list[val_num]
+      for s in range(len(index_val)):
+        suffix_str_list.append(index_val[s:])
+    suffix_str_list.sort()
+
+    assert len(suffix_array) == len(suffix_str_list)
+
+    for p in range(len(suffix_array)):
+      suffix_str = sarray_index.__get_suffix_str__(suffix_array_data, (p, p))
+      assert suffix_str == suffix_str_list[p]
+      assert index_val_list[val_num_array[p]].endswith(suffix_str)
+
+      if (p > 0):
+        prev_suffix_str = suffix_str_list[p-1]
+        lcp = 0
+        while ((lcp < min(len(suffix_str), len(prev_suffix_str))) and \
+               (suffix_str[lcp] == prev_suffix_str[lcp])):
+          lcp += 1
+        assert lcp_array[p] == lcp
+
+    # Each run contains equal suffixes, each LCP interval all suffixes with
+    # the same prefix of at least the minimum length
+    #
+    for (lb, rb) in sarray_index.__suffix_array_runs__(suffix_array_data):
+      assert len(set(suffix_str_list[lb:rb+1])) == 1
+      assert (rb+1 == len(suffix_str_list)) or \
+             (suffix_str_list[rb+1] != suffix_str_list[lb])
+
+    for (lb, rb) in sarray_index.__suffix_array_intervals__(suffix_array_data,
+                                                            2):
+      prefix_str = os.path.commonprefix(suffix_str_list[lb:rb+1])
+      assert len(prefix_str) >= 2
+      assert [p for p in range(len(suffix_str_list)) if \
+              suffix_str_list[p].startswith(prefix_str)] == range(lb, rb+1)
+
+    # Record pairs must be the same as with the 'dict' build method
+    #
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+      for suffix_method in ['suffixonly', 'allsubstr']:
+        for block_method in [(3, 10), (5, 5), (2, 20)]:
+          for padded in [True, False]:
+
+            rec_pair_dict_list = []
+
+            for build_method in ['dict', 'array']:
+              sarray_index = indexing.SuffixArrayIndex(description = 'Test',
+                                                  dataset1 = self.dataset1,
+                                                  dataset2 = dataset2,
+                                                  rec_comparator = rec_comp,
+                                                  block_method = block_method,
+                                                  suffix_method = suffix_method,
+                                                  padded = padded,
+                                                  build_method = build_method,
+                                                  index_def = [index_def1,
+                                                               index_def2])
+              sarray_index.build()
+              sarray_index.compact()
+              rec_pair_dict_list.append(sarray_index.rec_pair_dict)
+
+            assert rec_pair_dict_list[0] == rec_pair_dict_list[1], \
+                   (suffix_method, block_method, padded)
+
+      for block_method in [(3, 10), (2, 20)]:
+
+        rec_pair_dict_list = []
+
+        for build_method in ['dict', 'array']:
+          rsarray_index = indexing.RobustSuffixArrayIndex(description='Test',
+                                                dataset1 = self.dataset1,
+                                                dataset2 = dataset2,
+                                                rec_comparator = rec_comp,
+                                                block_method = block_method,
+                                                str_cmp_funct = \
+                                                  stringcmp.editdist,
+                                                str_cmp_thres = 0.8,
+                                                build_method = build_method,
+                                                index_def = [index_def1,
+                                                             index_def2])
+          rsarray_index.build()
+          rsarray_index.compact()
+          rec_pair_dict_list.append(rsarray_index.rec_pair_dict)
+
+        assert rec_pair_dict_list[0] == rec_pair_dict_list[1], block_method
+
+    self.assertRaises(Exception, indexing.SuffixArrayIndex,
+                      build_method = 'tree', block_method = (3, 10),
+                      suffix_method = 'suffixonly', description = 'Test',
+                      dataset1 = self.dataset1, dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      index_def = [index_def1])
+
+  # ---------------------------------------------------------------------------
+
   def testRobustSuffixArrayIndexLinkage(self):  # - - - - - - - - - - - - - - -
     """Test RobustSuffixArrayIndex linkage"""
 
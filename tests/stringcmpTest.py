@@ -49,8 +49,14 @@
 # =============================================================================
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
+import distutils.ccompiler
+import distutils.sysconfig
+import imp
 import logging
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 sys.path.append('..')
 
@@ -60,6 +66,44 @@ log_level = logging.WARNING  # logging.INFO
 
 # =============================================================================
 
+def load_stringcmpext():
+  """Return True if the compiled stringcmpext module is available to the
+     stringcmp module. If it has not been compiled (see INSTALL.txt) it is
+     built from stringcmpext.c into a temporary directory, so the compiled
+     comparators can be compared with the pure Python versions. Returns False
+     if the module cannot be built (for example if there is no C compiler).
+  """
+
+  if (hasattr(stringcmp, 'stringcmpext') == True):
+    return True
+
+  src_file_name = os.path.join(os.path.dirname(os.path.abspath(
+                               stringcmp.__file__)), 'stringcmpext.c')
+  build_dir = tempfile.mkdtemp()
+
+  try:
+    compiler = distutils.ccompiler.new_compiler()
+    distutils.sysconfig.customize_compiler(compiler)
+
+    obj_file_list = compiler.compile([src_file_name], output_dir=build_dir,
+                        include_dirs=[distutils.sysconfig.get_python_inc()])
+    ext_file_name = os.path.join(build_dir, 'stringcmpext' + \
+                                 distutils.sysconfig.get_config_var('SO'))
+    compiler.link_shared_object(obj_file_list, ext_file_name)
+
+    stringcmp.stringcmpext = imp.load_dynamic('stringcmpext', ext_file_name)
+
+  except Exception, exc:
+    logging.warning('Cannot build module "stringcmpext": %s' % (str(exc)))
+    return False
+
+  finally:
+    shutil.rmtree(build_dir, True)
+
+  return True
+
+# =============================================================================
+
 class TestCase(unittest.TestCase):
 
   # Initialise test case  - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -280,6 +324,170 @@ class TestCase(unittest.TestCase):
                str(pair)
 
 
+  def testEditDistBackend(self):   # - - - - - - - - - - - - - - - - - - - - -
+    """Test compiled 'EditDist' comparator against pure Python version"""
+
+    if (load_stringcmpext() == False):
+      self.skipTest('Module "stringcmpext" not available')
+
+    imp_stringcmpext = stringcmp.imp_stringcmpext
+
+    test_pairs = self.string_pairs + [['gail',        'gale'       ],
+                                      ['abcdefgh',    'hgfedcba'   ],
+                                      ['abcdefghij',  'xyzdefghij' ],
+                                      ['peter',       'peterchrist'],
+                                      ['christen',    'xxxxchriste'],
+                                      ['a',           'b'          ],
+                                      ['ab',          'ba'         ],
+                                      [70*'ab',       69*'ba'      ],
+                                      ['',            'peter'      ]]
+
+    for pair in test_pairs:
+      for min_threshold in [None, 0.1, 0.25, 0.3, 0.5, 0.6, 0.75, 0.8, 0.9]:
+
+        stringcmp.imp_stringcmpext = True
+        approx_str_value_1 = stringcmp.editdist(pair[0],pair[1],min_threshold)
+        approx_str_value_2 = stringcmp.editdist(pair[1],pair[0],min_threshold)
+
+        stringcmp.imp_stringcmpext = False
+        approx_str_value_3 = stringcmp.editdist(pair[0],pair[1],min_threshold)
+        approx_str_value_4 = stringcmp.editdist(pair[1],pair[0],min_threshold)
+
+        stringcmp.imp_stringcmpext = imp_stringcmpext
+
+        assert (approx_str_value_1 == approx_str_value_3), \
+               '"EditDist" returns different values for compiled and ' + \
+               'Python version: '+str(pair)+' (threshold %s): ' % \
+               (str(min_threshold))+str(approx_str_value_1)+', '+ \
+               str(approx_str_value_3)
+
+        assert (approx_str_value_2 == approx_str_value_4), \
+               '"EditDist" returns different values for compiled and ' + \
+               'Python version: '+str(pair)+' (threshold %s): ' % \
+               (str(min_threshold))+str(approx_str_value_2)+', '+ \
+               str(approx_str_value_4)
+
+  def testCompiledBackend(self):   # - - - - - - - - - - - - - - - - - - - - -
+    """Test comparators using compiled inner loops against pure Python
+       versions"""
+
+    if (load_stringcmpext() == False):
+      self.skipTest('Module "stringcmpext" not available')
+
+    imp_stringcmpext = stringcmp.imp_stringcmpext
+
+    test_pairs = self.string_pairs + [['gail',        'gale'       ],
+                                      ['abcdefgh',    'hgfedcba'   ],
+                                      ['abcdefghij',  'xyzdefghij' ],
+                                      ['peter',       'peterchrist'],
+                                      ['christen',    'xxxxchriste'],
+                                      ['prap',        'papr'       ],
+                                      ['aaaa',        'aa'         ],
+                                      ['a',           'b'          ],
+                                      ['ab',          'ba'         ],
+                                      ['a'+chr(1),    chr(1)+'a'   ],
+                                      ['peter',       ''           ],
+                                      ['',            'peter'      ]]
+
+    comp_funct_list = [('Jaro',        stringcmp.jaro,        {}),
+                       ('Winkler',     stringcmp.winkler,     {}),
+                       ('SortWinkler', stringcmp.sortwinkler, {}),
+                       ('SWDist',      stringcmp.swdist,      {}),
+                       ('Editex',      stringcmp.editex,      {})]
+
+    for common_divisor in ['average', 'shortest', 'longest']:
+      for q in [1, 2, 3]:
+        for padded in [True, False]:
+          comp_funct_list.append(('QGram', stringcmp.qgram,
+                                  {'q':q, 'padded':padded,
+                                   'common_divisor':common_divisor}))
+      for min_common_len in [1, 2, 3]:
+        comp_funct_list.append(('LCS', stringcmp.lcs,
+                                {'min_common_len':min_common_len,
+                                 'common_divisor':common_divisor}))
+        comp_funct_list.append(('OntoLCS', stringcmp.ontolcs,
+                                {'min_common_len':min_common_len,
+                                 'common_divisor':common_divisor}))
+      comp_funct_list.append(('SWDist', stringcmp.swdist,
+                              {'common_divisor':common_divisor}))
+
+    for (comp_name, comp_funct, comp_args) in comp_funct_list:
+      for pair in test_pairs:
+        for min_threshold in [None, 0.25, 0.5, 0.75, 0.9]:
+
+          comp_args['min_threshold'] = min_threshold
+
+          stringcmp.imp_stringcmpext = True
+          approx_str_value_1 = comp_funct(pair[0], pair[1], **comp_args)
+          approx_str_value_2 = comp_funct(pair[1], pair[0], **comp_args)
+
+          stringcmp.imp_stringcmpext = False
+          approx_str_value_3 = comp_funct(pair[0], pair[1], **comp_args)
+          approx_str_value_4 = comp_funct(pair[1], pair[0], **comp_args)
+
+          stringcmp.imp_stringcmpext = imp_stringcmpext
+
+          assert (approx_str_value_1 == approx_str_value_3), \
+                 '"%s" returns different values for compiled and ' % \
+                 (comp_name) + 'Python version: '+str(pair)+' (%s): ' % \
+                 (str(comp_args))+str(approx_str_value_1)+', '+ \
+                 str(approx_str_value_3)
+
+          assert (approx_str_value_2 == approx_str_value_4), \
+                 '"%s" returns different values for compiled and ' % \
+                 (comp_name) + 'Python version: '+str(pair)+' (%s): ' % \
+                 (str(comp_args))+str(approx_str_value_2)+', '+ \
+                 str(approx_str_value_4)
+
+  def testEditDistBitParallel(self):   # - - - - - - - - - - - - - - - - - - -
+    """Test bit-parallel 'EditDist' and 'ModEditDist' comparators against the
+       dynamic programming versions"""
+
+    imp_stringcmpext = stringcmp.imp_stringcmpext
+    stringcmp.imp_stringcmpext = False  # Only use pure Python versions
+
+    test_pairs = self.string_pairs + [['sydney',      'sydeny'     ],
+                                      ['abcdefgh',    'badcfehg'   ],
+                                      ['abcdefghij',  'xyzdefghij' ],
+                                      ['peter',       'peterchrist'],
+                                      ['christen',    'xxxxchriste'],
+                                      ['ab',          'ba'         ],
+                                      ['ca',          'abc'        ],
+                                      [70*'ab',       69*'ba'      ]]
+
+    for pair in test_pairs:
+      for min_threshold in [None, 0.1, 0.25, 0.3, 0.5, 0.6, 0.75, 0.8, 0.9]:
+        for funct in [stringcmp.editdist, stringcmp.mod_editdist]:
+
+          stringcmp.BITPARALLEL_MAX_LEN = 64
+          approx_str_value_1 = funct(pair[0],pair[1],min_threshold)
+          approx_str_value_2 = funct(pair[1],pair[0],min_threshold)
+
+          stringcmp.BITPARALLEL_MAX_LEN = 0
+          approx_str_value_3 = funct(pair[0],pair[1],min_threshold)
+          approx_str_value_4 = funct(pair[1],pair[0],min_threshold)
+
+          stringcmp.BITPARALLEL_MAX_LEN = 64
+
+          assert (approx_str_value_1 == approx_str_value_3), \
+                 '"%s" returns different values for bit-parallel ' % \
+                 (funct.__name__)+'and DP version: '+str(pair)+ \
+                 ' (threshold %s): ' % (str(min_threshold))+ \
+                 str(approx_str_value_1)+', '+str(approx_str_value_3)
+
+          assert (approx_str_value_2 == approx_str_value_4), \
+                 '"%s" returns different values for bit-parallel ' % \
+                 (funct.__name__)+'and DP version: '+str(pair)+ \
+                 ' (threshold %s): ' % (str(min_threshold))+ \
+                 str(approx_str_value_2)+', '+str(approx_str_value_4)
+
+    stringcmp.imp_stringcmpext = imp_stringcmpext
+
+    # Check transpositions are counted as one operation
+    #
+    assert stringcmp.mod_editdist('sydney','sydeny') == 1.0 - 1.0/6.0
+    assert stringcmp.editdist('sydney','sydeny') == 1.0 - 2.0/6.0
+
   def testSeqMatch(self):   # - - - - - - - - - - - - - - - - - - - - - - - - -
     """Test 'SeqMatch' approximate string comparator"""
 